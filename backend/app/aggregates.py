@@ -0,0 +1,276 @@
+"""
+Home Cloud Drive - Folder and per-type usage aggregates
+
+Folder rows carry ``subtree_size`` (bytes of untrashed files below them) and
+``subtree_count`` (untrashed files and folders below them), and
+``user_type_usage`` holds each owner's untrashed file count and bytes per file
+type.  They are kept current incrementally: every change that makes rows
+appear, disappear, or change size applies the difference to the ancestors
+found through ``file_closure`` in the same transaction, so reading them never
+walks a subtree.
+
+Subtree operations (trash, restore, move, purge) gather their deltas with
+:func:`collect_totals` *before* changing the rows, over exactly the rows whose
+state flips, and then apply them with :func:`apply_totals`.
+
+``python -m app.aggregates`` recomputes everything from scratch for drift
+repair; ``--check`` only reports how many rows disagree.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.file_tree import subtree_ids
+from app.models import File as FileModel, FileClosure, UserTypeUsage
+
+files_table = FileModel.__table__
+
+
+@dataclass
+class Totals:
+    """Pending (count, size) changes per folder id and per (owner id, type)"""
+    folders: dict[str, tuple[int, int]] = field(default_factory=dict)
+    types: dict[tuple[str, str], tuple[int, int]] = field(default_factory=dict)
+
+
+def _own_size(file_type: str, size: int | None) -> int:
+    return 0 if file_type == "folder" else (size or 0)
+
+
+async def _bump_type(db: AsyncSession, owner_id: str, file_type: str, count: int, size: int) -> None:
+    if file_type == "folder" or (count == 0 and size == 0):
+        return
+    stmt = sqlite_insert(UserTypeUsage).values(
+        user_id=owner_id,
+        type=file_type,
+        file_count=count,
+        total_size=size,
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserTypeUsage.user_id, UserTypeUsage.type],
+        set_={
+            "file_count": UserTypeUsage.file_count + stmt.excluded.file_count,
+            "total_size": UserTypeUsage.total_size + stmt.excluded.total_size,
+        },
+    ))
+
+
+async def _shift_ancestors(db: AsyncSession, file_id: str, count: int, size: int) -> None:
+    if count == 0 and size == 0:
+        return
+    await db.execute(
+        update(FileModel)
+        .where(FileModel.id.in_(
+            select(FileClosure.ancestor_id).where(
+                FileClosure.descendant_id == file_id,
+                FileClosure.depth > 0,
+            )
+        ))
+        .values(
+            subtree_count=FileModel.subtree_count + count,
+            subtree_size=FileModel.subtree_size + size,
+            updated_at=FileModel.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def record_created(db: AsyncSession, file: FileModel) -> None:
+    """Count a new, untrashed row; call once its closure rows exist."""
+    size = _own_size(file.type, file.size)
+    await _shift_ancestors(db, file.id, 1, size)
+    await _bump_type(db, file.owner_id, file.type, 1, size)
+
+
+async def record_replaced(db: AsyncSession, file: FileModel, old_type: str, old_size: int | None) -> None:
+    """Account for new content on *file* (new or restored version)."""
+    if file.is_trashed:
+        return
+    old_size = _own_size(old_type, old_size)
+    new_size = _own_size(file.type, file.size)
+    await _shift_ancestors(db, file.id, 0, new_size - old_size)
+    if old_type == file.type:
+        await _bump_type(db, file.owner_id, file.type, 0, new_size - old_size)
+    else:
+        await _bump_type(db, file.owner_id, old_type, -1, -old_size)
+        await _bump_type(db, file.owner_id, file.type, 1, new_size)
+
+
+async def collect_totals(
+    db: AsyncSession,
+    members,
+    *,
+    trashed: bool = False,
+    outside=None,
+    types: bool = True,
+) -> Totals:
+    """Totals contributed by the *members* rows that are in the given trash state.
+
+    *members* is a list of ids or a SELECT of ids.  Folder totals are grouped
+    by every ancestor of those rows, optionally leaving out ancestors that
+    are in *outside* (moves and purges leave their own subtree alone).
+    """
+    descendant = aliased(FileModel)
+    own_size = func.coalesce(func.sum(case((descendant.type != "folder", descendant.size), else_=0)), 0)
+    query = (
+        select(FileClosure.ancestor_id, func.count(), own_size)
+        .join(descendant, descendant.id == FileClosure.descendant_id)
+        .where(
+            FileClosure.descendant_id.in_(members),
+            FileClosure.depth > 0,
+            descendant.is_trashed == trashed,
+        )
+        .group_by(FileClosure.ancestor_id)
+    )
+    if outside is not None:
+        query = query.where(FileClosure.ancestor_id.not_in(outside))
+
+    totals = Totals()
+    for ancestor_id, count, size in (await db.execute(query)).all():
+        totals.folders[ancestor_id] = (count, size)
+
+    if types:
+        type_rows = await db.execute(
+            select(FileModel.owner_id, FileModel.type, func.count(), func.coalesce(func.sum(FileModel.size), 0))
+            .where(
+                FileModel.id.in_(members),
+                FileModel.is_trashed == trashed,
+                FileModel.type != "folder",
+            )
+            .group_by(FileModel.owner_id, FileModel.type)
+        )
+        for owner_id, file_type, count, size in type_rows.all():
+            totals.types[(owner_id, file_type)] = (count, size)
+    return totals
+
+
+async def apply_totals(db: AsyncSession, totals: Totals, sign: int) -> None:
+    """Add (``sign=1``) or subtract (``sign=-1``) collected totals."""
+    if totals.folders:
+        await db.execute(
+            files_table.update()
+            .where(files_table.c.id == bindparam("folder_id"))
+            .values(
+                subtree_count=files_table.c.subtree_count + bindparam("delta_count"),
+                subtree_size=files_table.c.subtree_size + bindparam("delta_size"),
+                updated_at=files_table.c.updated_at,
+            ),
+            [
+                {"folder_id": folder_id, "delta_count": sign * count, "delta_size": sign * size}
+                for folder_id, (count, size) in totals.folders.items()
+            ],
+        )
+    for (owner_id, file_type), (count, size) in totals.types.items():
+        await _bump_type(db, owner_id, file_type, sign * count, sign * size)
+
+
+async def record_trashing(db: AsyncSession, root_ids: list[str]) -> None:
+    """Call before *root_ids* and their subtrees are trashed."""
+    await apply_totals(db, await collect_totals(db, subtree_ids(root_ids, include_self=True)), -1)
+
+
+async def record_restoring(db: AsyncSession, root_ids: list[str]) -> None:
+    """Call before *root_ids* and their subtrees are restored."""
+    await apply_totals(db, await collect_totals(db, subtree_ids(root_ids, include_self=True), trashed=True), 1)
+
+
+async def record_purging(db: AsyncSession, root_ids: list[str]) -> None:
+    """Call before *root_ids* and their subtrees are deleted for good."""
+    members = subtree_ids(root_ids, include_self=True)
+    await apply_totals(db, await collect_totals(db, members, outside=members), -1)
+
+
+async def record_moving(db: AsyncSession, root_ids: list[str]) -> None:
+    """Call before re-parenting *root_ids* in the closure table."""
+    members = subtree_ids(root_ids, include_self=True)
+    await apply_totals(db, await collect_totals(db, members, outside=members, types=False), -1)
+
+
+async def record_moved(db: AsyncSession, root_ids: list[str]) -> None:
+    """Call after re-parenting *root_ids* in the closure table."""
+    members = subtree_ids(root_ids, include_self=True)
+    await apply_totals(db, await collect_totals(db, members, outside=members, types=False), 1)
+
+
+# Full recomputation, used by the rebuild command and the startup backfill
+_LIVE_DESCENDANTS = (
+    "FROM file_closure c JOIN files d ON d.id = c.descendant_id "
+    "WHERE c.ancestor_id = files.id AND c.depth > 0 AND d.is_trashed = 0"
+)
+_EXPECTED_COUNT = f"(SELECT count(*) {_LIVE_DESCENDANTS})"
+_EXPECTED_SIZE = f"(SELECT coalesce(sum(d.size), 0) {_LIVE_DESCENDANTS} AND d.type != 'folder')"
+
+
+async def count_drift(conn: AsyncConnection) -> tuple[int, int]:
+    """Rows whose stored totals disagree: (folder/file rows, type counters)."""
+    drifted_files = await conn.scalar(text(
+        "SELECT count(*) FROM files WHERE "
+        f"(type = 'folder' AND (subtree_count != {_EXPECTED_COUNT} OR subtree_size != {_EXPECTED_SIZE})) "
+        "OR (type != 'folder' AND (subtree_count != 0 OR subtree_size != 0))"
+    ))
+    expected = (
+        "SELECT owner_id AS user_id, type, count(*) AS file_count, coalesce(sum(size), 0) AS total_size "
+        "FROM files WHERE is_trashed = 0 AND type != 'folder' GROUP BY owner_id, type"
+    )
+    stored = "SELECT user_id, type, file_count, total_size FROM user_type_usage WHERE file_count != 0"
+    drifted_types = await conn.scalar(text(
+        f"SELECT count(*) FROM (SELECT user_id, type FROM ({expected} EXCEPT {stored}) "
+        f"UNION SELECT user_id, type FROM ({stored} EXCEPT {expected}))"
+    ))
+    return drifted_files or 0, drifted_types or 0
+
+
+async def rebuild_aggregates(conn: AsyncConnection) -> tuple[int, int]:
+    """Recompute every folder total and type counter; returns the drift that was repaired."""
+    drift = await count_drift(conn)
+    await conn.execute(text(
+        f"UPDATE files SET subtree_count = {_EXPECTED_COUNT}, subtree_size = {_EXPECTED_SIZE} "
+        "WHERE type = 'folder'"
+    ))
+    await conn.execute(text(
+        "UPDATE files SET subtree_count = 0, subtree_size = 0 "
+        "WHERE type != 'folder' AND (subtree_count != 0 OR subtree_size != 0)"
+    ))
+    await conn.execute(delete(UserTypeUsage))
+    await conn.execute(insert(UserTypeUsage).from_select(
+        ["user_id", "type", "file_count", "total_size"],
+        select(FileModel.owner_id, FileModel.type, func.count(), func.coalesce(func.sum(FileModel.size), 0))
+        .where(FileModel.is_trashed == False, FileModel.type != "folder")  # noqa: E712
+        .group_by(FileModel.owner_id, FileModel.type),
+    ))
+    return drift
+
+
+async def aggregates_need_rebuild(conn: AsyncConnection) -> bool:
+    """True for databases that have files but were never aggregated."""
+    has_files = await conn.scalar(text(
+        "SELECT 1 FROM files WHERE is_trashed = 0 AND type != 'folder' LIMIT 1"
+    ))
+    has_usage = await conn.scalar(text("SELECT 1 FROM user_type_usage LIMIT 1"))
+    return bool(has_files) and not has_usage
+
+
+async def _main(check_only: bool) -> None:
+    from app.database import engine
+
+    async with engine.begin() as conn:
+        if check_only:
+            files_drift, types_drift = await count_drift(conn)
+            print(f"{files_drift} file rows and {types_drift} type counters out of date")
+        else:
+            files_drift, types_drift = await rebuild_aggregates(conn)
+            print(f"Rebuilt aggregates ({files_drift} file rows and {types_drift} type counters were out of date)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute folder totals and per-type usage counters.")
+    parser.add_argument("--check", action="store_true", help="only report drift, change nothing")
+    asyncio.run(_main(parser.parse_args().check))
@@ -0,0 +1,167 @@
+"""
+Home Cloud Drive - Streaming ZIP archives
+
+Folder and multi-file downloads are zipped on the fly.  ``zipfile`` writes
+into an unseekable sink that is drained after every block, so a request holds
+about one block in memory and nothing is staged on disk.  Entry sizes are
+known up front, so ZIP64 extra fields are only written for entries that need
+them, and ``zipfile`` switches the central directory to ZIP64 by itself past
+65,535 entries or 4 GiB.  Formats that are already compressed are stored
+rather than deflated a second time.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BLOCK_SIZE = 1024 * 1024
+ARCHIVE_MEDIA_TYPE = "application/zip"
+
+# Containers and codecs that deflate cannot shrink meaningfully
+STORED_EXTENSIONS = {
+    "jpg", "jpeg", "png", "gif", "webp", "avif", "heic", "heif",
+    "mp3", "m4a", "aac", "ogg", "oga", "opus", "flac",
+    "mp4", "m4v", "mov", "mkv", "webm", "avi",
+    "zip", "gz", "tgz", "bz2", "xz", "7z", "rar", "zst", "br",
+    "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub", "jar", "apk",
+    "pdf",
+}
+STORED_MIME_PREFIXES = ("video/", "audio/")
+
+
+@dataclass
+class ArchiveEntry:
+    name: str  # path inside the archive; folders end with "/"
+    path: Optional[str] = None  # file on disk, None for folders
+    modified: Optional[datetime] = None
+    mime_type: Optional[str] = None
+
+
+def is_precompressed(name: str, mime_type: Optional[str] = None) -> bool:
+    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    if ext in STORED_EXTENSIONS:
+        return True
+    return bool(mime_type) and mime_type.startswith(STORED_MIME_PREFIXES)
+
+
+def archive_name(parts: list[str]) -> str:
+    """Join path components for an archive member, dropping anything that could escape the root."""
+    clean = []
+    for part in parts:
+        part = str(part).replace("/", "_").replace("\\", "_").strip()
+        if part and part not in {".", ".."}:
+            clean.append(part)
+    return "/".join(clean) or "unnamed"
+
+
+def unique_names(entries: list[ArchiveEntry]) -> list[ArchiveEntry]:
+    """Suffix " (n)" onto repeated member names, keeping the extension."""
+    seen: set[str] = set()
+    for entry in entries:
+        name = entry.name
+        if name in seen:
+            is_dir = name.endswith("/")
+            stem, ext = os.path.splitext(name.rstrip("/"))
+            if is_dir:
+                stem, ext = name.rstrip("/"), ""
+            counter = 2
+            while name in seen:
+                name = f"{stem} ({counter}){ext}" + ("/" if is_dir else "")
+                counter += 1
+            entry.name = name
+        seen.add(name)
+    return entries
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer that hands out what was written so far"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _zip_time(value: Optional[datetime]) -> tuple:
+    if value is None or value.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return value.timetuple()[:6]
+
+
+def _open_member(archive: zipfile.ZipFile, entry: ArchiveEntry):
+    """Open the source file and its archive member; None if the file is gone."""
+    try:
+        handle = open(entry.path, "rb")
+    except OSError:
+        logger.warning("Skipping missing file %s in archive", entry.path)
+        return None
+    info = zipfile.ZipInfo(entry.name, date_time=_zip_time(entry.modified))
+    info.file_size = os.fstat(handle.fileno()).st_size
+    info.compress_type = zipfile.ZIP_STORED if is_precompressed(entry.name, entry.mime_type) else zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    try:
+        return handle, archive.open(info, "w")
+    except Exception:
+        handle.close()
+        raise
+
+
+def _copy_block(handle, member, block_size: int) -> bool:
+    """Copy one block; returns False at end of file."""
+    block = handle.read(block_size)
+    if not block:
+        return False
+    member.write(block)
+    return True
+
+
+async def stream_zip(entries: list[ArchiveEntry], block_size: int = ARCHIVE_BLOCK_SIZE) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of *entries*, one block at a time."""
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", allowZip64=True)
+    for entry in entries:
+        if entry.path is None:
+            info = zipfile.ZipInfo(entry.name, date_time=_zip_time(entry.modified))
+            info.external_attr = (0o40755 << 16) | 0x10
+            archive.writestr(info, b"")
+        else:
+            opened = await asyncio.to_thread(_open_member, archive, entry)
+            if opened is None:
+                continue
+            handle, member = opened
+            try:
+                while await asyncio.to_thread(_copy_block, handle, member, block_size):
+                    data = sink.take()
+                    if data:
+                        yield data
+                await asyncio.to_thread(member.close)
+            finally:
+                handle.close()
+        data = sink.take()
+        if data:
+            yield data
+    archive.close()
+    yield sink.take()
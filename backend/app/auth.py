@@ -5,6 +5,7 @@ import base64
 import hashlib
 import hmac
 import secrets
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from urllib.parse import quote
@@ -17,8 +18,17 @@ from sqlalchemy import select, update as sql_update
 
 from app.config import get_settings
 from app.database import get_db
+from app.executors import CryptoBusy, run_crypto
 from app.models import User, UserSession
 from app.schemas import TokenData
+from app.session_cache import (
+    CachedSession,
+    attach_cached_user,
+    invalidate_user_sessions,
+    last_seen_buffer,
+    session_cache,
+    snapshot_user,
+)
 
 settings = get_settings()
 
@@ -34,6 +44,27 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def _run_crypto(func, *args):
+    try:
+        return await run_crypto(func, *args)
+    except CryptoBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """:func:`verify_password` on the crypto executor, off the event loop."""
+    return await _run_crypto(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """:func:`get_password_hash` on the crypto executor, off the event loop."""
+    return await _run_crypto(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -222,47 +253,66 @@ async def get_current_user(
         raise credentials_exception
     token_data = TokenData(user_id=user_id)
 
-    result = await db.execute(select(User).where(User.id == token_data.user_id))
-    user = result.scalar_one_or_none()
-    if user is None:
-        raise credentials_exception
-
     session_id: str | None = payload.get("sid")
-    if session_id is None:
-        raise credentials_exception
+    cached = session_cache.get(session_id, token_data.user_id) if session_id is not None else None
+    if cached is not None:
+        expires = cached.expires_at
+        last_seen = cached.last_seen_at
+        user = await attach_cached_user(db, cached)
+    else:
+        generation = session_cache.generation(token_data.user_id)
+        result = await db.execute(select(User).where(User.id == token_data.user_id))
+        user = result.scalar_one_or_none()
+        if user is None:
+            raise credentials_exception
 
-    session_result = await db.execute(
-        select(UserSession).where(
-            UserSession.id == session_id,
-            UserSession.user_id == user.id,
+        if session_id is None:
+            raise credentials_exception
+
+        session_result = await db.execute(
+            select(UserSession).where(
+                UserSession.id == session_id,
+                UserSession.user_id == user.id,
+            )
         )
-    )
-    current_session = session_result.scalar_one_or_none()
+        current_session = session_result.scalar_one_or_none()
 
-    if current_session is None or current_session.revoked_at is not None:
-        raise credentials_exception
+        if current_session is None or current_session.revoked_at is not None:
+            raise credentials_exception
 
-    expires = current_session.expires_at
-    if expires is None:
-        raise credentials_exception
-    if expires.tzinfo is None:
-        expires = expires.replace(tzinfo=timezone.utc)
-    
-    if expires <= datetime.now(timezone.utc):
-        raise credentials_exception
+        expires = current_session.expires_at
+        if expires is None:
+            raise credentials_exception
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        last_seen = current_session.last_seen_at
+        if last_seen is not None and last_seen.tzinfo is None:
+            # SQLite returns naive datetimes; values are stored as UTC so tag them.
+            last_seen = last_seen.replace(tzinfo=timezone.utc)
+        cached = CachedSession(
+            user_id=user.id,
+            expires_at=expires,
+            last_seen_at=last_seen,
+            user_state=snapshot_user(user),
+            cached_at=time.monotonic(),
+        )
+        session_cache.put(session_id, cached, generation)
 
     now = datetime.now(timezone.utc)
+    if expires <= now:
+        session_cache.invalidate_session(session_id)
+        raise credentials_exception
+
+    # last_seen_at is written by the background flusher, not this transaction.
     update_interval = settings.session_last_seen_update_interval_seconds
-    last_seen = current_session.last_seen_at
-    if last_seen is not None and last_seen.tzinfo is None:
-        # SQLite returns naive datetimes; values are stored as UTC so tag them.
-        last_seen = last_seen.replace(tzinfo=timezone.utc)
     if (
         update_interval == 0
         or last_seen is None
         or (now - last_seen).total_seconds() >= update_interval
     ):
-        current_session.last_seen_at = now
+        last_seen_buffer.record(session_id, now)
+        if cached is not None:
+            cached.last_seen_at = now
     return user
 
 
@@ -280,7 +330,7 @@ async def authenticate_user(db: AsyncSession, email: str, password: str) -> Opti
     user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
@@ -315,6 +365,7 @@ async def revoke_user_sessions(
         .where(*conditions)
         .values(revoked_at=now)
     )
+    invalidate_user_sessions(db, user_id)
 
 
 async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
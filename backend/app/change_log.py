@@ -0,0 +1,172 @@
+"""
+Per-owner change feed for sync clients.
+
+Every request that creates, renames, moves, stars, trashes, restores, deletes
+or adds a version to a file appends one ``file_changes`` row per affected
+file with :func:`record_changes`, inside the same transaction as the change.
+``seq`` is an ``AUTOINCREMENT`` key, so it never goes backwards or gets
+reused.  SQLite has a single writer, so entries also commit in ``seq``
+order.  A client that remembers the last ``seq`` it applied and asks
+``GET /api/changes?since=<seq>`` therefore never misses an entry, and each
+page is one range scan of ``ix_file_changes_owner_seq``.
+
+An entry only says *that* a file changed; the feed returns the file's current
+state next to it.  That lets :func:`compact_changes` drop any entry that is
+older than ``change_log_compact_after_seconds`` and superseded by a newer
+entry for the same file.  Entries older than ``change_log_retention_days``
+are dropped outright, and the owner's ``change_log_floor`` is raised past
+them; a client asking for changes since a ``seq`` below the floor gets 410
+and has to list its tree again.
+
+Trashing, restoring or deleting a folder records every file below it as
+well.  Moving or renaming one records only the folder: the files below keep
+their ``parent_id``, and a client can derive their new paths from it.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import DateTime, and_, exists, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.file_tree import subtree_ids
+from app.models import File as FileModel, FileChange, User
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANGE_ACTIONS = ("created", "updated", "moved", "trashed", "restored", "deleted", "version_added")
+RECORD_BATCH_SIZE = 500
+
+
+async def record_changes(
+    db: AsyncSession,
+    action: str,
+    file_ids: Iterable[str],
+    *,
+    subtree: bool = False,
+) -> None:
+    """Append an *action* entry for each of *file_ids* (and everything below them with *subtree*).
+
+    Owners are read from ``files``, so deletions must be recorded before the
+    rows are purged.
+    """
+    if action not in CHANGE_ACTIONS:
+        raise ValueError(f"Unknown change action: {action}")
+    ids = list(dict.fromkeys(file_ids))
+    if not ids:
+        return
+    # The rows read below may still be pending in the session
+    await db.flush()
+    now = datetime.now(timezone.utc)
+    for start in range(0, len(ids), RECORD_BATCH_SIZE):
+        batch = ids[start:start + RECORD_BATCH_SIZE]
+        targets = subtree_ids(batch, include_self=True) if subtree else batch
+        await db.execute(
+            insert(FileChange).from_select(
+                ["owner_id", "file_id", "action", "created_at"],
+                select(FileModel.owner_id, FileModel.id, literal(action), literal(now, DateTime()))
+                .where(FileModel.id.in_(targets))
+                .order_by(FileModel.id),
+            )
+        )
+
+
+async def latest_seq(db: AsyncSession, owner_id: str) -> int:
+    """Position a client should sync from after listing *owner_id*'s tree in full."""
+    latest = await db.scalar(select(func.max(FileChange.seq)).where(FileChange.owner_id == owner_id))
+    floor = await db.scalar(select(User.change_log_floor).where(User.id == owner_id))
+    return max(latest or 0, floor or 0)
+
+
+@dataclass
+class CompactionResult:
+    superseded: int = 0
+    expired: int = 0
+
+
+async def compact_changes(db: AsyncSession, now: Optional[datetime] = None) -> CompactionResult:
+    """Drop superseded and expired feed entries; the caller commits."""
+    now = now or datetime.now(timezone.utc)
+    result = CompactionResult()
+    changes = FileChange.__table__
+    newer = changes.alias("newer")
+
+    superseded_before = now - timedelta(seconds=max(0, settings.change_log_compact_after_seconds))
+    deleted = await db.execute(
+        changes.delete().where(
+            changes.c.created_at < superseded_before,
+            exists().where(and_(newer.c.file_id == changes.c.file_id, newer.c.seq > changes.c.seq)),
+        )
+    )
+    result.superseded = deleted.rowcount or 0
+
+    if settings.change_log_retention_days > 0:
+        horizon = now - timedelta(days=settings.change_log_retention_days)
+        floors = (await db.execute(
+            select(FileChange.owner_id, func.max(FileChange.seq))
+            .where(FileChange.created_at < horizon)
+            .group_by(FileChange.owner_id)
+        )).all()
+        for owner_id, floor in floors:
+            # Raise the floor in the same transaction as the delete, so a
+            # reader that misses the entries also sees the new floor
+            await db.execute(
+                update(User.__table__)
+                .where(User.id == owner_id, User.change_log_floor < floor)
+                .values(change_log_floor=floor)
+            )
+            deleted = await db.execute(
+                changes.delete().where(changes.c.owner_id == owner_id, changes.c.seq <= floor)
+            )
+            result.expired += deleted.rowcount or 0
+    return result
+
+
+class ChangeLogCompactor:
+    """Background task compacting the change feed periodically."""
+
+    def __init__(self, session_factory=None, interval: Optional[float] = None):
+        if session_factory is None:
+            from app.database import async_session as session_factory
+        self.session_factory = session_factory
+        self.interval = interval if interval is not None else settings.change_log_compact_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await self.compact()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed compaction failed")
+                continue
+            if result.superseded or result.expired:
+                logger.info(
+                    "Change feed compaction dropped %d superseded and %d expired entries",
+                    result.superseded,
+                    result.expired,
+                )
+
+    async def compact(self) -> CompactionResult:
+        async with self.session_factory() as db:
+            result = await compact_changes(db)
+            await db.commit()
+        return result
@@ -38,11 +38,68 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite+aiosqlite:///./data/homecloud.db"
 
+    # SQLite tuning, applied to every connection (see app/sqlite_tuning.py)
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000  # also how long a writer waits for the write gate
+    sqlite_cache_size_kib: int = 16384  # page cache per connection
+    sqlite_mmap_size_bytes: int = 268435456  # 0 disables memory-mapped reads
+    sqlite_pool_size: int = 10
+    sqlite_pool_max_overflow: int = 20
+    sqlite_single_writer: bool = True  # queue write transactions of a process instead of racing for the lock
+
+    @field_validator('sqlite_journal_mode', 'sqlite_synchronous')
+    @classmethod
+    def validate_sqlite_pragma(cls, v, info):
+        allowed = {
+            'sqlite_journal_mode': {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'},
+            'sqlite_synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+        }[info.field_name]
+        v = v.strip().upper()
+        if v not in allowed:
+            raise ValueError(f"{info.field_name.upper()} must be one of {', '.join(sorted(allowed))}")
+        return v
+
     # Storage (local filesystem)
     storage_path: str = "./storage"
     max_storage_bytes: int = 107374182400  # 100 GB default per user
     max_file_size_bytes: int = 1073741824  # 1 GB max per file
     trash_auto_delete_days: int = 30  # Auto-delete trashed files after N days
+    upload_session_ttl_hours: int = 24  # resumable uploads expire this long after their last chunk
+    quota_reservation_ttl_seconds: int = 3600  # quota held by an unfinished streamed upload stops counting after this
+
+    # Storage garbage collection (expired uploads, orphan blobs and thumbnails)
+    storage_gc_interval_seconds: int = 21600  # 0 disables the periodic run
+    storage_gc_grace_seconds: int = 3600  # never touch anything modified more recently
+    storage_gc_batch_size: int = 500  # directory entries checked per DB lookup
+    storage_gc_batch_pause_seconds: float = 0.05  # pause between batches to spread disk I/O
+
+    # Change feed for sync clients (GET /api/changes)
+    change_log_retention_days: int = 30  # older entries are dropped; clients behind them resync (0 keeps all)
+    change_log_compact_after_seconds: int = 86400  # entries superseded by a newer one for the same file go after this
+    change_log_compact_interval_seconds: int = 3600  # 0 disables the periodic compaction
+
+    # Background jobs (thumbnails, text extraction)
+    job_workers: int = 2  # concurrent asyncio workers per API process
+    job_process_workers: int = 2  # processes for CPU-bound work such as image decoding
+    job_max_attempts: int = 3
+    job_retry_base_seconds: int = 5  # exponential backoff base between attempts
+    job_poll_interval_seconds: float = 2.0
+    job_lease_seconds: int = 600  # running jobs not finished by then are retried
+
+    # Password hashing / verification threads (bcrypt runs off the event loop)
+    crypto_workers: int = 2  # concurrent bcrypt calls per API process
+    crypto_max_queue: int = 64  # calls waiting beyond this are refused with 503
+
+    # Thumbnail renditions: webp or avif (falls back to webp if Pillow lacks AVIF)
+    thumbnail_format: str = "webp"
+
+    # File delivery offload: after permission checks, answer with an
+    # X-Accel-Redirect to this internal nginx location instead of streaming
+    # the bytes from Python. Needs the matching location block in nginx.conf
+    # and the storage volume mounted into the nginx container.
+    x_accel_redirect: bool = False
+    x_accel_redirect_prefix: str = "/_protected_storage/"
 
     # CORS - allowed origins for frontend (comma-separated string)
     # Accepts both CORS_ORIGINS and CORS_ORIGINS_STR env var names
@@ -64,6 +121,29 @@ class Settings(BaseSettings):
     # Session last-seen throttle - only write last_seen_at if older than this many seconds.
     # Reduces write amplification on busy deployments (set to 0 to always update).
     session_last_seen_update_interval_seconds: int = 60
+    # last_seen_at updates are buffered in memory and written in one batch this often.
+    session_last_seen_flush_interval_seconds: float = 15.0
+    # Validated sessions (and their user row) are cached per process for this long,
+    # so authenticated requests skip the users/user_sessions lookups (0 disables).
+    session_cache_ttl_seconds: int = 30
+    session_cache_max_entries: int = 10000
+    # A correct share-link password earns a signed access grant valid this long, so
+    # repeat views and downloads skip bcrypt.  Link + file rows of public share links
+    # are cached per process for share_link_cache_ttl_seconds (0 disables).
+    share_grant_ttl_seconds: int = 900
+    # A counted share download returns a resume token; Range requests carrying it
+    # continue that download for this long without counting again.
+    share_resume_ttl_seconds: int = 3600
+    share_link_cache_ttl_seconds: int = 30
+    share_link_cache_max_entries: int = 10000
+    # Listings embed signed thumbnail/preview URLs; expiries are rounded to windows of
+    # this length so repeat listings reuse the same URLs (and the browser cache).
+    # Previews serve the full file, so their window is much shorter.
+    signed_url_ttl_seconds: int = 43200
+    signed_preview_url_ttl_seconds: int = 600
+    # Shared-folder grants a user holds per owner are cached per process (0 disables).
+    shared_grant_cache_ttl_seconds: int = 60
+    shared_grant_cache_max_entries: int = 10000
     trust_proxy_headers: bool = False
 
     # Registration control - default OFF for secure-by-default; enable explicitly via env
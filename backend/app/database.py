@@ -4,6 +4,7 @@ Home Cloud Drive - Database Connection
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.config import get_settings
+from app.sqlite_tuning import configure_sqlite, engine_options
 import os
 
 settings = get_settings()
@@ -18,7 +19,10 @@ engine = create_async_engine(
     settings.database_url,
     echo=False,
     future=True,
+    **engine_options(settings.database_url),
 )
+# WAL and friends on every connection; write transactions queue at write_gate
+write_gate = configure_sqlite(engine)
 
 async_session = async_sessionmaker(
     engine,
@@ -0,0 +1,154 @@
+"""
+Home Cloud Drive - File delivery
+Shared responder for downloads, previews, thumbnails and share links.
+
+Bodies are sent with Starlette's ``FileResponse``, which streams from disk
+without a Python generator (or hands the path to the server when it supports
+the ASGI ``pathsend`` extension) and implements single and multipart
+``Range`` requests plus ``If-Range``.  This module adds validators derived
+from the file id and version, so they survive restarts and blob moves and
+change exactly when the content does, and answers conditional requests
+with ``304 Not Modified``.
+
+With ``X_ACCEL_REDIRECT`` enabled the body is not sent from Python at all:
+the response carries an ``X-Accel-Redirect`` header and nginx serves the
+file (including ranges) from an internal location.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def content_etag(file_id: str, version: Optional[int], variant: str = "") -> str:
+    """Strong ETag for one version of a file (``variant`` tells renditions apart)."""
+    seed = f"{file_id}:{version or 1}:{variant}"
+    return f'"{hashlib.sha256(seed.encode()).hexdigest()[:32]}"'
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # SQLite returns naive datetimes; they are stored as UTC.
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison, as required for If-None-Match."""
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2).
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def continues_download(request: Request, etag: str, last_modified: Optional[str], size: int) -> bool:
+    """
+    True for a ``Range`` request whose answer does not include the first byte
+    of the file: a seek or a resumed transfer rather than a new download.
+    """
+    http_range = request.headers.get("range", "").strip()
+    if not http_range.lower().startswith("bytes="):
+        return False
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in (etag, last_modified):
+        return False  # the full file is sent instead
+    for part in http_range[6:].split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return False
+        try:
+            if start.strip():
+                covers_first_byte = int(start) == 0
+            else:
+                # Suffix range ("-N"): the last N bytes
+                covers_first_byte = int(end) >= size
+        except ValueError:
+            return False
+        if covers_first_byte:
+            return False
+    return True
+
+
+def ensure_within_storage(path: str) -> str:
+    """
+    Path traversal protection: *path* must resolve under the storage root.
+    Returns the path relative to that root.
+    """
+    resolved = os.path.realpath(path)
+    base_path = os.path.realpath(settings.storage_path)
+    if os.path.commonpath([base_path, resolved]) != base_path:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return os.path.relpath(resolved, base_path)
+
+
+def accel_redirect_uri(relative_path: str) -> str:
+    """Internal nginx URI for a storage-relative path"""
+    prefix = settings.x_accel_redirect_prefix.rstrip("/")
+    return f"{prefix}/{quote(relative_path.replace(os.sep, '/'), safe='/')}"
+
+
+def send_file(
+    request: Request,
+    path: str,
+    *,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    media_type: Optional[str] = None,
+    content_disposition: Optional[str] = None,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """
+    Respond with the file at *path*, honoring conditional and range headers.
+    Callers do their own permission checks first.
+    """
+    relative_path = ensure_within_storage(path)
+
+    headers = {"ETag": etag}
+    modified = http_date(last_modified)
+    if modified:
+        headers["Last-Modified"] = modified
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+
+    if is_not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+
+    if content_disposition:
+        headers["Content-Disposition"] = content_disposition
+    if settings.x_accel_redirect:
+        # nginx keeps Content-Type, Content-Disposition and Cache-Control from
+        # this response and serves the body (and any Range) itself.
+        headers["X-Accel-Redirect"] = accel_redirect_uri(relative_path)
+        headers["Content-Type"] = media_type or "application/octet-stream"
+        return Response(status_code=200, headers=headers)
+    return FileResponse(
+        path=path,
+        media_type=media_type or "application/octet-stream",
+        headers=headers,
+        stat_result=os.stat(path),
+    )
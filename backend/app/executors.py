@@ -0,0 +1,140 @@
+"""
+Shared executors for work that must stay off the event loop.
+
+CPU-bound work (image decoding) goes to a process pool so it neither blocks
+the event loop nor competes for the GIL with request handling.  Workers are
+started with the ``spawn`` method: the API process runs an event loop and
+driver threads, which are unsafe to ``fork``.
+
+Password hashing and verification (bcrypt, ~250 ms each) go to a small
+thread pool instead: bcrypt releases the GIL, so threads run it in
+parallel with the event loop.  At most ``CRYPTO_WORKERS`` calls run at
+once, at most ``CRYPTO_MAX_QUEUE`` more wait for a slot, and further calls
+are refused with :class:`CryptoBusy` rather than piling up behind a login
+burst.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import get_settings
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max(1, get_settings().job_process_workers),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_process(func, *args, **kwargs):
+    """Run a picklable top-level *func* in the shared process pool."""
+    global _process_pool
+    pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a hostile image); replace the pool so
+        # later calls work and let the caller's retry policy handle this one.
+        if _process_pool is pool:
+            _process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+class CryptoBusy(RuntimeError):
+    """Raised when the crypto executor's queue is full."""
+
+
+@dataclass
+class CryptoMetrics:
+    """Process-wide counters of the crypto executor"""
+    workers: int = 0
+    max_queue: int = 0
+    running: int = 0
+    queued: int = 0
+    peak_queued: int = 0
+    completed: int = 0
+    rejected: int = 0
+    wait_seconds_total: float = 0.0
+
+
+class CryptoExecutor:
+    """Bounded thread pool for password hashing and verification."""
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        settings = get_settings()
+        self.metrics = CryptoMetrics(
+            workers=max(1, workers if workers is not None else settings.crypto_workers),
+            max_queue=max(0, max_queue if max_queue is not None else settings.crypto_max_queue),
+        )
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _slots_for_loop(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._slots, self._loop = asyncio.Semaphore(self.metrics.workers), loop
+        return self._slots
+
+    async def run(self, func, *args):
+        """Run *func* in the pool once a slot is free, or raise CryptoBusy."""
+        metrics = self.metrics
+        slots = self._slots_for_loop()
+        if slots.locked() and metrics.queued >= metrics.max_queue:
+            metrics.rejected += 1
+            raise CryptoBusy("Too many password checks in progress")
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=metrics.workers, thread_name_prefix="crypto")
+
+        metrics.queued += 1
+        metrics.peak_queued = max(metrics.peak_queued, metrics.queued)
+        started = time.monotonic()
+        try:
+            await slots.acquire()
+        finally:
+            metrics.queued -= 1
+            metrics.wait_seconds_total += time.monotonic() - started
+
+        metrics.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(func, *args))
+        finally:
+            metrics.running -= 1
+            metrics.completed += 1
+            slots.release()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+crypto_executor = CryptoExecutor()
+
+
+async def run_crypto(func, *args):
+    """Run a password hash or verification on the shared crypto executor."""
+    return await crypto_executor.run(func, *args)
+
+
+def shutdown_executors() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    crypto_executor.shutdown()
@@ -0,0 +1,207 @@
+"""
+Helpers for the materialized folder hierarchy.
+
+Every file row carries a ``parent_id`` plus ``file_closure`` rows linking it to
+each of its ancestors (and a depth-0 row to itself).  Subtree lookups are then
+indexed reads of ``file_closure.ancestor_id`` instead of ``LIKE`` scans over the
+JSON ``path`` column.  ``path`` is still stored as a denormalized read cache for
+listings; when a folder is renamed or moved it is rewritten for the whole
+subtree by a single set-based ``UPDATE``.
+"""
+from __future__ import annotations
+
+import json
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, literal, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import File as FileModel, FileClosure
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _parse_path(path_json: str | None) -> list[str]:
+    try:
+        parsed = json.loads(path_json or "[]")
+    except Exception:
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def _serialize_path(path: list[str]) -> str:
+    return json.dumps(path, separators=(",", ":"))
+
+
+def subtree_ids(folder_id: str | list[str], *, include_self: bool = False):
+    """Return a SELECT of the ids below *folder_id* (optionally including it).
+
+    A list of folder ids selects the union of their subtrees.
+    """
+    if isinstance(folder_id, str):
+        query = select(FileClosure.descendant_id).where(FileClosure.ancestor_id == folder_id)
+    else:
+        query = select(FileClosure.descendant_id).where(FileClosure.ancestor_id.in_(folder_id))
+    if not include_self:
+        query = query.where(FileClosure.depth > 0)
+    return query
+
+
+async def link_node(db: AsyncSession, file_id: str, parent_id: Optional[str]) -> None:
+    """Insert closure rows for a newly created file or folder."""
+    await db.execute(
+        insert(FileClosure).values(ancestor_id=file_id, descendant_id=file_id, depth=0)
+    )
+    if parent_id is None:
+        return
+    await db.execute(
+        insert(FileClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                FileClosure.ancestor_id,
+                literal(file_id),
+                FileClosure.depth + 1,
+            ).where(FileClosure.descendant_id == parent_id),
+        )
+    )
+
+
+async def unlink_node(db: AsyncSession, file_id: str) -> None:
+    """Remove every closure row that references *file_id*."""
+    await db.execute(
+        delete(FileClosure).where(
+            or_(FileClosure.ancestor_id == file_id, FileClosure.descendant_id == file_id)
+        )
+    )
+
+
+async def move_subtree(db: AsyncSession, node_id: str, new_parent_id: Optional[str]) -> None:
+    """Re-parent *node_id* and its descendants in the closure table."""
+    await move_subtrees(db, [node_id], new_parent_id)
+
+
+async def move_subtrees(db: AsyncSession, node_ids: list[str], new_parent_id: Optional[str]) -> None:
+    """Re-parent several nodes under one parent with two set-based statements.
+
+    No node may lie inside another's subtree; callers moving nested
+    selections must move the inner nodes first.
+    """
+    subtree = select(FileClosure.descendant_id).where(FileClosure.ancestor_id.in_(node_ids))
+    await db.execute(
+        delete(FileClosure).where(
+            FileClosure.descendant_id.in_(subtree),
+            FileClosure.ancestor_id.not_in(subtree),
+        )
+    )
+    if new_parent_id is None:
+        return
+
+    above = aliased(FileClosure)
+    below = aliased(FileClosure)
+    await db.execute(
+        insert(FileClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                above.ancestor_id,
+                below.descendant_id,
+                above.depth + below.depth + 1,
+            ).where(
+                above.descendant_id == new_parent_id,
+                below.ancestor_id.in_(node_ids),
+            ),
+        )
+    )
+
+
+async def rewrite_subtree_paths(
+    db: AsyncSession,
+    folder_id: str,
+    old_full_path: list[str],
+    new_full_path: list[str],
+) -> None:
+    """Swap the ``path`` prefix of every descendant of *folder_id* in one UPDATE.
+
+    Paths are stored in the compact serialization, so a folder's children all
+    start with ``serialize(old_full_path)`` minus the closing bracket.
+    """
+    if old_full_path == new_full_path:
+        return
+
+    old_prefix = _serialize_path(old_full_path)[:-1]
+    new_prefix = _serialize_path(new_full_path)[:-1]
+    await db.execute(
+        update(FileModel)
+        .where(
+            FileModel.id.in_(subtree_ids(folder_id)),
+            func.substr(FileModel.path, 1, len(old_prefix)) == old_prefix,
+        )
+        .values(path=literal(new_prefix) + func.substr(FileModel.path, len(old_prefix) + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def tree_index_needs_rebuild(conn: AsyncConnection) -> bool:
+    """True when some file row has no depth-0 closure row (legacy data)."""
+    result = await conn.execute(text(
+        "SELECT 1 FROM files WHERE NOT EXISTS ("
+        "SELECT 1 FROM file_closure c WHERE c.descendant_id = files.id AND c.depth = 0"
+        ") LIMIT 1"
+    ))
+    return result.first() is not None
+
+
+async def rebuild_tree_index(conn: AsyncConnection) -> int:
+    """Backfill ``parent_id`` and the closure table from the ``path`` column.
+
+    Also rewrites legacy ``json.dumps`` paths into the compact form so that
+    prefix rewrites in :func:`rewrite_subtree_paths` match every row.
+    Returns the number of file rows indexed.
+    """
+    rows = (await conn.execute(text(
+        "SELECT id, owner_id, name, type, path, is_trashed, parent_id FROM files"
+    ))).all()
+
+    folders: dict[tuple[str, tuple[str, ...]], str] = {}
+    # Live folders win over trashed ones that share the same location.
+    for row in sorted(rows, key=lambda r: not r.is_trashed):
+        if row.type != "folder":
+            continue
+        key = (row.owner_id, tuple(_parse_path(row.path)) + (row.name,))
+        folders.setdefault(key, row.id)
+
+    parents: dict[str, Optional[str]] = {}
+    row_updates = []
+    for row in rows:
+        path = _parse_path(row.path)
+        parent_id = folders.get((row.owner_id, tuple(path))) if path else None
+        if parent_id == row.id:
+            parent_id = None
+        parents[row.id] = parent_id
+        canonical = _serialize_path(path)
+        if parent_id != row.parent_id or canonical != row.path:
+            row_updates.append({"file_id": row.id, "parent_id": parent_id, "path": canonical})
+
+    for start in range(0, len(row_updates), REBUILD_BATCH_SIZE):
+        await conn.execute(
+            text("UPDATE files SET parent_id = :parent_id, path = :path WHERE id = :file_id"),
+            row_updates[start:start + REBUILD_BATCH_SIZE],
+        )
+
+    await conn.execute(text("DELETE FROM file_closure"))
+    batch = []
+    for file_id in parents:
+        batch.append({"ancestor_id": file_id, "descendant_id": file_id, "depth": 0})
+        seen = {file_id}
+        ancestor_id, depth = parents[file_id], 1
+        while ancestor_id is not None and ancestor_id not in seen:
+            batch.append({"ancestor_id": ancestor_id, "descendant_id": file_id, "depth": depth})
+            seen.add(ancestor_id)
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            await conn.execute(insert(FileClosure), batch)
+            batch = []
+    if batch:
+        await conn.execute(insert(FileClosure), batch)
+
+    return len(rows)
@@ -0,0 +1,335 @@
+"""
+Persistent background job queue for post-upload work.
+
+Endpoints add rows to ``background_jobs`` inside their own transaction, so a
+job exists exactly when the file row it refers to was committed.  Each API
+process runs a small pool of asyncio workers that claim due jobs with one
+conditional ``UPDATE``, run CPU-heavy handlers in the shared process pool,
+and write the result back onto the file row (or its ``file_contents`` row).
+
+A claimed job's ``run_after`` holds a lease expiry: if the process dies
+mid-job the lease lapses and any worker picks the job up again.  Failed
+attempts are retried with exponential backoff up to ``max_attempts``; a job
+whose last attempt lost its lease is marked failed instead of run again.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, event, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.executors import run_in_process
+from app.models import BackgroundJob, File as FileModel, FileContent
+from app.search_index import build_search_document, should_extract_text
+from app.thumbnails import (
+    DEFAULT_THUMBNAIL_SIZE,
+    can_generate_thumbnail,
+    generate_thumbnails,
+    remove_thumbnails,
+    resolve_format,
+)
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+JOB_THUMBNAIL = "thumbnail"
+JOB_EXTRACT_TEXT = "extract_text"
+
+# Set by the running JobWorkerPool so committed enqueues can wake it.
+_active_pool: Optional["JobWorkerPool"] = None
+
+
+def enqueue_job(
+    db: AsyncSession,
+    kind: str,
+    file: FileModel,
+    payload: dict,
+    *,
+    created_by: Optional[str] = None,
+) -> BackgroundJob:
+    """Add a job to the caller's transaction; workers are woken on commit."""
+    job = BackgroundJob(
+        kind=kind,
+        file_id=file.id,
+        owner_id=file.owner_id,
+        created_by=created_by,
+        payload=json.dumps(payload),
+        max_attempts=max(1, settings.job_max_attempts),
+    )
+    db.add(job)
+    db.info["wake_job_workers"] = True
+    return job
+
+
+async def enqueue_file_processing(
+    db: AsyncSession,
+    file: FileModel,
+    *,
+    thumbnail_dir: str,
+    thumbnail_key: str,
+    created_by: Optional[str] = None,
+) -> list[BackgroundJob]:
+    """Queue the thumbnail and text-extraction work for *file*'s current content.
+
+    Results are only applied while the file still points at the same
+    ``storage_path`` and ``version``, so a newer upload supersedes older jobs.
+    """
+    current = {"source_path": file.storage_path, "version": file.version}
+    jobs = []
+    if can_generate_thumbnail(file.name):
+        jobs.append(enqueue_job(
+            db,
+            JOB_THUMBNAIL,
+            file,
+            {**current, "thumbnail_dir": thumbnail_dir, "thumbnail_key": thumbnail_key},
+            created_by=created_by,
+        ))
+    if should_extract_text(file.name, file.mime_type, file.type):
+        # No file_contents row marks the content as not yet extracted
+        await db.execute(delete(FileContent).where(FileContent.file_id == file.id))
+        jobs.append(enqueue_job(
+            db,
+            JOB_EXTRACT_TEXT,
+            file,
+            {**current, "name": file.name, "mime_type": file.mime_type, "type": file.type},
+            created_by=created_by,
+        ))
+    else:
+        # Same "checked, nothing to index" sentinel the startup backfill uses.
+        await store_content_index(db, file.id, "")
+    return jobs
+
+
+async def store_content_index(db: AsyncSession, file_id: str, content: str, *conditions) -> None:
+    """Upsert *content* as *file_id*'s extracted text while the file row matches *conditions*."""
+    stmt = sqlite_insert(FileContent).from_select(
+        ["file_id", "content_index"],
+        select(FileModel.id, literal(content)).where(FileModel.id == file_id, *conditions),
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[FileContent.file_id],
+        set_={"content_index": stmt.excluded.content_index},
+    ))
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers_after_commit(session: Session) -> None:
+    if session.info.pop("wake_job_workers", False) and _active_pool is not None:
+        _active_pool.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_wake_after_rollback(session: Session) -> None:
+    session.info.pop("wake_job_workers", None)
+
+
+async def _run_thumbnail(payload: dict) -> str:
+    renditions = await run_in_process(
+        generate_thumbnails,
+        payload["source_path"],
+        payload["thumbnail_dir"],
+        payload["thumbnail_key"],
+        fmt=resolve_format(settings.thumbnail_format),
+    )
+    if not renditions:
+        raise RuntimeError("thumbnail generation failed")
+    return renditions[DEFAULT_THUMBNAIL_SIZE]
+
+
+async def _run_extract_text(payload: dict) -> Optional[str]:
+    return await asyncio.to_thread(
+        build_search_document,
+        payload["source_path"],
+        payload["name"],
+        payload["mime_type"],
+        payload["type"],
+    )
+
+
+def _is_current(payload: dict):
+    return (
+        FileModel.storage_path == payload["source_path"],
+        FileModel.version == payload["version"],
+    )
+
+
+async def _apply_thumbnail(db: AsyncSession, file_id: str, payload: dict, thumbnail_path: str) -> None:
+    previous = await db.scalar(
+        select(FileModel.thumbnail_path).where(FileModel.id == file_id, *_is_current(payload))
+    )
+    result = await db.execute(
+        update(FileModel)
+        .where(FileModel.id == file_id, *_is_current(payload))
+        # Keep updated_at: a finished thumbnail is not a user-visible modification.
+        .values(thumbnail_path=thumbnail_path, updated_at=FileModel.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # The file was deleted or replaced by a newer version meanwhile.
+        remove_thumbnails(thumbnail_path)
+    elif previous and previous != thumbnail_path:
+        remove_thumbnails(previous)
+
+
+async def _apply_extract_text(db: AsyncSession, file_id: str, payload: dict, content: Optional[str]) -> None:
+    await store_content_index(db, file_id, content or "", *_is_current(payload))
+
+
+JOB_HANDLERS = {
+    JOB_THUMBNAIL: (_run_thumbnail, _apply_thumbnail),
+    JOB_EXTRACT_TEXT: (_run_extract_text, _apply_extract_text),
+}
+
+
+class JobWorkerPool:
+    """asyncio workers draining ``background_jobs`` for one API process."""
+
+    def __init__(self, session_factory=None, workers: Optional[int] = None):
+        if session_factory is None:
+            from app.database import async_session as session_factory
+        self.session_factory = session_factory
+        self.workers = max(1, workers if workers is not None else settings.job_workers)
+        self._wake_event: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        global _active_pool
+        self._wake_event = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        _active_pool = self
+
+    async def stop(self) -> None:
+        global _active_pool
+        if _active_pool is self:
+            _active_pool = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def _worker(self) -> None:
+        while True:
+            self._wake_event.clear()
+            try:
+                processed = await self.run_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Background job worker error")
+                processed = False
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout=settings.job_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_until_idle(self) -> int:
+        """Process due jobs until none are left; returns how many ran."""
+        processed = 0
+        while await self.run_next():
+            processed += 1
+        return processed
+
+    async def run_next(self) -> bool:
+        job = await self._claim()
+        if job is None:
+            return False
+
+        payload = json.loads(job.payload or "{}")
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"unknown job kind {job.kind!r}")
+            async with self.session_factory() as db:
+                exists = await db.scalar(select(FileModel.id).where(FileModel.id == job.file_id))
+            result = await handler[0](payload) if exists else None
+        except Exception as exc:
+            await self._record_failure(job, exc)
+            return True
+
+        async with self.session_factory() as db:
+            if exists:
+                await handler[1](db, job.file_id, payload, result)
+            now = datetime.now(timezone.utc)
+            await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job.id)
+                .values(status="done", last_error=None, finished_at=now, updated_at=now)
+            )
+            await db.commit()
+        return True
+
+    async def _claim(self):
+        now = datetime.now(timezone.utc)
+        runnable = (
+            BackgroundJob.status.in_(("queued", "running")),
+            BackgroundJob.run_after <= now,
+            BackgroundJob.attempts < BackgroundJob.max_attempts,
+        )
+        next_job = (
+            select(BackgroundJob.id)
+            .where(*runnable)
+            .order_by(BackgroundJob.run_after)
+            .limit(1)
+            .scalar_subquery()
+        )
+        async with self.session_factory() as db:
+            # The process running the last attempt died: give up on the job
+            # rather than retry it forever
+            await db.execute(
+                update(BackgroundJob)
+                .where(
+                    BackgroundJob.status == "running",
+                    BackgroundJob.run_after <= now,
+                    BackgroundJob.attempts >= BackgroundJob.max_attempts,
+                )
+                .values(status="failed", last_error="Lease expired", finished_at=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            result = await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == next_job, *runnable)
+                .values(
+                    status="running",
+                    attempts=BackgroundJob.attempts + 1,
+                    run_after=now + timedelta(seconds=settings.job_lease_seconds),
+                    updated_at=now,
+                )
+                .returning(
+                    BackgroundJob.id,
+                    BackgroundJob.kind,
+                    BackgroundJob.file_id,
+                    BackgroundJob.payload,
+                    BackgroundJob.attempts,
+                    BackgroundJob.max_attempts,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            job = result.first()
+            await db.commit()
+        return job
+
+    async def _record_failure(self, job, exc: Exception) -> None:
+        now = datetime.now(timezone.utc)
+        values = {"last_error": f"{type(exc).__name__}: {exc}"[:1000], "updated_at": now}
+        if job.attempts >= job.max_attempts:
+            values.update(status="failed", finished_at=now)
+            logger.warning("Background job %s (%s) failed permanently: %s", job.id, job.kind, exc)
+        else:
+            delay = settings.job_retry_base_seconds * (2 ** (job.attempts - 1))
+            values.update(status="queued", run_after=now + timedelta(seconds=delay))
+        async with self.session_factory() as db:
+            await db.execute(update(BackgroundJob).where(BackgroundJob.id == job.id).values(**values))
+            await db.commit()
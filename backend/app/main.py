@@ -8,9 +8,16 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from app.change_log import ChangeLogCompactor
 from app.config import get_settings
 from app.database import init_db, engine
+from app.executors import shutdown_executors
+from app.jobs import JobWorkerPool
 from app.limiter import limiter
+from app.session_cache import LastSeenFlusher
+from app.storage_gc import StorageCollector
+from app.storage import get_storage, wait_for_unlinks
+from app.thumbnails import remove_thumbnails
 from app.routers import auth, files, folders, storage
 
 settings = get_settings()
@@ -19,21 +26,29 @@ settings = get_settings()
 async def run_migrations():
     """Add new columns to existing tables (SQLite doesn't support IF NOT EXISTS for columns)"""
     from sqlalchemy import text
+    from app.aggregates import aggregates_need_rebuild, rebuild_aggregates
+    from app.file_tree import rebuild_tree_index, tree_index_needs_rebuild
+    from app.search_index import ensure_search_index
     
     migrations = [
         ("users", "is_admin", "ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0"),
         ("users", "two_factor_enabled", "ALTER TABLE users ADD COLUMN two_factor_enabled BOOLEAN DEFAULT 0"),
         ("users", "two_factor_secret", "ALTER TABLE users ADD COLUMN two_factor_secret VARCHAR(64)"),
         ("users", "two_factor_pending_secret", "ALTER TABLE users ADD COLUMN two_factor_pending_secret VARCHAR(64)"),
-        ("files", "content_index", "ALTER TABLE files ADD COLUMN content_index TEXT"),
+        ("users", "change_log_floor", "ALTER TABLE users ADD COLUMN change_log_floor INTEGER NOT NULL DEFAULT 0"),
         ("files", "thumbnail_path", "ALTER TABLE files ADD COLUMN thumbnail_path VARCHAR(500)"),
         ("files", "version", "ALTER TABLE files ADD COLUMN version INTEGER DEFAULT 1"),
+        ("files", "parent_id", "ALTER TABLE files ADD COLUMN parent_id VARCHAR(36)"),
+        ("files", "subtree_size", "ALTER TABLE files ADD COLUMN subtree_size BIGINT NOT NULL DEFAULT 0"),
+        ("files", "subtree_count", "ALTER TABLE files ADD COLUMN subtree_count INTEGER NOT NULL DEFAULT 0"),
     ]
     
+    added = set()
     async with engine.begin() as conn:
         for table, column, sql in migrations:
             try:
                 await conn.execute(text(sql))
+                added.add((table, column))
                 print(f"[+] Added column {table}.{column}")
             except Exception:
                 pass  # nosec B110
@@ -48,13 +63,66 @@ async def run_migrations():
         except Exception:
             pass  # nosec B110
 
+        # Composite indexes for the hot listing/search/trash queries (see test_query_plans.py)
+        for index_sql in (
+            "CREATE INDEX IF NOT EXISTS ix_files_parent_id ON files (parent_id)",
+            "DROP INDEX IF EXISTS ix_files_owner_path_trashed",
+            "CREATE INDEX IF NOT EXISTS ix_files_owner_path_listing "
+            "ON files (owner_id, path, is_trashed, type, name, id)",
+            "CREATE INDEX IF NOT EXISTS ix_files_owner_trashed_updated ON files (owner_id, is_trashed, updated_at)",
+            "CREATE INDEX IF NOT EXISTS ix_files_owner_starred ON files (owner_id, is_starred)",
+            "CREATE INDEX IF NOT EXISTS ix_files_trashed_at ON files (trashed_at)",
+            "CREATE INDEX IF NOT EXISTS ix_share_links_owner_created ON share_links (owner_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_share_links_file_id ON share_links (file_id)",
+            "CREATE INDEX IF NOT EXISTS ix_activity_logs_user_timestamp ON activity_logs (user_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS ix_file_versions_storage_path ON file_versions (storage_path)",
+            "CREATE INDEX IF NOT EXISTS ix_shared_folders_user_owner ON shared_folders (user_id, owner_id)",
+        ):
+            await conn.execute(text(index_sql))
+
+        # Extracted text used to live in files.content_index; move it to file_contents
+        file_columns = {row[1] for row in (await conn.execute(text("PRAGMA table_info(files)"))).all()}
+        if "content_index" in file_columns:
+            await conn.execute(text(
+                "INSERT OR IGNORE INTO file_contents (file_id, content_index) "
+                "SELECT id, content_index FROM files WHERE content_index IS NOT NULL"
+            ))
+            # The old search triggers read the column; ensure_search_index recreates them below
+            await conn.execute(text("DROP TRIGGER IF EXISTS files_fts_ai"))
+            await conn.execute(text("DROP TRIGGER IF EXISTS files_fts_au"))
+            try:
+                await conn.execute(text("ALTER TABLE files DROP COLUMN content_index"))
+            except Exception:
+                # SQLite < 3.35 cannot drop columns; at least free the text
+                await conn.execute(text("UPDATE files SET content_index = NULL WHERE content_index IS NOT NULL"))
+            print("[+] Moved extracted text to file_contents")
+
+        # Backfill parent_id and the folder closure table from the JSON path column
+        # for rows written before the hierarchy existed.
+        tree_rebuilt = await tree_index_needs_rebuild(conn)
+        if tree_rebuilt:
+            indexed = await rebuild_tree_index(conn)
+            print(f"[+] Rebuilt folder hierarchy index for {indexed} files")
+
+        # Folder totals and per-type counters for databases that predate them
+        if tree_rebuilt or ("files", "subtree_size") in added or await aggregates_need_rebuild(conn):
+            await rebuild_aggregates(conn)
+            print("[+] Rebuilt folder size and per-type usage aggregates")
+
+        # FTS5 mirror of the searchable file columns (LIKE search is used if unavailable)
+        if await conn.run_sync(ensure_search_index):
+            print("[+] Ensured full-text search index")
+
 
 async def cleanup_old_trash():
     """Auto-delete files that have been in trash longer than trash_auto_delete_days."""
     from datetime import datetime, timedelta, timezone
     from sqlalchemy import select, and_
     from app.database import async_session
-    from app.models import File as FileModel, User, FileVersion
+    from app import quota
+    from app.models import File as FileModel, FileVersion
+    from app.change_log import record_changes
+    from app.file_tree import unlink_node
     
     days = settings.trash_auto_delete_days
     if days <= 0:
@@ -78,7 +146,10 @@ async def cleanup_old_trash():
             print(f"[*] Trash cleanup: no files older than {days} days")
             return
         
+        await record_changes(db, "deleted", [file.id for file in old_files])
+
         # Group by owner for storage accounting
+        storage = get_storage()
         owner_freed = {}
         deleted_count = 0
         
@@ -91,38 +162,24 @@ async def cleanup_old_trash():
 
             if versions:
                 for version in versions:
-                    if version.storage_path and os.path.exists(version.storage_path):
-                        try:
-                            os.remove(version.storage_path)
-                        except OSError:
-                            pass
+                    await storage.release(db, version.storage_path)
                     freed += version.size or 0
                     await db.delete(version)
             else:
-                if file.storage_path and os.path.exists(file.storage_path):
-                    try:
-                        os.remove(file.storage_path)
-                    except OSError:
-                        pass
+                await storage.release(db, file.storage_path)
                 freed += file.size or 0
 
-            # Delete thumbnail
-            if file.thumbnail_path and os.path.exists(file.thumbnail_path):
-                try:
-                    os.remove(file.thumbnail_path)
-                except OSError:
-                    pass
+            # Delete thumbnail renditions
+            remove_thumbnails(file.thumbnail_path)
             
             owner_freed[file.owner_id] = owner_freed.get(file.owner_id, 0) + freed
+            await unlink_node(db, file.id)
             await db.delete(file)
             deleted_count += 1
         
         # Update storage for each owner
         for owner_id, freed in owner_freed.items():
-            user_result = await db.execute(select(User).where(User.id == owner_id))
-            user = user_result.scalar_one_or_none()
-            if user:
-                user.storage_used = max(0, user.storage_used - freed)
+            await quota.credit(db, owner_id, freed)
         
         await db.commit()
         print(f"[+] Trash cleanup: deleted {deleted_count} files older than {days} days")
@@ -139,10 +196,10 @@ async def backfill_search_index():
     transactions small.  A non-blocking exclusive file lock prevents multiple
     workers from running the backfill concurrently in multi-worker deployments.
 
-    After processing, ``content_index`` is set to the extracted text, or to
-    ``""`` (empty string) as a sentinel for "checked – nothing to index".
-    Only rows with ``content_index IS NULL`` are treated as unprocessed, so
-    binary files are not re-examined on every startup.
+    After processing, each file has a ``file_contents`` row holding the
+    extracted text, or ``""`` (empty string) as a sentinel for "checked –
+    nothing to index".  Only files without a row are treated as unprocessed,
+    so binary files are not re-examined on every startup.
     """
     try:
         import fcntl as _fcntl
@@ -153,7 +210,8 @@ async def backfill_search_index():
 
     from sqlalchemy import select
     from app.database import async_session
-    from app.models import File as FileModel
+    from app.jobs import store_content_index
+    from app.models import File as FileModel, FileContent
     from app.search_index import build_search_document
 
     lock_path = "./data/.backfill.lock"
@@ -178,26 +236,31 @@ async def backfill_search_index():
         while True:
             async with async_session() as db:
                 result = await db.execute(
-                    select(FileModel)
-                    .where(FileModel.content_index.is_(None))
+                    select(FileModel.id, FileModel.storage_path, FileModel.name, FileModel.mime_type, FileModel.type)
+                    .where(~select(FileContent.file_id).where(FileContent.file_id == FileModel.id).exists())
                     .limit(BACKFILL_BATCH_SIZE)
                 )
-                files = result.scalars().all()
+                files = result.all()
 
                 if not files:
                     break
 
-                for file in files:
-                    indexed_content = await asyncio.to_thread(
+                # Read the whole batch before writing, so the write
+                # transaction is not held open across file reads.
+                contents = [
+                    await asyncio.to_thread(
                         build_search_document,
                         file.storage_path,
                         file.name,
                         file.mime_type,
                         file.type,
                     )
+                    for file in files
+                ]
+                for file, indexed_content in zip(files, contents):
                     # Use "" as a sentinel for "checked, nothing to index" so
                     # these rows are not revisited on the next startup.
-                    file.content_index = indexed_content or ""
+                    await store_content_index(db, file.id, indexed_content or "")
 
                 await db.commit()
                 total_updated += len(files)
@@ -255,8 +318,34 @@ async def lifespan(app: FastAPI):
     
     # Auto-cleanup old trashed files
     await cleanup_old_trash()
+
+    # Drain queued thumbnail / text-extraction jobs
+    job_pool = JobWorkerPool()
+    job_pool.start()
+    app.state.job_pool = job_pool
+
+    # Batched session last_seen_at writes
+    last_seen_flusher = LastSeenFlusher()
+    last_seen_flusher.start()
+    app.state.last_seen_flusher = last_seen_flusher
+
+    # Periodic cleanup of expired uploads and unreferenced files
+    storage_collector = StorageCollector()
+    storage_collector.start()
+    app.state.storage_collector = storage_collector
+
+    # Periodic compaction of the sync change feed
+    change_log_compactor = ChangeLogCompactor()
+    change_log_compactor.start()
+    app.state.change_log_compactor = change_log_compactor
     
     yield
+
+    await change_log_compactor.stop()
+    await storage_collector.stop()
+    await job_pool.stop()
+    await last_seen_flusher.stop()
+    shutdown_executors()
     
     # Shutdown — cancel the backfill if it is still running
     task = getattr(app.state, "backfill_task", None)
@@ -266,6 +355,12 @@ async def lifespan(app: FastAPI):
             await task
         except asyncio.CancelledError:
             pass
+
+    # Let released blobs finish unlinking before the pool closes
+    await wait_for_unlinks()
+
+    # Close pooled connections; the last one checkpoints the WAL
+    await engine.dispose()
     print("[*] Shutting down Home Cloud Drive API...")
 
 
@@ -286,6 +381,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Share-Resume"],
 )
 
 # Rate limiting
@@ -297,7 +393,7 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
 # Import additional routers
-from app.routers import admin, sharing, shared_folders
+from app.routers import admin, sharing, shared_folders, jobs, changes
 
 # Include routers
 app.include_router(auth.router)
@@ -307,6 +403,8 @@ app.include_router(storage.router)
 app.include_router(admin.router)
 app.include_router(sharing.router)
 app.include_router(shared_folders.router)
+app.include_router(jobs.router)
+app.include_router(changes.router)
 
 
 @app.get("/")
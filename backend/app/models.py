@@ -1,7 +1,7 @@
 """
 Home Cloud Drive - SQLAlchemy Models
 """
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, BigInteger, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, BigInteger, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
@@ -31,6 +31,7 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     storage_used = Column(BigInteger, default=0)  # bytes
     storage_quota = Column(BigInteger, default=107374182400)  # 100 GB
+    change_log_floor = Column(Integer, default=0, nullable=False)  # highest seq compacted out of the change feed
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -47,6 +48,17 @@ class User(Base):
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # Directory listings: owner + folder path + trash state, already in
+        # (type, name, id) order so keyset pages read straight off the index
+        Index("ix_files_owner_path_listing", "owner_id", "path", "is_trashed", "type", "name", "id"),
+        # Search, storage stats and trash views: owner + trash state, newest first
+        Index("ix_files_owner_trashed_updated", "owner_id", "is_trashed", "updated_at"),
+        # Starred view
+        Index("ix_files_owner_starred", "owner_id", "is_starred"),
+        # Trash auto-cleanup cutoff scan
+        Index("ix_files_trashed_at", "trashed_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     name = Column(String(255), nullable=False)
@@ -54,17 +66,22 @@ class File(Base):
     mime_type = Column(String(100), nullable=True)
     size = Column(BigInteger, default=0)  # bytes
     path = Column(Text, default="[]")  # JSON array of folder names
+    parent_id = Column(String(36), ForeignKey("files.id", ondelete="SET NULL"), nullable=True, index=True)
     storage_path = Column(String(500), nullable=True)  # actual file path on disk
     version = Column(Integer, default=1)
+
+    # Folder totals over untrashed descendants, maintained by app.aggregates (0 for files)
+    subtree_size = Column(BigInteger, default=0, nullable=False)
+    subtree_count = Column(Integer, default=0, nullable=False)
     
-    # Search & thumbnails
-    content_index = Column(Text, nullable=True)  # extracted text for full-text search
+    # Thumbnails
     thumbnail_path = Column(String(500), nullable=True)  # path to generated thumbnail
     
     # Ownership
     owner_id = Column(String(36), ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="files")
     versions = relationship("FileVersion", back_populates="file", cascade="all, delete-orphan", order_by="FileVersion.version")
+    content = relationship("FileContent", back_populates="file", cascade="all, delete-orphan", uselist=False)
     
     # Status flags
     is_starred = Column(Boolean, default=False)
@@ -76,10 +93,35 @@ class File(Base):
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
 
+class FileContent(Base):
+    """Derived content of a file, kept off ``files`` so listings stay narrow.
+
+    No row means the current content has not been processed yet; an empty
+    ``content_index`` means it was checked and had no text to index.
+    """
+    __tablename__ = "file_contents"
+
+    file_id = Column(String(36), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    content_index = Column(Text, nullable=True)  # extracted text for full-text search
+
+    file = relationship("File", back_populates="content")
+
+
+class FileClosure(Base):
+    """Ancestor/descendant pairs for the folder tree (includes a depth-0 self row)."""
+    __tablename__ = "file_closure"
+
+    ancestor_id = Column(String(36), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(String(36), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
+
+
 class FileVersion(Base):
     __tablename__ = "file_versions"
     __table_args__ = (
         UniqueConstraint("file_id", "version", name="uq_file_versions_file_id_version"),
+        # Reference lookups for blobs shared between versions
+        Index("ix_file_versions_storage_path", "storage_path"),
     )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
@@ -95,8 +137,90 @@ class FileVersion(Base):
     owner = relationship("User")
 
 
+class Blob(Base):
+    """Stored file data, shared by every file version with identical content."""
+    __tablename__ = "blobs"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    sha256 = Column(String(64), unique=True, nullable=True)  # NULL for adopted pre-dedup files
+    size = Column(BigInteger, default=0)
+    refcount = Column(Integer, nullable=False, default=0)  # file_versions rows using this blob
+    storage_path = Column(String(500), unique=True, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class BackgroundJob(Base):
+    """Durable queue entry for post-upload work (thumbnails, text extraction)."""
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        # Claim query: next runnable job by status and due time
+        Index("ix_background_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    kind = Column(String(50), nullable=False)  # thumbnail | extract_text
+    file_id = Column(String(36), ForeignKey("files.id", ondelete="CASCADE"), nullable=False, index=True)
+    owner_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_by = Column(String(36), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    payload = Column(Text, nullable=False, default="{}")  # JSON arguments for the handler
+    status = Column(String(20), nullable=False, default="queued")  # queued | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))  # due time, or lease expiry while running
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
+
+
+class UserTypeUsage(Base):
+    """Untrashed file count and bytes per owner and file type (see app.aggregates)"""
+    __tablename__ = "user_type_usage"
+
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    type = Column(String(50), primary_key=True)
+    file_count = Column(Integer, default=0, nullable=False)
+    total_size = Column(BigInteger, default=0, nullable=False)
+
+
+class UploadSession(Base):
+    """Resumable upload in progress; its data file lives under storage/tmp."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    path = Column(Text, default="[]")  # JSON array of target folder names
+    mime_type = Column(String(100), nullable=True)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    expected_chunks = Column(Integer, nullable=False)
+    chunk_map = Column(Text, nullable=False)  # one "0"/"1" character per chunk
+    received_chunks = Column(Integer, nullable=False, default=0)
+    received_bytes = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class QuotaReservation(Base):
+    """Quota held by an upload in flight; see app.quota."""
+    __tablename__ = "quota_reservations"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    upload_id = Column(String(36), nullable=True, unique=True)  # resumable upload holding it, if any
+    bytes = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=True, index=True)  # None while the upload session lives
+
+
 class ShareLink(Base):
     __tablename__ = "share_links"
+    __table_args__ = (
+        Index("ix_share_links_owner_created", "owner_id", "created_at"),
+        Index("ix_share_links_file_id", "file_id"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     token = Column(String(64), unique=True, nullable=False, default=generate_share_token, index=True)
@@ -119,6 +243,8 @@ class SharedFolderAccess(Base):
     __tablename__ = "shared_folders"
     __table_args__ = (
         UniqueConstraint("folder_id", "user_id", name="uq_shared_folders_folder_user"),
+        # A user's grants in one owner's tree (shared_access.load_shared_grants)
+        Index("ix_shared_folders_user_owner", "user_id", "owner_id"),
     )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
@@ -136,8 +262,30 @@ class SharedFolderAccess(Base):
     invited_by_user = relationship("User", foreign_keys=[invited_by])
 
 
+class FileChange(Base):
+    """One entry of an owner's change feed; ``seq`` only ever grows."""
+    __tablename__ = "file_changes"
+    __table_args__ = (
+        # Feed reads: one owner's entries after a sequence number
+        Index("ix_file_changes_owner_seq", "owner_id", "seq"),
+        # Compaction: newer entries for the same file
+        Index("ix_file_changes_file_seq", "file_id", "seq"),
+        # Never reuse the seq of a compacted entry
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(String(36), ForeignKey("users.id"), nullable=False)
+    file_id = Column(String(36), nullable=False)  # no FK: entries outlive purged files
+    action = Column(String(20), nullable=False)  # created, updated, moved, trashed, restored, deleted, version_added
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
+    __table_args__ = (
+        Index("ix_activity_logs_user_timestamp", "user_id", "timestamp"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,75 @@
+"""
+Opaque keyset cursors for paginated listings.
+
+A cursor carries the sort key of the last row on a page plus a short tag
+naming the ordering it belongs to, so a cursor from one listing cannot be
+replayed against a different ordering.  The next page is selected with a
+keyset predicate ("rows after this key") instead of OFFSET, which keeps
+every page as cheap as the first.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, tuple_
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "t" in value:
+        return datetime.fromisoformat(value["t"])
+    return value
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+    payload = json.dumps({"k": kind, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, size: int) -> list:
+    """Decode *cursor*, raising 400 unless it was issued for the *kind* ordering."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values = [_decode_value(v) for v in payload["v"]]
+        valid = payload["k"] == kind and len(values) == size
+    except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_after(order: Sequence[tuple[Any, bool]], values: Sequence[Any]):
+    """Build a predicate selecting rows that sort after *values*.
+
+    *order* lists ``(expression, descending)`` pairs matching the query's
+    ORDER BY.  Uniform directions use a row-value comparison, which SQLite
+    can turn into an index range seek; mixed directions expand to the
+    equivalent OR chain.
+    """
+    directions = {descending for _, descending in order}
+    if len(directions) == 1:
+        left = tuple_(*(expr for expr, _ in order))
+        right = tuple_(*values)
+        return left < right if directions.pop() else left > right
+
+    clauses = []
+    for position, (expr, descending) in enumerate(order):
+        step = expr < values[position] if descending else expr > values[position]
+        ties = [order[i][0] == values[i] for i in range(position)]
+        clauses.append(and_(*ties, step))
+    return or_(*clauses)
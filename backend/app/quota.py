@@ -0,0 +1,255 @@
+"""
+Home Cloud Drive - Storage quota reservations
+
+Uploads used to read ``users.storage_used`` in Python, stream the body, and
+then write ``storage_used += size``: parallel uploads could all pass the
+check, and the read-modify-write could lose increments.
+
+Quota is now checked in SQL.  An upload first reserves its expected size in
+``quota_reservations`` with a conditional ``INSERT ... SELECT`` that only
+inserts when ``storage_used`` plus the user's live reservations plus the new
+bytes fit the quota, and commits right away so no lock is held while the
+body streams.  Bodies of unknown length grow their reservation with a
+conditional ``UPDATE``.  On completion the transaction that records the file
+adds the real size to ``storage_used`` and deletes the reservation, so the
+total seen by other uploads never dips; on failure the reservation is
+deleted on its own.
+
+Reservations taken by a request expire after ``QUOTA_RESERVATION_TTL_SECONDS``
+and stop counting then, in case the process died before releasing them.
+Resumable uploads reserve at init and hold the reservation for as long as
+their ``upload_sessions`` row is live.  Direct charges without a reservation
+(copies, version restores) are one conditional ``UPDATE`` of the user row.
+"""
+from __future__ import annotations
+
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, String, and_, delete, func, insert, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.config import get_settings
+from app.models import QuotaReservation, UploadSession, User
+from app.session_cache import invalidate_user_sessions
+
+settings = get_settings()
+
+# Bodies of unknown length reserve at least this much more at a time
+GROW_STEP = 16 * 1024 * 1024
+
+
+@dataclass
+class Reservation:
+    id: str
+    user_id: str
+    bytes: int
+    used: int = 0  # consumed by earlier files of the same request
+
+    @property
+    def remaining(self) -> int:
+        return self.bytes - self.used
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _expiry(now: datetime) -> datetime:
+    return now + timedelta(seconds=max(1, settings.quota_reservation_ttl_seconds))
+
+
+def _live(now: datetime):
+    return or_(
+        QuotaReservation.expires_at > now,
+        QuotaReservation.upload_id.in_(select(UploadSession.id).where(UploadSession.expires_at > now)),
+    )
+
+
+def _reserved_bytes(user_id, now: datetime):
+    return (
+        select(func.coalesce(func.sum(QuotaReservation.bytes), 0))
+        .where(QuotaReservation.user_id == user_id, _live(now))
+        .scalar_subquery()
+    )
+
+
+def _fits(user_id, size: int, now: datetime):
+    """SQL condition on the ``users`` row: *size* more bytes stay within quota."""
+    return or_(
+        User.storage_quota <= 0,
+        func.coalesce(User.storage_used, 0) + _reserved_bytes(user_id, now) + size <= User.storage_quota,
+    )
+
+
+async def available(db: AsyncSession, user_id: str) -> Optional[int]:
+    """Bytes *user_id* may still reserve, or None when the quota is unlimited."""
+    now = _now()
+    row = (await db.execute(
+        select(User.storage_quota, func.coalesce(User.storage_used, 0) + _reserved_bytes(User.id, now))
+        .where(User.id == user_id)
+    )).one_or_none()
+    if row is None or row[0] <= 0:
+        return None
+    return max(0, row[0] - row[1])
+
+
+async def _quota_exceeded(db: AsyncSession, user_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Storage quota exceeded. Available: {await available(db, user_id) or 0} bytes",
+    )
+
+
+async def reserve(db: AsyncSession, user_id: str, size: int, *, upload_id: Optional[str] = None) -> Reservation:
+    """Hold *size* bytes of *user_id*'s quota, or raise 400 when they do not fit."""
+    now = _now()
+    await db.execute(delete(QuotaReservation).where(
+        QuotaReservation.user_id == user_id,
+        QuotaReservation.expires_at <= now,
+    ))
+    reservation_id = str(uuid.uuid4())
+    inserted = await db.scalar(
+        insert(QuotaReservation)
+        .from_select(
+            ["id", "user_id", "upload_id", "bytes", "created_at", "expires_at"],
+            select(
+                literal(reservation_id, String()),
+                User.id,
+                literal(upload_id, String()),
+                literal(size),
+                literal(now, DateTime()),
+                literal(None if upload_id else _expiry(now), DateTime()),
+            ).where(User.id == user_id, _fits(user_id, size, now)),
+        )
+        .returning(QuotaReservation.id)
+    )
+    if inserted is None:
+        raise await _quota_exceeded(db, user_id)
+    return Reservation(id=reservation_id, user_id=user_id, bytes=size)
+
+
+async def grow(db: AsyncSession, reservation: Reservation, shortfall: int) -> None:
+    """Extend *reservation* by at least *shortfall* bytes and commit, or raise 400."""
+    now = _now()
+    amounts = [max(shortfall, GROW_STEP)]
+    if shortfall < GROW_STEP:
+        amounts.append(shortfall)  # close to the quota, try for just what is needed
+    for amount in amounts:
+        grown = await db.scalar(
+            update(QuotaReservation)
+            .where(
+                QuotaReservation.id == reservation.id,
+                select(User.id).where(User.id == reservation.user_id, _fits(reservation.user_id, amount, now)).exists(),
+            )
+            .values(bytes=QuotaReservation.bytes + amount, expires_at=_expiry(now))
+            .returning(QuotaReservation.bytes)
+        )
+        if grown is not None:
+            reservation.bytes = grown
+            await db.commit()
+            return
+    raise await _quota_exceeded(db, reservation.user_id)
+
+
+async def release(
+    db: AsyncSession,
+    reservation_id: Optional[str] = None,
+    *,
+    upload_id: Optional[str] = None,
+) -> Optional[int]:
+    """Drop a reservation by id or resumable upload id; returns its bytes if it existed."""
+    condition = (
+        QuotaReservation.id == reservation_id
+        if reservation_id is not None
+        else QuotaReservation.upload_id == upload_id
+    )
+    return await db.scalar(delete(QuotaReservation).where(condition).returning(QuotaReservation.bytes))
+
+
+@asynccontextmanager
+async def reserved(db: AsyncSession, user_id: str, size: int) -> AsyncIterator[Reservation]:
+    """
+    Reserve *size* bytes and commit before the body is read.  The reservation
+    is dropped in the caller's transaction on success, and in a transaction
+    of its own if the block raises.
+    """
+    reservation = await reserve(db, user_id, size)
+    await db.commit()
+    try:
+        yield reservation
+    except Exception:
+        await db.rollback()
+        await release(db, reservation.id)
+        await db.commit()
+        raise
+    await release(db, reservation.id)
+
+
+def _sync_user(db: AsyncSession, user_id: str, storage_used: int) -> None:
+    """Refresh a loaded user without marking it dirty, and drop its cached sessions."""
+    user = db.sync_session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, "storage_used", storage_used)
+    invalidate_user_sessions(db, user_id)
+
+
+async def charge(db: AsyncSession, user_id: str, size: int, *, check: bool = True) -> None:
+    """
+    Add *size* to ``storage_used`` in one statement.  With *check*, the
+    update only applies when the bytes fit beside live reservations and
+    raises 400 otherwise; pass ``check=False`` when a reservation covers them.
+    """
+    if size == 0:
+        return
+    stmt = update(User).where(User.id == user_id)
+    if check:
+        stmt = stmt.where(_fits(user_id, size, _now()))
+    used = await db.scalar(
+        stmt.values(storage_used=func.coalesce(User.storage_used, 0) + size)
+        .returning(User.storage_used)
+        .execution_options(synchronize_session=False)
+    )
+    if used is None:
+        raise await _quota_exceeded(db, user_id)
+    _sync_user(db, user_id, used)
+
+
+async def credit(db: AsyncSession, user_id: str, size: int) -> None:
+    """Subtract freed bytes from ``storage_used`` in one statement, never below zero."""
+    if size == 0:
+        return
+    used = await db.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(storage_used=func.max(0, func.coalesce(User.storage_used, 0) - size))
+        .returning(User.storage_used)
+        .execution_options(synchronize_session=False)
+    )
+    if used is not None:
+        _sync_user(db, user_id, used)
+
+
+async def expire_reservations(db: AsyncSession) -> int:
+    """Delete reservations that no longer count; returns how many."""
+    now = _now()
+    expired = await db.scalars(
+        delete(QuotaReservation)
+        .where(
+            or_(
+                QuotaReservation.expires_at <= now,
+                and_(
+                    QuotaReservation.expires_at.is_(None),
+                    QuotaReservation.upload_id.not_in(select(UploadSession.id)),
+                ),
+            )
+        )
+        .returning(QuotaReservation.id)
+    )
+    return len(expired.all())
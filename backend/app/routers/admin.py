@@ -6,16 +6,28 @@ import os
 import shutil
 import asyncio
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, delete
 
 from app.database import get_db
 from app.limiter import limiter
-from app.models import User, File as FileModel, ActivityLog
-from app.schemas import AdminUserResponse, AdminUserUpdate, SystemStats, AdminPasswordReset
-from app.auth import get_admin_user, get_password_hash, revoke_user_sessions
+from app.models import User, File as FileModel, ActivityLog, FileChange, FileClosure, FileVersion, QuotaReservation, UploadSession, UserTypeUsage
+from app.schemas import (
+    AdminPasswordReset,
+    AdminUserResponse,
+    AdminUserUpdate,
+    CryptoExecutorStatus,
+    StorageGCReport,
+    StorageGCStatus,
+    SystemStats,
+)
+from app.auth import get_admin_user, get_password_hash_async, revoke_user_sessions
 from app.config import get_settings
+from app.executors import crypto_executor
+from app.storage import get_storage
+from app.storage_gc import GCAlreadyRunning, StorageCollector, gc_metrics
+from app import uploads
 
 settings = get_settings()
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
@@ -162,15 +174,42 @@ async def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Delete user's files from disk
+    # Drop the user's references to shared blobs; content still used by
+    # other users' files stays on disk.
+    storage = get_storage()
+    version_paths = await db.scalars(
+        select(FileVersion.storage_path)
+        .join(FileModel, FileModel.id == FileVersion.file_id)
+        .where(FileModel.owner_id == user_id)
+    )
+    for storage_path in version_paths.all():
+        await storage.release(db, storage_path)
+
+    # Delete user's remaining files (thumbnails, pre-dedup uploads) from disk
     user_storage_path = os.path.join(settings.storage_path, user.id)
     if os.path.exists(user_storage_path):
         await asyncio.to_thread(shutil.rmtree, user_storage_path, ignore_errors=True)
 
-    # Delete user's activity logs
+    # Drop unfinished resumable uploads and their data files
+    await db.execute(delete(UploadSession).where(UploadSession.user_id == user_id))
+    await db.execute(delete(UserTypeUsage).where(UserTypeUsage.user_id == user_id))
+    await db.execute(delete(QuotaReservation).where(QuotaReservation.user_id == user_id))
+    upload_temp_path = os.path.join(uploads.temp_root(), user.id)
+    if os.path.exists(upload_temp_path):
+        await asyncio.to_thread(shutil.rmtree, upload_temp_path, ignore_errors=True)
+
+    # Delete user's activity logs and change feed
     await db.execute(
         delete(ActivityLog).where(ActivityLog.user_id == user_id)
     )
+    await db.execute(delete(FileChange).where(FileChange.owner_id == user_id))
+
+    # Drop the user's folder hierarchy index rows
+    await db.execute(
+        delete(FileClosure).where(
+            FileClosure.descendant_id.in_(select(FileModel.id).where(FileModel.owner_id == user_id))
+        )
+    )
 
     # Delete user (cascades to files via relationship)
     await db.delete(user)
@@ -198,7 +237,7 @@ async def reset_user_password(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.password_hash = get_password_hash(data.new_password)
+    user.password_hash = await get_password_hash_async(data.new_password)
     await revoke_user_sessions(db, user.id)
     await db.flush()
 
@@ -253,3 +292,38 @@ async def get_system_stats(
         disk_total=disk_total,
         disk_free=disk_free,
     )
+
+
+@router.get("/crypto", response_model=CryptoExecutorStatus)
+@limiter.limit("60/minute")
+async def get_crypto_executor_status(
+    request: Request,
+    admin: User = Depends(get_admin_user),
+):
+    """Queue depth and counters of the password hashing executor"""
+    return CryptoExecutorStatus.model_validate(crypto_executor.metrics)
+
+
+@router.get("/storage/gc", response_model=StorageGCStatus)
+@limiter.limit("60/minute")
+async def get_storage_gc_status(
+    request: Request,
+    admin: User = Depends(get_admin_user),
+):
+    """Totals reclaimed by storage garbage collection and the last run's report"""
+    return StorageGCStatus.model_validate(gc_metrics)
+
+
+@router.post("/storage/gc", response_model=StorageGCReport)
+@limiter.limit("5/minute")
+async def run_storage_gc(
+    request: Request,
+    dry_run: bool = Query(True, description="Only report what would be removed"),
+    admin: User = Depends(get_admin_user),
+):
+    """Run storage garbage collection now; a dry run by default"""
+    try:
+        report = await StorageCollector().collect(dry_run=dry_run)
+    except GCAlreadyRunning as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return StorageGCReport.model_validate(report)
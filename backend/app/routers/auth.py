@@ -20,12 +20,12 @@ from app.auth import (
     create_temporary_login_token,
     generate_totp_secret,
     get_current_user,
-    get_password_hash,
+    get_password_hash_async,
     get_session_by_id,
     get_user_by_email,
     get_user_by_username,
     revoke_user_sessions,
-    verify_password,
+    verify_password_async,
     verify_password_reset_token,
     verify_temporary_login_token,
     verify_totp_code,
@@ -48,6 +48,7 @@ from app.schemas import (
     UserCreate,
     UserResponse,
 )
+from app.session_cache import last_seen_buffer
 
 settings = get_settings()
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
@@ -229,7 +230,7 @@ def build_session_response(session: UserSession, current_session_id: str | None)
         user_agent=session.user_agent,
         device_name=session.device_name,
         created_at=session.created_at,
-        last_seen_at=session.last_seen_at,
+        last_seen_at=last_seen_buffer.pending(session.id) or session.last_seen_at,
         expires_at=session.expires_at,
         revoked_at=session.revoked_at,
         is_suspicious=session.is_suspicious,
@@ -258,7 +259,7 @@ async def register(request: Request, user_data: UserCreate, db: AsyncSession = D
     new_user = User(
         email=user_data.email,
         username=user_data.username,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=await get_password_hash_async(user_data.password),
         storage_quota=settings.max_storage_bytes,
     )
 
@@ -440,7 +441,7 @@ async def disable_two_factor(
     if not current_user.two_factor_enabled or not current_user.two_factor_secret:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="2FA is not enabled")
 
-    if not verify_password(payload.password, current_user.password_hash):
+    if not await verify_password_async(payload.password, current_user.password_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Current password is incorrect")
 
     if not verify_totp_code(current_user.two_factor_secret, payload.code):
@@ -464,7 +465,7 @@ async def change_password(
     db: AsyncSession = Depends(get_db),
 ):
     """Change the current user's password."""
-    if not verify_password(data.current_password, current_user.password_hash):
+    if not await verify_password_async(data.current_password, current_user.password_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Current password is incorrect")
 
     if data.current_password == data.new_password:
@@ -473,7 +474,7 @@ async def change_password(
             detail="New password must be different from current password",
         )
 
-    current_user.password_hash = get_password_hash(data.new_password)
+    current_user.password_hash = await get_password_hash_async(data.new_password)
     await revoke_user_sessions(db, current_user.id, exclude_session_id=current_session_id)
     await db.flush()
 
@@ -534,13 +535,13 @@ async def reset_password(
             detail="Invalid or expired password reset link",
         )
 
-    if verify_password(data.new_password, result.password_hash):
+    if await verify_password_async(data.new_password, result.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from your current password",
         )
 
-    result.password_hash = get_password_hash(data.new_password)
+    result.password_hash = await get_password_hash_async(data.new_password)
     await revoke_user_sessions(db, result.id)
 
     return {"detail": "Password reset successfully. You can now sign in."}
@@ -0,0 +1,74 @@
+"""
+Home Cloud Drive - Change Feed Router
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+
+from app.auth import get_current_user
+from app.change_log import latest_seq
+from app.database import get_db
+from app.limiter import limiter
+from app.models import File as FileModel, FileChange, User
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.routers.files import LISTING_COLUMNS, to_file_response
+from app.schemas import ChangeEntry, ChangeFeedPage
+
+router = APIRouter(prefix="/api/changes", tags=["Changes"])
+
+
+@router.get("", response_model=ChangeFeedPage)
+@limiter.limit("120/minute")
+async def list_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Changes to the caller's files after sequence number *since*, oldest first.
+
+    Without *since* only the current position is returned: fetch it, list the
+    tree, then poll from it (changes made in between are replayed, not lost).
+    """
+    if since is None:
+        return ChangeFeedPage(changes=[], next_since=await latest_seq(db, current_user.id))
+
+    rows = (await db.execute(
+        select(FileChange, FileModel)
+        .select_from(FileChange)
+        .outerjoin(FileModel, FileModel.id == FileChange.file_id)
+        .options(load_only(*LISTING_COLUMNS, raiseload=True))
+        .where(FileChange.owner_id == current_user.id, FileChange.seq > since)
+        .order_by(FileChange.seq)
+        .limit(limit + 1)
+    )).all()
+
+    # Read after the entries: a compaction that removed any of them has
+    # raised the floor in the same transaction
+    floor = await db.scalar(select(User.change_log_floor).where(User.id == current_user.id))
+    if since < (floor or 0):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Changes since this position are no longer available; list the files again",
+        )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ChangeFeedPage(
+        changes=[
+            ChangeEntry(
+                seq=change.seq,
+                file_id=change.file_id,
+                action=change.action,
+                changed_at=change.created_at,
+                file=to_file_response(file) if file is not None else None,
+            )
+            for change, file in rows
+        ],
+        next_since=rows[-1][0].seq if rows else since,
+        has_more=has_more,
+    )
@@ -5,27 +5,37 @@ import os
 import json
 import uuid
 import asyncio
+import shutil
 import aiofiles
 import mimetypes
 import unicodedata
 from urllib.parse import quote
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, update as sql_update
+from sqlalchemy import select, and_, or_, func, insert, literal, update as sql_update
+from sqlalchemy.orm import load_only
 from sqlalchemy.exc import IntegrityError
 import logging
 
 from app.database import get_db
 from app.limiter import limiter
-from app.models import User, File as FileModel, ActivityLog, FileVersion, ShareLink
+from app.models import User, File as FileModel, ActivityLog, FileClosure, FileContent, FileVersion, ShareLink
 from app.schemas import (
     FileResponse as FileResponseSchema,
+    FileListPage,
     FileUpdate,
     FileMoveRequest,
+    ArchiveRequest,
+    ArchiveLinkResponse,
+    BulkFileRequest,
+    BulkFileResponse,
+    BulkFileResult,
     SearchResult,
+    SearchResultPage,
     FileVersionResponse,
     ChunkedUploadInitRequest,
     ChunkedUploadInitResponse,
@@ -35,18 +45,50 @@ from app.schemas import (
 from app.auth import get_current_user
 from app.config import get_settings
 from app.db_utils import LIKE_ESCAPE_CHAR, escape_like_literal, prefix_like_pattern
-from app.search_index import build_match_context, build_search_document
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, keyset_after
+from app.file_tree import link_node, move_subtree, move_subtrees, rewrite_subtree_paths, subtree_ids, unlink_node
+from app import aggregates, search_index
+from app.change_log import record_changes
+from app.search_index import (
+    build_match_context,
+    files_fts,
+    fts_content_snippet,
+    fts_join_condition,
+    fts_match_clause,
+    fts_match_expression,
+    fts_rank,
+)
+from app.archives import ARCHIVE_MEDIA_TYPE, ArchiveEntry, archive_name, stream_zip, unique_names
+from app.downloads import content_etag, send_file
+from app.storage import get_storage, new_hasher
+from app import quota, uploads
 from app.shared_access import (
     FileAccessContext,
     get_file_access_context,
+    get_file_access_contexts,
     get_shared_root_access,
-    get_serialized_path_variants as get_shared_path_variants,
     parse_path as parse_shared_path,
-    path_prefixes_for_shared_root,
     relative_path_within_shared_root,
     resolve_target_path,
 )
-from app.thumbnails import generate_thumbnail, can_generate_thumbnail
+from app.jobs import JOB_THUMBNAIL, enqueue_file_processing, enqueue_job
+from app.thumbnails import (
+    can_generate_thumbnail,
+    ensure_rendition,
+    media_type_for,
+    nearest_rendition_size,
+    remove_thumbnails,
+    rendition_path,
+    resolve_format,
+    thumbnail_key,
+)
+from app.signed_urls import (
+    signed_archive_url,
+    signed_cache_control,
+    signed_preview_url,
+    signed_thumbnail_url,
+    verify_signed_url,
+)
 from app.tree_validation import normalize_tree_path, sanitize_tree_name, ensure_folder_path_exists
 
 settings = get_settings()
@@ -57,8 +99,8 @@ router = APIRouter(prefix="/api/files", tags=["Files"])
 _MAX_VERSION_RETRIES = 5
 
 CHUNK_SIZE = 1024 * 1024  # 1 MB chunks for streaming uploads
+BULK_BATCH_SIZE = 500  # ids per IN (...) list in bulk statements
 RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024
-UPLOAD_METADATA_FILENAME = "upload.json"
 
 
 def sanitize_filename(filename: Optional[str]) -> str:
@@ -171,11 +213,7 @@ def validate_upload_id(upload_id: str) -> str:
 
 
 def get_upload_temp_dir(user_id: str, upload_id: str) -> str:
-    return os.path.join(settings.storage_path, "tmp", user_id, upload_id)
-
-
-def get_upload_metadata_path(temp_dir: str) -> str:
-    return os.path.join(temp_dir, UPLOAD_METADATA_FILENAME)
+    return uploads.temp_dir_for(user_id, upload_id)
 
 
 def get_expected_chunk_count(total_size: int, chunk_size: int) -> int:
@@ -193,120 +231,259 @@ def get_expected_chunk_size(total_size: int, chunk_size: int, chunk_index: int)
     return chunk_size
 
 
-async def write_upload_metadata(
-    temp_dir: str,
-    total_size: int,
-    chunk_size: int,
-    filename: Optional[str] = None,
-    path: Optional[List[str]] = None,
-    mime_type: Optional[str] = None,
-) -> None:
-    metadata = {
-        "total_size": total_size,
-        "chunk_size": chunk_size,
-        "expected_chunks": get_expected_chunk_count(total_size, chunk_size),
-    }
-    if filename is not None:
-        metadata["filename"] = filename
-    if path is not None:
-        metadata["path"] = path
-    if mime_type is not None:
-        metadata["mime_type"] = mime_type
-
-    async with aiofiles.open(get_upload_metadata_path(temp_dir), "w", encoding="utf-8") as handle:
-        await handle.write(json.dumps(metadata, separators=(",", ":")))
-
-
-async def read_upload_metadata(temp_dir: str) -> dict:
-    metadata_path = get_upload_metadata_path(temp_dir)
-    if not os.path.exists(metadata_path):
-        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+def spooled_size(upload: UploadFile) -> int:
+    """Size of a parsed multipart file, measured on its spooled copy when not recorded."""
+    if upload.size is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
 
+
+async def iter_upload_file(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Read a multipart ``UploadFile`` in ``CHUNK_SIZE`` pieces."""
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def coalesce_chunks(chunks: AsyncIterator[bytes], block_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Regroup small body messages (typically 64 KB) into ``block_size`` blocks
+    so every thread-pool file write moves a useful amount of data.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= block_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def raw_body_mime_type(request: Request, filename: str) -> Optional[str]:
+    """Mime type of a raw upload: the request's Content-Type unless it is generic."""
+    content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    if content_type and content_type != "application/octet-stream":
+        return content_type
+    return mimetypes.guess_type(filename)[0] or content_type or None
+
+
+def check_declared_length(request: Request, too_large_detail: str) -> int:
+    """Content-Length of a raw upload (0 when absent); rejects it up front when over the size limit."""
     try:
-        async with aiofiles.open(metadata_path, "r", encoding="utf-8") as handle:
-            metadata = json.loads(await handle.read())
-    except (OSError, json.JSONDecodeError) as exc:
-        raise HTTPException(status_code=400, detail="Upload session metadata is invalid") from exc
+        declared = max(0, int(request.headers.get("content-length", "")))
+    except ValueError:
+        return 0
+    if settings.max_file_size_bytes > 0 and declared > settings.max_file_size_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large_detail)
+    return declared
 
+
+async def stream_to_staging(
+    chunks: AsyncIterator[bytes],
+    staged_path: str,
+    *,
+    reservation: quota.Reservation,
+    too_large_detail: str,
+    failure_detail: str = "Failed to save file",
+    db: Optional[AsyncSession] = None,
+) -> tuple[int, str]:
+    """
+    Write *chunks* to *staged_path*, hashing for the blob store as it goes.
+
+    ``max_file_size_bytes`` and the quota *reservation* are enforced per
+    block, so an oversized body is cut off as soon as it crosses the limit.
+    When *db* is given, a body that outgrows the reservation grows it instead
+    (for bodies of unknown length). Returns ``(size, sha256 hex digest)``;
+    the staged file is removed on error.
+    """
+    file_size = 0
+    digest = new_hasher()
     try:
-        total_size = int(metadata["total_size"])
-        chunk_size = int(metadata["chunk_size"])
-        expected_chunks = int(metadata["expected_chunks"])
-    except (KeyError, TypeError, ValueError) as exc:
-        raise HTTPException(status_code=400, detail="Upload session metadata is invalid") from exc
+        async with aiofiles.open(staged_path, "wb") as handle:
+            async for block in coalesce_chunks(chunks):
+                file_size += len(block)
+                if settings.max_file_size_bytes > 0 and file_size > settings.max_file_size_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large_detail)
+                if file_size > reservation.remaining:
+                    if db is None:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Storage quota exceeded.")
+                    await quota.grow(db, reservation, file_size - reservation.remaining)
+                digest.update(block)
+                await handle.write(block)
+    except HTTPException:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise
+    except ClientDisconnect as exc:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise HTTPException(status_code=400, detail="Upload was interrupted") from exc
+    except Exception as exc:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise HTTPException(status_code=500, detail=f"{failure_detail}: {exc}")
+    reservation.used += file_size
+    return file_size, digest.hexdigest()
+
+
+async def resolve_upload_target(
+    db: AsyncSession,
+    current_user: User,
+    path: List[str],
+    shared_folder_id: Optional[str],
+) -> tuple[List[str], FileAccessContext, User, Optional[str]]:
+    """Resolve where an upload lands: (target path, access, owner, parent folder id)."""
+    target_path, access_ctx = await resolve_target_path(
+        db,
+        current_user,
+        path,
+        shared_folder_id=shared_folder_id,
+        required_role="editor",
+    )
+    target_owner = current_user if access_ctx.is_owner else await db.get(User, access_ctx.owner_id)
+    if target_owner is None:
+        raise HTTPException(status_code=404, detail="Target owner not found")
+    parent_id = await ensure_folder_path_exists(db, target_owner.id, target_path)
+    os.makedirs(os.path.join(settings.storage_path, target_owner.id), exist_ok=True)
+    return target_path, access_ctx, target_owner, parent_id
 
-    if total_size < 0 or chunk_size <= 0 or expected_chunks != get_expected_chunk_count(total_size, chunk_size):
-        raise HTTPException(status_code=400, detail="Upload session metadata is invalid")
 
-    raw_path = metadata.get("path")
-    if isinstance(raw_path, str):
-        try:
-            raw_path = json.loads(raw_path)
-        except Exception:
-            raw_path = []
-    if raw_path is not None and not isinstance(raw_path, list):
-        raw_path = []
-
-    return {
-        "total_size": total_size,
-        "chunk_size": chunk_size,
-        "expected_chunks": expected_chunks,
-        "filename": metadata.get("filename"),
-        "path": raw_path,
-        "mime_type": metadata.get("mime_type"),
-    }
-
-
-def _get_uploaded_bytes(temp_dir: str) -> int:
-    uploaded_bytes = 0
-    for name in os.listdir(temp_dir):
-        if not name.startswith("chunk_"):
-            continue
-        try:
-            uploaded_bytes += os.path.getsize(os.path.join(temp_dir, name))
-        except OSError:
-            continue
-    return uploaded_bytes
+async def record_uploaded_file(
+    db: AsyncSession,
+    *,
+    current_user: User,
+    target_owner: User,
+    access_ctx: FileAccessContext,
+    target_path: List[str],
+    parent_id: Optional[str],
+    filename: str,
+    mime_type: Optional[str],
+    size: int,
+    storage_path: str,
+) -> FileResponseSchema:
+    """
+    Add the file row, its first version, processing jobs and activity for a
+    finished upload. The caller holds a quota reservation covering *size*.
+    """
+    file_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    new_file = FileModel(
+        id=file_id,
+        name=filename,
+        type=get_file_type(filename, mime_type),
+        mime_type=mime_type,
+        size=size,
+        path=serialize_path(target_path),
+        parent_id=parent_id,
+        storage_path=storage_path,
+        owner_id=target_owner.id,
+        is_starred=False,
+        is_trashed=False,
+        version=1,
+        created_at=now,
+        updated_at=now,
+    )
 
+    db.add(new_file)
+    await link_node(db, file_id, parent_id)
+    await aggregates.record_created(db, new_file)
+    # Thumbnail and text extraction run on the job workers, off the request path
+    await enqueue_file_processing(
+        db,
+        new_file,
+        thumbnail_dir=os.path.join(settings.storage_path, target_owner.id, "thumbnails"),
+        thumbnail_key=file_id,
+        created_by=current_user.id,
+    )
+    db.add(FileVersion(
+        file_id=file_id,
+        version=1,
+        size=size,
+        mime_type=mime_type,
+        storage_path=storage_path,
+        created_at=now,
+        created_by=current_user.id,
+    ))
 
-def get_uploaded_chunks(temp_dir: str, metadata: dict) -> tuple[list[int], int]:
-    uploaded_chunks: list[int] = []
-    uploaded_bytes = 0
-    try:
-        entries = os.listdir(temp_dir)
-    except OSError:
-        return [], 0
-    for name in entries:
-        if not name.startswith("chunk_"):
-            continue
-        try:
-            chunk_index = int(name.split("_", 1)[1])
-        except (ValueError, IndexError):
-            continue
+    # Quota is charged per logical file, even when the content is deduplicated
+    await quota.charge(db, target_owner.id, size, check=False)
 
-        if chunk_index < 0 or chunk_index >= metadata["expected_chunks"]:
-            continue
+    db.add(ActivityLog(
+        user_id=current_user.id,
+        action="upload",
+        file_name=filename,
+    ))
+    await record_changes(db, "created", [file_id])
 
-        chunk_path = os.path.join(temp_dir, name)
-        try:
-            chunk_size = os.path.getsize(chunk_path)
-        except OSError:
-            continue
+    response_path = (
+        relative_path_within_shared_root(new_file, access_ctx.shared_root)
+        if access_ctx.shared_root is not None
+        else None
+    )
+    return to_file_response(new_file, access_ctx, path_override=response_path)
 
-        expected_size = get_expected_chunk_size(
-            metadata["total_size"],
-            metadata["chunk_size"],
-            chunk_index,
-        )
-        if chunk_size != expected_size:
-            continue
 
-        uploaded_chunks.append(chunk_index)
-        uploaded_bytes += chunk_size
+async def store_upload_chunk(
+    db: AsyncSession,
+    current_user: User,
+    upload_id: str,
+    chunk_index: int,
+    chunks: AsyncIterator[bytes],
+) -> dict:
+    """Write one resumable-upload chunk in place; it only counts once all of it arrived."""
+    upload_id = validate_upload_id(upload_id)
+    session = await uploads.get_session(db, current_user.id, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+
+    expected_chunk_size = get_expected_chunk_size(session.total_size, session.chunk_size, chunk_index)
+    if uploads.is_chunk_received(session, chunk_index):
+        return {"status": "ok", "message": f"Chunk {chunk_index} already received"}
+    # Don't hold a read transaction open while the chunk body streams in
+    await db.commit()
+
+    # Written in place at the chunk's offset in the preallocated data file
+    temp_dir = get_upload_temp_dir(current_user.id, upload_id)
+    offset = chunk_index * session.chunk_size
+    hasher = uploads.digest_for_chunk(upload_id, chunk_index)
+    bytes_written = 0
+    try:
+        fd = await asyncio.to_thread(uploads.open_data_file, temp_dir)
+    except OSError as exc:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired") from exc
+    try:
+        async for data in coalesce_chunks(chunks):
+            if bytes_written + len(data) > expected_chunk_size:
+                raise HTTPException(status_code=400, detail="Chunk exceeds declared upload size")
+            await asyncio.to_thread(uploads.pwrite_all, fd, data, offset + bytes_written)
+            if hasher is not None:
+                hasher.update(data)
+            bytes_written += len(data)
+    except HTTPException:
+        raise
+    except ClientDisconnect as exc:
+        raise HTTPException(status_code=400, detail="Upload was interrupted") from exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save chunk: {e}")
+    finally:
+        os.close(fd)
 
-    uploaded_chunks = sorted(set(uploaded_chunks))
-    uploaded_bytes = min(uploaded_bytes, metadata["total_size"])
-    return uploaded_chunks, uploaded_bytes
+    if bytes_written != expected_chunk_size:
+        raise HTTPException(status_code=400, detail="Chunk is smaller than declared upload size")
+
+    if not await uploads.mark_chunk_received(db, upload_id, chunk_index, bytes_written):
+        return {"status": "ok", "message": f"Chunk {chunk_index} already received"}
+    if hasher is not None:
+        uploads.advance_digest(upload_id, chunk_index, hasher)
+
+    return {"status": "ok", "message": f"Chunk {chunk_index} received"}
 
 
 async def get_next_version_number(db: AsyncSession, file_id: str) -> int:
@@ -346,7 +523,8 @@ async def ensure_base_version(file: FileModel, db: AsyncSession, owner_id: str)
 async def purge_file(db: AsyncSession, file: FileModel) -> int:
     """Delete a file and all of its versions from disk and database.
 
-    Returns the total number of bytes freed for storage accounting.
+    Blobs still referenced by other files or versions are kept. Returns the
+    total number of logical bytes freed for storage accounting.
     """
     freed_bytes = 0
     versions_result = await db.execute(
@@ -354,34 +532,190 @@ async def purge_file(db: AsyncSession, file: FileModel) -> int:
     )
     versions = versions_result.scalars().all()
 
+    storage = get_storage()
     if versions:
         for version in versions:
-            if version.storage_path and os.path.exists(version.storage_path):
-                try:
-                    os.remove(version.storage_path)
-                except OSError:
-                    pass
+            await storage.release(db, version.storage_path)
             freed_bytes += version.size or 0
             await db.delete(version)
     else:
         # Legacy rows without versions — fall back to file.storage_path/size.
-        if file.storage_path and os.path.exists(file.storage_path):
-            try:
-                os.remove(file.storage_path)
-            except OSError:
-                pass
+        await storage.release(db, file.storage_path)
         freed_bytes += file.size or 0
 
-    if file.thumbnail_path and os.path.exists(file.thumbnail_path):
-        try:
-            os.remove(file.thumbnail_path)
-        except OSError:
-            pass
+    remove_thumbnails(file.thumbnail_path)
 
+    await unlink_node(db, file.id)
     await db.delete(file)
     return freed_bytes
 
 
+def batched(ids: List[str], size: int = BULK_BATCH_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+async def purge_files(db: AsyncSession, file_ids: List[str]) -> dict[str, int]:
+    """Set-based :func:`purge_file` for many rows (callers include whole subtrees).
+
+    Returns the logical bytes freed per owner id.
+    """
+    freed: dict[str, int] = {}
+    references: dict[str, int] = {}
+    for batch in batched(file_ids):
+        files = (await db.execute(
+            select(FileModel.id, FileModel.owner_id, FileModel.size, FileModel.storage_path, FileModel.thumbnail_path)
+            .where(FileModel.id.in_(batch))
+        )).all()
+        versions = (await db.execute(
+            select(FileVersion.file_id, FileVersion.size, FileVersion.storage_path)
+            .where(FileVersion.file_id.in_(batch))
+        )).all()
+
+        versioned = set()
+        owners = {row.id: row.owner_id for row in files}
+        for version in versions:
+            versioned.add(version.file_id)
+            owner_id = owners.get(version.file_id)
+            if owner_id is not None:
+                freed[owner_id] = freed.get(owner_id, 0) + (version.size or 0)
+            if version.storage_path:
+                references[version.storage_path] = references.get(version.storage_path, 0) + 1
+        for row in files:
+            if row.id not in versioned:
+                # Legacy rows without versions — fall back to file.storage_path/size.
+                freed[row.owner_id] = freed.get(row.owner_id, 0) + (row.size or 0)
+                if row.storage_path:
+                    references[row.storage_path] = references.get(row.storage_path, 0) + 1
+            remove_thumbnails(row.thumbnail_path)
+
+        await db.execute(FileVersion.__table__.delete().where(FileVersion.file_id.in_(batch)))
+        await db.execute(FileContent.__table__.delete().where(FileContent.file_id.in_(batch)))
+        await db.execute(
+            FileClosure.__table__.delete().where(
+                or_(FileClosure.ancestor_id.in_(batch), FileClosure.descendant_id.in_(batch))
+            )
+        )
+        await db.execute(FileModel.__table__.delete().where(FileModel.id.in_(batch)))
+
+    await get_storage().release_many(db, references)
+    return freed
+
+
+async def prepare_version_upload(
+    db: AsyncSession,
+    current_user: User,
+    file_id: str,
+) -> tuple[FileModel, FileAccessContext, User]:
+    """Check that a new version may be uploaded; returns (file, access, owner)."""
+    file, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="editor")
+    if file.type == "folder":
+        raise HTTPException(status_code=400, detail="Folders do not support versions")
+    if file.is_trashed:
+        raise HTTPException(status_code=400, detail="Restore the file before adding versions")
+
+    await ensure_base_version(file, db, file.owner_id)
+
+    owner_user = current_user if access_ctx.is_owner else await db.get(User, file.owner_id)
+    if owner_user is None:
+        raise HTTPException(status_code=404, detail="File owner not found")
+    os.makedirs(os.path.join(settings.storage_path, file.owner_id), exist_ok=True)
+    return file, access_ctx, owner_user
+
+
+async def record_new_version(
+    db: AsyncSession,
+    file: FileModel,
+    access_ctx: FileAccessContext,
+    *,
+    current_user: User,
+    owner_user: User,
+    mime_type: Optional[str],
+    size: int,
+    storage_path: str,
+) -> FileResponseSchema:
+    """
+    Point *file* at freshly ingested content and record it as the next
+    version. The caller holds a quota reservation covering *size*.
+    """
+    next_version = await get_next_version_number(db, file.id)
+    now = datetime.now(timezone.utc)
+    old_type, old_size = file.type, file.size
+    file.version = next_version
+    file.size = size
+    file.mime_type = mime_type
+    file.type = get_file_type(file.name, mime_type)
+    file.storage_path = storage_path
+    file.updated_at = now
+    await aggregates.record_replaced(db, file, old_type, old_size)
+
+    for _vretry in range(_MAX_VERSION_RETRIES):
+        try:
+            async with db.begin_nested():
+                db.add(FileVersion(
+                    file_id=file.id,
+                    version=next_version,
+                    size=size,
+                    mime_type=mime_type,
+                    storage_path=storage_path,
+                    created_at=now,
+                    created_by=current_user.id,
+                ))
+                await db.flush()
+            break
+        except IntegrityError:
+            if _vretry >= _MAX_VERSION_RETRIES - 1:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Version conflict; please retry the upload",
+                )
+            next_version = await get_next_version_number(db, file.id)
+            file.version = next_version
+
+    # Queue processing once the final storage path and version are settled;
+    # the previous thumbnail stays in place until the new one replaces it.
+    await enqueue_file_processing(
+        db,
+        file,
+        thumbnail_dir=os.path.join(settings.storage_path, file.owner_id, "thumbnails"),
+        thumbnail_key=f"{file.id}-v{next_version}",
+        created_by=current_user.id,
+    )
+
+    await quota.charge(db, owner_user.id, size, check=False)
+
+    activity = ActivityLog(
+        user_id=current_user.id,
+        action="version_upload",
+        file_name=f"{file.name} v{next_version}",
+    )
+    db.add(activity)
+    await record_changes(db, "version_added", [file.id])
+    await db.flush()
+    await db.refresh(file)
+    response_path = (
+        relative_path_within_shared_root(file, access_ctx.shared_root)
+        if access_ctx.shared_root is not None
+        else None
+    )
+    return to_file_response(file, access_ctx, path_override=response_path)
+
+
+PREVIEWABLE_TYPES = {"image", "video", "pdf", "text"}
+
+
+def thumbnail_url_for(file: FileModel) -> Optional[str]:
+    if not file.thumbnail_path:
+        return None
+    return signed_thumbnail_url(file.id, file.version, file.owner_id)
+
+
+def preview_url_for(file: FileModel) -> Optional[str]:
+    if file.type not in PREVIEWABLE_TYPES:
+        return None
+    return signed_preview_url(file.id, file.version)
+
+
 def to_file_response(
     file: FileModel,
     access_ctx: Optional[FileAccessContext] = None,
@@ -389,7 +723,6 @@ def to_file_response(
     path_override: Optional[List[str]] = None,
     is_shared_root: bool = False,
 ) -> FileResponseSchema:
-    thumb_url = f"/api/files/{file.id}/thumbnail" if file.thumbnail_path else None
     ctx = access_ctx or FileAccessContext(
         role="owner",
         is_owner=True,
@@ -402,10 +735,13 @@ def to_file_response(
         type=file.type,
         mime_type=file.mime_type,
         size=file.size,
+        subtree_size=file.subtree_size or 0,
+        subtree_count=file.subtree_count or 0,
         path=path_override if path_override is not None else parse_path(file.path),
         is_starred=file.is_starred,
         is_trashed=file.is_trashed,
-        thumbnail_url=thumb_url,
+        thumbnail_url=thumbnail_url_for(file),
+        preview_url=preview_url_for(file),
         version=file.version or 1,
         is_shared=not ctx.is_owner,
         is_shared_root=is_shared_root,
@@ -421,51 +757,124 @@ def to_file_response(
     )
 
 
-@router.get("", response_model=List[FileResponseSchema])
+# Columns listings and search results read; everything else stays on disk
+LISTING_COLUMNS = (
+    FileModel.id,
+    FileModel.name,
+    FileModel.type,
+    FileModel.mime_type,
+    FileModel.size,
+    FileModel.subtree_size,
+    FileModel.subtree_count,
+    FileModel.path,
+    FileModel.thumbnail_path,
+    FileModel.version,
+    FileModel.owner_id,
+    FileModel.is_starred,
+    FileModel.is_trashed,
+    FileModel.created_at,
+    FileModel.updated_at,
+)
+
+
+def listing_select(*extra_columns):
+    """``select(FileModel)`` that only loads :data:`LISTING_COLUMNS`."""
+    return select(FileModel, *extra_columns).options(load_only(*LISTING_COLUMNS, raiseload=True))
+
+
+async def _fetch_page(
+    db: AsyncSession,
+    query,
+    order: list,
+    cursor_kind: str,
+    sort_key,
+    limit: int,
+    cursor: Optional[str],
+    include_total: bool,
+):
+    """Run *query* one keyset page at a time.
+
+    *order* holds the ``(expression, descending)`` pairs of the ORDER BY and
+    *sort_key* maps a result row to the values of those expressions.
+    Returns ``(rows, next_cursor, total)``; *total* is only counted on request.
+    """
+    total = None
+    if include_total:
+        total = await db.scalar(
+            select(func.count()).select_from(query.with_only_columns(FileModel.id).order_by(None).subquery())
+        )
+
+    if cursor:
+        query = query.where(keyset_after(order, decode_cursor(cursor, cursor_kind, len(order))))
+    order_by = [expr.desc() if descending else expr.asc() for expr, descending in order]
+    rows = (await db.execute(query.order_by(*order_by).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(cursor_kind, sort_key(rows[-1]))
+    return rows, next_cursor, total
+
+
+@router.get("", response_model=FileListPage)
 async def list_files(
     path: Optional[str] = Query(None, description="Path as JSON array"),
     include_trashed: bool = Query(False),
     starred_only: bool = Query(False),
     shared_folder_id: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_total: bool = Query(False),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """List files in a directory"""
+    """List files in a directory, one page at a time (ordered by type, name)"""
     raw_path = parse_path(path or "[]")
 
+    shared_root = access_ctx = None
     if shared_folder_id:
         shared_root, access_ctx = await get_shared_root_access(db, current_user, shared_folder_id)
         actual_path = parse_shared_path(shared_root.path) + [shared_root.name] + raw_path
-        query = select(FileModel).where(FileModel.owner_id == shared_root.owner_id)
-        if not include_trashed:
-            query = query.where(FileModel.is_trashed == False)
-        if starred_only:
-            query = query.where(FileModel.is_starred == True)
-        query = query.where(FileModel.path.in_(get_shared_path_variants(actual_path)))
-        result = await db.execute(query.order_by(FileModel.type, FileModel.name))
-        files = result.scalars().all()
-        return [
+        query = listing_select().where(FileModel.owner_id == shared_root.owner_id)
+        # Paths are stored in the compact serialization (legacy rows are
+        # normalized by run_migrations), so one equality keeps the listing
+        # index usable for the ORDER BY as well.
+        query = query.where(FileModel.path == serialize_path(actual_path))
+    else:
+        query = listing_select().where(FileModel.owner_id == current_user.id)
+        if path:
+            query = query.where(FileModel.path == serialize_path(raw_path))
+    if not include_trashed:
+        query = query.where(FileModel.is_trashed == False)
+    if starred_only:
+        query = query.where(FileModel.is_starred == True)
+
+    rows, next_cursor, total = await _fetch_page(
+        db,
+        query,
+        [(FileModel.type, False), (FileModel.name, False), (FileModel.id, False)],
+        "files",
+        lambda row: (row[0].type, row[0].name, row[0].id),
+        limit,
+        cursor,
+        include_total,
+    )
+
+    if shared_root is not None:
+        items = [
             to_file_response(
                 file,
                 access_ctx,
                 path_override=relative_path_within_shared_root(file, shared_root),
             )
-            for file in files
+            for (file,) in rows
         ]
-
-    query = select(FileModel).where(FileModel.owner_id == current_user.id)
-    if not include_trashed:
-        query = query.where(FileModel.is_trashed == False)
-    if starred_only:
-        query = query.where(FileModel.is_starred == True)
-    if path:
-        query = query.where(FileModel.path.in_(get_serialized_path_variants(raw_path)))
-    result = await db.execute(query.order_by(FileModel.type, FileModel.name))
-    files = result.scalars().all()
-    return [to_file_response(file) for file in files]
+    else:
+        items = [to_file_response(file) for (file,) in rows]
+    return FileListPage(items=items, next_cursor=next_cursor, total=total)
 
 
-@router.get("/search", response_model=List[SearchResult])
+@router.get("/search", response_model=SearchResultPage)
 async def search_files(
     q: str = Query(..., min_length=1, description="Search query"),
     file_type: Optional[str] = Query(None, alias="type"),
@@ -474,39 +883,43 @@ async def search_files(
     starred_only: bool = Query(False),
     include_trashed: bool = Query(False),
     shared_folder_id: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_total: bool = Query(False),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """Search files by name, path metadata, and indexed text content."""
     normalized_query = q.strip()
     if not normalized_query:
-        return []
+        return SearchResultPage(items=[], total=0 if include_total else None)
 
-    # Escape LIKE metacharacters so the query is treated as a literal substring.
-    escaped_query = escape_like_literal(normalized_query)
-    like_query = f"%{escaped_query}%"
-    conditions = [
-        or_(
-            FileModel.name.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
-            FileModel.path.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
-            FileModel.mime_type.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
-            FileModel.type.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
-            FileModel.content_index.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
-        ),
-    ]
+    match_expression = fts_match_expression(normalized_query) if search_index.fts_available else None
+    if match_expression is not None:
+        conditions = [fts_match_clause(match_expression)]
+    else:
+        # Escape LIKE metacharacters so the query is treated as a literal substring.
+        escaped_query = escape_like_literal(normalized_query)
+        like_query = f"%{escaped_query}%"
+        conditions = [
+            or_(
+                FileModel.name.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
+                FileModel.path.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
+                FileModel.mime_type.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
+                FileModel.type.ilike(like_query, escape=LIKE_ESCAPE_CHAR),
+                FileModel.id.in_(
+                    select(FileContent.file_id)
+                    .where(FileContent.content_index.ilike(like_query, escape=LIKE_ESCAPE_CHAR))
+                ),
+            ),
+        ]
 
     access_ctx = None
     shared_root = None
     if shared_folder_id:
         shared_root, access_ctx = await get_shared_root_access(db, current_user, shared_folder_id)
-        root_prefix, path_prefixes = path_prefixes_for_shared_root(shared_root)
         conditions.append(FileModel.owner_id == shared_root.owner_id)
-        conditions.append(
-            or_(
-                FileModel.id == shared_root.id,
-                *[FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR) for prefix in path_prefixes],
-            )
-        )
+        conditions.append(FileModel.id.in_(subtree_ids(shared_root.id, include_self=True)))
     else:
         conditions.append(FileModel.owner_id == current_user.id)
 
@@ -521,31 +934,60 @@ async def search_files(
     if date_to:
         conditions.append(FileModel.created_at <= date_to)
 
-    result = await db.execute(
-        select(FileModel)
-        .where(and_(*conditions))
-        .order_by((FileModel.type == "folder").desc(), FileModel.updated_at.desc(), FileModel.name.asc())
-    )
-    files = result.scalars().all()
+    if match_expression is not None:
+        rank = fts_rank()
+        rows, next_cursor, total = await _fetch_page(
+            db,
+            listing_select(fts_content_snippet(), rank)
+            .join_from(FileModel, files_fts, fts_join_condition())
+            .where(and_(*conditions)),
+            [(rank, False), (FileModel.updated_at, True), (FileModel.id, False)],
+            "search-fts",
+            lambda row: (row[2], row[0].updated_at, row[0].id),
+            limit,
+            cursor,
+            include_total,
+        )
+    else:
+        rows, next_cursor, total = await _fetch_page(
+            db,
+            # Without FTS the text of matched rows is scanned for a snippet
+            listing_select(
+                select(FileContent.content_index).where(FileContent.file_id == FileModel.id).scalar_subquery()
+            ).where(and_(*conditions)),
+            [
+                (FileModel.type == "folder", True),
+                (FileModel.updated_at, True),
+                (FileModel.name, False),
+                (FileModel.id, False),
+            ],
+            "search",
+            lambda row: (int(row[0].type == "folder"), row[0].updated_at, row[0].name, row[0].id),
+            limit,
+            cursor,
+            include_total,
+        )
 
     response = []
-    for file in files:
+    for file, matched_text, *_ in rows:
         path_segments = (
             relative_path_within_shared_root(file, shared_root)
             if shared_root is not None
             else parse_path(file.path)
         )
-        thumb_url = f"/api/files/{file.id}/thumbnail" if file.thumbnail_path else None
         response.append(SearchResult(
             id=file.id,
             name=file.name,
             type=file.type,
             mime_type=file.mime_type,
             size=file.size,
+            subtree_size=file.subtree_size or 0,
+            subtree_count=file.subtree_count or 0,
             path=path_segments,
             is_starred=file.is_starred,
             is_trashed=file.is_trashed,
-            thumbnail_url=thumb_url,
+            thumbnail_url=thumbnail_url_for(file),
+            preview_url=preview_url_for(file),
             is_shared=bool(access_ctx and not access_ctx.is_owner),
             is_shared_root=bool(shared_root is not None and file.id == shared_root.id),
             shared_folder_id=access_ctx.shared_folder_id if access_ctx else None,
@@ -557,10 +999,14 @@ async def search_files(
             can_share_public=access_ctx.can_share_public if access_ctx else True,
             created_at=file.created_at,
             updated_at=file.updated_at,
-            match_context=build_match_context(file, normalized_query, path_segments),
+            match_context=(
+                build_match_context(file, normalized_query, path_segments, content_snippet=matched_text)
+                if match_expression is not None
+                else build_match_context(file, normalized_query, path_segments, content=matched_text)
+            ),
         ))
 
-    return response
+    return SearchResultPage(items=response, next_cursor=next_cursor, total=total)
 
 
 @router.post("/upload", response_model=List[FileResponseSchema], status_code=status.HTTP_201_CREATED)
@@ -574,126 +1020,93 @@ async def upload_files(
     db: AsyncSession = Depends(get_db)
 ):
     """Upload one or more files (streamed to disk in chunks to avoid OOM)"""
-    target_path, access_ctx = await resolve_target_path(
-        db,
-        current_user,
-        parse_path(path or "[]"),
-        shared_folder_id=shared_folder_id,
-        required_role="editor",
+    target_path, access_ctx, target_owner, parent_id = await resolve_upload_target(
+        db, current_user, parse_path(path or "[]"), shared_folder_id
     )
-    target_owner = current_user if access_ctx.is_owner else await db.get(User, access_ctx.owner_id)
-    if target_owner is None:
-        raise HTTPException(status_code=404, detail="Target owner not found")
-    await ensure_folder_path_exists(db, target_owner.id, target_path)
+    storage = get_storage()
 
-    user_storage_path = os.path.join(settings.storage_path, target_owner.id)
-    os.makedirs(user_storage_path, exist_ok=True)
-    
+    # The multipart body is already spooled, so the sizes are known up front
+    total_size = sum(spooled_size(file) for file in files)
     uploaded_files = []
-    
-    for file in files:
-        safe_filename = sanitize_filename(file.filename)
-
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        ext = safe_filename.split('.')[-1] if '.' in safe_filename else ''
-        storage_filename = f"{file_id}.{ext}" if ext else file_id
-        storage_filepath = os.path.join(user_storage_path, storage_filename)
-        
-        # Stream file to disk in chunks (never load entire file into RAM)
-        file_size = 0
-        try:
-            async with aiofiles.open(storage_filepath, 'wb') as f:
-                while True:
-                    chunk = await file.read(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    file_size += len(chunk)
-                    await f.write(chunk)
-                    
-                    # Per-file size limit check
-                    if settings.max_file_size_bytes > 0 and file_size > settings.max_file_size_bytes:
-                        await f.close()
-                        os.remove(storage_filepath)
-                        raise HTTPException(
-                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                            detail=f"File '{safe_filename}' exceeds max size of {settings.max_file_size_bytes} bytes"
-                        )
-        except HTTPException:
-            raise
-        except Exception as e:
-            if os.path.exists(storage_filepath):
-                os.remove(storage_filepath)
-            raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
-        
-        # Check storage quota after writing
-        if target_owner.storage_quota > 0 and target_owner.storage_used + file_size > target_owner.storage_quota:
-            os.remove(storage_filepath)
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Storage quota exceeded. Available: {target_owner.storage_quota - target_owner.storage_used} bytes"
+    async with quota.reserved(db, target_owner.id, total_size) as reservation:
+        for file in files:
+            safe_filename = sanitize_filename(file.filename)
+            staged_path = storage.staging_path()
+            file_size, digest = await stream_to_staging(
+                iter_upload_file(file),
+                staged_path,
+                reservation=reservation,
+                too_large_detail=f"File '{safe_filename}' exceeds max size of {settings.max_file_size_bytes} bytes",
             )
-        
-        # Get mime type
-        mime_type = file.content_type or mimetypes.guess_type(safe_filename)[0]
-        
-        # Generate thumbnail for images
-        thumb_path = None
-        if can_generate_thumbnail(safe_filename):
-            thumb_dir = os.path.join(user_storage_path, "thumbnails")
-            thumb_path = generate_thumbnail(storage_filepath, thumb_dir, file_id)
-        
-        # Create database entry with explicit defaults
-        now = datetime.now(timezone.utc)
-        new_file = FileModel(
-            id=file_id,
-            name=safe_filename,
-            type=get_file_type(safe_filename, mime_type),
-            mime_type=mime_type,
-            size=file_size,
-            path=serialize_path(target_path),
-            storage_path=storage_filepath,
-            content_index=build_search_document(storage_filepath, safe_filename, mime_type, get_file_type(safe_filename, mime_type)),
-            thumbnail_path=thumb_path,
-            owner_id=target_owner.id,
-            is_starred=False,
-            is_trashed=False,
-            version=1,
-            created_at=now,
-            updated_at=now,
+            storage_filepath = await storage.ingest(db, staged_path, digest, file_size)
+
+            uploaded_files.append(await record_uploaded_file(
+                db,
+                current_user=current_user,
+                target_owner=target_owner,
+                access_ctx=access_ctx,
+                target_path=target_path,
+                parent_id=parent_id,
+                filename=safe_filename,
+                mime_type=file.content_type or mimetypes.guess_type(safe_filename)[0],
+                size=file_size,
+                storage_path=storage_filepath,
+            ))
+
+    await db.flush()
+    return uploaded_files
+
+
+@router.put("/upload/raw", response_model=FileResponseSchema, status_code=status.HTTP_201_CREATED)
+@limiter.limit("20/minute")
+async def upload_file_raw(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    path: Optional[str] = Query("[]", description="Path as JSON array"),
+    shared_folder_id: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Upload one file sent as the raw request body.
+
+    The body is streamed straight into blob staging as it arrives, so there
+    is no multipart parsing and no spooled temp copy; size and quota limits
+    apply while streaming. The mime type comes from ``Content-Type``.
+    """
+    target_path, access_ctx, target_owner, parent_id = await resolve_upload_target(
+        db, current_user, parse_path(path or "[]"), shared_folder_id
+    )
+    safe_filename = sanitize_filename(filename)
+    too_large_detail = f"File '{safe_filename}' exceeds max size of {settings.max_file_size_bytes} bytes"
+    declared_size = check_declared_length(request, too_large_detail)
+
+    storage = get_storage()
+    async with quota.reserved(db, target_owner.id, declared_size) as reservation:
+        staged_path = storage.staging_path()
+        file_size, digest = await stream_to_staging(
+            request.stream(),
+            staged_path,
+            reservation=reservation,
+            too_large_detail=too_large_detail,
+            db=db,
         )
-        
-        db.add(new_file)
-        db.add(FileVersion(
-            file_id=file_id,
-            version=1,
+        storage_filepath = await storage.ingest(db, staged_path, digest, file_size)
+
+        uploaded = await record_uploaded_file(
+            db,
+            current_user=current_user,
+            target_owner=target_owner,
+            access_ctx=access_ctx,
+            target_path=target_path,
+            parent_id=parent_id,
+            filename=safe_filename,
+            mime_type=raw_body_mime_type(request, safe_filename),
             size=file_size,
-            mime_type=mime_type,
             storage_path=storage_filepath,
-            created_at=now,
-            created_by=current_user.id,
-        ))
-        
-        # Update user storage
-        target_owner.storage_used += file_size
-        
-        # Log activity
-        activity = ActivityLog(
-            user_id=current_user.id,
-            action="upload",
-            file_name=safe_filename,
-        )
-        db.add(activity)
-        
-        response_path = (
-            relative_path_within_shared_root(new_file, access_ctx.shared_root)
-            if access_ctx.shared_root is not None
-            else None
         )
-        uploaded_files.append(to_file_response(new_file, access_ctx, path_override=response_path))
-    
     await db.flush()
-    return uploaded_files
+    return uploaded
 
 
 # --- CHUNKED UPLOAD ENDPOINTS ---
@@ -719,13 +1132,6 @@ async def init_chunked_upload(
         raise HTTPException(status_code=404, detail="Target owner not found")
     await ensure_folder_path_exists(db, target_owner.id, target_path)
 
-    # Check overall storage quota before starting
-    if target_owner.storage_quota > 0 and target_owner.storage_used + init_req.total_size > target_owner.storage_quota:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Storage quota exceeded. Available: {target_owner.storage_quota - target_owner.storage_used} bytes"
-        )
-
     # Per-file size limit check
     if settings.max_file_size_bytes > 0 and init_req.total_size > settings.max_file_size_bytes:
         raise HTTPException(
@@ -733,18 +1139,28 @@ async def init_chunked_upload(
             detail=f"File exceeds max size of {settings.max_file_size_bytes} bytes"
         )
 
+    # Hold the quota for the whole upload; released when the session completes or expires
     upload_id = str(uuid.uuid4())
+    await quota.reserve(db, target_owner.id, init_req.total_size, upload_id=upload_id)
     temp_dir = get_upload_temp_dir(current_user.id, upload_id)
     os.makedirs(temp_dir, exist_ok=True)
-    safe_filename = sanitize_filename(init_req.filename)
-    await write_upload_metadata(
-        temp_dir,
-        init_req.total_size,
-        RESUMABLE_CHUNK_SIZE,
-        filename=safe_filename,
-        path=target_path,
+    try:
+        await asyncio.to_thread(uploads.preallocate, temp_dir, init_req.total_size)
+    except uploads.UploadSpaceError as exc:
+        await asyncio.to_thread(shutil.rmtree, temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=507, detail="Not enough disk space for this upload") from exc
+    db.add(uploads.new_session(
+        upload_id,
+        current_user.id,
+        filename=sanitize_filename(init_req.filename),
+        path=serialize_path(target_path),
         mime_type=init_req.mime_type,
-    )
+        total_size=init_req.total_size,
+        chunk_size=RESUMABLE_CHUNK_SIZE,
+        expected_chunks=get_expected_chunk_count(init_req.total_size, RESUMABLE_CHUNK_SIZE),
+    ))
+    await db.flush()
+    uploads.start_digest(upload_id)
 
     # Return the upload_id and standard chunk size (e.g. 5 MB)
     return ChunkedUploadInitResponse(
@@ -760,65 +1176,24 @@ async def upload_chunk(
     upload_id: str,
     chunk_index: int = Query(..., description="0-based index of the chunk"),
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Upload a single chunk for a resumable upload."""
-    upload_id = validate_upload_id(upload_id)
-    temp_dir = get_upload_temp_dir(current_user.id, upload_id)
-    
-    if not os.path.exists(temp_dir):
-        raise HTTPException(status_code=404, detail="Upload session not found or expired")
-
-    metadata = await read_upload_metadata(temp_dir)
-    expected_chunk_size = get_expected_chunk_size(
-        metadata["total_size"],
-        metadata["chunk_size"],
-        chunk_index,
-    )
-    chunk_filepath = os.path.join(temp_dir, f"chunk_{chunk_index}")
-
-    if os.path.exists(chunk_filepath):
-        try:
-            existing_size = os.path.getsize(chunk_filepath)
-        except OSError:
-            existing_size = None
-        if existing_size is not None and existing_size == expected_chunk_size:
-            uploaded_bytes = _get_uploaded_bytes(temp_dir)
-            if uploaded_bytes > metadata["total_size"]:
-                raise HTTPException(status_code=400, detail="Uploaded chunks exceed declared file size")
-            return {"status": "ok", "message": f"Chunk {chunk_index} already received"}
-        try:
-            os.remove(chunk_filepath)
-        except OSError:
-            pass
-    
-    try:
-        bytes_written = 0
-        async with aiofiles.open(chunk_filepath, 'wb') as f:
-            while True:
-                data = await file.read(CHUNK_SIZE)
-                if not data:
-                    break
-                bytes_written += len(data)
-                if bytes_written > expected_chunk_size:
-                    raise HTTPException(status_code=400, detail="Chunk exceeds declared upload size")
-                await f.write(data)
-    except HTTPException:
-        if os.path.exists(chunk_filepath):
-            os.remove(chunk_filepath)
-        raise
-    except Exception as e:
-        if os.path.exists(chunk_filepath):
-            os.remove(chunk_filepath)
-        raise HTTPException(status_code=500, detail=f"Failed to save chunk: {e}")
+    return await store_upload_chunk(db, current_user, upload_id, chunk_index, iter_upload_file(file))
 
-    uploaded_bytes = _get_uploaded_bytes(temp_dir)
-    if uploaded_bytes > metadata["total_size"]:
-        if os.path.exists(chunk_filepath):
-            os.remove(chunk_filepath)
-        raise HTTPException(status_code=400, detail="Uploaded chunks exceed declared file size")
 
-    return {"status": "ok", "message": f"Chunk {chunk_index} received"}
+@router.put("/upload/{upload_id}/chunk/raw")
+@limiter.limit("120/minute")
+async def upload_chunk_raw(
+    request: Request,
+    upload_id: str,
+    chunk_index: int = Query(..., description="0-based index of the chunk"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Upload a single chunk sent as the raw request body."""
+    return await store_upload_chunk(db, current_user, upload_id, chunk_index, request.stream())
 
 
 @router.get("/upload/{upload_id}/status", response_model=ChunkedUploadStatusResponse)
@@ -827,34 +1202,26 @@ async def get_chunked_upload_status(
     request: Request,
     upload_id: str,
     current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Return the status of a resumable upload, including uploaded chunks."""
     upload_id = validate_upload_id(upload_id)
-    temp_dir = get_upload_temp_dir(current_user.id, upload_id)
-
-    if not os.path.exists(temp_dir):
+    session = await uploads.get_session(db, current_user.id, upload_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Upload session not found or expired")
 
-    metadata = await read_upload_metadata(temp_dir)
-    uploaded_chunks, uploaded_bytes = get_uploaded_chunks(temp_dir, metadata)
-    uploaded_chunks_set = set(uploaded_chunks)
-    next_chunk_index = metadata["expected_chunks"]
-    for idx in range(metadata["expected_chunks"]):
-        if idx not in uploaded_chunks_set:
-            next_chunk_index = idx
-            break
-
+    next_chunk_index = session.chunk_map.find(uploads.MISSING)
     return ChunkedUploadStatusResponse(
         upload_id=upload_id,
-        filename=metadata.get("filename"),
-        path=metadata.get("path") or [],
-        mime_type=metadata.get("mime_type"),
-        total_size=metadata["total_size"],
-        chunk_size=metadata["chunk_size"],
-        expected_chunks=metadata["expected_chunks"],
-        uploaded_chunks=uploaded_chunks,
-        uploaded_bytes=uploaded_bytes,
-        next_chunk_index=next_chunk_index,
+        filename=session.filename,
+        path=parse_path(session.path),
+        mime_type=session.mime_type,
+        total_size=session.total_size,
+        chunk_size=session.chunk_size,
+        expected_chunks=session.expected_chunks,
+        uploaded_chunks=uploads.received_chunks(session),
+        uploaded_bytes=session.received_bytes,
+        next_chunk_index=session.expected_chunks if next_chunk_index < 0 else next_chunk_index,
     )
 
 
@@ -866,22 +1233,22 @@ async def complete_chunked_upload(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Complete a chunked upload by assembling chunks into the final file."""
+    """Complete a chunked upload by moving its data file into the blob store."""
     upload_id = validate_upload_id(complete_req.upload_id)
-    temp_dir = get_upload_temp_dir(current_user.id, upload_id)
-    
-    if not os.path.exists(temp_dir):
+    session = await uploads.get_session(db, current_user.id, upload_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Upload session not found")
 
-    metadata = await read_upload_metadata(temp_dir)
-    if complete_req.total_size != metadata["total_size"]:
+    if complete_req.total_size != session.total_size:
         raise HTTPException(status_code=400, detail="Upload metadata does not match declared file size")
 
     safe_filename = sanitize_filename(complete_req.filename)
-    if metadata.get("filename") and sanitize_filename(str(metadata["filename"])) != safe_filename:
+    if sanitize_filename(session.filename) != safe_filename:
         raise HTTPException(status_code=400, detail="Upload metadata does not match filename")
 
-    stored_path = metadata.get("path")
+    if session.received_chunks != session.expected_chunks:
+        raise HTTPException(status_code=400, detail="Upload is incomplete")
+
     target_path, access_ctx = await resolve_target_path(
         db,
         current_user,
@@ -889,201 +1256,259 @@ async def complete_chunked_upload(
         shared_folder_id=complete_req.shared_folder_id,
         required_role="editor",
     )
-    if stored_path is not None and serialize_path(stored_path) != serialize_path(target_path):
+    if session.path != serialize_path(target_path):
         raise HTTPException(status_code=400, detail="Upload metadata does not match target path")
 
     target_owner = current_user if access_ctx.is_owner else await db.get(User, access_ctx.owner_id)
     if target_owner is None:
         raise HTTPException(status_code=404, detail="Target owner not found")
-    await ensure_folder_path_exists(db, target_owner.id, target_path)
-    user_storage_path = os.path.join(settings.storage_path, target_owner.id)
-    os.makedirs(user_storage_path, exist_ok=True)
+    parent_id = await ensure_folder_path_exists(db, target_owner.id, target_path)
+    os.makedirs(os.path.join(settings.storage_path, target_owner.id), exist_ok=True)
 
-    file_id = str(uuid.uuid4())
-    ext = safe_filename.split('.')[-1] if '.' in safe_filename else ''
-    storage_filename = f"{file_id}.{ext}" if ext else file_id
-    final_storage_filepath = os.path.join(user_storage_path, storage_filename)
+    # A concurrent completion of the same upload finds the row gone. Failing
+    # checks below roll the claim back, so the session stays resumable until
+    # it expires (e.g. after the owner frees up quota).
+    if not await uploads.claim_completed_session(db, upload_id):
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
 
-    chunk_indices = []
-    for name in os.listdir(temp_dir):
-        if not name.startswith("chunk_"):
-            continue
-        try:
-            chunk_indices.append(int(name.split("_", 1)[1]))
-        except ValueError as exc:
-            raise HTTPException(status_code=400, detail="Upload session metadata is invalid") from exc
-
-    expected_indices = list(range(metadata["expected_chunks"]))
-    if sorted(chunk_indices) != expected_indices:
-        raise HTTPException(status_code=400, detail="Upload is incomplete")
-
-    chunk_files = [f"chunk_{index}" for index in expected_indices]
-    for index, chunk_filename in enumerate(chunk_files):
-        chunk_path = os.path.join(temp_dir, chunk_filename)
-        if os.path.getsize(chunk_path) != get_expected_chunk_size(
-            metadata["total_size"],
-            metadata["chunk_size"],
-            index,
-        ):
-            raise HTTPException(status_code=400, detail="Upload is incomplete")
-
-    assembled_size = 0
-    try:
-        async with aiofiles.open(final_storage_filepath, 'wb') as outfile:
-            for chunk_filename in chunk_files:
-                chunk_path = os.path.join(temp_dir, chunk_filename)
-                async with aiofiles.open(chunk_path, 'rb') as infile:
-                    # Write in blocks
-                    while True:
-                        data = await infile.read(65536)
-                        if not data:
-                            break
-                        await outfile.write(data)
-                        assembled_size += len(data)
-    except Exception:
-        if os.path.exists(final_storage_filepath):
-            os.remove(final_storage_filepath)
-        logger.exception("Failed to assemble file during chunk assembly")
-        raise HTTPException(status_code=500, detail="Failed to assemble file.")
-
-    # Clean up temp dir
-    import shutil
+    # Chunks were written in place, so there is nothing to assemble: check
+    # the data file, flush it to disk and rename it into the blob store.
+    temp_dir = get_upload_temp_dir(current_user.id, upload_id)
+    data_path = uploads.data_path(temp_dir)
     try:
-        await asyncio.to_thread(shutil.rmtree, temp_dir, ignore_errors=True)
-    except Exception as e:
-        print(f"Warning: Failed to cleanup temp dir {temp_dir}: {e}")
+        assembled_size = os.path.getsize(data_path)
+    except OSError:
+        assembled_size = -1
 
     # Verify size
-    if assembled_size != metadata["total_size"]:
-        os.remove(final_storage_filepath)
+    if assembled_size != session.total_size:
         raise HTTPException(
             status_code=400,
-            detail=f"Size mismatch: Expected {metadata['total_size']}, got {assembled_size}. File deleted."
+            detail=f"Size mismatch: Expected {session.total_size}, got {max(assembled_size, 0)}."
         )
 
     # Enforce maximum allowed file size on the assembled file
     if settings.max_file_size_bytes and assembled_size > settings.max_file_size_bytes:
-        os.remove(final_storage_filepath)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File exceeds maximum allowed size of {settings.max_file_size_bytes} bytes."
         )
 
-    # Re-check storage quota (just in case it changed during upload)
-    if target_owner.storage_quota > 0 and target_owner.storage_used + assembled_size > target_owner.storage_quota:
-        os.remove(final_storage_filepath)
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Storage quota exceeded."
-        )
+    # The reservation taken at init covers the file; sessions started before
+    # reservations existed are checked now, inside this write transaction.
+    if await quota.release(db, upload_id=upload_id) is None:
+        quota_left = await quota.available(db, target_owner.id)
+        if quota_left is not None and assembled_size > quota_left:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Storage quota exceeded."
+            )
 
-    # Guess mime type if not provided
-    mime_type = complete_req.mime_type or metadata.get("mime_type") or mimetypes.guess_type(safe_filename)[0]
+    try:
+        digest = await uploads.finalize_digest(temp_dir, upload_id, session.expected_chunks)
+    except OSError:
+        logger.exception("Failed to finalize resumable upload data file")
+        raise HTTPException(status_code=500, detail="Failed to assemble file.")
 
-    # Generate thumbnail
-    thumb_path = None
-    if can_generate_thumbnail(safe_filename):
-        thumb_dir = os.path.join(user_storage_path, "thumbnails")
-        thumb_path = generate_thumbnail(final_storage_filepath, thumb_dir, file_id)
+    storage = get_storage()
+    final_storage_filepath = await storage.ingest(db, data_path, digest, assembled_size)
+    await asyncio.to_thread(uploads.fsync_directory, os.path.dirname(final_storage_filepath))
 
-    # Create DB entry
-    now = datetime.now(timezone.utc)
-    new_file = FileModel(
-        id=file_id,
-        name=safe_filename,
-        type=get_file_type(safe_filename, mime_type),
-        mime_type=mime_type,
+    # Clean up temp dir
+    await asyncio.to_thread(shutil.rmtree, temp_dir, ignore_errors=True)
+
+    uploaded = await record_uploaded_file(
+        db,
+        current_user=current_user,
+        target_owner=target_owner,
+        access_ctx=access_ctx,
+        target_path=target_path,
+        parent_id=parent_id,
+        filename=safe_filename,
+        # Guess mime type if not provided
+        mime_type=complete_req.mime_type or session.mime_type or mimetypes.guess_type(safe_filename)[0],
         size=assembled_size,
-        path=serialize_path(target_path),
         storage_path=final_storage_filepath,
-        thumbnail_path=thumb_path,
-        owner_id=target_owner.id,
-        is_starred=False,
-        is_trashed=False,
-        version=1,
-        created_at=now,
-        updated_at=now,
     )
+    await db.flush()
+    return uploaded
+
+
+@router.get("/{file_id}/download")
+@limiter.limit("60/minute")
+async def download_file(
+    request: Request,
+    file_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download a file"""
+    file, _access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
     
-    db.add(new_file)
-    db.add(FileVersion(
-        file_id=file_id,
-        version=1,
-        size=assembled_size,
-        mime_type=mime_type,
-        storage_path=final_storage_filepath,
-        created_at=now,
-        created_by=current_user.id,
-    ))
-    target_owner.storage_used += assembled_size
+    if file.type == "folder":
+        raise HTTPException(status_code=400, detail="Cannot download a folder")
     
-    activity = ActivityLog(
-        user_id=current_user.id,
-        action="upload",
-        file_name=safe_filename,
+    if not file.storage_path or not os.path.exists(file.storage_path):
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+    response = send_file(
+        request,
+        file.storage_path,
+        etag=content_etag(file.id, file.version),
+        last_modified=file.updated_at,
+        media_type=file.mime_type,
+        content_disposition=build_content_disposition("attachment", file.name),
     )
-    db.add(activity)
-    
-    await db.flush()
+    if response.status_code != status.HTTP_304_NOT_MODIFIED:
+        # Log activity
+        activity = ActivityLog(
+            user_id=current_user.id,
+            action="download",
+            file_name=file.name,
+        )
+        db.add(activity)
+        # get_db only commits once the body has been sent; an open write
+        # transaction would hold the write gate for the whole transfer.
+        await db.commit()
+    return response
 
-    response_path = (
-        relative_path_within_shared_root(new_file, access_ctx.shared_root)
-        if access_ctx.shared_root is not None
-        else None
+
+async def collect_archive_entries(db: AsyncSession, item: FileModel, seen_ids: set[str]) -> list[ArchiveEntry]:
+    """Archive members for *item*: a file, or a folder with its untrashed subtree."""
+    base_depth = len(parse_path(item.path))
+    query = select(
+        FileModel.id,
+        FileModel.name,
+        FileModel.type,
+        FileModel.path,
+        FileModel.storage_path,
+        FileModel.mime_type,
+        FileModel.updated_at,
     )
-    return to_file_response(new_file, access_ctx, path_override=response_path)
+    if item.type == "folder":
+        query = query.where(
+            FileModel.id.in_(subtree_ids(item.id, include_self=True)),
+            FileModel.owner_id == item.owner_id,
+            FileModel.is_trashed == False,
+        )
+    else:
+        query = query.where(FileModel.id == item.id)
+
+    # Sort on the parsed path so each folder precedes its contents
+    rows = sorted(
+        ((parse_path(row.path)[base_depth:] + [row.name], row) for row in (await db.execute(query)).all()),
+        key=lambda pair: pair[0],
+    )
+    entries = []
+    for parts, row in rows:
+        if row.id in seen_ids:
+            continue
+        seen_ids.add(row.id)
+        name = archive_name(parts)
+        if row.type == "folder":
+            entries.append(ArchiveEntry(name=f"{name}/", modified=row.updated_at))
+        elif row.storage_path:
+            entries.append(ArchiveEntry(
+                name=name,
+                path=row.storage_path,
+                modified=row.updated_at,
+                mime_type=row.mime_type,
+            ))
+    return entries
+
+
+def archive_response(entries: list[ArchiveEntry], filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_zip(unique_names(entries)),
+        media_type=ARCHIVE_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": build_content_disposition("attachment", filename),
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+async def _folder_archive(db: AsyncSession, current_user: User, folder_id: str):
+    item, _access_ctx = await get_file_access_context(db, current_user, folder_id, required_role="viewer")
+    entries = await collect_archive_entries(db, item, set())
+    filename = f"{item.name}.zip"
+
+    db.add(ActivityLog(user_id=current_user.id, action="download", file_name=filename))
+    # Commit now: the archive may stream for minutes before get_db would
+    await db.commit()
+    return archive_response(entries, filename)
+
+
+@router.get("/{folder_id}/archive")
+@limiter.limit("30/minute")
+async def download_archive(
+    request: Request,
+    folder_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Download a folder (or a single file) as a ZIP archive streamed on the fly"""
+    return await _folder_archive(db, current_user, folder_id)
+
+
+@router.post("/{folder_id}/archive/link", response_model=ArchiveLinkResponse)
+@limiter.limit("30/minute")
+async def create_archive_link(
+    request: Request,
+    folder_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Short-lived signed URL the browser can download a folder archive from directly"""
+    await get_file_access_context(db, current_user, folder_id, required_role="viewer")
+    url, expires = signed_archive_url(folder_id, current_user.id)
+    return ArchiveLinkResponse(url=url, expires_at=datetime.fromtimestamp(expires, timezone.utc))
+
+
+@router.get("/{folder_id}/archive/signed")
+@limiter.limit("30/minute")
+async def download_archive_signed(
+    request: Request,
+    folder_id: str,
+    user: str = Query(...),
+    expires: int = Query(...),
+    sig: str = Query(...),
+    db: AsyncSession = Depends(get_db),
+):
+    """Download a folder archive through a URL from ``POST /{folder_id}/archive/link``.
 
+    The signature stands in for the Authorization header; access is still
+    checked for the user it was issued to.
+    """
+    verify_signed_url("archive", folder_id, 0, expires, sig, owner_id=user)
+    current_user = await db.get(User, user)
+    if current_user is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    return await _folder_archive(db, current_user, folder_id)
 
-@router.get("/{file_id}/download")
-@limiter.limit("60/minute")
-async def download_file(
+
+@router.post("/archive")
+@limiter.limit("30/minute")
+async def download_selection_archive(
     request: Request,
-    file_id: str,
+    archive_req: ArchiveRequest,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
 ):
-    """Download a file"""
-    file, _access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
-    
-    if file.type == "folder":
-        raise HTTPException(status_code=400, detail="Cannot download a folder")
-    
-    if not file.storage_path or not os.path.exists(file.storage_path):
-        raise HTTPException(status_code=404, detail="File not found on disk")
-    
-    # Path traversal protection
-    resolved = os.path.realpath(file.storage_path)
-    base_path = os.path.realpath(settings.storage_path)
-    if os.path.commonpath([base_path, resolved]) != base_path:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    # Log activity
-    activity = ActivityLog(
-        user_id=current_user.id,
-        action="download",
-        file_name=file.name,
-    )
-    db.add(activity)
-    await db.flush()
-    
-    file_size = os.path.getsize(file.storage_path)
-
-    def iter_file():
-        with open(file.storage_path, "rb") as f:
-            while True:
-                chunk = f.read(65536)  # 64KB chunks
-                if not chunk:
-                    break
-                yield chunk
-
-    return StreamingResponse(
-        iter_file(),
-        media_type=file.mime_type or "application/octet-stream",
-        headers={
-            "Content-Length": str(file_size),
-            "Content-Disposition": build_content_disposition("attachment", file.name),
-        }
-    )
+    """Download several files and folders as one ZIP archive streamed on the fly"""
+    entries: list[ArchiveEntry] = []
+    seen_ids: set[str] = set()
+    items = []
+    for file_id in dict.fromkeys(archive_req.file_ids):
+        item, _access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
+        items.append(item)
+        entries.extend(await collect_archive_entries(db, item, seen_ids))
+    filename = f"{items[0].name}.zip" if len(items) == 1 else "download.zip"
+
+    db.add(ActivityLog(user_id=current_user.id, action="download", file_name=filename))
+    # Commit now: the archive may stream for minutes before get_db would
+    await db.commit()
+    return archive_response(entries, filename)
 
 
 @router.get("/{file_id}/versions", response_model=List[FileVersionResponse])
@@ -1116,7 +1541,8 @@ async def list_file_versions(
             size=version.size,
             mime_type=version.mime_type,
             created_at=version.created_at,
-            is_current=(version.version == current_version or version.storage_path == file.storage_path),
+            # Identical content shares a blob, so compare version numbers only.
+            is_current=version.version == current_version,
             created_by=version.created_by,
         )
         for version in versions
@@ -1133,120 +1559,71 @@ async def upload_new_version(
     db: AsyncSession = Depends(get_db),
 ):
     """Upload a new version of an existing file."""
-    file, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="editor")
-    if file.type == "folder":
-        raise HTTPException(status_code=400, detail="Folders do not support versions")
-    if file.is_trashed:
-        raise HTTPException(status_code=400, detail="Restore the file before adding versions")
-
-    await ensure_base_version(file, db, file.owner_id)
-
-    owner_user = current_user if access_ctx.is_owner else await db.get(User, file.owner_id)
-    if owner_user is None:
-        raise HTTPException(status_code=404, detail="File owner not found")
-    user_storage_path = os.path.join(settings.storage_path, file.owner_id)
-    os.makedirs(user_storage_path, exist_ok=True)
-
+    file, access_ctx, owner_user = await prepare_version_upload(db, current_user, file_id)
     safe_filename = sanitize_filename(new_file.filename or file.name)
-    ext = safe_filename.split('.')[-1] if '.' in safe_filename else ''
-    next_version = await get_next_version_number(db, file.id)
-    storage_filename = f"{file.id}_v{next_version}.{ext}" if ext else f"{file.id}_v{next_version}"
-    storage_filepath = os.path.join(user_storage_path, storage_filename)
-
-    file_size = 0
-    try:
-        async with aiofiles.open(storage_filepath, 'wb') as f:
-            while True:
-                chunk = await new_file.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                file_size += len(chunk)
-                if settings.max_file_size_bytes > 0 and file_size > settings.max_file_size_bytes:
-                    await f.close()
-                    os.remove(storage_filepath)
-                    raise HTTPException(
-                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                        detail=f"File exceeds max size of {settings.max_file_size_bytes} bytes"
-                    )
-                await f.write(chunk)
-    except HTTPException:
-        raise
-    except Exception as exc:
-        if os.path.exists(storage_filepath):
-            os.remove(storage_filepath)
-        raise HTTPException(status_code=500, detail=f"Failed to save version: {exc}")
-
-    if owner_user.storage_quota > 0 and owner_user.storage_used + file_size > owner_user.storage_quota:
-        os.remove(storage_filepath)
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Storage quota exceeded. Available: {owner_user.storage_quota - owner_user.storage_used} bytes"
+    storage = get_storage()
+    upload_size = spooled_size(new_file)
+    async with quota.reserved(db, owner_user.id, upload_size) as reservation:
+        staged_path = storage.staging_path()
+        file_size, digest = await stream_to_staging(
+            iter_upload_file(new_file),
+            staged_path,
+            reservation=reservation,
+            too_large_detail=f"File exceeds max size of {settings.max_file_size_bytes} bytes",
+            failure_detail="Failed to save version",
+        )
+        storage_filepath = await storage.ingest(db, staged_path, digest, file_size)
+
+        return await record_new_version(
+            db,
+            file,
+            access_ctx,
+            current_user=current_user,
+            owner_user=owner_user,
+            mime_type=new_file.content_type or mimetypes.guess_type(safe_filename)[0] or file.mime_type,
+            size=file_size,
+            storage_path=storage_filepath,
         )
 
-    mime_type = new_file.content_type or mimetypes.guess_type(safe_filename)[0] or file.mime_type
-    thumb_path = None
-    if can_generate_thumbnail(safe_filename):
-        thumb_dir = os.path.join(user_storage_path, "thumbnails")
-        thumb_path = generate_thumbnail(storage_filepath, thumb_dir, f"{file.id}-v{next_version}")
-
-    # Clean up previous thumbnail whenever the stored path changes, including removal
-    if file.thumbnail_path and file.thumbnail_path != thumb_path and os.path.exists(file.thumbnail_path):
-        os.remove(file.thumbnail_path)
-
-    now = datetime.now(timezone.utc)
-    file.version = next_version
-    file.size = file_size
-    file.mime_type = mime_type
-    file.type = get_file_type(file.name, mime_type)
-    file.storage_path = storage_filepath
-    file.thumbnail_path = thumb_path
-    file.content_index = build_search_document(storage_filepath, file.name, mime_type, file.type)
-    file.updated_at = now
-
-    for _vretry in range(_MAX_VERSION_RETRIES):
-        try:
-            async with db.begin_nested():
-                db.add(FileVersion(
-                    file_id=file.id,
-                    version=next_version,
-                    size=file_size,
-                    mime_type=mime_type,
-                    storage_path=storage_filepath,
-                    created_at=now,
-                    created_by=current_user.id,
-                ))
-                await db.flush()
-            break
-        except IntegrityError:
-            if _vretry >= _MAX_VERSION_RETRIES - 1:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Version conflict; please retry the upload",
-                )
-            next_version = await get_next_version_number(db, file.id)
-            new_storage_filename = f"{file.id}_v{next_version}.{ext}" if ext else f"{file.id}_v{next_version}"
-            new_storage_filepath = os.path.join(user_storage_path, new_storage_filename)
-            os.rename(storage_filepath, new_storage_filepath)
-            storage_filepath = new_storage_filepath
-            file.version = next_version
-            file.storage_path = storage_filepath
-
-    owner_user.storage_used += file_size
 
-    activity = ActivityLog(
-        user_id=current_user.id,
-        action="version_upload",
-        file_name=f"{file.name} v{next_version}",
-    )
-    db.add(activity)
-    await db.flush()
-    await db.refresh(file)
-    response_path = (
-        relative_path_within_shared_root(file, access_ctx.shared_root)
-        if access_ctx.shared_root is not None
-        else None
-    )
-    return to_file_response(file, access_ctx, path_override=response_path)
+@router.put("/{file_id}/versions/raw", response_model=FileResponseSchema, status_code=status.HTTP_201_CREATED)
+@limiter.limit("20/minute")
+async def upload_new_version_raw(
+    request: Request,
+    file_id: str,
+    filename: Optional[str] = Query(None, max_length=255, description="Used to guess the mime type"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Upload a new version of an existing file sent as the raw request body."""
+    file, access_ctx, owner_user = await prepare_version_upload(db, current_user, file_id)
+    safe_filename = sanitize_filename(filename or file.name)
+    too_large_detail = f"File exceeds max size of {settings.max_file_size_bytes} bytes"
+    declared_size = check_declared_length(request, too_large_detail)
+
+    storage = get_storage()
+    async with quota.reserved(db, owner_user.id, declared_size) as reservation:
+        staged_path = storage.staging_path()
+        file_size, digest = await stream_to_staging(
+            request.stream(),
+            staged_path,
+            reservation=reservation,
+            too_large_detail=too_large_detail,
+            failure_detail="Failed to save version",
+            db=db,
+        )
+        storage_filepath = await storage.ingest(db, staged_path, digest, file_size)
+
+        return await record_new_version(
+            db,
+            file,
+            access_ctx,
+            current_user=current_user,
+            owner_user=owner_user,
+            mime_type=raw_body_mime_type(request, safe_filename) or file.mime_type,
+            size=file_size,
+            storage_path=storage_filepath,
+        )
 
 
 @router.get("/{file_id}/versions/{version_id}/download")
@@ -1272,29 +1649,14 @@ async def download_version(
     if not version.storage_path or not os.path.exists(version.storage_path):
         raise HTTPException(status_code=404, detail="Version data missing")
 
-    resolved = os.path.realpath(version.storage_path)
-    base_path = os.path.realpath(settings.storage_path)
-    if os.path.commonpath([base_path, resolved]) != base_path:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    file_size = os.path.getsize(version.storage_path)
     download_name = f"{file.name} (v{version.version})"
-
-    def iter_file():
-        with open(version.storage_path, "rb") as f:
-            while True:
-                chunk = f.read(65536)
-                if not chunk:
-                    break
-                yield chunk
-
-    return StreamingResponse(
-        iter_file(),
-        media_type=version.mime_type or file.mime_type or "application/octet-stream",
-        headers={
-            "Content-Length": str(file_size),
-            "Content-Disposition": build_content_disposition("attachment", download_name),
-        }
+    return send_file(
+        request,
+        version.storage_path,
+        etag=content_etag(file.id, version.version),
+        last_modified=version.created_at,
+        media_type=version.mime_type or file.mime_type,
+        content_disposition=build_content_disposition("attachment", download_name),
     )
 
 
@@ -1336,44 +1698,24 @@ async def restore_file_version(
     owner_user = current_user if access_ctx.is_owner else await db.get(User, file.owner_id)
     if owner_user is None:
         raise HTTPException(status_code=404, detail="File owner not found")
-    if owner_user.storage_quota > 0 and owner_user.storage_used + version.size > owner_user.storage_quota:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Storage quota exceeded."
-        )
+    await quota.charge(db, owner_user.id, version.size or 0)
 
     user_storage_path = os.path.join(settings.storage_path, file.owner_id)
     os.makedirs(user_storage_path, exist_ok=True)
 
     next_version = await get_next_version_number(db, file.id)
-    ext = file.name.split('.')[-1] if '.' in file.name else ''
-    storage_filename = f"{file.id}_v{next_version}.{ext}" if ext else f"{file.id}_v{next_version}"
-    new_storage_path = os.path.join(user_storage_path, storage_filename)
-
-    import shutil
-    try:
-        await asyncio.to_thread(shutil.copy2, version.storage_path, new_storage_path)
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Version data missing")
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Failed to restore version: {exc}")
-
-    thumb_path = None
-    if can_generate_thumbnail(file.name):
-        thumb_dir = os.path.join(user_storage_path, "thumbnails")
-        thumb_path = generate_thumbnail(new_storage_path, thumb_dir, f"{file.id}-v{next_version}")
-
-    if file.thumbnail_path and file.thumbnail_path != thumb_path and os.path.exists(file.thumbnail_path):
-        os.remove(file.thumbnail_path)
+    # The restored version shares the old version's blob; nothing is copied.
+    new_storage_path = await get_storage().retain(db, version.storage_path)
 
     now = datetime.now(timezone.utc)
+    old_type, old_size = file.type, file.size
     file.version = next_version
     file.size = version.size
     file.mime_type = version.mime_type
     file.type = get_file_type(file.name, version.mime_type)
     file.storage_path = new_storage_path
-    file.thumbnail_path = thumb_path
     file.updated_at = now
+    await aggregates.record_replaced(db, file, old_type, old_size)
 
     for _vretry in range(_MAX_VERSION_RETRIES):
         try:
@@ -1396,23 +1738,24 @@ async def restore_file_version(
                     detail="Version conflict; please retry",
                 )
             next_version = await get_next_version_number(db, file.id)
-            new_storage_filename = f"{file.id}_v{next_version}.{ext}" if ext else f"{file.id}_v{next_version}"
-            updated_storage_path = os.path.join(user_storage_path, new_storage_filename)
-            os.rename(new_storage_path, updated_storage_path)
-            new_storage_path = updated_storage_path
             file.version = next_version
-            file.storage_path = new_storage_path
 
-    # Build the content index once using the final storage path (after any retries).
-    file.content_index = build_search_document(new_storage_path, file.name, version.mime_type, file.type)
+    # Queue processing once using the final storage path (after any retries).
+    await enqueue_file_processing(
+        db,
+        file,
+        thumbnail_dir=os.path.join(user_storage_path, "thumbnails"),
+        thumbnail_key=f"{file.id}-v{next_version}",
+        created_by=current_user.id,
+    )
 
-    owner_user.storage_used += version.size
     activity = ActivityLog(
         user_id=current_user.id,
         action="version_restore",
         file_name=f"{file.name} v{next_version}",
     )
     db.add(activity)
+    await record_changes(db, "version_added", [file.id])
 
     await db.flush()
     await db.refresh(file)
@@ -1448,23 +1791,18 @@ async def delete_file_version(
     if version.version == (file.version or 1):
         raise HTTPException(status_code=400, detail="Cannot delete the current version")
 
-    if version.storage_path and os.path.exists(version.storage_path):
-        try:
-            os.remove(version.storage_path)
-        except OSError:
-            pass
+    await get_storage().release(db, version.storage_path)
 
     freed = version.size or 0
     await db.delete(version)
-    owner_user = current_user if access_ctx.is_owner else await db.get(User, file.owner_id)
-    if owner_user is not None:
-        owner_user.storage_used = max(0, owner_user.storage_used - freed)
+    await quota.credit(db, file.owner_id, freed)
     activity = ActivityLog(
         user_id=current_user.id,
         action="version_delete",
         file_name=f"{file.name} v{version.version}",
     )
     db.add(activity)
+    await record_changes(db, "updated", [file.id])
     await db.flush()
 @router.post("/{file_id}/copy", response_model=FileResponseSchema, status_code=status.HTTP_201_CREATED)
 @limiter.limit("20/minute")
@@ -1475,8 +1813,6 @@ async def copy_file(
     db: AsyncSession = Depends(get_db)
 ):
     """Copy a file (creates a duplicate with '(copy)' suffix)"""
-    import shutil
-
     original, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
     if not access_ctx.is_owner:
         raise HTTPException(status_code=403, detail="Only the owner can create local copies from this view")
@@ -1487,25 +1823,14 @@ async def copy_file(
     if not original.storage_path or not os.path.exists(original.storage_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    # Check storage quota
-    if current_user.storage_quota > 0 and current_user.storage_used + original.size > current_user.storage_quota:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Storage quota exceeded. Available: {current_user.storage_quota - current_user.storage_used} bytes"
-        )
+    # Charge the quota up front; the UPDATE only applies if the copy fits
+    await quota.charge(db, current_user.id, original.size or 0)
 
-    # Generate new file ID and storage path
     new_id = str(uuid.uuid4())
     user_storage_path = os.path.join(settings.storage_path, current_user.id)
-    ext = original.name.split('.')[-1] if '.' in original.name else ''
-    storage_filename = f"{new_id}.{ext}" if ext else new_id
-    new_storage_path = os.path.join(user_storage_path, storage_filename)
 
-    # Copy file on disk
-    try:
-        await asyncio.to_thread(shutil.copy2, original.storage_path, new_storage_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to copy file: {e}")
+    # The copy references the original's blob; no data is duplicated on disk.
+    new_storage_path = await get_storage().retain(db, original.storage_path)
 
     # Generate copy name: "file.txt" -> "file (copy).txt"
     base_name = original.name
@@ -1515,12 +1840,6 @@ async def copy_file(
     else:
         copy_name = f"{base_name} (copy)"
 
-    # Generate thumbnail for the copy
-    thumb_path = None
-    if can_generate_thumbnail(copy_name):
-        thumb_dir = os.path.join(user_storage_path, "thumbnails")
-        thumb_path = generate_thumbnail(new_storage_path, thumb_dir, new_id)
-
     # Create database entry
     now = datetime.now(timezone.utc)
     new_file = FileModel(
@@ -1530,9 +1849,8 @@ async def copy_file(
         mime_type=original.mime_type,
         size=original.size,
         path=original.path,
+        parent_id=original.parent_id,
         storage_path=new_storage_path,
-        content_index=original.content_index,
-        thumbnail_path=thumb_path,
         owner_id=current_user.id,
         is_starred=False,
         is_trashed=False,
@@ -1542,6 +1860,26 @@ async def copy_file(
     )
 
     db.add(new_file)
+    await link_node(db, new_id, original.parent_id)
+    await aggregates.record_created(db, new_file)
+    await db.execute(insert(FileContent).from_select(
+        ["file_id", "content_index"],
+        select(literal(new_id), FileContent.content_index).where(FileContent.file_id == original.id),
+    ))
+    # The extracted text is copied above; only the thumbnail needs regenerating.
+    if can_generate_thumbnail(copy_name):
+        enqueue_job(
+            db,
+            JOB_THUMBNAIL,
+            new_file,
+            {
+                "source_path": new_storage_path,
+                "version": 1,
+                "thumbnail_dir": os.path.join(user_storage_path, "thumbnails"),
+                "thumbnail_key": new_id,
+            },
+            created_by=current_user.id,
+        )
     db.add(FileVersion(
         file_id=new_id,
         version=1,
@@ -1551,8 +1889,6 @@ async def copy_file(
         created_at=now,
         created_by=current_user.id,
     ))
-    current_user.storage_used += original.size
-
     # Log activity
     activity = ActivityLog(
         user_id=current_user.id,
@@ -1560,6 +1896,7 @@ async def copy_file(
         file_name=copy_name,
     )
     db.add(activity)
+    await record_changes(db, "created", [new_id])
     await db.flush()
 
     return to_file_response(new_file)
@@ -1582,6 +1919,8 @@ async def update_file(
 
     old_path = parse_path(file.path)
     old_full_path = old_path + [file.name]
+    moved = False
+    new_parent_id = file.parent_id
 
     if update.name is not None:
         safe_name = sanitize_rename_target(update.name)
@@ -1598,12 +1937,14 @@ async def update_file(
         normalized_path = normalize_tree_path(update.path)
         if access_ctx.shared_root is not None:
             normalized_path = parse_shared_path(access_ctx.shared_root.path) + [access_ctx.shared_root.name] + normalized_path
-        await ensure_folder_path_exists(db, file.owner_id, normalized_path)
+        new_parent_id = await ensure_folder_path_exists(db, file.owner_id, normalized_path)
 
         if file.type == "folder" and normalized_path[:len(old_full_path)] == old_full_path:
             raise HTTPException(status_code=400, detail="Cannot move a folder into itself")
 
         file.path = serialize_path(normalized_path)
+        file.parent_id = new_parent_id
+        moved = True
         activity = ActivityLog(
             user_id=current_user.id,
             action="move",
@@ -1623,26 +1964,14 @@ async def update_file(
 
     if file.type == "folder" and (update.name is not None or update.path is not None):
         new_full_path = parse_path(file.path) + [file.name]
-        folder_path_prefixes = get_serialized_path_prefixes(old_full_path)
-        children_result = await db.execute(
-            select(FileModel).where(
-                and_(
-                    FileModel.owner_id == file.owner_id,
-                    FileModel.id != file.id,
-                    or_(*[
-                        FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR)
-                        for prefix in folder_path_prefixes
-                    ]),
-                )
-            )
-        )
-        for child in children_result.scalars().all():
-            child_path = parse_path(child.path)
-            if child_path[:len(old_full_path)] != old_full_path:
-                continue
-            child.path = serialize_path(new_full_path + child_path[len(old_full_path):])
+        await rewrite_subtree_paths(db, file.id, old_full_path, new_full_path)
+    if moved:
+        await aggregates.record_moving(db, [file.id])
+        await move_subtree(db, file.id, new_parent_id)
+        await aggregates.record_moved(db, [file.id])
     
     file.updated_at = datetime.now(timezone.utc)
+    await record_changes(db, "moved" if moved else "updated", [file.id])
     await db.flush()
     await db.refresh(file)
     
@@ -1664,35 +1993,29 @@ async def trash_file(
 ):
     """Move file or folder to trash (recursive for folders)"""
     file, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="admin")
+    await aggregates.record_trashing(db, [file.id])
     
     now = datetime.now(timezone.utc)
     file.is_trashed = True
     file.trashed_at = now
     file.updated_at = now
-    affected_ids = [file.id]
     
     # If folder, recursively trash all children
     if file.type == "folder":
-        folder_path = parse_path(file.path) + [file.name]
-        folder_path_prefixes = get_serialized_path_prefixes(folder_path)
-        children_result = await db.execute(
-            select(FileModel).where(
-                and_(
-                    FileModel.owner_id == file.owner_id,
-                    or_(*[FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR) for prefix in folder_path_prefixes]),
-                    FileModel.is_trashed == False,
-                )
+        await db.execute(
+            sql_update(FileModel)
+            .where(
+                FileModel.id.in_(subtree_ids(file.id)),
+                FileModel.is_trashed == False,
             )
+            .values(is_trashed=True, trashed_at=now)
+            .execution_options(synchronize_session=False)
         )
-        for child in children_result.scalars().all():
-            child.is_trashed = True
-            child.trashed_at = now
-            affected_ids.append(child.id)
 
     await db.execute(
         sql_update(ShareLink)
         .where(
-            ShareLink.file_id.in_(affected_ids),
+            ShareLink.file_id.in_(subtree_ids(file.id, include_self=True)),
             ShareLink.is_active.is_(True),
         )
         .values(is_active=False)
@@ -1704,6 +2027,7 @@ async def trash_file(
         file_name=file.name,
     )
     db.add(activity)
+    await record_changes(db, "trashed", [file.id], subtree=True)
     
     await db.flush()
     await db.refresh(file)
@@ -1726,6 +2050,7 @@ async def restore_file(
 ):
     """Restore file or folder from trash (recursive for folders)"""
     file, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="admin", allow_trashed=True)
+    await aggregates.record_restoring(db, [file.id])
     
     file.is_trashed = False
     file.trashed_at = None
@@ -1733,20 +2058,15 @@ async def restore_file(
     
     # If folder, recursively restore all children
     if file.type == "folder":
-        folder_path = parse_path(file.path) + [file.name]
-        folder_path_prefixes = get_serialized_path_prefixes(folder_path)
-        children_result = await db.execute(
-            select(FileModel).where(
-                and_(
-                    FileModel.owner_id == file.owner_id,
-                    or_(*[FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR) for prefix in folder_path_prefixes]),
-                    FileModel.is_trashed == True,
-                )
+        await db.execute(
+            sql_update(FileModel)
+            .where(
+                FileModel.id.in_(subtree_ids(file.id)),
+                FileModel.is_trashed == True,
             )
+            .values(is_trashed=False, trashed_at=None)
+            .execution_options(synchronize_session=False)
         )
-        for child in children_result.scalars().all():
-            child.is_trashed = False
-            child.trashed_at = None
     
     activity = ActivityLog(
         user_id=current_user.id,
@@ -1754,6 +2074,7 @@ async def restore_file(
         file_name=file.name,
     )
     db.add(activity)
+    await record_changes(db, "restored", [file.id], subtree=True)
     
     await db.flush()
     await db.refresh(file)
@@ -1776,32 +2097,282 @@ async def delete_file_permanently(
 ):
     """Permanently delete a file or folder (recursive for folders)"""
     file, access_ctx = await get_file_access_context(db, current_user, file_id, required_role="admin", allow_trashed=True)
+    await aggregates.record_purging(db, [file.id])
+    await record_changes(db, "deleted", [file.id], subtree=True)
     
     freed_bytes = 0
 
     # If folder, recursively delete all children first
     if file.type == "folder":
-        folder_path = parse_path(file.path) + [file.name]
-        folder_path_prefixes = get_serialized_path_prefixes(folder_path)
         children_result = await db.execute(
-            select(FileModel).where(
-                and_(
-                    FileModel.owner_id == file.owner_id,
-                    or_(*[FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR) for prefix in folder_path_prefixes]),
-                )
-            )
+            select(FileModel).where(FileModel.id.in_(subtree_ids(file.id)))
         )
         for child in children_result.scalars().all():
             freed_bytes += await purge_file(db, child)
 
     freed_bytes += await purge_file(db, file)
-    owner_user = current_user if access_ctx.is_owner else await db.get(User, file.owner_id)
-    if owner_user is not None:
-        owner_user.storage_used = max(0, owner_user.storage_used - freed_bytes)
+    await quota.credit(db, file.owner_id, freed_bytes)
     await db.flush()
 
 
-PREVIEWABLE_TYPES = {"image", "video", "pdf", "text"}
+BULK_REQUIRED_ROLES = {
+    "move": "editor",
+    "trash": "admin",
+    "restore": "admin",
+    "delete": "admin",
+    "star": "owner",
+    "unstar": "owner",
+}
+
+
+async def bulk_move(
+    db: AsyncSession,
+    current_user: User,
+    targets: dict[str, tuple[FileModel, FileAccessContext]],
+    raw_path: List[str],
+) -> dict[str, HTTPException]:
+    """Move every target into *raw_path*; returns per-item failures.
+
+    Items in a shared folder resolve *raw_path* inside that folder, as the
+    single-item PATCH does.  Selected items nested inside other selected
+    folders are moved first, so each round can re-parent its items with
+    one set-based UPDATE and one closure rewrite per destination.
+    """
+    normalized_path = normalize_tree_path(raw_path)
+    destinations: dict[tuple[str, tuple[str, ...]], Optional[str] | HTTPException] = {}
+    moves: dict[str, tuple[FileModel, List[str], Optional[str]]] = {}
+    errors: dict[str, HTTPException] = {}
+    for file_id, (file, access_ctx) in targets.items():
+        target_path = normalized_path
+        if access_ctx.shared_root is not None:
+            target_path = parse_shared_path(access_ctx.shared_root.path) + [access_ctx.shared_root.name] + normalized_path
+        key = (file.owner_id, tuple(target_path))
+        if key not in destinations:
+            try:
+                destinations[key] = await ensure_folder_path_exists(db, file.owner_id, target_path)
+            except HTTPException as exc:
+                destinations[key] = exc
+        if isinstance(destinations[key], HTTPException):
+            errors[file_id] = destinations[key]
+            continue
+        if file.type == "folder" and target_path[:len(parse_path(file.path)) + 1] == parse_path(file.path) + [file.name]:
+            errors[file_id] = HTTPException(status_code=400, detail="Cannot move a folder into itself")
+            continue
+        moves[file_id] = (file, target_path, destinations[key])
+
+    # Number of selected ancestors per item; deepest items move first.
+    levels = dict.fromkeys(moves, 0)
+    for batch in batched(list(moves)):
+        nested = await db.execute(
+            select(FileClosure.descendant_id, func.count())
+            .where(
+                FileClosure.descendant_id.in_(batch),
+                FileClosure.ancestor_id.in_(list(moves)),
+                FileClosure.depth > 0,
+            )
+            .group_by(FileClosure.descendant_id)
+        )
+        for file_id, count in nested.all():
+            levels[file_id] = count
+
+    now = datetime.now(timezone.utc)
+    for level in sorted(set(levels.values()), reverse=True):
+        groups: dict[tuple[Optional[str], tuple[str, ...]], List[str]] = {}
+        for file_id, item_level in levels.items():
+            if item_level == level:
+                _file, target_path, parent_id = moves[file_id]
+                groups.setdefault((parent_id, tuple(target_path)), []).append(file_id)
+
+        for (parent_id, target_path), file_ids in groups.items():
+            for batch in batched(file_ids):
+                await aggregates.record_moving(db, batch)
+                await db.execute(
+                    sql_update(FileModel)
+                    .where(FileModel.id.in_(batch))
+                    .values(path=serialize_path(list(target_path)), parent_id=parent_id, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                for file_id in batch:
+                    file = moves[file_id][0]
+                    if file.type == "folder":
+                        await rewrite_subtree_paths(
+                            db,
+                            file.id,
+                            parse_path(file.path) + [file.name],
+                            list(target_path) + [file.name],
+                        )
+                await move_subtrees(db, batch, parent_id)
+                await aggregates.record_moved(db, batch)
+
+    db.add_all([
+        ActivityLog(user_id=current_user.id, action="move", file_name=moves[file_id][0].name)
+        for file_id in moves
+    ])
+    await record_changes(db, "moved", moves)
+    return errors
+
+
+async def bulk_set_trashed(
+    db: AsyncSession,
+    current_user: User,
+    targets: dict[str, tuple[FileModel, FileAccessContext]],
+    trashed: bool,
+) -> None:
+    """Trash or restore every target together with its subtree"""
+    now = datetime.now(timezone.utc)
+    trashed_at = now if trashed else None
+    for batch in batched(list(targets)):
+        if trashed:
+            await aggregates.record_trashing(db, batch)
+        else:
+            await aggregates.record_restoring(db, batch)
+        await db.execute(
+            sql_update(FileModel)
+            .where(FileModel.id.in_(batch))
+            .values(is_trashed=trashed, trashed_at=trashed_at, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            sql_update(FileModel)
+            .where(
+                FileModel.id.in_(subtree_ids(batch)),
+                FileModel.is_trashed == (not trashed),
+            )
+            .values(is_trashed=trashed, trashed_at=trashed_at)
+            .execution_options(synchronize_session=False)
+        )
+        if trashed:
+            await db.execute(
+                sql_update(ShareLink)
+                .where(
+                    ShareLink.file_id.in_(subtree_ids(batch, include_self=True)),
+                    ShareLink.is_active.is_(True),
+                )
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+
+    action = "trash" if trashed else "restore"
+    db.add_all([
+        ActivityLog(user_id=current_user.id, action=action, file_name=file.name)
+        for file, _access_ctx in targets.values()
+    ])
+    await record_changes(db, "trashed" if trashed else "restored", targets, subtree=True)
+
+
+async def bulk_delete(
+    db: AsyncSession,
+    current_user: User,
+    targets: dict[str, tuple[FileModel, FileAccessContext]],
+) -> None:
+    """Permanently delete every target and its subtree, crediting each owner's usage"""
+    file_ids: set[str] = set()
+    for batch in batched(list(targets)):
+        file_ids.update((await db.scalars(subtree_ids(batch, include_self=True))).all())
+    file_ids.update(targets)
+
+    await aggregates.record_purging(db, list(targets))
+    await record_changes(db, "deleted", file_ids)
+    freed = await purge_files(db, list(file_ids))
+    for owner_id, freed_bytes in freed.items():
+        await quota.credit(db, owner_id, freed_bytes)
+
+
+async def bulk_set_starred(
+    db: AsyncSession,
+    current_user: User,
+    targets: dict[str, tuple[FileModel, FileAccessContext]],
+    starred: bool,
+) -> None:
+    now = datetime.now(timezone.utc)
+    for batch in batched(list(targets)):
+        await db.execute(
+            sql_update(FileModel)
+            .where(FileModel.id.in_(batch))
+            .values(is_starred=starred, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    if starred:
+        db.add_all([
+            ActivityLog(user_id=current_user.id, action="star", file_name=file.name)
+            for file, _access_ctx in targets.values()
+        ])
+    await record_changes(db, "updated", targets)
+
+
+@router.post("/bulk", response_model=BulkFileResponse)
+@limiter.limit("30/minute")
+async def bulk_file_operation(
+    request: Request,
+    bulk_req: BulkFileRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Move, trash, restore, delete, star, or unstar many items in one transaction.
+
+    Access is checked for every id up front; items that fail are reported
+    individually and the rest are applied with set-based statements.
+    """
+    operation = bulk_req.operation
+    if operation == "move" and bulk_req.path is None:
+        raise HTTPException(status_code=400, detail="A destination path is required to move files")
+
+    file_ids = list(dict.fromkeys(bulk_req.file_ids))
+    resolved = await get_file_access_contexts(
+        db,
+        current_user,
+        file_ids,
+        required_role=BULK_REQUIRED_ROLES[operation],
+        allow_trashed=operation in {"restore", "delete"},
+    )
+    errors = {file_id: outcome for file_id, outcome in resolved.items() if isinstance(outcome, HTTPException)}
+    targets = {file_id: outcome for file_id, outcome in resolved.items() if not isinstance(outcome, HTTPException)}
+
+    if targets:
+        if operation == "move":
+            move_errors = await bulk_move(db, current_user, targets, bulk_req.path)
+            errors.update(move_errors)
+        elif operation in {"trash", "restore"}:
+            await bulk_set_trashed(db, current_user, targets, operation == "trash")
+        elif operation == "delete":
+            await bulk_delete(db, current_user, targets)
+        else:
+            await bulk_set_starred(db, current_user, targets, operation == "star")
+        await db.flush()
+
+    results = [
+        BulkFileResult(id=file_id, ok=False, status_code=errors[file_id].status_code, detail=errors[file_id].detail)
+        if file_id in errors
+        else BulkFileResult(id=file_id, ok=True)
+        for file_id in file_ids
+    ]
+    return BulkFileResponse(
+        operation=operation,
+        succeeded=len(file_ids) - len(errors),
+        failed=len(errors),
+        results=results,
+    )
+
+
+def send_preview(request: Request, file: FileModel, cache_control: str) -> Response:
+    if file.type not in PREVIEWABLE_TYPES:
+        raise HTTPException(status_code=400, detail="This file type cannot be previewed")
+
+    if not file.storage_path or not os.path.exists(file.storage_path):
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+    media_type = file.mime_type or mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+
+    # Range requests (video seeking) and conditional GETs are handled by the responder
+    return send_file(
+        request,
+        file.storage_path,
+        etag=content_etag(file.id, file.version),
+        last_modified=file.updated_at,
+        media_type=media_type,
+        content_disposition=build_content_disposition("inline", file.name),
+        cache_control=cache_control,
+    )
 
 
 @router.get("/{file_id}/preview", response_model=None)
@@ -1814,89 +2385,57 @@ async def preview_file(
 ):
     """Serve file content inline for preview. Authenticated via Authorization header."""
     file, _access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
+    return send_preview(request, file, "private, max-age=3600")
 
-    if file.type not in PREVIEWABLE_TYPES:
-        raise HTTPException(status_code=400, detail="This file type cannot be previewed")
 
-    if not file.storage_path or not os.path.exists(file.storage_path):
-        raise HTTPException(status_code=404, detail="File not found on disk")
+@router.get("/{file_id}/preview/{version}", response_model=None)
+@limiter.limit("120/minute")
+async def preview_signed(
+    request: Request,
+    file_id: str,
+    version: int,
+    expires: int = Query(...),
+    sig: str = Query(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Serve one version inline through the signed ``preview_url`` of a listing.
 
-    # Path traversal protection
-    resolved = os.path.realpath(file.storage_path)
-    base_path = os.path.realpath(settings.storage_path)
-    if os.path.commonpath([base_path, resolved]) != base_path:
-        raise HTTPException(status_code=403, detail="Access denied")
+    The signature stands in for the Authorization header and the access
+    check; the file row is read by primary key only to locate its content.
+    """
+    verify_signed_url("preview", file_id, version, expires, sig)
+    file = await db.scalar(
+        select(FileModel).where(
+            FileModel.id == file_id,
+            FileModel.version == version,
+            FileModel.is_trashed == False,
+        )
+    )
+    if file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return send_preview(request, file, signed_cache_control(expires))
 
-    # Get file size
-    file_size = os.path.getsize(file.storage_path)
-    media_type = file.mime_type or mimetypes.guess_type(file.name)[0] or "application/octet-stream"
 
-    # Parse Range header for partial content (required for video seeking)
-    range_header = request.headers.get("range")
+async def resolve_thumbnail(file: FileModel, size: Optional[int]) -> str:
+    """Path of the rendition covering ``size``, generating it if needed."""
+    if not (file.thumbnail_path or can_generate_thumbnail(file.name)):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
 
-    if range_header:
-        # Parse "bytes=start-end"
-        try:
-            range_spec = range_header.replace("bytes=", "").strip()
-            parts = range_spec.split("-")
-            start = int(parts[0]) if parts[0] else 0
-            end = int(parts[1]) if parts[1] else file_size - 1
-        except (ValueError, IndexError):
-            start = 0
-            end = file_size - 1
-
-        if start >= file_size:
-            return StreamingResponse(
-                status_code=416,
-                headers={"Content-Range": f"bytes */{file_size}"}
-            )
-        end = min(end, file_size - 1)
-        content_length = end - start + 1
-
-        def iter_range():
-            with open(file.storage_path, "rb") as f:
-                f.seek(start)
-                remaining = content_length
-                while remaining > 0:
-                    chunk_size = min(65536, remaining)  # 64KB chunks
-                    data = f.read(chunk_size)
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-
-        return StreamingResponse(
-            iter_range(),
-            status_code=206,
-            media_type=media_type,
-            headers={
-                "Content-Range": f"bytes {start}-{end}/{file_size}",
-                "Content-Length": str(content_length),
-                "Accept-Ranges": "bytes",
-                "Content-Disposition": build_content_disposition("inline", file.name),
-                "Cache-Control": "private, max-age=3600",
-            }
+    thumbnail_path = None
+    if file.storage_path and os.path.exists(file.storage_path) and can_generate_thumbnail(file.name):
+        thumbnail_path = await ensure_rendition(
+            file.storage_path,
+            os.path.join(settings.storage_path, file.owner_id, "thumbnails"),
+            thumbnail_key(file.id, file.version),
+            nearest_rendition_size(size),
+            resolve_format(settings.thumbnail_format),
         )
-
-    # No Range header — stream the full file in chunks (avoids loading into memory)
-    def iter_file():
-        with open(file.storage_path, "rb") as f:
-            while True:
-                chunk = f.read(65536)  # 64KB chunks
-                if not chunk:
-                    break
-                yield chunk
-
-    return StreamingResponse(
-        iter_file(),
-        media_type=media_type,
-        headers={
-            "Content-Length": str(file_size),
-            "Accept-Ranges": "bytes",
-            "Content-Disposition": build_content_disposition("inline", file.name),
-            "Cache-Control": "private, max-age=3600",
-        }
-    )
+    if thumbnail_path is None:
+        # Legacy single-size JPEG, or the source could not be decoded.
+        thumbnail_path = file.thumbnail_path
+    if not thumbnail_path or not os.path.exists(thumbnail_path):
+        raise HTTPException(status_code=404, detail="Thumbnail file missing")
+    return thumbnail_path
 
 
 @router.get("/{file_id}/thumbnail", response_model=None)
@@ -1904,26 +2443,66 @@ async def preview_file(
 async def get_thumbnail(
     request: Request,
     file_id: str,
+    size: Optional[int] = Query(None, ge=16, le=2048, description="Requested edge length in pixels"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Serve a file's thumbnail image. Authenticated via Authorization header."""
+    """Serve a file's thumbnail image. Authenticated via Authorization header.
+
+    Returns the smallest stored rendition covering ``size``; renditions that
+    do not exist yet are generated on demand in the process pool.
+    """
 
     file, _access_ctx = await get_file_access_context(db, current_user, file_id, required_role="viewer")
-    if not file or not file.thumbnail_path:
-        raise HTTPException(status_code=404, detail="Thumbnail not found")
-    
-    if not os.path.exists(file.thumbnail_path):
-        raise HTTPException(status_code=404, detail="Thumbnail file missing")
-    
-    # Path traversal protection
-    resolved = os.path.realpath(file.thumbnail_path)
-    base_path = os.path.realpath(settings.storage_path)
-    if os.path.commonpath([base_path, resolved]) != base_path:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    return FileResponse(
-        path=file.thumbnail_path,
-        media_type="image/jpeg",
-        headers={"Cache-Control": "public, max-age=86400"}
+    thumbnail_path = await resolve_thumbnail(file, size)
+
+    return send_file(
+        request,
+        thumbnail_path,
+        etag=content_etag(file.id, file.version, os.path.basename(thumbnail_path)),
+        last_modified=file.updated_at,
+        media_type=media_type_for(thumbnail_path),
+        cache_control="public, max-age=86400",
+    )
+
+
+@router.get("/{file_id}/thumbnail/{version}", response_model=None)
+@limiter.limit("1200/minute")
+async def get_thumbnail_signed(
+    request: Request,
+    file_id: str,
+    version: int,
+    owner: str = Query(...),
+    expires: int = Query(...),
+    sig: str = Query(...),
+    size: Optional[int] = Query(None, ge=16, le=2048, description="Requested edge length in pixels"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Serve a thumbnail through the signed ``thumbnail_url`` of a listing.
+
+    A rendition already on disk is served without touching the database; the
+    file row is only read to generate a missing one.
+    """
+    verify_signed_url("thumbnail", file_id, version, expires, sig, owner_id=owner)
+
+    thumbnail_path = rendition_path(
+        os.path.join(settings.storage_path, owner, "thumbnails"),
+        thumbnail_key(file_id, version),
+        nearest_rendition_size(size),
+        resolve_format(settings.thumbnail_format),
+    )
+    if not os.path.exists(thumbnail_path):
+        file = await db.scalar(
+            select(FileModel).where(FileModel.id == file_id, FileModel.version == version)
+        )
+        if file is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        thumbnail_path = await resolve_thumbnail(file, size)
+
+    return send_file(
+        request,
+        thumbnail_path,
+        etag=content_etag(file_id, version, os.path.basename(thumbnail_path)),
+        media_type=media_type_for(thumbnail_path),
+        cache_control=signed_cache_control(expires),
     )
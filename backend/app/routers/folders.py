@@ -6,13 +6,16 @@ from typing import List
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, update as sql_update
+from sqlalchemy import select, and_, update as sql_update
 
+from app import aggregates
 from app.database import get_db
 from app.models import User, File as FileModel, ActivityLog, ShareLink
 from app.schemas import FolderCreate, FileResponse as FileResponseSchema
 from app.auth import get_current_user
-from app.db_utils import LIKE_ESCAPE_CHAR, prefix_like_pattern
+from app.change_log import record_changes
+from app.db_utils import prefix_like_pattern
+from app.file_tree import link_node, subtree_ids
 from app.shared_access import get_file_access_context, relative_path_within_shared_root, resolve_target_path
 from app.tree_validation import sanitize_tree_name, ensure_folder_path_exists
 
@@ -61,7 +64,7 @@ async def create_folder(
         required_role="editor",
     )
     owner_id = access_ctx.owner_id
-    await ensure_folder_path_exists(db, owner_id, normalized_path)
+    parent_id = await ensure_folder_path_exists(db, owner_id, normalized_path)
 
     # Check if folder with same name exists in same path
     existing = await db.execute(
@@ -87,11 +90,15 @@ async def create_folder(
         type="folder",
         size=0,
         path=serialize_path(normalized_path),
+        parent_id=parent_id,
         owner_id=owner_id,
         version=1,
     )
     
     db.add(new_folder)
+    await db.flush()
+    await link_node(db, new_folder.id, parent_id)
+    await aggregates.record_created(db, new_folder)
     
     # Log activity
     activity = ActivityLog(
@@ -100,6 +107,7 @@ async def create_folder(
         file_name=normalized_name,
     )
     db.add(activity)
+    await record_changes(db, "created", [new_folder.id])
     
     await db.flush()
     await db.refresh(new_folder)
@@ -115,6 +123,8 @@ async def create_folder(
         type=new_folder.type,
         mime_type=new_folder.mime_type,
         size=new_folder.size,
+        subtree_size=new_folder.subtree_size or 0,
+        subtree_count=new_folder.subtree_count or 0,
         path=path_override if path_override is not None else parse_path(new_folder.path),
         is_starred=new_folder.is_starred,
         is_trashed=new_folder.is_trashed,
@@ -145,32 +155,20 @@ async def delete_folder(
     if folder.type != "folder":
         raise HTTPException(status_code=400, detail="Not a folder")
     
-    # Get folder path for finding children
-    folder_path = parse_path(folder.path)
-    folder_full_path = folder_path + [folder.name]
-    folder_path_prefixes = get_serialized_path_prefixes(folder_full_path)
-    
-    # Get all files/folders inside this folder (and subfolders)
-    children_result = await db.execute(
-        select(FileModel).where(
-            and_(
-                FileModel.owner_id == folder.owner_id,
-                or_(*[FileModel.path.like(prefix, escape=LIKE_ESCAPE_CHAR) for prefix in folder_path_prefixes]),
-            )
-        )
+    await aggregates.record_trashing(db, [folder.id])
+    now = datetime.now(timezone.utc)
+
+    # Trash all files/folders inside this folder (and subfolders)
+    await db.execute(
+        sql_update(FileModel)
+        .where(FileModel.id.in_(subtree_ids(folder.id)))
+        .values(is_trashed=True, trashed_at=now)
+        .execution_options(synchronize_session=False)
     )
-    children = children_result.scalars().all()
-    affected_ids = [folder.id]
-    
-    # Trash all children
-    for child in children:
-        child.is_trashed = True
-        child.trashed_at = datetime.now(timezone.utc)
-        affected_ids.append(child.id)
     
     # Trash the folder itself
     folder.is_trashed = True
-    folder.trashed_at = datetime.now(timezone.utc)
+    folder.trashed_at = now
     
     # Log activity
     activity = ActivityLog(
@@ -183,10 +181,11 @@ async def delete_folder(
     await db.execute(
         sql_update(ShareLink)
         .where(
-            ShareLink.file_id.in_(affected_ids),
+            ShareLink.file_id.in_(subtree_ids(folder.id, include_self=True)),
             ShareLink.is_active == True,
         )
         .values(is_active=False)
     )
+    await record_changes(db, "trashed", [folder.id], subtree=True)
 
     await db.flush()
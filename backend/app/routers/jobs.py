@@ -0,0 +1,54 @@
+"""
+Background job status routes.
+"""
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_user
+from app.database import get_db
+from app.models import BackgroundJob, User
+from app.schemas import JobResponse
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+
+def _visible_to(user: User):
+    """Jobs are visible to the file owner and to whoever triggered them."""
+    return or_(BackgroundJob.owner_id == user.id, BackgroundJob.created_by == user.id)
+
+
+@router.get("", response_model=List[JobResponse])
+async def list_jobs(
+    file_id: Optional[str] = Query(None),
+    job_status: Optional[str] = Query(None, alias="status"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """List recent background jobs, optionally for one file or status"""
+    query = select(BackgroundJob).where(_visible_to(current_user))
+    if file_id:
+        query = query.where(BackgroundJob.file_id == file_id)
+    if job_status:
+        query = query.where(BackgroundJob.status == job_status)
+    result = await db.execute(query.order_by(BackgroundJob.created_at.desc()).limit(limit))
+    return result.scalars().all()
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get the status of one background job"""
+    result = await db.execute(
+        select(BackgroundJob).where(BackgroundJob.id == job_id, _visible_to(current_user))
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
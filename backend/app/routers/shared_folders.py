@@ -23,6 +23,7 @@ from app.shared_access import (
     relative_path_within_shared_root,
     resolve_user_identifier,
 )
+from app.shared_grants import invalidate_shared_grants
 
 router = APIRouter(prefix="/api/shared-folders", tags=["Shared Folders"])
 
@@ -35,6 +36,8 @@ def build_folder_response(folder: FileModel, *, current_user: User, owner_userna
         type=folder.type,
         mime_type=folder.mime_type,
         size=folder.size,
+        subtree_size=folder.subtree_size or 0,
+        subtree_count=folder.subtree_count or 0,
         path=[],
         is_starred=folder.is_starred,
         is_trashed=folder.is_trashed,
@@ -166,6 +169,7 @@ async def invite_to_shared_folder(
             updated_at=now,
         )
         db.add(access)
+    invalidate_shared_grants(db, target_user.id, folder.owner_id)
 
     db.add(ActivityLog(
         user_id=current_user.id,
@@ -204,6 +208,7 @@ async def update_shared_folder_access(
     access.role = payload.role
     access.invited_by = current_user.id
     access.updated_at = datetime.now(timezone.utc)
+    invalidate_shared_grants(db, access.user_id, access.owner_id)
     db.add(ActivityLog(
         user_id=current_user.id,
         action="share_folder_role_update",
@@ -242,4 +247,5 @@ async def remove_shared_folder_access(
         file_name=f"{folder.name} -> {invited_user.username}",
     ))
     await db.delete(access)
+    invalidate_shared_grants(db, access.user_id, access.owner_id)
     await db.flush()
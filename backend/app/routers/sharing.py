@@ -6,7 +6,6 @@ import os
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
-from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, update
 from pydantic import BaseModel
@@ -15,9 +14,18 @@ from app.database import get_db
 from app.limiter import limiter
 from app.models import User, File as FileModel, ShareLink, ActivityLog
 from app.schemas import ShareLinkCreate, ShareLinkResponse
-from app.auth import get_current_user, get_password_hash, verify_password
+from app.auth import get_current_user, get_password_hash_async, verify_password_async
 from app.config import get_settings
+from app.downloads import content_etag, continues_download, http_date, send_file
 from app.routers.files import build_content_disposition
+from app.share_links import (
+    create_resume_token,
+    create_share_grant,
+    grant_expiry,
+    share_link_cache,
+    verify_resume_token,
+    verify_share_grant,
+)
 
 settings = get_settings()
 router = APIRouter(prefix="/api/share", tags=["Sharing"])
@@ -25,6 +33,7 @@ router = APIRouter(prefix="/api/share", tags=["Sharing"])
 
 class ShareAccessRequest(BaseModel):
     password: Optional[str] = None
+    grant: Optional[str] = None
 
 
 async def reserve_share_download_slot(db: AsyncSession, link: ShareLink) -> None:
@@ -82,7 +91,7 @@ async def create_share_link(
     )
 
     if data.password:
-        share_link.password_hash = get_password_hash(data.password)
+        share_link.password_hash = await get_password_hash_async(data.password)
 
     if data.expires_in_hours is not None:
         share_link.expires_at = datetime.now(timezone.utc) + timedelta(hours=data.expires_in_hours)
@@ -170,15 +179,13 @@ async def _deactivate_share_link_for_trashed_file(
     link.is_active = False
 
 
-@router.post("/{token}")
-@limiter.limit("60/minute")
-async def access_shared_file(
-    request: Request,
-    token: str,
-    body: Optional[ShareAccessRequest] = None,
-    db: AsyncSession = Depends(get_db)
-):
-    """Access a shared file (public — no auth required). Password sent in body."""
+async def _load_share(db: AsyncSession, token: str) -> tuple[ShareLink, FileModel]:
+    """The link for *token* joined to its file, from the share cache when possible."""
+    cached = share_link_cache.get(token)
+    if cached is not None:
+        return cached.materialize()
+
+    generation = share_link_cache.generation()
     result = await db.execute(
         select(ShareLink, FileModel)
         .join(FileModel, ShareLink.file_id == FileModel.id)
@@ -189,37 +196,50 @@ async def access_shared_file(
         raise HTTPException(status_code=404, detail="Share link not found")
 
     link, file = row[0], row[1]
+    if link.is_active and not file.is_trashed:
+        share_link_cache.put(token, link, file, generation)
+    return link, file
 
-    if file.is_trashed:
-        await _deactivate_share_link_for_trashed_file(db, link)
-        raise HTTPException(status_code=410, detail="This file is no longer shared")
 
-    # Check if active
+def _ensure_link_usable(link: ShareLink, *, check_cap: bool = True) -> None:
+    """Reject revoked, expired and (with *check_cap*) exhausted links."""
     if not link.is_active:
         raise HTTPException(status_code=410, detail="This share link has been revoked")
 
-    # Check expiry
-    if link.expires_at and datetime.now(timezone.utc) > link.expires_at:
-        raise HTTPException(status_code=410, detail="This share link has expired")
+    expires_at = link.expires_at
+    if expires_at is not None:
+        if expires_at.tzinfo is None:
+            # SQLite hands DateTime values back naive; they are stored as UTC.
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) > expires_at:
+            raise HTTPException(status_code=410, detail="This share link has expired")
 
-    # Check max downloads
-    if link.max_downloads and link.download_count >= link.max_downloads:
+    if check_cap and link.max_downloads and link.download_count >= link.max_downloads:
         raise HTTPException(status_code=410, detail="Download limit reached")
 
-    # Check password (from body)
-    if link.password_hash:
-        password = body.password if body else None
-        if not password:
-            raise HTTPException(
-                status_code=401,
-                detail="Password required",
-                headers={"X-Share-Password-Required": "true"},
-            )
-        if not verify_password(password, link.password_hash):
-            raise HTTPException(status_code=401, detail="Incorrect password")
-
-    # Return file info for view permission
-    return {
+
+@router.post("/{token}")
+@limiter.limit("60/minute")
+async def access_shared_file(
+    request: Request,
+    token: str,
+    body: Optional[ShareAccessRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Access a shared file (public — no auth required). Password sent in body.
+    A correct password is answered with a signed ``access_grant`` that later
+    requests can send instead of the password.
+    """
+    link, file = await _load_share(db, token)
+
+    if file.is_trashed:
+        await _deactivate_share_link_for_trashed_file(db, link)
+        raise HTTPException(status_code=410, detail="This file is no longer shared")
+
+    _ensure_link_usable(link)
+
+    response = {
         "file_name": file.name,
         "file_type": file.type,
         "file_size": file.size,
@@ -228,6 +248,24 @@ async def access_shared_file(
         "can_download": link.permission == "download",
     }
 
+    # Check password (from body), or a grant earned with it
+    if link.password_hash:
+        grant = body.grant if body else None
+        if not grant or not verify_share_grant(grant, link):
+            password = body.password if body else None
+            if not password:
+                raise HTTPException(
+                    status_code=401,
+                    detail="Password required",
+                    headers={"X-Share-Password-Required": "true"},
+                )
+            if not await verify_password_async(password, link.password_hash):
+                raise HTTPException(status_code=401, detail="Incorrect password")
+            grant = create_share_grant(link)
+        response["access_grant"] = grant
+        response["grant_expires_at"] = grant_expiry(grant)
+
+    return response
 
 
 @router.get("/{token}/download")
@@ -236,57 +274,64 @@ async def download_shared_file(
     request: Request,
     token: str,
     x_share_password: Optional[str] = Header(None),
+    x_share_grant: Optional[str] = Header(None),
+    x_share_resume: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Download a shared file. Password sent via X-Share-Password header."""
-    result = await db.execute(
-        select(ShareLink, FileModel)
-        .join(FileModel, ShareLink.file_id == FileModel.id)
-        .where(ShareLink.token == token)
-    )
-    row = result.first()
-    if not row:
-        raise HTTPException(status_code=404, detail="Share link not found")
+    """
+    Download a shared file. Send the ``access_grant`` from ``POST /{token}``
+    via X-Share-Grant, or the password via X-Share-Password.
 
-    link, file = row[0], row[1]
+    Every download counts against the link's cap, except a ``Range`` request
+    past the first byte that sends back the X-Share-Resume token of a counted one.
+    """
+    link, file = await _load_share(db, token)
 
     if file.is_trashed:
         raise HTTPException(status_code=410, detail="This file is no longer shared")
 
-    # Validate
-    if not link.is_active:
-        raise HTTPException(status_code=410, detail="This share link has been revoked")
-    if link.expires_at and datetime.now(timezone.utc) > link.expires_at:
-        raise HTTPException(status_code=410, detail="This share link has expired")
-    if link.max_downloads and link.download_count >= link.max_downloads:
-        raise HTTPException(status_code=410, detail="Download limit reached")
+    # Resuming a counted download neither uses up another download nor is
+    # refused once the last one has been used.  Headers alone prove nothing
+    # (the ETag is public), so it takes the token issued with that download.
+    etag = content_etag(file.id, file.version)
+    continued = (
+        x_share_resume is not None
+        and verify_resume_token(x_share_resume, link, file)
+        and continues_download(request, etag, http_date(file.updated_at), file.size or 0)
+    )
+    _ensure_link_usable(link, check_cap=not continued)
     if link.permission != "download":
         raise HTTPException(status_code=403, detail="Download not permitted for this link")
 
-    # Check password (from header)
-    if link.password_hash:
-        if not x_share_password or not verify_password(x_share_password, link.password_hash):
+    # A grant is checked in microseconds; the password costs a bcrypt round.
+    if link.password_hash and not (x_share_grant and verify_share_grant(x_share_grant, link)):
+        if not x_share_password or not await verify_password_async(x_share_password, link.password_hash):
             raise HTTPException(status_code=401, detail="Password required or incorrect")
 
     # Check file on disk
     if not file.storage_path or not os.path.exists(file.storage_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    # Path traversal protection
-    resolved = os.path.realpath(file.storage_path)
-    base_path = os.path.realpath(settings.storage_path)
-    if os.path.commonpath([base_path, resolved]) != base_path:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    await reserve_share_download_slot(db, link)
-
-    return FileResponse(
-        path=file.storage_path,
-        media_type=file.mime_type or "application/octet-stream",
-        headers={
-            "Content-Disposition": build_content_disposition("attachment", file.name)
-        }
+    response = send_file(
+        request,
+        file.storage_path,
+        etag=etag,
+        last_modified=file.updated_at,
+        media_type=file.mime_type,
+        content_disposition=build_content_disposition("attachment", file.name),
     )
+    # A 304 transfers nothing, so it does not use up a download either.
+    if response.status_code != status.HTTP_304_NOT_MODIFIED and not continued:
+        try:
+            await reserve_share_download_slot(db, link)
+        except HTTPException:
+            share_link_cache.invalidate_token(token)
+            raise
+        # Commit before streaming, so the write gate is not held for the transfer
+        await db.commit()
+        share_link_cache.record_download(token)
+        response.headers["X-Share-Resume"] = create_resume_token(link, file)
+    return response
 
 
 @router.delete("/{link_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -8,10 +8,15 @@ from sqlalchemy import select, func
 
 from app.database import get_db
 from app.limiter import limiter
-from app.models import User, File as FileModel, ActivityLog, FileVersion
+from app.models import User, File as FileModel, ActivityLog, FileVersion, UserTypeUsage
 from app.schemas import StorageResponse, StorageBreakdown, ActivityResponse
 from app.auth import get_current_user
 from app.config import get_settings
+from app import quota
+from app.change_log import record_changes
+from app.file_tree import unlink_node
+from app.storage import get_storage
+from app.thumbnails import remove_thumbnails
 
 router = APIRouter(prefix="/api/storage", tags=["Storage"])
 
@@ -26,17 +31,12 @@ async def get_storage_info(
     """Get storage usage statistics"""
     import shutil
     
-    # Get breakdown by file type
+    # Per-type totals are kept current by app.aggregates, so this is one indexed read
     result = await db.execute(
-        select(
-            FileModel.type,
-            func.sum(FileModel.size).label('total_size'),
-            func.count(FileModel.id).label('count')
-        )
-        .where(FileModel.owner_id == current_user.id)
-        .where(FileModel.is_trashed == False)
-        .where(FileModel.type != 'folder')
-        .group_by(FileModel.type)
+        select(UserTypeUsage.type, UserTypeUsage.total_size, UserTypeUsage.file_count)
+        .where(UserTypeUsage.user_id == current_user.id)
+        .where(UserTypeUsage.file_count > 0)
+        .order_by(UserTypeUsage.type)
     )
     
     breakdown = []
@@ -123,8 +123,8 @@ async def empty_trash(
     db: AsyncSession = Depends(get_db)
 ):
     """Empty trash - permanently delete all trashed files"""
-    import os
-    
+    storage = get_storage()
+
     result = await db.execute(
         select(FileModel)
         .where(FileModel.owner_id == current_user.id)
@@ -133,6 +133,7 @@ async def empty_trash(
     
     trashed_files = result.scalars().all()
     total_freed = 0
+    await record_changes(db, "deleted", [file.id for file in trashed_files])
     
     for file in trashed_files:
         versions_result = await db.execute(
@@ -140,35 +141,23 @@ async def empty_trash(
         )
         versions = versions_result.scalars().all()
 
+        # Blobs are only unlinked once no other file or version uses them
         if versions:
             for version in versions:
-                if version.storage_path and os.path.exists(version.storage_path):
-                    try:
-                        os.remove(version.storage_path)
-                    except OSError:
-                        pass
+                await storage.release(db, version.storage_path)
                 total_freed += version.size or 0
                 await db.delete(version)
         else:
-            if file.storage_path and os.path.exists(file.storage_path):
-                try:
-                    os.remove(file.storage_path)
-                except OSError:
-                    pass
+            await storage.release(db, file.storage_path)
             total_freed += file.size or 0
         
-        # Delete thumbnail from disk
-        if file.thumbnail_path and os.path.exists(file.thumbnail_path):
-            try:
-                os.remove(file.thumbnail_path)
-            except OSError:
-                pass
+        # Delete thumbnail renditions from disk
+        remove_thumbnails(file.thumbnail_path)
         
+        await unlink_node(db, file.id)
         await db.delete(file)
     
     # Update user storage
-    current_user.storage_used -= total_freed
-    if current_user.storage_used < 0:
-        current_user.storage_used = 0
+    await quota.credit(db, current_user.id, total_freed)
     
     await db.flush()
@@ -152,10 +152,13 @@ class FileResponse(BaseModel):
     type: str
     mime_type: Optional[str] = None
     size: int
+    subtree_size: int = 0  # folders: bytes of untrashed files below
+    subtree_count: int = 0  # folders: untrashed files and folders below
     path: List[str]
     is_starred: bool
     is_trashed: bool
-    thumbnail_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None  # signed; append &size= for a rendition
+    preview_url: Optional[str] = None  # signed inline content for previewable types
     version: int = 1
     is_shared: bool = False
     is_shared_root: bool = False
@@ -173,6 +176,26 @@ class FileResponse(BaseModel):
         from_attributes = True
 
 
+class FileListPage(BaseModel):
+    items: List[FileResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= to fetch the next page
+    total: Optional[int] = None  # only computed when include_total=true
+
+
+class ChangeEntry(BaseModel):
+    seq: int
+    file_id: str
+    action: str  # created, updated, moved, trashed, restored, deleted, version_added
+    changed_at: datetime
+    file: Optional[FileResponse] = None  # current state; None once the file is deleted
+
+
+class ChangeFeedPage(BaseModel):
+    changes: List[ChangeEntry]
+    next_since: int  # pass back as ?since= to continue
+    has_more: bool = False
+
+
 class FileUpdate(BaseModel):
     name: Optional[str] = None
     path: Optional[List[str]] = None
@@ -183,6 +206,35 @@ class FileMoveRequest(BaseModel):
     new_path: List[str]
 
 
+class ArchiveRequest(BaseModel):
+    file_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class ArchiveLinkResponse(BaseModel):
+    url: str
+    expires_at: datetime
+
+
+class BulkFileRequest(BaseModel):
+    operation: Literal["move", "trash", "restore", "delete", "star", "unstar"]
+    file_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    path: Optional[List[str]] = None  # destination folder for "move"
+
+
+class BulkFileResult(BaseModel):
+    id: str
+    ok: bool
+    status_code: int = 200
+    detail: Optional[str] = None
+
+
+class BulkFileResponse(BaseModel):
+    operation: str
+    succeeded: int
+    failed: int
+    results: List[BulkFileResult]
+
+
 class FileVersionResponse(BaseModel):
     id: str
     version: int
@@ -196,6 +248,22 @@ class FileVersionResponse(BaseModel):
         from_attributes = True
 
 
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    file_id: str
+    status: str  # queued | running | done | failed
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # ============ FOLDER SCHEMAS ============
 
 class FolderCreate(BaseModel):
@@ -264,6 +332,55 @@ class SystemStats(BaseModel):
     disk_free: int = 0
 
 
+class StorageGCCategory(BaseModel):
+    files: int
+    bytes: int
+    samples: List[str] = []  # storage-relative paths, capped
+
+    class Config:
+        from_attributes = True
+
+
+class StorageGCReport(BaseModel):
+    dry_run: bool
+    started_at: datetime
+    duration_seconds: float
+    expired_upload_sessions: int
+    expired_quota_reservations: int = 0
+    reclaimed_bytes: int
+    categories: dict[str, StorageGCCategory]
+    skipped: List[str] = []
+
+    class Config:
+        from_attributes = True
+
+
+class StorageGCStatus(BaseModel):
+    runs: int
+    running: bool
+    last_run_at: Optional[datetime] = None
+    removed_files_total: dict[str, int]
+    reclaimed_bytes_total: dict[str, int]
+    last_report: Optional[StorageGCReport] = None
+
+    class Config:
+        from_attributes = True
+
+
+class CryptoExecutorStatus(BaseModel):
+    workers: int
+    max_queue: int
+    running: int
+    queued: int
+    peak_queued: int
+    completed: int
+    rejected: int
+    wait_seconds_total: float
+
+    class Config:
+        from_attributes = True
+
+
 # ============ SHARING SCHEMAS ============
 
 class ShareLinkCreate(BaseModel):
@@ -317,3 +434,9 @@ class SharedFolderAccessResponse(BaseModel):
 
 class SearchResult(FileResponse):
     match_context: Optional[str] = None
+
+
+class SearchResultPage(BaseModel):
+    items: List[SearchResult]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
@@ -1,16 +1,82 @@
 """
 Helpers for search indexing and result snippets.
+
+When the SQLite build ships FTS5 with the trigram tokenizer, searchable
+columns of ``files`` and the extracted text in ``file_contents`` are
+mirrored into the ``files_fts`` virtual table by triggers, so every write path (uploads, renames, moves, text backfill)
+keeps the index in sync without Python hooks.  Trigram matching keeps the
+case-insensitive substring semantics of the old ``LIKE`` search while
+letting SQLite rank with BM25 and cut content snippets itself.
+
+``files`` has a string primary key, so its ``rowid`` is implicit and may be
+renumbered (``VACUUM`` does).  Each index row therefore also carries the file
+id in an ``UNINDEXED`` column, and searches join on it: a hit always belongs to
+the file it was indexed for.  The triggers still find their row by ``rowid``
+(FTS5 cannot look up an unindexed column without a full scan) but also check
+the id, so after a renumbering they miss rather than touch another file's row,
+and :func:`ensure_search_index` rebuilds the index at the next startup.
 """
 from __future__ import annotations
 
+import logging
 import os
 import re
 from typing import Iterable, List, Optional
 
-from app.models import File as FileModel
+from sqlalchemy import column, event, literal_column, table
+from sqlalchemy.engine import Connection
+
+from app.models import File as FileModel, FileContent
+
+logger = logging.getLogger(__name__)
 
 MAX_INDEX_BYTES = 256 * 1024
 MAX_MATCH_CONTEXT_CHARS = 180
+
+FTS_TABLE = "files_fts"
+# Trigram tokens are three characters, so shorter queries use the LIKE path.
+FTS_MIN_QUERY_CHARS = 3
+FTS_SNIPPET_TOKENS = 64
+# BM25 weights for file_id (unindexed), name, path, type, mime_type, content_index.
+FTS_COLUMN_WEIGHTS = (0.0, 10.0, 4.0, 2.0, 2.0, 1.0)
+FTS_CONTENT_COLUMN = 5
+
+_FTS_TRIGGERS = (
+    "files_fts_ai", "files_fts_ad", "files_fts_au",
+    "file_contents_fts_ai", "file_contents_fts_au", "file_contents_fts_ad",
+)
+
+_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "file_id UNINDEXED, name, path, type, mime_type, content_index, tokenize='trigram')",
+    # OR REPLACE: a renumbered rowid may still hold another file's row
+    f"CREATE TRIGGER IF NOT EXISTS files_fts_ai AFTER INSERT ON files BEGIN "
+    f"INSERT OR REPLACE INTO {FTS_TABLE}(rowid, file_id, name, path, type, mime_type, content_index) "
+    "VALUES (new.rowid, new.id, new.name, new.path, new.type, new.mime_type, "
+    "(SELECT content_index FROM file_contents WHERE file_id = new.id)); END",
+    f"CREATE TRIGGER IF NOT EXISTS files_fts_ad AFTER DELETE ON files BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid AND file_id = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS files_fts_au "
+    "AFTER UPDATE OF name, path, type, mime_type ON files BEGIN "
+    f"UPDATE {FTS_TABLE} SET name = new.name, path = new.path, type = new.type, "
+    "mime_type = new.mime_type WHERE rowid = old.rowid AND file_id = old.id; END",
+    # Extracted text lives in file_contents, keyed by file id
+    f"CREATE TRIGGER IF NOT EXISTS file_contents_fts_ai AFTER INSERT ON file_contents BEGIN "
+    f"UPDATE {FTS_TABLE} SET content_index = new.content_index "
+    "WHERE rowid = (SELECT rowid FROM files WHERE id = new.file_id) AND file_id = new.file_id; END",
+    f"CREATE TRIGGER IF NOT EXISTS file_contents_fts_au AFTER UPDATE OF content_index ON file_contents BEGIN "
+    f"UPDATE {FTS_TABLE} SET content_index = new.content_index "
+    "WHERE rowid = (SELECT rowid FROM files WHERE id = new.file_id) AND file_id = new.file_id; END",
+    f"CREATE TRIGGER IF NOT EXISTS file_contents_fts_ad AFTER DELETE ON file_contents BEGIN "
+    f"UPDATE {FTS_TABLE} SET content_index = NULL "
+    "WHERE rowid = (SELECT rowid FROM files WHERE id = old.file_id) AND file_id = old.file_id; END",
+)
+
+# Set once the virtual table has been created successfully; search_files
+# falls back to LIKE predicates while this is False.
+fts_available = False
+
+files_fts = table(FTS_TABLE, column("rowid"), column("file_id"))
 TEXT_FILE_TYPES = {"text"}
 TEXT_EXTENSIONS = {
     "txt", "md", "markdown", "json", "xml", "html", "htm", "css", "js", "jsx",
@@ -54,7 +120,19 @@ def extract_text_content(
     return text or None
 
 
-def build_match_context(file: FileModel, query: str, path_segments: Optional[Iterable[str]] = None) -> Optional[str]:
+def build_match_context(
+    file: FileModel,
+    query: str,
+    path_segments: Optional[Iterable[str]] = None,
+    content_snippet: Optional[str] = None,
+    content: Optional[str] = None,
+) -> Optional[str]:
+    """Describe where *query* matched.
+
+    Pass *content_snippet* (from FTS ``snippet()``) to avoid re-scanning the
+    indexed document text in Python; otherwise the extracted *content* is
+    scanned.
+    """
     normalized_query = normalize_whitespace(query).lower()
     if not normalized_query:
         return None
@@ -64,8 +142,9 @@ def build_match_context(file: FileModel, query: str, path_segments: Optional[Ite
         ("path", " / ".join(path_segments or [])),
         ("type", file.type or ""),
         ("mime", file.mime_type or ""),
-        ("content", file.content_index or ""),
     ]
+    if content_snippet is None:
+        haystacks.append(("content", content or ""))
 
     for label, text in haystacks:
         normalized_text = normalize_whitespace(text)
@@ -88,6 +167,8 @@ def build_match_context(file: FileModel, query: str, path_segments: Optional[Ite
 
         return normalized_text[:MAX_MATCH_CONTEXT_CHARS]
 
+    if content_snippet and normalized_query in content_snippet.lower():
+        return content_snippet[:MAX_MATCH_CONTEXT_CHARS]
     return None
 
 
@@ -98,3 +179,85 @@ def build_search_document(
     file_type: str,
 ) -> Optional[str]:
     return extract_text_content(storage_path, filename, mime_type, file_type)
+
+
+def _drop_search_index(connection: Connection) -> None:
+    for trigger in _FTS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def ensure_search_index(connection: Connection) -> bool:
+    """Create ``files_fts`` and its sync triggers; backfill when out of step.
+
+    The index is out of step when any file lacks a row at its current
+    ``rowid`` carrying its id, which also catches renumbered rowids.
+
+    Returns False (and leaves LIKE search in place) when this SQLite build
+    lacks FTS5 or the trigram tokenizer.
+    """
+    global fts_available
+    try:
+        columns = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({FTS_TABLE})")}
+        if columns and "file_id" not in columns:
+            # Indexes built before file_id was stored are keyed on rowid alone
+            _drop_search_index(connection)
+        for statement in _FTS_DDL:
+            connection.exec_driver_sql(statement)
+    except Exception as exc:
+        logger.warning("FTS5 search index unavailable, using LIKE search: %s", exc)
+        fts_available = False
+        return False
+
+    indexed = connection.exec_driver_sql(f"SELECT count(*) FROM {FTS_TABLE}").scalar()
+    aligned = connection.exec_driver_sql(
+        f"SELECT count(*) FROM files f JOIN {FTS_TABLE} x ON x.rowid = f.rowid AND x.file_id = f.id"
+    ).scalar()
+    total = connection.exec_driver_sql("SELECT count(*) FROM files").scalar()
+    if not indexed == aligned == total:
+        rebuild_search_index(connection)
+    fts_available = True
+    return True
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """Repopulate ``files_fts`` from ``files``."""
+    connection.exec_driver_sql(f"DELETE FROM {FTS_TABLE}")
+    connection.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE}(rowid, file_id, name, path, type, mime_type, content_index) "
+        "SELECT f.rowid, f.id, f.name, f.path, f.type, f.mime_type, c.content_index "
+        "FROM files f LEFT JOIN file_contents c ON c.file_id = f.id"
+    )
+
+
+# file_contents is created after files, and the triggers need both tables
+@event.listens_for(FileContent.__table__, "after_create")
+def _create_search_index(target, connection, **kw) -> None:
+    if connection.dialect.name == "sqlite":
+        ensure_search_index(connection)
+
+
+def fts_match_expression(query: str) -> Optional[str]:
+    """Quote *query* as a single FTS5 phrase, or None if it is too short for trigrams."""
+    normalized = normalize_whitespace(query)
+    if len(normalized) < FTS_MIN_QUERY_CHARS:
+        return None
+    return '"' + normalized.replace('"', '""') + '"'
+
+
+def fts_join_condition():
+    return files_fts.c.file_id == FileModel.id
+
+
+def fts_match_clause(match_expression: str):
+    return literal_column(FTS_TABLE).op("MATCH")(match_expression)
+
+
+def fts_rank():
+    return literal_column(f"bm25({FTS_TABLE}, {', '.join(str(w) for w in FTS_COLUMN_WEIGHTS)})")
+
+
+def fts_content_snippet():
+    return literal_column(
+        f"snippet({FTS_TABLE}, {FTS_CONTENT_COLUMN}, '', '', '...', {FTS_SNIPPET_TOKENS})"
+    )
@@ -0,0 +1,236 @@
+"""
+Per-process cache for authenticated sessions.
+
+``get_current_user`` used to load the ``users`` row and the ``user_sessions``
+row on every request.  A validated session is now cached for
+``session_cache_ttl_seconds`` together with a snapshot of its user's columns;
+a cache hit re-attaches that snapshot to the request's DB session without
+running SQL, so handlers can still modify ``current_user`` as before.
+
+Entries are dropped when a flush changes or deletes the user or session row
+(password or quota changes, 2FA, admin edits, revocation), when sessions are
+revoked with a bulk ``UPDATE``, and once more when that transaction commits.
+A per-user generation counter stops a request that read the rows before such
+a commit from caching what it read.
+
+``last_seen_at`` is no longer written inside the request transaction:
+touches are buffered here and ``LastSeenFlusher`` writes them in one batched
+``UPDATE`` every ``session_last_seen_flush_interval_seconds``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.config import get_settings
+from app.models import User, UserSession
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class CachedSession:
+    """A validated session.  ``user_state`` is always a :func:`snapshot_user`
+    of a loaded ``User``; :func:`attach_cached_user` turns it back into one."""
+
+    user_id: str
+    expires_at: datetime
+    last_seen_at: Optional[datetime]
+    user_state: dict
+    cached_at: float
+
+
+class SessionCache:
+    """TTL'd LRU map of session id -> validated session and user snapshot"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, CachedSession]" = OrderedDict()
+        self._by_user: dict[str, set[str]] = {}
+        self._generations: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self, user_id: str) -> int:
+        return self._generations.get(user_id, 0)
+
+    def get(self, session_id: str, user_id: str) -> Optional[CachedSession]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        ttl = settings.session_cache_ttl_seconds
+        if entry.user_id != user_id or ttl <= 0 or time.monotonic() - entry.cached_at >= ttl:
+            self.invalidate_session(session_id)
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def put(self, session_id: str, entry: CachedSession, generation: int) -> None:
+        """Store *entry* unless its user was invalidated since *generation* was read."""
+        if settings.session_cache_ttl_seconds <= 0 or self.generation(entry.user_id) != generation:
+            return
+        self.invalidate_session(session_id)
+        self._entries[session_id] = entry
+        self._by_user.setdefault(entry.user_id, set()).add(session_id)
+        while len(self._entries) > max(1, settings.session_cache_max_entries):
+            self.invalidate_session(next(iter(self._entries)))
+
+    def invalidate_session(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            sessions = self._by_user.get(entry.user_id)
+            if sessions is not None:
+                sessions.discard(session_id)
+                if not sessions:
+                    del self._by_user[entry.user_id]
+
+    def invalidate_user(self, user_id: str) -> None:
+        self._generations[user_id] = self.generation(user_id) + 1
+        for session_id in list(self._by_user.get(user_id, ())):
+            self.invalidate_session(session_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+        self._generations.clear()
+
+
+session_cache = SessionCache()
+
+
+def snapshot_user(user: User) -> dict:
+    """Column values of a loaded user, enough to rebuild it without a query"""
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+async def attach_cached_user(db: AsyncSession, entry: CachedSession) -> User:
+    """Rebuild the cached user as a clean, persistent instance of *db*."""
+    user = User(**entry.user_state)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+
+def invalidate_user_sessions(db: AsyncSession, user_id: str) -> None:
+    """
+    Drop cached sessions of *user_id* now and again when *db* commits.
+    For changes the flush listener cannot see, such as bulk ``UPDATE``s.
+    """
+    session_cache.invalidate_user(user_id)
+    db.info.setdefault("invalidate_auth_users", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_auth_rows(session: Session, _flush_context) -> None:
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_id = obj.id
+        elif isinstance(obj, UserSession):
+            user_id = obj.user_id
+        else:
+            continue
+        if user_id is not None and (obj in session.deleted or session.is_modified(obj)):
+            session_cache.invalidate_user(user_id)
+            session.info.setdefault("invalidate_auth_users", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_auth_rows(session: Session) -> None:
+    for user_id in session.info.pop("invalidate_auth_users", ()):
+        session_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_auth_rows(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("invalidate_auth_users", None)
+
+
+class LastSeenBuffer:
+    """Pending ``last_seen_at`` values, newest per session"""
+
+    def __init__(self):
+        self._pending: dict[str, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, session_id: str, seen_at: datetime) -> None:
+        previous = self._pending.get(session_id)
+        if previous is None or seen_at > previous:
+            self._pending[session_id] = seen_at
+
+    def pending(self, session_id: str) -> Optional[datetime]:
+        return self._pending.get(session_id)
+
+    async def flush(self, session_factory=None) -> int:
+        """Write all pending touches in one executemany; returns how many."""
+        if not self._pending:
+            return 0
+        if session_factory is None:
+            from app.database import async_session as session_factory
+
+        batch, self._pending = self._pending, {}
+        table = UserSession.__table__
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("session_id"))
+            .values(last_seen_at=bindparam("seen_at"))
+        )
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    stmt,
+                    [{"session_id": sid, "seen_at": seen_at} for sid, seen_at in batch.items()],
+                )
+                await db.commit()
+        except Exception:
+            # Keep the touches for the next attempt; newer ones win.
+            for sid, seen_at in batch.items():
+                self.record(sid, seen_at)
+            raise
+        return len(batch)
+
+
+last_seen_buffer = LastSeenBuffer()
+
+
+class LastSeenFlusher:
+    """Background task writing buffered ``last_seen_at`` values periodically."""
+
+    def __init__(self, session_factory=None, interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.interval = max(0.1, interval if interval is not None else settings.session_last_seen_flush_interval_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await last_seen_buffer.flush(self.session_factory)
+        except Exception:
+            logger.exception("Final last_seen_at flush failed")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await last_seen_buffer.flush(self.session_factory)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("last_seen_at flush failed")
@@ -0,0 +1,246 @@
+"""
+Signed access grants and a per-process cache for public share links.
+
+A password-protected link used to run bcrypt on every ``POST
+/api/share/{token}`` and every download, so a popular link cost CPU in
+proportion to its traffic.  A correct password now earns a short-lived
+*access grant*: an HMAC-SHA256 over the link id, the grant's expiry and the
+link's download cap, keyed with ``SECRET_KEY`` and the link's password hash.
+Checking it takes microseconds, and it stops working when the link's password
+or cap changes.  The download cap itself is still enforced by the database on
+every download.
+
+Each counted download is answered with a *resume token* (``X-Share-Resume``)
+signed over the link, the file version and an expiry.  A ``Range`` request past
+the first byte that sends it back resumes that download without counting
+again, even once the cap is reached; without it every request is counted.
+
+Public requests also looked up the ``share_links`` row joined to its file on
+every hit.  :class:`ShareLinkCache` keeps a snapshot of both per token for
+``share_link_cache_ttl_seconds``.  Entries are dropped when a flush changes
+or deletes a cached link or file, when a bulk ``UPDATE``/``DELETE`` touches
+the columns it holds (revoking, trashing, purging), and once more when that
+transaction commits.  A generation counter stops a request that read the rows
+before such a commit from caching what it read.  Other API processes notice a
+revocation within the TTL.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models import File as FileModel, ShareLink
+
+settings = get_settings()
+
+# Columns of ``files`` held in a cache entry; bulk updates of other columns
+# (aggregates, paths, thumbnails) leave the cache alone.
+_CACHED_FILE_COLUMNS = frozenset(attr.key for attr in inspect(FileModel).column_attrs) - {
+    "path", "parent_id", "is_starred", "thumbnail_path", "subtree_count", "subtree_size", "updated_at",
+}
+# Counting a download does not change what a cached link grants.
+_UNCACHED_LINK_COLUMNS = frozenset({"download_count"})
+
+
+def _grant_signature(link_id: str, expires: int, cap: str, password_hash: Optional[str]) -> str:
+    message = "\n".join(("share-grant", link_id, str(expires), cap, password_hash or ""))
+    return hmac.new(
+        settings.secret_key.encode("utf-8"),
+        message.encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def create_share_grant(link: ShareLink) -> str:
+    """Sign an access grant for *link*, valid until the grant TTL or the link's expiry."""
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=max(1, settings.share_grant_ttl_seconds))
+    if link.expires_at is not None:
+        link_expiry = link.expires_at if link.expires_at.tzinfo else link.expires_at.replace(tzinfo=timezone.utc)
+        expires_at = min(expires_at, link_expiry)
+    expires = int(expires_at.timestamp())
+    cap = "" if link.max_downloads is None else str(link.max_downloads)
+    return f"{link.id}.{expires}.{cap}.{_grant_signature(link.id, expires, cap, link.password_hash)}"
+
+
+def grant_expiry(grant: str) -> datetime:
+    """When a grant accepted by :func:`verify_share_grant` stops working."""
+    return datetime.fromtimestamp(int(grant.split(".")[1]), timezone.utc)
+
+
+def verify_share_grant(grant: str, link: ShareLink) -> bool:
+    """True when *grant* was issued for *link* as it is now and has not expired."""
+    parts = grant.split(".")
+    if len(parts) != 4:
+        return False
+    link_id, expires, cap, signature = parts
+    if link_id != link.id or cap != ("" if link.max_downloads is None else str(link.max_downloads)):
+        return False
+    try:
+        expires_ts = int(expires)
+    except ValueError:
+        return False
+    if expires_ts <= time.time():
+        return False
+    return hmac.compare_digest(_grant_signature(link_id, expires_ts, cap, link.password_hash), signature)
+
+
+def _resume_signature(link: ShareLink, file: FileModel, expires: int) -> str:
+    message = "\n".join(("share-resume", link.id, file.id, str(file.version), str(expires), link.password_hash or ""))
+    return hmac.new(
+        settings.secret_key.encode("utf-8"),
+        message.encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def create_resume_token(link: ShareLink, file: FileModel) -> str:
+    """Sign a token resuming a counted download of this version of *file* through *link*."""
+    expires = int(time.time()) + max(1, settings.share_resume_ttl_seconds)
+    return f"{expires}.{_resume_signature(link, file, expires)}"
+
+
+def verify_resume_token(token: str, link: ShareLink, file: FileModel) -> bool:
+    """True when *token* was issued for *link* and this version of *file* and has not expired."""
+    expires, _, signature = token.partition(".")
+    try:
+        expires_ts = int(expires)
+    except ValueError:
+        return False
+    if expires_ts <= time.time():
+        return False
+    return hmac.compare_digest(_resume_signature(link, file, expires_ts), signature)
+
+
+@dataclass
+class CachedShare:
+    link_state: dict
+    file_state: dict
+    cached_at: float
+
+    def materialize(self) -> tuple[ShareLink, FileModel]:
+        """Fresh transient instances, so callers may modify them freely."""
+        return ShareLink(**self.link_state), FileModel(**self.file_state)
+
+
+def snapshot(obj) -> dict:
+    """Column values of a loaded row, enough to rebuild it without a query"""
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+class ShareLinkCache:
+    """TTL'd LRU map of share token -> link and file snapshot"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, CachedShare]" = OrderedDict()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, token: str) -> Optional[CachedShare]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        ttl = settings.share_link_cache_ttl_seconds
+        if ttl <= 0 or time.monotonic() - entry.cached_at >= ttl:
+            self._entries.pop(token, None)
+            return None
+        self._entries.move_to_end(token)
+        return entry
+
+    def put(self, token: str, link: ShareLink, file: FileModel, generation: int) -> None:
+        """Cache *link* and *file* unless anything was invalidated since *generation* was read."""
+        if settings.share_link_cache_ttl_seconds <= 0 or generation != self._generation:
+            return
+        self._entries[token] = CachedShare(snapshot(link), snapshot(file), time.monotonic())
+        self._entries.move_to_end(token)
+        while len(self._entries) > max(1, settings.share_link_cache_max_entries):
+            self._entries.popitem(last=False)
+
+    def record_download(self, token: str) -> None:
+        entry = self._entries.get(token)
+        if entry is not None:
+            entry.link_state["download_count"] = (entry.link_state.get("download_count") or 0) + 1
+
+    def invalidate_token(self, token: str) -> None:
+        self._generation += 1
+        self._entries.pop(token, None)
+
+    def invalidate_file(self, file_id: str) -> None:
+        self._generation += 1
+        for token in [t for t, entry in self._entries.items() if entry.file_state.get("id") == file_id]:
+            del self._entries[token]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+
+share_link_cache = ShareLinkCache()
+
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault("invalidate_share_links", {"tokens": set(), "files": set(), "all": False})
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_share_rows(session: Session, _flush_context) -> None:
+    for obj in list(session.dirty) + list(session.deleted):
+        if obj not in session.deleted and not session.is_modified(obj):
+            continue
+        if isinstance(obj, ShareLink) and obj.token:
+            share_link_cache.invalidate_token(obj.token)
+            _pending(session)["tokens"].add(obj.token)
+        elif isinstance(obj, FileModel) and obj.id:
+            share_link_cache.invalidate_file(obj.id)
+            _pending(session)["files"].add(obj.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_bulk_share_rows(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    statement = orm_execute_state.statement
+    table_name = getattr(getattr(statement, "table", None), "name", None)
+    if table_name not in (FileModel.__tablename__, ShareLink.__tablename__):
+        return
+    if orm_execute_state.is_update:
+        columns = {getattr(key, "key", key) for key in getattr(statement, "_values", None) or ()}
+        if table_name == FileModel.__tablename__ and columns and not columns & _CACHED_FILE_COLUMNS:
+            return
+        if table_name == ShareLink.__tablename__ and columns and columns <= _UNCACHED_LINK_COLUMNS:
+            return
+    share_link_cache.clear()
+    _pending(orm_execute_state.session)["all"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_share_rows(session: Session) -> None:
+    pending = session.info.pop("invalidate_share_links", None)
+    if pending is None:
+        return
+    if pending["all"]:
+        share_link_cache.clear()
+        return
+    for token in pending["tokens"]:
+        share_link_cache.invalidate_token(token)
+    for file_id in pending["files"]:
+        share_link_cache.invalidate_file(file_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_share_rows(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("invalidate_share_links", None)
@@ -12,7 +12,8 @@ from sqlalchemy import and_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db_utils import prefix_like_pattern
-from app.models import File as FileModel, SharedFolderAccess, User
+from app.models import File as FileModel, FileClosure, SharedFolderAccess, User
+from app.shared_grants import shared_grant_cache
 from app.tree_validation import normalize_tree_path
 
 
@@ -187,36 +188,94 @@ async def get_file_access_context(
             raise HTTPException(status_code=403, detail="Insufficient permissions")
         return file, ctx
 
-    access_result = await db.execute(
-        select(SharedFolderAccess, FileModel)
-        .join(FileModel, SharedFolderAccess.folder_id == FileModel.id)
+    grants = (await load_shared_grants(db, current_user.id, [file.owner_id]))[file.owner_id]
+    ancestors = await ancestor_folders(db, [file.id]) if grants else {}
+    return file, _shared_access_context(
+        file,
+        owner_username,
+        ancestors.get(file.id, ()),
+        grants,
+        required_role=required_role,
+        allow_trashed=allow_trashed,
+    )
+
+
+async def load_shared_grants(
+    db: AsyncSession,
+    user_id: str,
+    owner_ids: list[str],
+) -> dict[str, dict[str, str]]:
+    """The grants (folder id -> role) *user_id* holds in each owner's tree, cached per pair."""
+    grants: dict[str, dict[str, str]] = {}
+    missing = []
+    for owner_id in owner_ids:
+        cached = shared_grant_cache.get(user_id, owner_id)
+        if cached is None:
+            missing.append(owner_id)
+        else:
+            grants[owner_id] = cached
+    if not missing:
+        return grants
+
+    generation = shared_grant_cache.generation()
+    result = await db.execute(
+        select(SharedFolderAccess.owner_id, SharedFolderAccess.folder_id, SharedFolderAccess.role)
         .where(
-            and_(
-                SharedFolderAccess.user_id == current_user.id,
-                SharedFolderAccess.owner_id == file.owner_id,
-                FileModel.type == "folder",
-            )
+            SharedFolderAccess.user_id == user_id,
+            SharedFolderAccess.owner_id.in_(missing),
+        )
+    )
+    loaded: dict[str, dict[str, str]] = {owner_id: {} for owner_id in missing}
+    for owner_id, folder_id, role in result.all():
+        loaded[owner_id][folder_id] = role
+    for owner_id, roles in loaded.items():
+        shared_grant_cache.put(user_id, owner_id, roles, generation)
+    grants.update(loaded)
+    return grants
+
+
+async def ancestor_folders(db: AsyncSession, file_ids: list[str]) -> dict[str, list[FileModel]]:
+    """Folders containing each file (itself included), nearest first, from ``file_closure``."""
+    result = await db.execute(
+        select(FileClosure.descendant_id, FileModel)
+        .join(FileModel, FileModel.id == FileClosure.ancestor_id)
+        .where(
+            FileClosure.descendant_id.in_(file_ids),
+            FileModel.type == "folder",
         )
+        .order_by(FileClosure.descendant_id, FileClosure.depth)
     )
+    ancestors: dict[str, list[FileModel]] = {}
+    for descendant_id, folder in result.all():
+        ancestors.setdefault(descendant_id, []).append(folder)
+    return ancestors
 
+
+def _shared_access_context(
+    file: FileModel,
+    owner_username: Optional[str],
+    ancestors,
+    grants: dict[str, str],
+    *,
+    required_role: str,
+    allow_trashed: bool,
+) -> FileAccessContext:
+    """The nearest granted ancestor of *file* (the deepest shared root) decides its role."""
     matching_root = None
     matching_role = None
-    for access, shared_root in access_result.all():
-        if shared_root.is_trashed and not allow_trashed:
-            continue
-        if not resource_is_within_shared_root(file, shared_root):
+    for shared_root in ancestors:
+        role = grants.get(shared_root.id)
+        if role is None or (shared_root.is_trashed and not allow_trashed):
             continue
-        root_depth = len(parse_path(shared_root.path)) + 1
-        if matching_root is None or root_depth > (len(parse_path(matching_root.path)) + 1):
-            matching_root = shared_root
-            matching_role = access.role
+        matching_root, matching_role = shared_root, role
+        break
 
     if matching_root is None or matching_role is None:
         raise HTTPException(status_code=404, detail="File not found")
     if not has_required_role(matching_role, required_role):
         raise HTTPException(status_code=403, detail="Insufficient permissions for this shared folder")
 
-    return file, FileAccessContext(
+    return FileAccessContext(
         role=matching_role,
         is_owner=False,
         owner_id=file.owner_id,
@@ -226,6 +285,68 @@ async def get_file_access_context(
     )
 
 
+async def get_file_access_contexts(
+    db: AsyncSession,
+    current_user: User,
+    file_ids: list[str],
+    *,
+    required_role: str = "viewer",
+    allow_trashed: bool = False,
+) -> dict[str, tuple[FileModel, FileAccessContext] | HTTPException]:
+    """Batch form of :func:`get_file_access_context`.
+
+    Resolves every id with one files query plus, for files of other owners,
+    at most one grants query and one ``file_closure`` ancestor query.  Each
+    id maps to its ``(file, ctx)`` pair, or to the ``HTTPException`` the
+    single-item check would have raised.
+    """
+    result = await db.execute(
+        select(FileModel, User.username)
+        .join(User, User.id == FileModel.owner_id)
+        .where(FileModel.id.in_(file_ids))
+    )
+    rows = {file.id: (file, owner_username) for file, owner_username in result.all()}
+
+    foreign = [file for file, _ in rows.values() if file.owner_id != current_user.id]
+    grants_by_owner: dict[str, dict[str, str]] = {}
+    ancestors: dict[str, list[FileModel]] = {}
+    if foreign:
+        grants_by_owner = await load_shared_grants(
+            db, current_user.id, sorted({file.owner_id for file in foreign})
+        )
+        covered = [file.id for file in foreign if grants_by_owner.get(file.owner_id)]
+        if covered:
+            ancestors = await ancestor_folders(db, covered)
+
+    resolved: dict[str, tuple[FileModel, FileAccessContext] | HTTPException] = {}
+    for file_id in file_ids:
+        row = rows.get(file_id)
+        if row is None or (row[0].is_trashed and not allow_trashed):
+            resolved[file_id] = HTTPException(status_code=404, detail="File not found")
+            continue
+        file, owner_username = row
+        if file.owner_id == current_user.id:
+            resolved[file_id] = (file, FileAccessContext(
+                role="owner",
+                is_owner=True,
+                owner_id=file.owner_id,
+                owner_username=owner_username,
+            ))
+            continue
+        try:
+            resolved[file_id] = (file, _shared_access_context(
+                file,
+                owner_username,
+                ancestors.get(file.id, ()),
+                grants_by_owner.get(file.owner_id, {}),
+                required_role=required_role,
+                allow_trashed=allow_trashed,
+            ))
+        except HTTPException as exc:
+            resolved[file_id] = exc
+    return resolved
+
+
 async def resolve_target_path(
     db: AsyncSession,
     current_user: User,
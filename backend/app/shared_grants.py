@@ -0,0 +1,113 @@
+"""
+Per-process cache of shared-folder grant sets.
+
+Every preview, thumbnail, download and update of a file in someone else's
+folder asks which of the caller's grants covers it.  The grants a user holds
+for one owner are cached here as ``folder id -> role`` for
+``shared_grant_cache_ttl_seconds``.  The governing grant is then picked by
+walking the file's ancestors in ``file_closure``, so the work depends on the
+folder depth, not on how many grants the user holds.
+
+Invites, role changes and removals in ``routers/shared_folders.py`` drop the
+affected ``(user, owner)`` entry, and so does any flush that adds, changes or
+deletes a ``shared_folders`` row.  The drop happens again when the
+transaction commits, and a generation counter stops a request that read the
+grants before such a commit from caching what it read.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models import SharedFolderAccess
+
+settings = get_settings()
+
+
+@dataclass
+class CachedGrants:
+    roles: dict[str, str]  # shared folder id -> role
+    cached_at: float
+
+
+class SharedGrantCache:
+    """TTL'd LRU map of (user id, owner id) -> the user's grants in that owner's tree"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[tuple[str, str], CachedGrants]" = OrderedDict()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: str, owner_id: str) -> Optional[dict[str, str]]:
+        key = (user_id, owner_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        ttl = settings.shared_grant_cache_ttl_seconds
+        if ttl <= 0 or time.monotonic() - entry.cached_at >= ttl:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry.roles
+
+    def put(self, user_id: str, owner_id: str, roles: dict[str, str], generation: int) -> None:
+        """Store *roles* unless any grant was invalidated since *generation* was read."""
+        if settings.shared_grant_cache_ttl_seconds <= 0 or generation != self._generation:
+            return
+        key = (user_id, owner_id)
+        self._entries[key] = CachedGrants(roles, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(1, settings.shared_grant_cache_max_entries):
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str, owner_id: str) -> None:
+        self._generation += 1
+        self._entries.pop((user_id, owner_id), None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+
+shared_grant_cache = SharedGrantCache()
+
+
+def invalidate_shared_grants(db: AsyncSession, user_id: str, owner_id: str) -> None:
+    """Drop the cached grants of *user_id* in *owner_id*'s tree now and again when *db* commits."""
+    shared_grant_cache.invalidate(user_id, owner_id)
+    db.info.setdefault("invalidate_shared_grants", set()).add((user_id, owner_id))
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_grants(session: Session, _flush_context) -> None:
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, SharedFolderAccess) or obj.user_id is None or obj.owner_id is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        shared_grant_cache.invalidate(obj.user_id, obj.owner_id)
+        session.info.setdefault("invalidate_shared_grants", set()).add((obj.user_id, obj.owner_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_grants(session: Session) -> None:
+    for user_id, owner_id in session.info.pop("invalidate_shared_grants", ()):
+        shared_grant_cache.invalidate(user_id, owner_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_grants(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("invalidate_shared_grants", None)
@@ -0,0 +1,98 @@
+"""
+Signed, cacheable URLs for thumbnails and previews.
+
+``GET /api/files/{id}/thumbnail`` and ``/preview`` need an ``Authorization``
+header, so the SPA fetched every thumbnail with JavaScript.  The browser could
+not cache the images, and each one cost a session lookup and an access check.
+Listings now embed URLs signed with an HMAC-SHA256 over the file id, version,
+owner and an expiry.  The endpoints behind them check the signature without
+touching the database.
+
+Expiries are rounded up to whole ``signed_url_ttl_seconds`` windows, so the
+same file version gets the same URL on every listing within a window, and the
+browser cache keeps working across visits.  A preview URL serves the whole
+file rather than a small rendition, so it uses the much shorter
+``signed_preview_url_ttl_seconds`` window: a link that leaks, or outlives the
+holder's access, stops working within minutes.  A URL names one version of the
+file, so its response never changes and is sent with ``Cache-Control:
+immutable`` until the signature expires.
+
+Folder archives stream for as long as the ZIP takes to build, so the SPA
+hands them to the browser's download manager instead of buffering them with
+``fetch``.  A navigation cannot send the Authorization header, so it uses a
+URL signed for one user and folder that expires after
+``ARCHIVE_URL_TTL_SECONDS``; the endpoint behind it still checks that user's
+access to the folder.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Archive URLs are requested right before the browser follows them
+ARCHIVE_URL_TTL_SECONDS = 60
+
+
+def _signature(kind: str, file_id: str, version: int, owner_id: str, expires: int) -> str:
+    message = "\n".join(("file-url", kind, file_id, str(version), owner_id, str(expires)))
+    digest = hmac.new(settings.secret_key.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def url_expiry(now: Optional[float] = None, ttl: Optional[int] = None) -> int:
+    """End of the window after the current one: URLs stay valid one to two TTLs."""
+    window = max(60, settings.signed_url_ttl_seconds if ttl is None else ttl)
+    now = time.time() if now is None else now
+    return (int(now) // window + 2) * window
+
+
+def signed_thumbnail_url(file_id: str, version: Optional[int], owner_id: str) -> str:
+    version = version or 1
+    expires = url_expiry()
+    query = urlencode({
+        "owner": owner_id,
+        "expires": expires,
+        "sig": _signature("thumbnail", file_id, version, owner_id, expires),
+    })
+    return f"/api/files/{file_id}/thumbnail/{version}?{query}"
+
+
+def signed_preview_url(file_id: str, version: Optional[int]) -> str:
+    version = version or 1
+    expires = url_expiry(ttl=settings.signed_preview_url_ttl_seconds)
+    query = urlencode({"expires": expires, "sig": _signature("preview", file_id, version, "", expires)})
+    return f"/api/files/{file_id}/preview/{version}?{query}"
+
+
+def signed_archive_url(folder_id: str, user_id: str) -> tuple[str, int]:
+    """URL and expiry downloading *folder_id* as a ZIP on behalf of *user_id*."""
+    expires = int(time.time()) + ARCHIVE_URL_TTL_SECONDS
+    query = urlencode({
+        "user": user_id,
+        "expires": expires,
+        "sig": _signature("archive", folder_id, 0, user_id, expires),
+    })
+    return f"/api/files/{folder_id}/archive/signed?{query}", expires
+
+
+def verify_signed_url(kind: str, file_id: str, version: int, expires: int, sig: str, owner_id: str = "") -> None:
+    """Raise 403 unless *sig* signs this URL and it has not expired."""
+    if expires <= time.time() or not hmac.compare_digest(
+        _signature(kind, file_id, version, owner_id, expires), sig
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+
+
+def signed_cache_control(expires: int) -> str:
+    """Cache a signed response for as long as its URL stays valid."""
+    return f"private, max-age={max(0, expires - int(time.time()))}, immutable"
@@ -0,0 +1,143 @@
+"""
+SQLite performance profile for the API engine.
+
+Every new connection gets the pragmas from settings: WAL journaling so
+readers never block the writer (and vice versa), ``synchronous=NORMAL``
+(durable across application crashes, fsyncs only at checkpoints), a
+``busy_timeout``, a larger page cache, memory-mapped reads and in-memory
+temp tables.  Connections are pooled so the pragmas and the driver thread
+are paid once per connection instead of once per request.
+
+SQLite allows one writer at a time.  Left alone, concurrent writers spin in
+SQLite's busy handler, which sleeps and polls with growing delays, and give
+up with ``database is locked`` once the timeout runs out.  The
+:class:`WriteGate` instead queues write transactions of one process in FIFO
+order: the Python driver only opens a transaction at the first
+INSERT/UPDATE/DELETE, so the gate is taken right before that statement and
+handed to the next writer as soon as the connection goes back to the pool.
+Reads never wait for it.  Other processes sharing the file still meet at
+SQLite's lock and use ``busy_timeout``.
+"""
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
+
+from app.config import get_settings
+
+settings = get_settings()
+
+_WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+_GATE_HELD = "write_gate_held"
+
+
+def is_sqlite_url(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str) -> dict:
+    """Extra ``create_async_engine`` arguments for *url* (a pool for file databases)."""
+    if not is_sqlite_url(url) or ":memory:" in url:
+        return {}
+    return {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": max(1, settings.sqlite_pool_size),
+        "max_overflow": max(0, settings.sqlite_pool_max_overflow),
+    }
+
+
+def connection_pragmas() -> list[str]:
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={max(0, settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA cache_size={-max(0, settings.sqlite_cache_size_kib)}",  # negative means KiB
+        f"PRAGMA mmap_size={max(0, settings.sqlite_mmap_size_bytes)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+class WriteGate:
+    """Admits one write transaction per process at a time, in arrival order."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _current_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def acquire(self) -> None:
+        lock = self._current_lock()
+        if not lock.locked():
+            await lock.acquire()
+            return
+        started = time.monotonic()
+        self.waits += 1
+        try:
+            await asyncio.wait_for(lock.acquire(), self.timeout)
+        finally:
+            self.wait_seconds += time.monotonic() - started
+
+    def release(self) -> None:
+        if self._lock is not None and self._lock.locked():
+            self._lock.release()
+
+
+def configure_sqlite(engine: AsyncEngine, *, single_writer: Optional[bool] = None) -> Optional[WriteGate]:
+    """Apply the pragmas to *engine*'s connections and optionally install a write gate."""
+    sync_engine = engine.sync_engine
+    if sync_engine.dialect.name != "sqlite":
+        return None
+    pragmas = connection_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    if single_writer is None:
+        single_writer = settings.sqlite_single_writer
+    if not single_writer:
+        return None
+
+    gate = WriteGate(timeout=max(0, settings.sqlite_busy_timeout_ms) / 1000)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _enter_gate(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get(_GATE_HELD) or not statement.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+            return
+        try:
+            await_only(gate.acquire())
+        except asyncio.TimeoutError:
+            raise OperationalError(
+                statement,
+                parameters,
+                sqlite3.OperationalError("database is locked (timed out waiting for the write gate)"),
+            ) from None
+        conn.info[_GATE_HELD] = True
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _leave_gate(dbapi_connection, connection_record):
+        if connection_record is not None and connection_record.info.pop(_GATE_HELD, False):
+            gate.release()
+
+    return gate
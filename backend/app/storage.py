@@ -1,67 +1,175 @@
 """
 Home Cloud Drive - Local Storage Service
-Simple file storage using local filesystem with Docker volume support
+Content-addressed blob store on the local filesystem with Docker volume support.
+
+File data is stored once per distinct SHA-256 digest under
+``<storage>/blobs/<aa>/<bb>/<digest>`` and shared by every file version with
+identical bytes, across users.  ``blobs.refcount`` counts the
+``file_versions`` rows pointing at a blob, so copies and version restores only
+add a reference, and the bytes are unlinked once the last reference is
+released.  The unlink runs after the releasing transaction commits, in a new
+transaction that holds SQLite's write lock and re-checks the path's
+references first, so an upload of the same content in any worker either
+keeps the file or finds it gone and writes it again.
+
+Files uploaded before the blob store keep their per-user paths.  They are
+registered as unhashed blobs the first time something else needs to
+reference them; unregistered legacy paths are owned by a single version.
 """
+import asyncio
+import hashlib
+import logging
 import os
 import uuid
-import aiofiles
-from typing import Optional
+from typing import Mapping, Optional
+
+from sqlalchemy import case, event, func, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
 
 from app.config import get_settings
+from app.models import Blob, File as FileModel, FileVersion
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
+BLOB_DIRNAME = "blobs"
+STAGING_DIRNAME = ".staging"
+RELEASE_BATCH_SIZE = 500
+
 
 class LocalStorage:
-    """Simple local filesystem storage"""
-    
+    """Reference-counted, content-addressed local filesystem storage"""
+
     def __init__(self, base_path: str):
         self.base_path = base_path
-        os.makedirs(base_path, exist_ok=True)
-    
-    def _get_user_path(self, user_id: str) -> str:
-        """Get or create user's storage directory"""
-        user_path = os.path.join(self.base_path, user_id)
-        os.makedirs(user_path, exist_ok=True)
-        return user_path
-    
-    async def save(self, file_content: bytes, filename: str, user_id: str) -> str:
+        self.blob_root = os.path.join(base_path, BLOB_DIRNAME)
+        os.makedirs(self.blob_root, exist_ok=True)
+
+    def blob_path(self, digest: str) -> str:
+        """On-disk location of the blob with SHA-256 *digest*"""
+        return os.path.join(self.blob_root, digest[:2], digest[2:4], digest)
+
+    def staging_path(self) -> str:
+        """
+        Fresh temp path for incoming data.
+        Lives on the same filesystem as the blobs so ingest is a rename.
         """
-        Save file to disk and return the storage path.
-        Files are organized by user_id for easy management.
+        staging_dir = os.path.join(self.blob_root, STAGING_DIRNAME)
+        os.makedirs(staging_dir, exist_ok=True)
+        return os.path.join(staging_dir, str(uuid.uuid4()))
+
+    async def ingest(self, db: AsyncSession, staged_path: str, digest: str, size: int) -> str:
         """
-        # Generate unique filename to avoid collisions
-        file_id = str(uuid.uuid4())
-        ext = filename.split('.')[-1] if '.' in filename else ''
-        storage_filename = f"{file_id}.{ext}" if ext else file_id
-        
-        user_path = self._get_user_path(user_id)
-        full_path = os.path.join(user_path, storage_filename)
-        
-        async with aiofiles.open(full_path, 'wb') as f:
-            await f.write(file_content)
-        
-        return full_path
-    
-    async def get(self, storage_path: str) -> bytes:
-        """Read file from disk"""
-        if not os.path.exists(storage_path):
-            raise FileNotFoundError(f"File not found: {storage_path}")
-        
-        async with aiofiles.open(storage_path, 'rb') as f:
-            return await f.read()
-    
-    async def delete(self, storage_path: str) -> bool:
-        """Delete file from disk"""
-        if storage_path and os.path.exists(storage_path):
-            os.remove(storage_path)
-            return True
-        return False
-    
+        Take ownership of a fully written staging file and return its blob path.
+        Identical content already in the store gains a reference and the
+        staged copy is discarded.
+        """
+        blob_path = self.blob_path(digest)
+        stmt = sqlite_insert(Blob).values(
+            id=str(uuid.uuid4()),
+            sha256=digest,
+            size=size,
+            refcount=1,
+            storage_path=blob_path,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"refcount": Blob.refcount + 1},
+        ).returning(Blob.storage_path)
+        blob_path = (await db.execute(stmt)).scalar_one()
+
+        if os.path.exists(blob_path):
+            os.remove(staged_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(staged_path, blob_path)
+        return blob_path
+
+    async def retain(self, db: AsyncSession, storage_path: str) -> str:
+        """
+        Add a reference to data that is already stored (copy, version restore).
+        Call before adding the new ``FileVersion`` row.
+        """
+        result = await db.execute(
+            update(Blob)
+            .where(Blob.storage_path == storage_path)
+            .values(refcount=Blob.refcount + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # Legacy per-user file: register it in place, counting the
+            # versions that already point at it.
+            existing_refs = await db.scalar(
+                select(func.count()).select_from(FileVersion).where(FileVersion.storage_path == storage_path)
+            )
+            db.add(Blob(
+                sha256=None,
+                size=os.path.getsize(storage_path),
+                refcount=max(1, existing_refs or 0) + 1,
+                storage_path=storage_path,
+            ))
+            await db.flush()
+        return storage_path
+
+    async def release(self, db: AsyncSession, storage_path: Optional[str]) -> bool:
+        """
+        Drop one reference to *storage_path*.
+        Returns True if this was the last one and the data will be deleted.
+        """
+        if not storage_path:
+            return False
+        result = await db.execute(
+            update(Blob)
+            .where(Blob.storage_path == storage_path)
+            .values(refcount=Blob.refcount - 1)
+            .returning(Blob.id, Blob.refcount)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+        if row is not None:
+            if row.refcount > 0:
+                return False
+            await db.execute(
+                Blob.__table__.delete().where(Blob.id == row.id)
+            )
+        _unlink_after_commit(db, [storage_path])
+        return True
+
+    async def release_many(self, db: AsyncSession, references: Mapping[str, int]) -> None:
+        """
+        Drop ``references[path]`` references from each path, one UPDATE per
+        batch of paths.  Same bookkeeping as :meth:`release`.
+        """
+        paths = [path for path, count in references.items() if path and count > 0]
+        for start in range(0, len(paths), RELEASE_BATCH_SIZE):
+            batch = paths[start:start + RELEASE_BATCH_SIZE]
+            result = await db.execute(
+                update(Blob)
+                .where(Blob.storage_path.in_(batch))
+                .values(refcount=Blob.refcount - case(
+                    {path: references[path] for path in batch},
+                    value=Blob.storage_path,
+                    else_=0,
+                ))
+                .returning(Blob.id, Blob.storage_path, Blob.refcount)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            dead = [row for row in rows if row.refcount <= 0]
+            if dead:
+                await db.execute(
+                    Blob.__table__.delete().where(Blob.id.in_([row.id for row in dead]))
+                )
+            registered = {row.storage_path for row in rows}
+            unlink = [row.storage_path for row in dead] + [path for path in batch if path not in registered]
+            _unlink_after_commit(db, unlink)
+
     def exists(self, storage_path: str) -> bool:
         """Check if file exists"""
-        return storage_path and os.path.exists(storage_path)
-    
+        return bool(storage_path) and os.path.exists(storage_path)
+
     def get_file_path(self, storage_path: str) -> Optional[str]:
         """Get absolute file path for direct access (e.g., for streaming)"""
         if self.exists(storage_path):
@@ -69,13 +177,96 @@ class LocalStorage:
         return None
 
 
+def new_hasher():
+    """Digest object used for blob keys"""
+    return hashlib.sha256()
+
+
+async def lock_writes(db: AsyncSession) -> None:
+    """Take SQLite's write lock for the rest of *db*'s transaction."""
+    await db.execute(text("UPDATE blobs SET refcount = refcount WHERE 1 = 0"))
+
+
+async def referenced_paths(db: AsyncSession, paths: list[str]) -> set[str]:
+    """The subset of *paths* that a blob, file or file version still points at"""
+    referenced: set[str] = set()
+    for column in (Blob.storage_path, FileVersion.storage_path, FileModel.storage_path):
+        referenced.update(await db.scalars(select(column).where(column.in_(paths))))
+    return referenced
+
+
+_pending_unlinks: set[asyncio.Task] = set()
+
+
+def _unlink_after_commit(db: AsyncSession, paths: list[str]) -> None:
+    # Unlink only once the transaction that dropped the reference commits.
+    if paths:
+        db.info.setdefault("unlink_after_commit", []).extend(paths)
+        db.info["unlink_engine"] = db.bind
+
+
+async def _unlink_unreferenced(engine: AsyncEngine, paths: list[str]) -> None:
+    """
+    Remove the released *paths* that are still unreferenced.
+    Another worker may have re-ingested the same content since the release
+    committed; the write lock orders this check against such an upload.
+    """
+    async with AsyncSession(engine) as db:
+        await lock_writes(db)
+        for start in range(0, len(paths), RELEASE_BATCH_SIZE):
+            batch = paths[start:start + RELEASE_BATCH_SIZE]
+            live = await referenced_paths(db, batch)
+            for path in batch:
+                if path in live:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        await db.commit()
+
+
+def _unlink_done(task: asyncio.Task) -> None:
+    _pending_unlinks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        # Left for the storage garbage collector
+        logger.error("Unlinking released blobs failed", exc_info=task.exception())
+
+
+async def wait_for_unlinks() -> None:
+    """Wait until every scheduled blob unlink has finished"""
+    while _pending_unlinks:
+        await asyncio.gather(*_pending_unlinks, return_exceptions=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _unlink_released_blobs(session: Session) -> None:
+    paths = session.info.pop("unlink_after_commit", None)
+    engine = session.info.pop("unlink_engine", None)
+    if not paths or engine is None:
+        return
+    # The committing connection still holds this process's write gate, so
+    # the re-check runs in its own task once the session has let go of it.
+    task = asyncio.get_running_loop().create_task(_unlink_unreferenced(engine, paths))
+    _pending_unlinks.add(task)
+    task.add_done_callback(_unlink_done)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _keep_blobs_after_rollback(session: Session, previous_transaction) -> None:
+    # Savepoint rollbacks (version-number retries) keep the outer releases.
+    if previous_transaction.parent is None:
+        session.info.pop("unlink_after_commit", None)
+        session.info.pop("unlink_engine", None)
+
+
 # Global storage instance
 _storage: Optional[LocalStorage] = None
 
 
 def get_storage() -> LocalStorage:
-    """Get or create storage singleton"""
+    """Get or create storage singleton for the configured storage path"""
     global _storage
-    if _storage is None:
+    if _storage is None or _storage.base_path != settings.storage_path:
         _storage = LocalStorage(settings.storage_path)
     return _storage
@@ -0,0 +1,383 @@
+"""
+Home Cloud Drive - Storage garbage collector
+
+Reclaims disk space that nothing in the database points at any more:
+
+* expired ``upload_sessions`` rows with their ``storage/tmp`` directories,
+  and temp directories whose session row never committed;
+* quota reservations that expired or whose upload session is gone;
+* abandoned staging files under ``blobs/.staging``;
+* blobs and pre-blob-store per-user files not referenced by ``blobs``,
+  ``files.storage_path`` or ``file_versions.storage_path``;
+* thumbnail renditions whose file is gone or has moved on to another key.
+
+The tree is walked in batches of ``STORAGE_GC_BATCH_SIZE`` entries.  Each
+batch is checked with one ``IN`` query per table, and the collector sleeps
+``STORAGE_GC_BATCH_PAUSE_SECONDS`` between batches so a large store is not
+scanned in one burst.  Entries modified within ``STORAGE_GC_GRACE_SECONDS``
+are left alone, because they may belong to a request that wrote to disk and
+has not committed yet.  A batch is deleted while holding SQLite's write lock,
+after re-checking its references.  An upload that concurrently reuses an
+orphaned blob then either keeps it or finds it gone and writes it again.
+
+``StorageCollector`` runs every ``STORAGE_GC_INTERVAL_SECONDS``.  Admins can
+also trigger a run, including a dry run that only reports what would go.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterator, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import quota, uploads
+from app.config import get_settings
+from app.models import Blob, File as FileModel, FileVersion, UploadSession
+from app.storage import BLOB_DIRNAME, STAGING_DIRNAME, lock_writes, referenced_paths
+from app.thumbnails import key_from_path
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CATEGORIES = ("upload_sessions", "staging", "blobs", "user_files", "thumbnails")
+THUMBNAIL_DIRNAME = "thumbnails"
+MAX_SAMPLES = 50
+
+_VERSION_SUFFIX = re.compile(r"-v\d+$")
+
+
+@dataclass
+class GCCategory:
+    files: int = 0
+    bytes: int = 0
+    samples: list[str] = field(default_factory=list)
+
+
+@dataclass
+class GCReport:
+    """What one run removed, or would remove when ``dry_run`` is set"""
+    dry_run: bool
+    started_at: datetime
+    duration_seconds: float = 0.0
+    expired_upload_sessions: int = 0
+    expired_quota_reservations: int = 0
+    categories: dict[str, GCCategory] = field(
+        default_factory=lambda: {name: GCCategory() for name in CATEGORIES}
+    )
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def reclaimed_bytes(self) -> int:
+        return sum(category.bytes for category in self.categories.values())
+
+    def record(self, category: str, path: str, size: int) -> None:
+        entry = self.categories[category]
+        entry.files += 1
+        entry.bytes += size
+        if len(entry.samples) < MAX_SAMPLES:
+            entry.samples.append(os.path.relpath(path, settings.storage_path))
+
+
+@dataclass
+class GCMetrics:
+    """Process-wide totals across non-dry runs"""
+    runs: int = 0
+    running: bool = False
+    last_run_at: Optional[datetime] = None
+    last_report: Optional[GCReport] = None
+    removed_files_total: dict[str, int] = field(default_factory=lambda: dict.fromkeys(CATEGORIES, 0))
+    reclaimed_bytes_total: dict[str, int] = field(default_factory=lambda: dict.fromkeys(CATEGORIES, 0))
+
+    def add(self, report: GCReport) -> None:
+        self.last_report = report
+        self.last_run_at = report.started_at
+        if report.dry_run:
+            return
+        self.runs += 1
+        for name, category in report.categories.items():
+            self.removed_files_total[name] += category.files
+            self.reclaimed_bytes_total[name] += category.bytes
+
+
+gc_metrics = GCMetrics()
+
+
+class GCAlreadyRunning(RuntimeError):
+    """Raised when a collection is requested while one is in progress."""
+
+
+def _scan_files(top: str, cutoff: float, skip_dirs: frozenset = frozenset()) -> Iterator[tuple[str, int]]:
+    """(path, size) of regular files under *top* last modified before *cutoff*"""
+    stack = [top]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in skip_dirs:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime < cutoff:
+                        yield entry.path, stat.st_size
+            except OSError:
+                continue
+
+
+def _scan_upload_dirs(cutoff: float) -> Iterator[tuple[str, int]]:
+    """(path, size) of ``tmp/<user>/<upload_id>`` dirs untouched since *cutoff*"""
+    for user_dir in _subdirs(uploads.temp_root()):
+        for upload_dir in _subdirs(user_dir):
+            data_path = uploads.data_path(upload_dir)
+            try:
+                mtime = os.stat(data_path).st_mtime
+            except OSError:
+                try:
+                    mtime = os.stat(upload_dir).st_mtime
+                except OSError:
+                    continue
+            if mtime < cutoff:
+                yield upload_dir, _tree_size(upload_dir)
+
+
+def _subdirs(path: str) -> list[str]:
+    try:
+        return [entry.path for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def _user_dirs() -> list[str]:
+    """Per-user directories at the storage root (named by user id)"""
+    user_dirs = []
+    for path in _subdirs(settings.storage_path):
+        try:
+            uuid.UUID(os.path.basename(path))
+        except ValueError:
+            continue
+        user_dirs.append(path)
+    return user_dirs
+
+
+def _tree_size(path: str) -> int:
+    return sum(size for _path, size in _scan_files(path, float("inf")))
+
+
+def _remove(entries: list[tuple[str, int]]) -> list[tuple[str, int]]:
+    removed = []
+    for path, size in entries:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            logger.warning("Storage GC could not remove %s", path, exc_info=True)
+            continue
+        removed.append((path, size))
+    return removed
+
+
+async def _live_thumbnails(db: AsyncSession, paths: list[str]) -> set[str]:
+    keys = {path: key_from_path(path) for path in paths}
+    file_ids = {_VERSION_SUFFIX.sub("", key) for key in keys.values() if key}
+    if not file_ids:
+        return set()
+    current = await db.scalars(
+        select(FileModel.thumbnail_path).where(
+            FileModel.id.in_(file_ids),
+            FileModel.thumbnail_path.isnot(None),
+        )
+    )
+    live_keys = {key_from_path(path) for path in current}
+    return {path for path, key in keys.items() if key in live_keys}
+
+
+async def _live_upload_dirs(db: AsyncSession, paths: list[str]) -> set[str]:
+    by_id = {os.path.basename(path): path for path in paths}
+    existing = await db.scalars(select(UploadSession.id).where(UploadSession.id.in_(by_id)))
+    return {by_id[upload_id] for upload_id in existing}
+
+
+async def _stored_paths_match_layout(db: AsyncSession) -> bool:
+    """
+    Orphans are found by exact path lookups, so every stored path must use
+    the current ``STORAGE_PATH`` spelling; otherwise nothing is deleted.
+    """
+    prefix = os.path.join(settings.storage_path, "")
+    for column in (Blob.storage_path, FileVersion.storage_path, FileModel.storage_path, FileModel.thumbnail_path):
+        mismatch = await db.scalar(
+            select(column)
+            .where(column.isnot(None), column != "", ~column.startswith(prefix, autoescape=True))
+            .limit(1)
+        )
+        if mismatch is not None:
+            return False
+    return True
+
+
+class StorageCollector:
+    """Expires upload sessions and removes unreferenced files from storage."""
+
+    def __init__(self, session_factory=None, interval: Optional[float] = None):
+        if session_factory is None:
+            from app.database import async_session as session_factory
+        self.session_factory = session_factory
+        self.interval = interval if interval is not None else settings.storage_gc_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await self.collect()
+            except GCAlreadyRunning:
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Storage garbage collection failed")
+                continue
+            if report.reclaimed_bytes or report.expired_upload_sessions:
+                logger.info(
+                    "Storage GC reclaimed %d bytes (%d expired upload sessions)",
+                    report.reclaimed_bytes,
+                    report.expired_upload_sessions,
+                )
+
+    async def collect(self, dry_run: bool = False) -> GCReport:
+        if gc_metrics.running:
+            raise GCAlreadyRunning("Storage garbage collection is already running")
+        gc_metrics.running = True
+        report = GCReport(dry_run=dry_run, started_at=datetime.now(timezone.utc))
+        started = time.monotonic()
+        try:
+            await self._expire_upload_sessions(report)
+            if not report.dry_run:
+                async with self.session_factory() as db:
+                    report.expired_quota_reservations = await quota.expire_reservations(db)
+                    await db.commit()
+            cutoff = time.time() - max(0, settings.storage_gc_grace_seconds)
+            await self._reconcile(report, "upload_sessions", _scan_upload_dirs(cutoff), _live_upload_dirs)
+
+            blob_root = os.path.join(settings.storage_path, BLOB_DIRNAME)
+            staging = _scan_files(os.path.join(blob_root, STAGING_DIRNAME), cutoff)
+            await self._reconcile(report, "staging", staging, None)
+
+            async with self.session_factory() as db:
+                layout_ok = await _stored_paths_match_layout(db)
+            if not layout_ok:
+                report.skipped.append(
+                    "Stored paths do not all start with STORAGE_PATH; blobs, user files and thumbnails were not checked"
+                )
+            else:
+                user_dirs = _user_dirs()
+                blobs = _scan_files(blob_root, cutoff, frozenset({STAGING_DIRNAME}))
+                user_files = itertools.chain.from_iterable(
+                    _scan_files(path, cutoff, frozenset({THUMBNAIL_DIRNAME})) for path in user_dirs
+                )
+                thumbnails = itertools.chain.from_iterable(
+                    _scan_files(os.path.join(path, THUMBNAIL_DIRNAME), cutoff) for path in user_dirs
+                )
+                await self._reconcile(report, "blobs", blobs, referenced_paths)
+                await self._reconcile(report, "user_files", user_files, referenced_paths)
+                await self._reconcile(report, "thumbnails", thumbnails, _live_thumbnails)
+        finally:
+            report.duration_seconds = round(time.monotonic() - started, 3)
+            gc_metrics.running = False
+        gc_metrics.add(report)
+        return report
+
+    async def _batches(self, entries: Iterator[tuple[str, int]]):
+        batch_size = max(1, settings.storage_gc_batch_size)
+        while True:
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(entries, batch_size)))
+            if not batch:
+                return
+            yield batch
+            await asyncio.sleep(max(0.0, settings.storage_gc_batch_pause_seconds))
+
+    async def _reconcile(
+        self,
+        report: GCReport,
+        category: str,
+        entries: Iterator[tuple[str, int]],
+        find_live: Optional[Callable[[AsyncSession, list[str]], Awaitable[set[str]]]],
+    ) -> None:
+        async for batch in self._batches(entries):
+            if find_live is None:
+                orphans = batch if report.dry_run else await asyncio.to_thread(_remove, batch)
+            else:
+                async with self.session_factory() as db:
+                    if not report.dry_run:
+                        await lock_writes(db)
+                    live = await find_live(db, [path for path, _size in batch])
+                    orphans = [entry for entry in batch if entry[0] not in live]
+                    if not report.dry_run:
+                        orphans = await asyncio.to_thread(_remove, orphans)
+                    await db.commit()
+            for path, size in orphans:
+                report.record(category, path, size)
+
+    async def _expire_upload_sessions(self, report: GCReport) -> None:
+        now = datetime.now(timezone.utc)
+        batch_size = max(1, settings.storage_gc_batch_size)
+        last_id = ""
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(
+                    select(UploadSession.id, UploadSession.user_id)
+                    .where(UploadSession.expires_at <= now, UploadSession.id > last_id)
+                    .order_by(UploadSession.id)
+                    .limit(batch_size)
+                )).all()
+                if not rows:
+                    return
+                last_id = rows[-1].id
+                if not report.dry_run:
+                    # A chunk may have extended a session since it was read
+                    expired = set(await db.scalars(
+                        delete(UploadSession)
+                        .where(UploadSession.id.in_([row.id for row in rows]), UploadSession.expires_at <= now)
+                        .returning(UploadSession.id)
+                    ))
+                    await db.commit()
+                    rows = [row for row in rows if row.id in expired]
+
+            report.expired_upload_sessions += len(rows)
+            entries = []
+            for row in rows:
+                uploads.forget_digest(row.id)
+                temp_dir = uploads.temp_dir_for(row.user_id, row.id)
+                entries.append((temp_dir, await asyncio.to_thread(_tree_size, temp_dir)))
+            if not report.dry_run:
+                await asyncio.to_thread(_remove, entries)
+            for path, size in entries:
+                report.record("upload_sessions", path, size)
+            await asyncio.sleep(max(0.0, settings.storage_gc_batch_pause_seconds))
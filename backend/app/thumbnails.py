@@ -1,13 +1,35 @@
 """
 Home Cloud Drive - Thumbnail Generation Utility
-Generates server-side thumbnails for image files using Pillow.
+Generates server-side thumbnail renditions for image files using Pillow.
+
+Each image gets square-bounded renditions at ``THUMBNAIL_SIZES`` stored as
+``<thumbnails>/<key>_<size>.<ext>``, where *key* is the file id (plus a
+``-v<n>`` suffix for later versions).  ``File.thumbnail_path`` points at the
+default-size rendition; the other sizes live next to it.
+
+The generator functions are CPU-bound and run in the shared process pool,
+so this module keeps its top-level imports light.
 """
+import asyncio
+import glob
 import os
-from PIL import Image
+from typing import Optional
 
-THUMBNAIL_SIZE = (300, 300)
-THUMBNAIL_QUALITY = 85
+from PIL import Image, features
+
+THUMBNAIL_SIZES = (64, 256, 1024)
+DEFAULT_THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
 SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+RENDITION_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+}
+LEGACY_SUFFIX = "_thumb.jpg"
+
+# Renditions currently being generated, keyed by output path, so concurrent
+# requests for the same missing rendition share one decode.
+_inflight: dict[str, asyncio.Future] = {}
 
 
 def can_generate_thumbnail(filename: str) -> bool:
@@ -16,37 +38,134 @@ def can_generate_thumbnail(filename: str) -> bool:
     return ext in SUPPORTED_FORMATS
 
 
-def generate_thumbnail(source_path: str, thumbnail_dir: str, file_id: str) -> str | None:
+def resolve_format(preferred: str) -> str:
+    """Return *preferred* if this Pillow build can encode it, else ``webp``."""
+    preferred = (preferred or "webp").lower()
+    if preferred == "avif" and not features.check("avif"):
+        return "webp"
+    return preferred if preferred in RENDITION_FORMATS else "webp"
+
+
+def media_type_for(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return RENDITION_FORMATS[ext][1] if ext in RENDITION_FORMATS else "image/jpeg"
+
+
+def nearest_rendition_size(requested: Optional[int]) -> int:
+    """Smallest configured rendition that covers *requested* pixels."""
+    if not requested:
+        return DEFAULT_THUMBNAIL_SIZE
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def thumbnail_key(file_id: str, version: int) -> str:
+    return file_id if (version or 1) <= 1 else f"{file_id}-v{version}"
+
+
+def rendition_path(thumbnail_dir: str, key: str, size: int, fmt: str) -> str:
+    return os.path.join(thumbnail_dir, f"{key}_{size}.{fmt}")
+
+
+def key_from_path(thumbnail_path: str) -> Optional[str]:
+    name = os.path.basename(thumbnail_path)
+    if name.endswith(LEGACY_SUFFIX):
+        return name[: -len(LEGACY_SUFFIX)]
+    stem, _, _size = os.path.splitext(name)[0].rpartition("_")
+    return stem or None
+
+
+def remove_thumbnails(thumbnail_path: Optional[str]) -> None:
+    """Delete every rendition sharing *thumbnail_path*'s key (plus legacy JPEGs)."""
+    if not thumbnail_path:
+        return
+    key = key_from_path(thumbnail_path)
+    targets = {thumbnail_path}
+    if key:
+        targets.update(glob.glob(os.path.join(glob.escape(os.path.dirname(thumbnail_path)), f"{glob.escape(key)}_*")))
+    for path in targets:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def generate_thumbnails(
+    source_path: str,
+    thumbnail_dir: str,
+    key: str,
+    sizes=THUMBNAIL_SIZES,
+    fmt: str = "webp",
+) -> dict[int, str] | None:
     """
-    Generate a thumbnail for an image file.
-    
+    Generate thumbnail renditions for an image file.
+
+    The source is decoded once: for JPEGs ``draft()`` lets libjpeg decode at
+    a reduced scale close to the largest requested size, and each smaller
+    rendition is resampled from the previous one instead of the original.
+
     Args:
         source_path: Path to the original image file
         thumbnail_dir: Directory to store thumbnails
-        file_id: Unique file ID (used as thumbnail filename)
-    
+        key: Rendition key (file id, plus ``-v<n>`` for later versions)
+        sizes: Bounding-box sizes to produce
+        fmt: ``webp`` or ``avif``
+
     Returns:
-        Path to the generated thumbnail, or None if generation failed
+        Mapping of size to rendition path, or None if generation failed
     """
+    pil_format = RENDITION_FORMATS[fmt][0]
     try:
         os.makedirs(thumbnail_dir, exist_ok=True)
-        
-        thumbnail_path = os.path.join(thumbnail_dir, f"{file_id}_thumb.jpg")
-        
+        outputs = {}
         with Image.open(source_path) as img:
-            # Convert RGBA/P to RGB for JPEG output
-            if img.mode in ('RGBA', 'P', 'LA'):
-                img = img.convert('RGB')
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize maintaining aspect ratio
-            img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-            
-            # Save as JPEG
-            img.save(thumbnail_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
-        
-        return thumbnail_path
+            largest = max(sizes)
+            img.draft("RGB", (largest, largest))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+            else:
+                img.load()
+
+            current = img
+            for size in sorted(sizes, reverse=True):
+                current = current.copy()
+                current.thumbnail((size, size), Image.Resampling.LANCZOS)
+                path = rendition_path(thumbnail_dir, key, size, fmt)
+                # Write-then-rename so readers never see a partial file.
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                current.save(tmp_path, pil_format, quality=THUMBNAIL_QUALITY)
+                os.replace(tmp_path, path)
+                outputs[size] = path
+        return outputs
     except Exception as e:
         print(f"[!] Thumbnail generation failed for {source_path}: {e}")
         return None
+
+
+async def ensure_rendition(source_path: str, thumbnail_dir: str, key: str, size: int, fmt: str) -> Optional[str]:
+    """Return the rendition path, generating it in the process pool if missing.
+
+    Concurrent callers asking for the same rendition await a single decode.
+    """
+    path = rendition_path(thumbnail_dir, key, size, fmt)
+    if os.path.exists(path):
+        return path
+
+    pending = _inflight.get(path)
+    if pending is None:
+        from app.executors import run_in_process
+
+        async def _generate():
+            try:
+                outputs = await run_in_process(generate_thumbnails, source_path, thumbnail_dir, key, (size,), fmt)
+                return outputs.get(size) if outputs else None
+            finally:
+                _inflight.pop(path, None)
+
+        pending = asyncio.ensure_future(_generate())
+        _inflight[path] = pending
+    # shield: one cancelled request must not abort the shared decode
+    return await asyncio.shield(pending)
@@ -3,7 +3,7 @@ Validation helpers for folder/file tree metadata.
 """
 import json
 import unicodedata
-from typing import List
+from typing import List, Optional
 
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -54,11 +54,14 @@ async def ensure_folder_path_exists(
     path: List[str],
     *,
     error_detail: str = "Parent folder does not exist",
-) -> None:
+) -> Optional[str]:
     """Check that every segment of *path* resolves to a real, non-trashed folder
-    belonging to *user_id*.  Raises HTTP 400 when the folder cannot be found."""
+    belonging to *user_id*.  Raises HTTP 400 when the folder cannot be found.
+
+    Returns the id of the folder at *path* (``None`` for the root) so callers
+    can record it as the new row's ``parent_id``."""
     if not path:
-        return
+        return None
 
     # Import here to avoid a top-level circular-import with models → database.
     from app.models import File as FileModel  # noqa: PLC0415
@@ -76,5 +79,7 @@ async def ensure_folder_path_exists(
             )
         )
     )
-    if result.scalar_one_or_none() is None:
+    folder_id = result.scalar_one_or_none()
+    if folder_id is None:
         raise HTTPException(status_code=400, detail=error_detail)
+    return folder_id
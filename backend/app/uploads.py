@@ -0,0 +1,264 @@
+"""
+Home Cloud Drive - Resumable upload data files
+
+Each resumable upload owns one data file the size of the whole upload,
+preallocated at init (``posix_fallocate`` where the platform and filesystem
+support it).  Chunks are written in place with ``pwrite`` at their offset, so
+completion needs no assembly pass: the data file is fsynced and renamed into
+the blob store, which lives on the same volume.
+
+Which chunks arrived is tracked in the ``upload_sessions`` row, not on disk.
+Its chunk map holds one character per chunk and is updated with a single
+conditional ``UPDATE`` together with the byte and chunk counters, so status
+is one primary-key read, a repeated chunk is never counted twice, and any
+API worker sharing the database and storage volume can accept any chunk.
+
+The blob store needs the SHA-256 of the whole file.  While chunks arrive in
+order the digest is carried forward in memory, so the common sequential
+upload completes without re-reading anything; uploads that went out of order,
+or that were resumed after a restart, are hashed with one read at completion.
+"""
+from __future__ import annotations
+
+import asyncio
+import errno
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models import UploadSession
+
+settings = get_settings()
+
+TEMP_DIRNAME = "tmp"
+DATA_FILENAME = "data"
+MISSING = "0"
+RECEIVED = "1"
+
+# Upper bound on in-memory digests kept for sequential uploads
+_MAX_TRACKED_DIGESTS = 1024
+_digests: "OrderedDict[str, tuple[int, object]]" = OrderedDict()
+
+
+class UploadSpaceError(OSError):
+    """Raised when the upload's data file cannot be preallocated (disk full)."""
+
+
+def temp_root() -> str:
+    return os.path.join(settings.storage_path, TEMP_DIRNAME)
+
+
+def temp_dir_for(user_id: str, upload_id: str) -> str:
+    return os.path.join(temp_root(), user_id, upload_id)
+
+
+def data_path(temp_dir: str) -> str:
+    return os.path.join(temp_dir, DATA_FILENAME)
+
+
+def preallocate(temp_dir: str, total_size: int) -> None:
+    """Create the upload's data file at its final size."""
+    fd = os.open(data_path(temp_dir), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        if total_size > 0:
+            try:
+                os.posix_fallocate(fd, 0, total_size)
+            except AttributeError:
+                os.ftruncate(fd, total_size)
+            except OSError as exc:
+                if exc.errno in (errno.ENOSPC, errno.EDQUOT):
+                    raise UploadSpaceError(exc.errno, "Not enough disk space for this upload") from exc
+                # Filesystem without fallocate support: a sparse file still
+                # lets chunks land at their offsets.
+                os.ftruncate(fd, total_size)
+    finally:
+        os.close(fd)
+
+
+def open_data_file(temp_dir: str) -> int:
+    return os.open(data_path(temp_dir), os.O_WRONLY | os.O_CREAT, 0o600)
+
+
+def pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def session_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=max(1, settings.upload_session_ttl_hours))
+
+
+def new_session(
+    upload_id: str,
+    user_id: str,
+    *,
+    filename: str,
+    path: str,
+    mime_type: Optional[str],
+    total_size: int,
+    chunk_size: int,
+    expected_chunks: int,
+) -> UploadSession:
+    return UploadSession(
+        id=upload_id,
+        user_id=user_id,
+        filename=filename,
+        path=path,
+        mime_type=mime_type,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        expected_chunks=expected_chunks,
+        chunk_map=MISSING * expected_chunks,
+        received_chunks=0,
+        received_bytes=0,
+        expires_at=session_expiry(),
+    )
+
+
+async def get_session(db: AsyncSession, user_id: str, upload_id: str) -> Optional[UploadSession]:
+    """The user's unexpired upload session, or None."""
+    return await db.scalar(
+        select(UploadSession).where(
+            UploadSession.id == upload_id,
+            UploadSession.user_id == user_id,
+            UploadSession.expires_at > datetime.now(timezone.utc),
+        )
+    )
+
+
+def received_chunks(session: UploadSession) -> list[int]:
+    return [index for index, flag in enumerate(session.chunk_map) if flag == RECEIVED]
+
+
+def is_chunk_received(session: UploadSession, chunk_index: int) -> bool:
+    return session.chunk_map[chunk_index:chunk_index + 1] == RECEIVED
+
+
+async def mark_chunk_received(db: AsyncSession, upload_id: str, chunk_index: int, size: int) -> bool:
+    """
+    Flip the chunk's map entry and bump the counters in one statement.
+    Returns False when the chunk had already been recorded, e.g. by a retry
+    racing on another worker.
+    """
+    position = chunk_index + 1
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == upload_id,
+            func.substr(UploadSession.chunk_map, position, 1) == MISSING,
+        )
+        .values(
+            chunk_map=func.substr(UploadSession.chunk_map, 1, chunk_index)
+            .concat(RECEIVED)
+            .concat(func.substr(UploadSession.chunk_map, position + 1)),
+            received_chunks=UploadSession.received_chunks + 1,
+            received_bytes=UploadSession.received_bytes + size,
+            updated_at=now,
+            expires_at=session_expiry(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def claim_completed_session(db: AsyncSession, upload_id: str) -> bool:
+    """
+    Delete the session row if every chunk arrived, so only one completion
+    request wins; rolling the transaction back restores it.
+    """
+    result = await db.execute(
+        UploadSession.__table__.delete().where(
+            UploadSession.id == upload_id,
+            UploadSession.received_chunks == UploadSession.expected_chunks,
+        )
+    )
+    return result.rowcount == 1
+
+
+def start_digest(upload_id: str) -> None:
+    """Begin carrying the digest forward for a fresh upload."""
+    _digests[upload_id] = (0, hashlib.sha256())
+    while len(_digests) > _MAX_TRACKED_DIGESTS:
+        _digests.popitem(last=False)
+
+
+def digest_for_chunk(upload_id: str, chunk_index: int):
+    """
+    A copy of the running digest if *chunk_index* is the next chunk in order,
+    else None.  Feed the chunk to it and hand it back with ``advance_digest``.
+    """
+    state = _digests.get(upload_id)
+    if state is None or state[0] != chunk_index:
+        return None
+    return state[1].copy()
+
+
+def advance_digest(upload_id: str, chunk_index: int, hasher) -> None:
+    state = _digests.get(upload_id)
+    if state is not None and state[0] == chunk_index:
+        _digests[upload_id] = (chunk_index + 1, hasher)
+
+
+def take_digest(upload_id: str, expected_chunks: int) -> Optional[str]:
+    """Final digest if every chunk was hashed in order; forgets the upload."""
+    state = _digests.pop(upload_id, None)
+    if state is None or state[0] != expected_chunks:
+        return None
+    return state[1].hexdigest()
+
+
+def forget_digest(upload_id: str) -> None:
+    _digests.pop(upload_id, None)
+
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while True:
+            block = handle.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def fsync_file(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(path: str) -> None:
+    """Persist a rename; directories cannot be opened for fsync on Windows."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+async def finalize_digest(temp_dir: str, upload_id: str, expected_chunks: int) -> str:
+    """Flush the data file to disk and return its SHA-256."""
+    path = data_path(temp_dir)
+    await asyncio.to_thread(fsync_file, path)
+    digest = take_digest(upload_id, expected_chunks)
+    if digest is None:
+        digest = await asyncio.to_thread(hash_file, path)
+    return digest
@@ -0,0 +1,96 @@
+"""
+Download latency on one API worker during a burst of logins.
+
+A simulated download streams a file in 1 MB blocks the way ``FileResponse``
+does (read in a thread, then hand the block to the event loop) while a burst
+of concurrent logins verifies bcrypt passwords:
+
+- ``inline``:   ``verify_password`` called directly in the handler (before)
+- ``executor``: ``verify_password_async`` on the bounded crypto executor
+
+    SECRET_KEY=... python benchmark_login_burst.py --logins 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from app.auth import get_password_hash, verify_password, verify_password_async
+from app.executors import crypto_executor, shutdown_executors
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def _read_block(handle) -> bytes:
+    return handle.read(BLOCK_SIZE)
+
+
+async def download(path: str, stop: asyncio.Event) -> list[float]:
+    """Stream *path* repeatedly until *stop*; returns the time to deliver each block."""
+    block_times = []
+    while not stop.is_set():
+        with open(path, "rb") as handle:
+            while not stop.is_set():
+                started = time.perf_counter()
+                block = await asyncio.to_thread(_read_block, handle)
+                if not block:
+                    break
+                await asyncio.sleep(0)  # the send to the client
+                block_times.append(time.perf_counter() - started)
+    return block_times
+
+
+async def login(mode: str, hashed: str) -> None:
+    if mode == "inline":
+        verify_password("correct horse battery", hashed)
+    else:
+        await verify_password_async("correct horse battery", hashed)
+
+
+def summarize(name: str, block_times: list[float], burst_seconds: float) -> None:
+    block_times = sorted(block_times)
+    p99 = block_times[max(0, int(len(block_times) * 0.99) - 1)]
+    print(
+        f"{name:9} blocks {len(block_times):6}  p50 {statistics.median(block_times) * 1000:7.2f} ms  "
+        f"p99 {p99 * 1000:7.2f} ms  max {block_times[-1] * 1000:7.2f} ms  logins took {burst_seconds:5.2f} s"
+    )
+
+
+async def run(mode: str, path: str, hashed: str, logins: int) -> None:
+    stop = asyncio.Event()
+    streaming = asyncio.create_task(download(path, stop))
+    await asyncio.sleep(0.5)  # steady state before the burst
+    started = time.perf_counter()
+    if mode != "idle":
+        await asyncio.gather(*(login(mode, hashed) for _ in range(logins)))
+    else:
+        await asyncio.sleep(1.0)
+    burst_seconds = time.perf_counter() - started
+    stop.set()
+    summarize(mode, await streaming, burst_seconds)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20, help="concurrent logins in the burst")
+    parser.add_argument("--file-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    hashed = get_password_hash("correct horse battery")
+    with tempfile.NamedTemporaryFile(delete=False) as handle:
+        handle.write(os.urandom(BLOCK_SIZE) * args.file_mb)
+        path = handle.name
+    try:
+        print(f"{args.logins} concurrent logins, crypto workers: {crypto_executor.metrics.workers}")
+        for mode in ("idle", "inline", "executor"):
+            await run(mode, path, hashed, args.logins)
+        print(f"peak crypto queue depth: {crypto_executor.metrics.peak_queued}")
+    finally:
+        os.remove(path)
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+Shared-folder access resolution for a user holding many grants.
+
+An owner shares ``--grants`` folders (each holding a nested folder and a
+file) with one user, who then opens ``--lookups`` files at random:
+
+- ``scan``:  the previous resolver (load every grant with its root row and
+             match the paths in Python)
+- ``cold``:  ``get_file_access_context`` with the grant cache disabled
+- ``warm``:  ``get_file_access_context`` with the grant cache
+
+    SECRET_KEY=... python benchmark_shared_access.py --grants 500 --lookups 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.file_tree import rebuild_tree_index
+from app.models import File as FileModel, SharedFolderAccess, User
+from app.shared_access import get_file_access_context, parse_path, resource_is_within_shared_root
+from app.shared_grants import settings as grant_settings, shared_grant_cache
+
+
+async def scan_access_context(db: AsyncSession, user: User, file_id: str) -> str:
+    """The resolver this replaced, kept here for comparison."""
+    file = await db.get(FileModel, file_id)
+    rows = (await db.execute(
+        select(SharedFolderAccess, FileModel)
+        .join(FileModel, SharedFolderAccess.folder_id == FileModel.id)
+        .where(and_(
+            SharedFolderAccess.user_id == user.id,
+            SharedFolderAccess.owner_id == file.owner_id,
+            FileModel.type == "folder",
+        ))
+    )).all()
+    best, best_depth = None, -1
+    for access, root in rows:
+        if root.is_trashed or not resource_is_within_shared_root(file, root):
+            continue
+        depth = len(parse_path(root.path)) + 1
+        if depth > best_depth:
+            best, best_depth = access.role, depth
+    return best
+
+
+async def setup(session_factory, grants: int) -> tuple[User, list[str]]:
+    async with session_factory() as db:
+        owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+        viewer = User(email="viewer@example.com", username="viewer", password_hash="hashed")
+        db.add_all([owner, viewer])
+        await db.flush()
+        file_ids = []
+        for n in range(grants):
+            top = FileModel(name=f"team-{n}", type="folder", path="[]", owner_id=owner.id)
+            db.add(top)
+            await db.flush()
+            inner = FileModel(name="docs", type="folder", path=f'["team-{n}"]', parent_id=top.id, owner_id=owner.id)
+            db.add(inner)
+            await db.flush()
+            leaf = FileModel(
+                name="notes.txt", type="text", path=f'["team-{n}","docs"]', parent_id=inner.id, owner_id=owner.id
+            )
+            db.add(leaf)
+            db.add(SharedFolderAccess(folder_id=top.id, owner_id=owner.id, user_id=viewer.id, role="viewer"))
+            await db.flush()
+            file_ids.append(leaf.id)
+        await db.commit()
+    return viewer, file_ids
+
+
+async def run(name, session_factory, viewer, file_ids, lookups) -> None:
+    picks = [random.choice(file_ids) for _ in range(lookups)]
+    latencies = []
+    async with session_factory() as db:
+        for file_id in picks:
+            started = time.perf_counter()
+            if name == "scan":
+                await scan_access_context(db, viewer, file_id)
+            else:
+                await get_file_access_context(db, viewer, file_id)
+            latencies.append(time.perf_counter() - started)
+            db.expunge_all()
+    latencies.sort()
+    print(
+        f"{name:5} p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f} ms  "
+        f"total {sum(latencies):6.2f} s"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--grants", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        viewer, file_ids = await setup(session_factory, args.grants)
+        async with engine.begin() as conn:
+            await rebuild_tree_index(conn)
+
+        print(f"{args.grants} grants, {args.lookups} lookups")
+        await run("scan", session_factory, viewer, file_ids, args.lookups)
+        ttl = grant_settings.shared_grant_cache_ttl_seconds
+        grant_settings.shared_grant_cache_ttl_seconds = 0
+        await run("cold", session_factory, viewer, file_ids, args.lookups)
+        grant_settings.shared_grant_cache_ttl_seconds = ttl
+        shared_grant_cache.clear()
+        await run("warm", session_factory, viewer, file_ids, args.lookups)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Write throughput of the SQLite profiles under concurrent clients.
+
+Each client runs request-shaped write transactions (read the user row,
+insert an activity row, bump ``storage_used``) against a fresh database:
+
+- ``default``: driver defaults (rollback journal, no pool, no write gate)
+- ``pragmas``: the WAL / pragma profile and connection pool, no write gate
+- ``gated``:   the full profile used by the API (pragmas, pool, write gate)
+
+    SECRET_KEY=... python benchmark_sqlite_writes.py --clients 50 --transactions 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import ActivityLog, User
+from app.sqlite_tuning import configure_sqlite, engine_options
+
+
+async def run_profile(name: str, directory: str, clients: int, transactions: int) -> None:
+    url = f"sqlite+aiosqlite:///{os.path.join(directory, f'{name}.db')}"
+    if name == "default":
+        engine = create_async_engine(url)
+    else:
+        engine = create_async_engine(url, **engine_options(url))
+        configure_sqlite(engine, single_writer=name == "gated")
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_factory() as db:
+        user = User(email="bench@example.com", username="bench", password_hash="hashed", storage_used=0)
+        db.add(user)
+        await db.commit()
+
+    latencies: list[float] = []
+    errors = 0
+
+    async def client(n: int) -> None:
+        nonlocal errors
+        for i in range(transactions):
+            started = time.perf_counter()
+            try:
+                async with session_factory() as db:
+                    await db.scalar(select(User.storage_used).where(User.id == user.id))
+                    db.add(ActivityLog(user_id=user.id, action="upload", file_name=f"{n}-{i}.bin"))
+                    await db.execute(update(User).where(User.id == user.id).values(storage_used=User.storage_used + 1))
+                    await db.commit()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(
+        f"{name:8} {len(latencies) / elapsed:9.1f} tx/s  "
+        f"p50 {statistics.median(latencies) * 1000 if latencies else 0:8.1f} ms  "
+        f"p95 {p95 * 1000:8.1f} ms  errors {errors}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=20, help="write transactions per client")
+    parser.add_argument("--profiles", nargs="+", default=["default", "pragmas", "gated"])
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.transactions} write transactions")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.profiles:
+            await run_profile(name, directory, args.clients, args.transactions)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
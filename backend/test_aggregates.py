@@ -0,0 +1,187 @@
+import os
+import shutil
+import unittest
+import uuid
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.aggregates import count_drift, rebuild_aggregates  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import File as FileModel, User, UserTypeUsage  # noqa: E402
+from app.routers import files as files_router  # noqa: E402
+from app.routers.folders import create_folder  # noqa: E402
+from app.routers.storage import get_storage_info  # noqa: E402
+from app.schemas import BulkFileRequest, FileUpdate, FolderCreate  # noqa: E402
+from app.shared_access import FileAccessContext  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_aggregate_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(method: str = "POST") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class AggregateTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'aggregates.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _folder(self, name, path):
+        async with self.session_factory() as db:
+            folder = await create_folder(
+                folder=FolderCreate(name=name, path=path),
+                current_user=await db.get(User, self.owner.id),
+                db=db,
+            )
+            await db.commit()
+        return folder.id
+
+    async def _upload(self, name, path, size):
+        async with self.session_factory() as db:
+            owner = await db.get(User, self.owner.id)
+            response = await files_router.record_uploaded_file(
+                db,
+                current_user=owner,
+                target_owner=owner,
+                access_ctx=FileAccessContext(role="owner", is_owner=True, owner_id=owner.id, owner_username=owner.username),
+                target_path=path,
+                parent_id=await files_router.ensure_folder_path_exists(db, owner.id, path),
+                filename=name,
+                mime_type=None,
+                size=size,
+                storage_path=os.path.join(self.test_dir, name),
+            )
+            await db.commit()
+        return response.id
+
+    async def _totals(self, file_id):
+        async with self.session_factory() as db:
+            row = await db.get(FileModel, file_id)
+            return row.subtree_count, row.subtree_size
+
+    async def _assert_no_drift(self):
+        async with self.engine.connect() as conn:
+            self.assertEqual(await count_drift(conn), (0, 0))
+
+    async def _call(self, handler, **kwargs):
+        async with self.session_factory() as db:
+            result = await handler(request=make_request(), current_user=await db.get(User, self.owner.id), db=db, **kwargs)
+            await db.commit()
+        return result
+
+    async def test_totals_follow_every_tree_change(self):
+        docs = await self._folder("Docs", [])
+        reports = await self._folder("Reports", ["Docs"])
+        archive = await self._folder("Archive", [])
+        report = await self._upload("q1.txt", ["Docs", "Reports"], 100)
+        notes = await self._upload("notes.txt", ["Docs"], 20)
+        await self._assert_no_drift()
+        self.assertEqual(await self._totals(docs), (3, 120))
+        self.assertEqual(await self._totals(reports), (1, 100))
+
+        await self._call(files_router.update_file, file_id=reports, update=FileUpdate(path=["Archive"]))
+        self.assertEqual(await self._totals(docs), (1, 20))
+        self.assertEqual(await self._totals(archive), (2, 100))
+        await self._assert_no_drift()
+
+        await self._call(files_router.trash_file, file_id=report)
+        self.assertEqual(await self._totals(archive), (1, 0))
+        await self._call(files_router.trash_file, file_id=archive)
+        await self._call(files_router.restore_file, file_id=archive)
+        self.assertEqual(await self._totals(archive), (2, 100))
+        await self._assert_no_drift()
+
+        async with self.session_factory() as db:
+            file = await db.get(FileModel, notes)
+            owner = await db.get(User, self.owner.id)
+            ctx = FileAccessContext(role="owner", is_owner=True, owner_id=owner.id, owner_username=owner.username)
+            await files_router.record_new_version(
+                db, file, ctx, current_user=owner, owner_user=owner,
+                mime_type="image/png", size=50, storage_path=os.path.join(self.test_dir, "v2"),
+            )
+            await db.commit()
+        self.assertEqual(await self._totals(docs), (1, 50))
+        await self._assert_no_drift()
+
+        await self._call(
+            files_router.bulk_file_operation,
+            bulk_req=BulkFileRequest(operation="move", file_ids=[notes, archive], path=["Docs"]),
+        )
+        self.assertEqual(await self._totals(docs), (4, 150))
+        await self._call(
+            files_router.bulk_file_operation,
+            bulk_req=BulkFileRequest(operation="trash", file_ids=[notes]),
+        )
+        await self._call(
+            files_router.bulk_file_operation,
+            bulk_req=BulkFileRequest(operation="restore", file_ids=[notes]),
+        )
+        await self._assert_no_drift()
+
+        await self._call(files_router.delete_file_permanently, file_id=archive)
+        self.assertEqual(await self._totals(docs), (1, 50))
+        await self._assert_no_drift()
+
+    async def test_storage_breakdown_reads_type_counters(self):
+        await self._folder("Docs", [])
+        await self._upload("a.txt", ["Docs"], 10)
+        await self._upload("b.txt", [], 5)
+        photo = await self._upload("c.png", [], 7)
+        await self._call(files_router.trash_file, file_id=photo)
+
+        storage = await self._call(get_storage_info)
+
+        self.assertEqual(
+            [(item.type, item.count, item.size) for item in storage.breakdown],
+            [("text", 2, 15)],
+        )
+
+    async def test_rebuild_repairs_drift(self):
+        docs = await self._folder("Docs", [])
+        await self._upload("a.txt", ["Docs"], 10)
+        async with self.session_factory() as db:
+            await db.execute(update(FileModel).where(FileModel.id == docs).values(subtree_count=7, subtree_size=1))
+            await db.execute(update(UserTypeUsage).values(file_count=3))
+            await db.commit()
+
+        async with self.engine.begin() as conn:
+            self.assertEqual(await count_drift(conn), (1, 1))
+            self.assertEqual(await rebuild_aggregates(conn), (1, 1))
+
+        self.assertEqual(await self._totals(docs), (1, 10))
+        await self._assert_no_drift()
+
+
+if __name__ == "__main__":
+    unittest.main()
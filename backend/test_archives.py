@@ -0,0 +1,217 @@
+import io
+import os
+import shutil
+import unittest
+import uuid
+import zipfile
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.file_tree import link_node  # noqa: E402
+from app.models import ActivityLog, File as FileModel, SharedFolderAccess, User  # noqa: E402
+from app.schemas import ArchiveRequest  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_archive_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(method: str = "GET") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files/archive",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+async def read_archive(response) -> zipfile.ZipFile:
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    return zipfile.ZipFile(io.BytesIO(body))
+
+
+class ArchiveTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'archive.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            self.viewer = User(email="viewer@example.com", username="viewer", password_hash="hashed")
+            self.stranger = User(email="stranger@example.com", username="stranger", password_hash="hashed")
+            db.add_all([self.owner, self.viewer, self.stranger])
+            await db.flush()
+
+            self.root = await self._add(db, "Projects", "folder", [], None)
+            self.notes = await self._add(db, "notes.txt", "document", ["Projects"], self.root, b"hello " * 500)
+            self.specs = await self._add(db, "Specs", "folder", ["Projects"], self.root)
+            self.photo = await self._add(db, "photo.jpg", "image", ["Projects", "Specs"], self.specs, b"\xff\xd8" * 500)
+            self.trashed = await self._add(db, "old.txt", "document", ["Projects"], self.root, b"gone")
+            self.trashed.is_trashed = True
+            self.other_notes = await self._add(db, "notes.txt", "document", [], None, b"top level")
+            db.add(SharedFolderAccess(
+                folder_id=self.root.id, owner_id=self.owner.id, user_id=self.viewer.id, role="viewer",
+            ))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _add(self, db, name, file_type, path, parent, content=None):
+        storage_path = None
+        if content is not None:
+            storage_path = os.path.join(self.test_dir, "storage", str(uuid.uuid4()))
+            os.makedirs(os.path.dirname(storage_path), exist_ok=True)
+            with open(storage_path, "wb") as handle:
+                handle.write(content)
+        item = FileModel(
+            name=name,
+            type=file_type,
+            size=len(content or b""),
+            path=files_router.serialize_path(path),
+            parent_id=parent.id if parent else None,
+            owner_id=self.owner.id,
+            storage_path=storage_path,
+        )
+        db.add(item)
+        await db.flush()
+        await link_node(db, item.id, item.parent_id)
+        return item
+
+    async def test_folder_archive_streams_subtree(self):
+        async with self.session_factory() as db:
+            response = await files_router.download_archive(
+                request=make_request(), folder_id=self.root.id, current_user=self.owner, db=db,
+            )
+            await db.commit()
+        self.assertIn("Projects.zip", response.headers["content-disposition"])
+
+        archive = await read_archive(response)
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            sorted(archive.namelist()),
+            ["Projects/", "Projects/Specs/", "Projects/Specs/photo.jpg", "Projects/notes.txt"],
+        )
+        self.assertEqual(archive.read("Projects/notes.txt"), b"hello " * 500)
+        self.assertEqual(archive.getinfo("Projects/notes.txt").compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo("Projects/Specs/photo.jpg").compress_type, zipfile.ZIP_STORED)
+
+        async with self.session_factory() as db:
+            logs = (await db.scalars(select(ActivityLog.file_name))).all()
+        self.assertEqual(logs, ["Projects.zip"])
+
+    async def test_activity_is_committed_before_the_archive_streams(self):
+        async with self.session_factory() as db:
+            response = await files_router.download_archive(
+                request=make_request(), folder_id=self.root.id, current_user=self.owner, db=db,
+            )
+            # The request transaction is already closed while the ZIP is still unsent
+            self.assertFalse(db.in_transaction())
+            async with self.session_factory() as other:
+                logs = (await other.scalars(select(ActivityLog.file_name))).all()
+            self.assertEqual(logs, ["Projects.zip"])
+            self.assertIsNone((await read_archive(response)).testzip())
+
+    async def test_signed_link_downloads_the_archive_without_a_session(self):
+        async with self.session_factory() as db:
+            link = await files_router.create_archive_link(
+                request=make_request("POST"), folder_id=self.specs.id, current_user=self.viewer, db=db,
+            )
+        url = urlsplit(link.url)
+        self.assertEqual(url.path, f"/api/files/{self.specs.id}/archive/signed")
+        params = dict(parse_qsl(url.query))
+
+        async def follow(folder_id=self.specs.id, **overrides):
+            query = {**params, **overrides}
+            async with self.session_factory() as db:
+                response = await files_router.download_archive_signed(
+                    request=make_request(),
+                    folder_id=folder_id,
+                    user=query["user"],
+                    expires=int(query["expires"]),
+                    sig=query["sig"],
+                    db=db,
+                )
+                return await read_archive(response)
+
+        self.assertEqual((await follow()).namelist(), ["Specs/", "Specs/photo.jpg"])
+
+        # The signature covers the folder and the user, and access is re-checked
+        for folder_id, overrides in (
+            (self.root.id, {}),
+            (self.specs.id, {"user": self.owner.id}),
+            (self.specs.id, {"expires": str(int(params["expires"]) + 60)}),
+        ):
+            with self.assertRaises(HTTPException) as ctx:
+                await follow(folder_id, **overrides)
+            self.assertEqual(ctx.exception.status_code, 403)
+
+        async with self.session_factory() as db:
+            for grant in (await db.scalars(select(SharedFolderAccess))).all():
+                await db.delete(grant)
+            await db.commit()
+        with self.assertRaises(HTTPException) as ctx:
+            await follow()
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    async def test_selection_archive_dedupes_and_renames_collisions(self):
+        async with self.session_factory() as db:
+            response = await files_router.download_selection_archive(
+                request=make_request("POST"),
+                archive_req=ArchiveRequest(file_ids=[self.other_notes.id, self.specs.id, self.photo.id, self.notes.id]),
+                current_user=self.owner,
+                db=db,
+            )
+
+        archive = await read_archive(response)
+        self.assertEqual(
+            archive.namelist(),
+            ["notes.txt", "Specs/", "Specs/photo.jpg", "notes (2).txt"],
+        )
+        self.assertEqual(archive.read("notes.txt"), b"top level")
+
+    async def test_shared_folder_access_is_respected(self):
+        async with self.session_factory() as db:
+            response = await files_router.download_archive(
+                request=make_request(), folder_id=self.specs.id, current_user=self.viewer, db=db,
+            )
+            archive = await read_archive(response)
+            self.assertEqual(archive.namelist(), ["Specs/", "Specs/photo.jpg"])
+
+            with self.assertRaises(HTTPException) as ctx:
+                await files_router.download_archive(
+                    request=make_request(), folder_id=self.root.id, current_user=self.stranger, db=db,
+                )
+            self.assertEqual(ctx.exception.status_code, 404)
+
+            with self.assertRaises(HTTPException):
+                await files_router.download_selection_archive(
+                    request=make_request("POST"),
+                    archive_req=ArchiveRequest(file_ids=[self.other_notes.id]),
+                    current_user=self.viewer,
+                    db=db,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
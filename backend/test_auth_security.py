@@ -17,6 +17,8 @@ from app.auth import (  # noqa: E402
     verify_password_reset_token,
 )
 from app.config import get_settings  # noqa: E402
+from app.models import User  # noqa: E402
+from app.session_cache import session_cache  # noqa: E402
 
 settings = get_settings()
 
@@ -46,8 +48,8 @@ class PasswordResetTokenTests(unittest.TestCase):
 # get_current_user: session-backed token enforcement tests
 # ---------------------------------------------------------------------------
 
-def _make_user(user_id: str = "user-1") -> SimpleNamespace:
-    return SimpleNamespace(id=user_id, username="tester", email="t@example.com")
+def _make_user(user_id: str = "user-1") -> User:
+    return User(id=user_id, username="tester", email="t@example.com", password_hash="hashed")
 
 
 def _make_session(
@@ -94,6 +96,11 @@ def _make_db_for_user_lookup(user, session):
 
 
 class GetCurrentUserSessionTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Every test drives the uncached path against its own fake rows
+        session_cache.clear()
+        self.addCleanup(session_cache.clear)
+
     async def test_token_without_sid_raises_401(self):
         """Access tokens that carry no session id must be rejected."""
         payload = {"sub": "user-1", "type": "access"}
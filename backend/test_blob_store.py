@@ -0,0 +1,209 @@
+import io
+import os
+import shutil
+import unittest
+import uuid
+
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import Blob, File as FileModel, FileVersion, User  # noqa: E402
+from app.storage import _unlink_unreferenced, get_storage, wait_for_unlinks  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_blob_store_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(method: str = "POST") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class BlobStoreTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'blobs.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+
+        async with self.session_factory() as db:
+            self.alice = User(email="alice@example.com", username="alice", password_hash="hashed")
+            self.bob = User(email="bob@example.com", username="bob", password_hash="hashed")
+            db.add_all([self.alice, self.bob])
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _upload(self, user_id, name, content):
+        async with self.session_factory() as db:
+            user = await db.get(User, user_id)
+            uploaded = await files_router.upload_files(
+                request=make_request(),
+                files=[UploadFile(filename=name, file=io.BytesIO(content))],
+                path="[]",
+                shared_folder_id=None,
+                current_user=user,
+                db=db,
+            )
+            await db.commit()
+            return uploaded[0]
+
+    async def _call(self, endpoint, user_id, **kwargs):
+        async with self.session_factory() as db:
+            user = await db.get(User, user_id)
+            result = await endpoint(request=make_request(), current_user=user, db=db, **kwargs)
+            await db.commit()
+            return result
+
+    async def _blobs(self):
+        async with self.session_factory() as db:
+            return (await db.execute(select(Blob))).scalars().all()
+
+    async def _storage_used(self, user_id):
+        async with self.session_factory() as db:
+            return (await db.get(User, user_id)).storage_used
+
+    def _blob_files(self):
+        blob_root = get_storage().blob_root
+        return [
+            name
+            for root, _dirs, names in os.walk(blob_root)
+            if os.path.basename(root) != ".staging"
+            for name in names
+        ]
+
+    async def test_identical_uploads_are_stored_once_and_charged_per_file(self):
+        await self._upload(self.alice.id, "a.txt", b"same bytes")
+        await self._upload(self.bob.id, "b.txt", b"same bytes")
+
+        blobs = await self._blobs()
+        self.assertEqual([(blob.refcount, blob.size) for blob in blobs], [(2, 10)])
+        self.assertEqual(len(self._blob_files()), 1)
+        self.assertEqual(await self._storage_used(self.alice.id), 10)
+        self.assertEqual(await self._storage_used(self.bob.id), 10)
+
+    async def test_copy_and_restore_only_add_references(self):
+        original = await self._upload(self.alice.id, "report.txt", b"v1 content")
+        copy = await self._call(files_router.copy_file, self.alice.id, file_id=original.id)
+
+        async with self.session_factory() as db:
+            stored = await db.get(FileModel, original.id)
+            stored_copy = await db.get(FileModel, copy.id)
+            v1_id = await db.scalar(select(FileVersion.id).where(FileVersion.file_id == original.id))
+        self.assertEqual(stored_copy.storage_path, stored.storage_path)
+
+        async with self.session_factory() as db:
+            user = await db.get(User, self.alice.id)
+            await files_router.upload_new_version(
+                request=make_request(),
+                file_id=original.id,
+                new_file=UploadFile(filename="report.txt", file=io.BytesIO(b"v2 content")),
+                current_user=user,
+                db=db,
+            )
+            await db.commit()
+        await self._call(files_router.restore_file_version, self.alice.id, file_id=original.id, version_id=v1_id)
+
+        async with self.session_factory() as db:
+            restored = await db.get(FileModel, original.id)
+        self.assertEqual((restored.version, restored.storage_path), (3, stored.storage_path))
+        refcounts = sorted(blob.refcount for blob in await self._blobs())
+        self.assertEqual(refcounts, [1, 3])
+        self.assertEqual(len(self._blob_files()), 2)
+        self.assertEqual(await self._storage_used(self.alice.id), 40)
+
+    async def test_blob_is_unlinked_only_when_last_reference_is_purged(self):
+        original = await self._upload(self.alice.id, "notes.txt", b"shared")
+        copy = await self._call(files_router.copy_file, self.alice.id, file_id=original.id)
+        blob_path = (await self._blobs())[0].storage_path
+
+        await self._call(files_router.delete_file_permanently, self.alice.id, file_id=original.id)
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual([blob.refcount for blob in await self._blobs()], [1])
+
+        await self._call(files_router.delete_file_permanently, self.alice.id, file_id=copy.id)
+        await wait_for_unlinks()
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertEqual(await self._blobs(), [])
+        self.assertEqual(await self._storage_used(self.alice.id), 0)
+
+    async def test_released_blob_survives_rolled_back_delete(self):
+        uploaded = await self._upload(self.alice.id, "keep.txt", b"keep me")
+        blob_path = (await self._blobs())[0].storage_path
+
+        async with self.session_factory() as db:
+            user = await db.get(User, self.alice.id)
+            await files_router.delete_file_permanently(
+                request=make_request(), file_id=uploaded.id, current_user=user, db=db
+            )
+            await db.rollback()
+
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual([blob.refcount for blob in await self._blobs()], [1])
+
+    async def test_reingested_blob_survives_a_late_unlink(self):
+        uploaded = await self._upload(self.alice.id, "first.txt", b"same bytes")
+        blob_path = (await self._blobs())[0].storage_path
+        await self._call(files_router.delete_file_permanently, self.alice.id, file_id=uploaded.id)
+        await wait_for_unlinks()
+        self.assertFalse(os.path.exists(blob_path))
+
+        # Another worker uploads the same content before a stale unlink runs
+        await self._upload(self.bob.id, "again.txt", b"same bytes")
+        await _unlink_unreferenced(self.engine, [blob_path])
+
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual([blob.refcount for blob in await self._blobs()], [1])
+
+    async def test_legacy_files_are_adopted_without_copying(self):
+        legacy_path = os.path.join(files_router.settings.storage_path, self.alice.id, "legacy.txt")
+        os.makedirs(os.path.dirname(legacy_path))
+        with open(legacy_path, "wb") as handle:
+            handle.write(b"old upload")
+        async with self.session_factory() as db:
+            legacy = FileModel(
+                name="legacy.txt", type="text", size=10, path="[]",
+                storage_path=legacy_path, owner_id=self.alice.id, version=1,
+            )
+            db.add(legacy)
+            await db.commit()
+
+        copy = await self._call(files_router.copy_file, self.alice.id, file_id=legacy.id)
+        self.assertEqual([(blob.sha256, blob.refcount) for blob in await self._blobs()], [(None, 2)])
+        self.assertEqual(self._blob_files(), [])
+
+        await self._call(files_router.delete_file_permanently, self.alice.id, file_id=legacy.id)
+        self.assertTrue(os.path.exists(legacy_path))
+        await self._call(files_router.delete_file_permanently, self.alice.id, file_id=copy.id)
+        await wait_for_unlinks()
+        self.assertFalse(os.path.exists(legacy_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
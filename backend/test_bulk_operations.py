@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import unittest
+import uuid
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.database import Base  # noqa: E402
+from app.file_tree import link_node  # noqa: E402
+from app.models import (  # noqa: E402
+    ActivityLog,
+    Blob,
+    File as FileModel,
+    FileClosure,
+    FileVersion,
+    ShareLink,
+    SharedFolderAccess,
+    User,
+)
+from app.routers import files as files_router  # noqa: E402
+from app.schemas import BulkFileRequest  # noqa: E402
+from app.storage import wait_for_unlinks  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_bulk_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/files/bulk",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class BulkOperationTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'bulk.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed", storage_used=30)
+            self.viewer = User(email="viewer@example.com", username="viewer", password_hash="hashed")
+            db.add_all([self.owner, self.viewer])
+            await db.flush()
+
+            self.docs = await self._add(db, "Docs", "folder", [], None)
+            self.reports = await self._add(db, "Reports", "folder", ["Docs"], self.docs)
+            self.q1 = await self._add(db, "q1.txt", "document", ["Docs", "Reports"], self.reports, size=10)
+            self.notes = await self._add(db, "notes.txt", "document", ["Docs"], self.docs, size=10)
+            self.archive = await self._add(db, "Archive", "folder", [], None)
+            self.loose = await self._add(db, "loose.txt", "document", [], None, size=10)
+            db.add(SharedFolderAccess(
+                folder_id=self.docs.id, owner_id=self.owner.id, user_id=self.viewer.id, role="viewer",
+            ))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _add(self, db, name, file_type, path, parent, size=0):
+        item = FileModel(
+            name=name,
+            type=file_type,
+            size=size,
+            path=files_router.serialize_path(path),
+            parent_id=parent.id if parent else None,
+            owner_id=self.owner.id,
+        )
+        db.add(item)
+        await db.flush()
+        await link_node(db, item.id, item.parent_id)
+        return item
+
+    async def _bulk(self, operation, file_ids, path=None, user=None):
+        async with self.session_factory() as db:
+            response = await files_router.bulk_file_operation(
+                request=make_request(),
+                bulk_req=BulkFileRequest(operation=operation, file_ids=file_ids, path=path),
+                current_user=await db.get(User, (user or self.owner).id),
+                db=db,
+            )
+            await db.commit()
+        return response
+
+    async def _ancestors(self, db, file_id):
+        result = await db.execute(
+            select(FileClosure.ancestor_id).where(FileClosure.descendant_id == file_id).order_by(FileClosure.depth)
+        )
+        return result.scalars().all()
+
+    async def test_move_handles_nested_selection_and_reports_failures(self):
+        missing_id = str(uuid.uuid4())
+        response = await self._bulk(
+            "move",
+            [self.docs.id, self.reports.id, self.archive.id, missing_id],
+            path=["Archive"],
+        )
+
+        self.assertEqual((response.succeeded, response.failed), (2, 2))
+        results = {result.id: result for result in response.results}
+        self.assertEqual(results[self.archive.id].status_code, 400)
+        self.assertEqual(results[missing_id].status_code, 404)
+
+        async with self.session_factory() as db:
+            docs = await db.get(FileModel, self.docs.id)
+            reports = await db.get(FileModel, self.reports.id)
+            q1 = await db.get(FileModel, self.q1.id)
+            notes = await db.get(FileModel, self.notes.id)
+            self.assertEqual((json.loads(docs.path), docs.parent_id), (["Archive"], self.archive.id))
+            self.assertEqual((json.loads(reports.path), reports.parent_id), (["Archive"], self.archive.id))
+            self.assertEqual(json.loads(q1.path), ["Archive", "Reports"])
+            self.assertEqual(json.loads(notes.path), ["Archive", "Docs"])
+            self.assertEqual(await self._ancestors(db, self.q1.id), [self.q1.id, self.reports.id, self.archive.id])
+            self.assertEqual(await self._ancestors(db, self.notes.id), [self.notes.id, self.docs.id, self.archive.id])
+            moves = await db.scalar(select(func.count()).select_from(ActivityLog).where(ActivityLog.action == "move"))
+            self.assertEqual(moves, 2)
+
+    async def test_trash_and_restore_cover_subtrees(self):
+        async with self.session_factory() as db:
+            db.add(ShareLink(file_id=self.q1.id, owner_id=self.owner.id))
+            await db.commit()
+
+        response = await self._bulk("trash", [self.docs.id, self.loose.id])
+        self.assertEqual(response.succeeded, 2)
+
+        async with self.session_factory() as db:
+            trashed = set((await db.scalars(select(FileModel.id).where(FileModel.is_trashed == True))).all())  # noqa: E712
+            self.assertEqual(trashed, {self.docs.id, self.reports.id, self.q1.id, self.notes.id, self.loose.id})
+            self.assertFalse(await db.scalar(select(ShareLink.is_active)))
+
+        again = await self._bulk("trash", [self.docs.id])
+        self.assertEqual(again.results[0].status_code, 404)
+
+        await self._bulk("restore", [self.docs.id])
+        async with self.session_factory() as db:
+            trashed = set((await db.scalars(select(FileModel.id).where(FileModel.is_trashed == True))).all())  # noqa: E712
+            self.assertEqual(trashed, {self.loose.id})
+
+    async def test_delete_releases_blobs_and_credits_usage(self):
+        storage_root = files_router.settings.storage_path
+        shared_blob = os.path.join(storage_root, "blobs", "aa", "bb", "a" * 64)
+        kept_blob = os.path.join(storage_root, "blobs", "bb", "cc", "b" * 64)
+        for path in (shared_blob, kept_blob):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as handle:
+                handle.write(b"0123456789")
+        async with self.session_factory() as db:
+            db.add_all([
+                Blob(sha256="a" * 64, size=10, refcount=2, storage_path=shared_blob),
+                Blob(sha256="b" * 64, size=10, refcount=2, storage_path=kept_blob),
+                FileVersion(file_id=self.q1.id, version=1, size=10, storage_path=shared_blob, created_by=self.owner.id),
+                FileVersion(file_id=self.notes.id, version=1, size=10, storage_path=shared_blob, created_by=self.owner.id),
+                FileVersion(file_id=self.loose.id, version=1, size=10, storage_path=kept_blob, created_by=self.owner.id),
+            ])
+            await db.commit()
+
+        response = await self._bulk("delete", [self.docs.id, self.q1.id])
+
+        self.assertEqual(response.succeeded, 2)
+        await wait_for_unlinks()
+        self.assertFalse(os.path.exists(shared_blob))
+        self.assertTrue(os.path.exists(kept_blob))
+        async with self.session_factory() as db:
+            remaining = set((await db.scalars(select(FileModel.id))).all())
+            self.assertEqual(remaining, {self.archive.id, self.loose.id})
+            self.assertEqual((await db.scalars(select(Blob.refcount))).all(), [2])
+            closure_ids = set((await db.scalars(select(FileClosure.descendant_id))).all())
+            self.assertEqual(closure_ids, {self.archive.id, self.loose.id})
+            owner = await db.get(User, self.owner.id)
+            self.assertEqual(owner.storage_used, 10)
+
+    async def test_star_requires_ownership_per_item(self):
+        response = await self._bulk("star", [self.q1.id], user=self.viewer)
+        self.assertEqual((response.results[0].ok, response.results[0].status_code), (False, 403))
+
+        response = await self._bulk("star", [self.q1.id, self.loose.id])
+        self.assertEqual(response.succeeded, 2)
+        async with self.session_factory() as db:
+            starred = set((await db.scalars(select(FileModel.id).where(FileModel.is_starred == True))).all())  # noqa: E712
+            self.assertEqual(starred, {self.q1.id, self.loose.id})
+
+        await self._bulk("unstar", [self.q1.id])
+        async with self.session_factory() as db:
+            self.assertFalse((await db.get(FileModel, self.q1.id)).is_starred)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.change_log import compact_changes, settings as change_settings  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import FileChange, User  # noqa: E402
+from app.routers import changes as changes_router  # noqa: E402
+from app.routers import files as files_router  # noqa: E402
+from app.routers.folders import create_folder  # noqa: E402
+from app.schemas import BulkFileRequest, FileUpdate, FolderCreate  # noqa: E402
+from app.shared_access import FileAccessContext  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_change_feed_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(method: str = "GET") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/changes",
+            "headers": [(b"host", b"testserver"), (b"x-forwarded-for", b"127.0.0.1")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class ChangeFeedTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'changes.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            self.other = User(email="other@example.com", username="other", password_hash="hashed")
+            db.add_all([self.owner, self.other])
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _folder(self, name, path, user=None):
+        async with self.session_factory() as db:
+            folder = await create_folder(
+                folder=FolderCreate(name=name, path=path),
+                current_user=await db.get(User, (user or self.owner).id),
+                db=db,
+            )
+            await db.commit()
+        return folder.id
+
+    async def _upload(self, name, path):
+        async with self.session_factory() as db:
+            owner = await db.get(User, self.owner.id)
+            response = await files_router.record_uploaded_file(
+                db,
+                current_user=owner,
+                target_owner=owner,
+                access_ctx=FileAccessContext(role="owner", is_owner=True, owner_id=owner.id, owner_username=owner.username),
+                target_path=path,
+                parent_id=await files_router.ensure_folder_path_exists(db, owner.id, path),
+                filename=name,
+                mime_type="text/plain",
+                size=10,
+                storage_path=os.path.join(self.test_dir, name),
+            )
+            await db.commit()
+        return response.id
+
+    async def _call(self, handler, **kwargs):
+        async with self.session_factory() as db:
+            result = await handler(request=make_request("POST"), current_user=await db.get(User, self.owner.id), db=db, **kwargs)
+            await db.commit()
+        return result
+
+    async def _changes(self, since, limit=200):
+        async with self.session_factory() as db:
+            return await changes_router.list_changes(
+                request=make_request(),
+                since=since,
+                limit=limit,
+                current_user=await db.get(User, self.owner.id),
+                db=db,
+            )
+
+    async def test_feed_follows_every_tree_change_in_order(self):
+        start = (await self._changes(None)).next_since
+        docs = await self._folder("Docs", [])
+        archive = await self._folder("Archive", [])
+        report = await self._upload("report.txt", ["Docs"])
+        await self._folder("Elsewhere", [], user=self.other)
+
+        await self._call(files_router.update_file, file_id=report, update=FileUpdate(name="q1.txt"))
+        await self._call(files_router.update_file, file_id=docs, update=FileUpdate(path=["Archive"]))
+        await self._call(files_router.trash_file, file_id=archive)
+        await self._call(files_router.restore_file, file_id=archive)
+        await self._call(
+            files_router.bulk_file_operation,
+            bulk_req=BulkFileRequest(operation="delete", file_ids=[archive]),
+        )
+
+        page = await self._changes(start)
+        self.assertEqual(
+            [(change.action, change.file_id) for change in page.changes],
+            [
+                ("created", docs),
+                ("created", archive),
+                ("created", report),
+                ("updated", report),
+                ("moved", docs),
+                *sorted([("trashed", archive), ("trashed", docs), ("trashed", report)], key=lambda c: c[1]),
+                *sorted([("restored", archive), ("restored", docs), ("restored", report)], key=lambda c: c[1]),
+                *sorted([("deleted", archive), ("deleted", docs), ("deleted", report)], key=lambda c: c[1]),
+            ],
+        )
+        seqs = [change.seq for change in page.changes]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertTrue(all(change.file is None for change in page.changes))
+        self.assertFalse(page.has_more)
+        self.assertEqual(page.next_since, seqs[-1])
+        self.assertEqual((await self._changes(None)).next_since, seqs[-1])
+
+        first = await self._changes(start, limit=2)
+        self.assertTrue(first.has_more)
+        second = await self._changes(first.next_since, limit=2)
+        self.assertEqual([c.seq for c in first.changes + second.changes], seqs[:4])
+
+    async def test_entries_carry_the_current_file_state(self):
+        report = await self._upload("report.txt", [])
+        await self._call(files_router.update_file, file_id=report, update=FileUpdate(name="final.txt"))
+
+        page = await self._changes(0)
+        self.assertEqual([change.action for change in page.changes], ["created", "updated"])
+        self.assertEqual([change.file.name for change in page.changes], ["final.txt", "final.txt"])
+
+    async def test_compaction_drops_superseded_entries_and_raises_the_floor(self):
+        report = await self._upload("report.txt", [])
+        notes = await self._upload("notes.txt", [])
+        await self._call(files_router.update_file, file_id=report, update=FileUpdate(name="final.txt"))
+
+        async with self.session_factory() as db:
+            result = await compact_changes(
+                db, now=datetime.now(timezone.utc) + timedelta(seconds=change_settings.change_log_compact_after_seconds + 60)
+            )
+            await db.commit()
+        self.assertEqual((result.superseded, result.expired), (1, 0))
+        page = await self._changes(0)
+        self.assertEqual([(c.action, c.file_id) for c in page.changes], [("created", notes), ("updated", report)])
+
+        async with self.session_factory() as db:
+            result = await compact_changes(
+                db, now=datetime.now(timezone.utc) + timedelta(days=change_settings.change_log_retention_days + 1)
+            )
+            await db.commit()
+            self.assertEqual(await db.scalar(select(func.count()).select_from(FileChange)), 0)
+        self.assertEqual(result.expired, 2)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._changes(0)
+        self.assertEqual(ctx.exception.status_code, 410)
+        latest = (await self._changes(None)).next_since
+        self.assertEqual(latest, page.changes[-1].seq)
+        self.assertEqual((await self._changes(latest)).changes, [])
+
+        # Sequence numbers keep growing after everything was compacted away
+        await self._call(files_router.update_file, file_id=notes, update=FileUpdate(is_starred=True))
+        page = await self._changes(latest)
+        self.assertEqual([(c.action, c.file_id) for c in page.changes], [("updated", notes)])
+        self.assertGreater(page.changes[0].seq, latest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,9 @@ import os
 import shutil
 import unittest
 import uuid
-from types import SimpleNamespace
 
 from fastapi import HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from starlette.requests import Request
 
 os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
@@ -14,9 +14,12 @@ from app.routers.files import (  # noqa: E402
     complete_chunked_upload,
     get_chunked_upload_status,
     get_upload_temp_dir,
+    serialize_path,
     upload_chunk,
-    write_upload_metadata,
 )
+from app import uploads  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import UploadSession, User  # noqa: E402
 from app.routers import files as files_router  # noqa: E402
 from app.schemas import ChunkedUploadCompleteRequest  # noqa: E402
 
@@ -38,9 +41,67 @@ def make_request() -> Request:
 
 
 class ChunkUploadSecurityTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tempdir = os.path.join(TEST_TEMP_ROOT, f"storage-{uuid.uuid4()}")
+        os.makedirs(self.tempdir, exist_ok=True)
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = self.tempdir
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tempdir, 'uploads.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.user = User(email="chunks@example.com", username="chunks", password_hash="hashed", storage_quota=1024)
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    async def _create_session(self, total_size, chunk_size, filename="test.txt", path=()):
+        upload_id = str(uuid.uuid4())
+        session_dir = get_upload_temp_dir(self.user.id, upload_id)
+        os.makedirs(session_dir, exist_ok=True)
+        uploads.preallocate(session_dir, total_size)
+        async with self.session_factory() as db:
+            db.add(uploads.new_session(
+                upload_id,
+                self.user.id,
+                filename=filename,
+                path=serialize_path(list(path)),
+                mime_type=None,
+                total_size=total_size,
+                chunk_size=chunk_size,
+                expected_chunks=files_router.get_expected_chunk_count(total_size, chunk_size),
+            ))
+            await db.commit()
+        return upload_id, session_dir
+
+    async def _upload_chunk(self, upload_id, chunk_index, content):
+        async with self.session_factory() as db:
+            response = await upload_chunk(
+                request=make_request(),
+                upload_id=upload_id,
+                chunk_index=chunk_index,
+                file=UploadFile(filename="chunk.bin", file=io.BytesIO(content)),
+                current_user=self.user,
+                db=db,
+            )
+            await db.commit()
+            return response
+
+    async def _stored_session(self, upload_id):
+        async with self.session_factory() as db:
+            return await db.get(UploadSession, upload_id)
+
     async def test_rejects_invalid_upload_id_before_touching_disk(self):
         upload = UploadFile(filename="chunk.bin", file=io.BytesIO(b"abc"))
-        user = SimpleNamespace(id="user-1", storage_quota=1024, storage_used=0)
 
         with self.assertRaises(HTTPException) as ctx:
             await upload_chunk(
@@ -48,149 +109,111 @@ class ChunkUploadSecurityTests(unittest.IsolatedAsyncioTestCase):
                 upload_id="..",
                 chunk_index=0,
                 file=upload,
-                current_user=user,
+                current_user=self.user,
+                db=object(),
             )
 
         self.assertEqual(ctx.exception.status_code, 400)
 
     async def test_rejects_chunk_larger_than_declared_size(self):
-        tempdir = os.path.join(TEST_TEMP_ROOT, f"storage-{uuid.uuid4()}")
-        os.makedirs(tempdir, exist_ok=True)
-        original_storage_path = files_router.settings.storage_path
-        files_router.settings.storage_path = tempdir
-        try:
-            user = SimpleNamespace(id="user-1", storage_quota=1024, storage_used=0)
-            upload_id = str(uuid.uuid4())
-            session_dir = get_upload_temp_dir(user.id, upload_id)
-            os.makedirs(session_dir, exist_ok=True)
-            await write_upload_metadata(session_dir, total_size=5, chunk_size=2)
-
-            upload = UploadFile(filename="chunk.bin", file=io.BytesIO(b"abc"))
-            with self.assertRaises(HTTPException) as ctx:
-                await upload_chunk(
-                    request=make_request(),
-                    upload_id=upload_id,
-                    chunk_index=0,
-                    file=upload,
-                    current_user=user,
-                )
+        upload_id, _session_dir = await self._create_session(total_size=5, chunk_size=2)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._upload_chunk(upload_id, 0, b"abc")
 
-            self.assertEqual(ctx.exception.status_code, 400)
-            self.assertFalse(os.path.exists(os.path.join(session_dir, "chunk_0")))
-        finally:
-            files_router.settings.storage_path = original_storage_path
-            shutil.rmtree(tempdir, ignore_errors=True)
+        self.assertEqual(ctx.exception.status_code, 400)
+        session = await self._stored_session(upload_id)
+        self.assertEqual(uploads.received_chunks(session), [])
+        self.assertEqual((session.received_chunks, session.received_bytes), (0, 0))
 
     async def test_upload_chunk_is_idempotent_for_existing_chunk(self):
-        tempdir = os.path.join(TEST_TEMP_ROOT, f"storage-{uuid.uuid4()}")
-        os.makedirs(tempdir, exist_ok=True)
-        original_storage_path = files_router.settings.storage_path
-        files_router.settings.storage_path = tempdir
-        try:
-            user = SimpleNamespace(id="user-1", storage_quota=1024, storage_used=0)
-            upload_id = str(uuid.uuid4())
-            session_dir = get_upload_temp_dir(user.id, upload_id)
-            os.makedirs(session_dir, exist_ok=True)
-            await write_upload_metadata(session_dir, total_size=4, chunk_size=2)
-
-            chunk_path = os.path.join(session_dir, "chunk_0")
-            with open(chunk_path, "wb") as handle:
-                handle.write(b"ab")
-
-            upload = UploadFile(filename="chunk.bin", file=io.BytesIO(b"zz"))
-            response = await upload_chunk(
-                request=make_request(),
-                upload_id=upload_id,
-                chunk_index=0,
-                file=upload,
-                current_user=user,
-            )
+        upload_id, session_dir = await self._create_session(total_size=4, chunk_size=2)
 
-            self.assertEqual(response["status"], "ok")
-            with open(chunk_path, "rb") as handle:
-                self.assertEqual(handle.read(), b"ab")
-        finally:
-            files_router.settings.storage_path = original_storage_path
-            shutil.rmtree(tempdir, ignore_errors=True)
+        for content in (b"ab", b"zz"):
+            response = await self._upload_chunk(upload_id, 0, content)
 
-    async def test_complete_rejects_missing_chunks(self):
-        tempdir = os.path.join(TEST_TEMP_ROOT, f"storage-{uuid.uuid4()}")
-        os.makedirs(tempdir, exist_ok=True)
-        original_storage_path = files_router.settings.storage_path
-        files_router.settings.storage_path = tempdir
-        try:
-            user = SimpleNamespace(id="user-1", storage_quota=1024, storage_used=0)
-            upload_id = str(uuid.uuid4())
-            session_dir = get_upload_temp_dir(user.id, upload_id)
-            os.makedirs(session_dir, exist_ok=True)
-            await write_upload_metadata(session_dir, total_size=3, chunk_size=2)
-
-            with open(os.path.join(session_dir, "chunk_0"), "wb") as handle:
-                handle.write(b"ab")
-
-            request = ChunkedUploadCompleteRequest(
-                upload_id=upload_id,
-                filename="test.txt",
-                total_size=3,
-                path=[],
-                mime_type="text/plain",
-            )
+        self.assertEqual(response["status"], "ok")
+        self.assertIn("already received", response["message"])
+        with open(uploads.data_path(session_dir), "rb") as handle:
+            self.assertEqual(handle.read(2), b"ab")
+        session = await self._stored_session(upload_id)
+        self.assertEqual((session.received_chunks, session.received_bytes), (1, 2))
+
+    async def test_concurrent_mark_counts_a_chunk_once(self):
+        upload_id, _session_dir = await self._create_session(total_size=4, chunk_size=2)
 
+        async with self.session_factory() as db:
+            self.assertTrue(await uploads.mark_chunk_received(db, upload_id, 1, 2))
+            self.assertFalse(await uploads.mark_chunk_received(db, upload_id, 1, 2))
+            await db.commit()
+
+        session = await self._stored_session(upload_id)
+        self.assertEqual(session.chunk_map, "01")
+        self.assertEqual((session.received_chunks, session.received_bytes), (1, 2))
+
+    async def test_complete_rejects_missing_chunks(self):
+        upload_id, _session_dir = await self._create_session(total_size=3, chunk_size=2)
+        await self._upload_chunk(upload_id, 0, b"ab")
+
+        request = ChunkedUploadCompleteRequest(
+            upload_id=upload_id,
+            filename="test.txt",
+            total_size=3,
+            path=[],
+            mime_type="text/plain",
+        )
+
+        async with self.session_factory() as db:
             with self.assertRaises(HTTPException) as ctx:
                 await complete_chunked_upload(
                     request=make_request(),
                     complete_req=request,
-                    current_user=user,
-                    db=object(),
+                    current_user=self.user,
+                    db=db,
                 )
 
-            self.assertEqual(ctx.exception.status_code, 400)
-            self.assertEqual(ctx.exception.detail, "Upload is incomplete")
-        finally:
-            files_router.settings.storage_path = original_storage_path
-            shutil.rmtree(tempdir, ignore_errors=True)
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(ctx.exception.detail, "Upload is incomplete")
 
     async def test_status_reports_uploaded_chunks_and_progress(self):
-        tempdir = os.path.join(TEST_TEMP_ROOT, f"storage-{uuid.uuid4()}")
-        os.makedirs(tempdir, exist_ok=True)
-        original_storage_path = files_router.settings.storage_path
-        files_router.settings.storage_path = tempdir
-        try:
-            user = SimpleNamespace(id="user-1", storage_quota=1024, storage_used=0)
-            upload_id = str(uuid.uuid4())
-            session_dir = get_upload_temp_dir(user.id, upload_id)
-            os.makedirs(session_dir, exist_ok=True)
-            await write_upload_metadata(
-                session_dir,
-                total_size=5,
-                chunk_size=2,
-                filename="demo.bin",
-                path=["folder"],
-            )
+        upload_id, _session_dir = await self._create_session(
+            total_size=5,
+            chunk_size=2,
+            filename="demo.bin",
+            path=["folder"],
+        )
 
-            with open(os.path.join(session_dir, "chunk_0"), "wb") as handle:
-                handle.write(b"ab")
-            with open(os.path.join(session_dir, "chunk_2"), "wb") as handle:
-                handle.write(b"x")
+        for chunk_index, content in ((0, b"ab"), (2, b"x")):
+            await self._upload_chunk(upload_id, chunk_index, content)
 
+        async with self.session_factory() as db:
             status = await get_chunked_upload_status(
                 request=make_request(),
                 upload_id=upload_id,
-                current_user=user,
+                current_user=self.user,
+                db=db,
             )
 
-            self.assertEqual(status.upload_id, upload_id)
-            self.assertEqual(status.total_size, 5)
-            self.assertEqual(status.chunk_size, 2)
-            self.assertEqual(status.expected_chunks, 3)
-            self.assertEqual(status.uploaded_chunks, [0, 2])
-            self.assertEqual(status.uploaded_bytes, 3)
-            self.assertEqual(status.next_chunk_index, 1)
-            self.assertEqual(status.filename, "demo.bin")
-            self.assertEqual(status.path, ["folder"])
-        finally:
-            files_router.settings.storage_path = original_storage_path
-            shutil.rmtree(tempdir, ignore_errors=True)
+        self.assertEqual(status.upload_id, upload_id)
+        self.assertEqual(status.total_size, 5)
+        self.assertEqual(status.chunk_size, 2)
+        self.assertEqual(status.expected_chunks, 3)
+        self.assertEqual(status.uploaded_chunks, [0, 2])
+        self.assertEqual(status.uploaded_bytes, 3)
+        self.assertEqual(status.next_chunk_index, 1)
+        self.assertEqual(status.filename, "demo.bin")
+        self.assertEqual(status.path, ["folder"])
+
+    async def test_expired_session_is_not_found(self):
+        upload_id, _session_dir = await self._create_session(total_size=2, chunk_size=2)
+        async with self.session_factory() as db:
+            session = await db.get(UploadSession, upload_id)
+            session.expires_at = session.created_at
+            await db.commit()
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._upload_chunk(upload_id, 0, b"ab")
+        self.assertEqual(ctx.exception.status_code, 404)
 
 
 if __name__ == "__main__":
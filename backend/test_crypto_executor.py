@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app import auth  # noqa: E402
+from app.executors import CryptoBusy, CryptoExecutor  # noqa: E402
+
+
+class CryptoExecutorTests(unittest.IsolatedAsyncioTestCase):
+    async def test_password_checks_do_not_stall_the_event_loop(self):
+        hashed = auth.get_password_hash("correct horse")
+        started = time.monotonic()
+        auth.verify_password("correct horse", hashed)
+        one_check = time.monotonic() - started
+
+        gaps = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.monotonic()
+            while not done.is_set():
+                await asyncio.sleep(0.002)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(auth.verify_password_async("correct horse", hashed) for _ in range(6)))
+        done.set()
+        await ticking
+
+        self.assertEqual(results, [True] * 6)
+        self.assertLess(max(gaps), one_check / 2)
+
+    async def test_queue_is_bounded_and_counted(self):
+        executor = CryptoExecutor(workers=1, max_queue=1)
+        try:
+            results = await asyncio.gather(
+                *(executor.run(time.sleep, 0.1) for _ in range(3)),
+                return_exceptions=True,
+            )
+        finally:
+            executor.shutdown()
+
+        self.assertEqual(sum(isinstance(result, CryptoBusy) for result in results), 1)
+        metrics = executor.metrics
+        self.assertEqual(
+            (metrics.completed, metrics.rejected, metrics.peak_queued, metrics.running, metrics.queued),
+            (2, 1, 1, 0, 0),
+        )
+
+    async def test_full_queue_answers_503(self):
+        with patch.object(auth, "run_crypto", side_effect=CryptoBusy("busy")):
+            with self.assertRaises(HTTPException) as ctx:
+                await auth.verify_password_async("secret", "hash")
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(ctx.exception.headers, {"Retry-After": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import io
+import os
+import tempfile
+import unittest
+
+from fastapi import UploadFile
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import ActivityLog, FileVersion, User  # noqa: E402
+from app.sqlite_tuning import configure_sqlite  # noqa: E402
+
+
+CONTENT = b"0123456789abcdefghij"
+
+
+def make_scope(headers=None) -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/files/download",
+        "headers": [(b"host", b"testserver")] + [
+            (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+        ],
+        "server": ("testserver", 80),
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+    }
+
+
+async def run_response(response, scope):
+    """Drive an ASGI response and collect (status, headers, body)."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await response(scope, receive, send)
+    start = messages[0]
+    headers = {name.decode().lower(): value.decode() for name, value in start["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], headers, body
+
+
+class DownloadResponderTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        temp_dir = tempfile.TemporaryDirectory(prefix="downloads-")
+        self.addCleanup(temp_dir.cleanup)
+        self.test_dir = temp_dir.name
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'downloads.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+            uploaded = await files_router.upload_files(
+                request=Request(make_scope()),
+                files=[UploadFile(filename="data.txt", file=io.BytesIO(CONTENT))],
+                path="[]",
+                shared_folder_id=None,
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        self.file_id = uploaded[0].id
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+
+    async def _download(self, headers=None, endpoint=None, **kwargs):
+        scope = make_scope(headers)
+        async with self.session_factory() as db:
+            response = await (endpoint or files_router.download_file)(
+                request=Request(scope),
+                file_id=self.file_id,
+                current_user=self.owner,
+                db=db,
+                **kwargs,
+            )
+            await db.commit()
+        return await run_response(response, scope)
+
+    async def _download_count(self):
+        async with self.session_factory() as db:
+            return await db.scalar(
+                select(func.count()).select_from(ActivityLog).where(ActivityLog.action == "download")
+            )
+
+    async def test_full_download_sets_validators(self):
+        status, headers, body = await self._download()
+        self.assertEqual((status, body), (200, CONTENT))
+        self.assertEqual(headers["content-length"], str(len(CONTENT)))
+        self.assertEqual(headers["accept-ranges"], "bytes")
+        self.assertTrue(headers["etag"].startswith('"'))
+        self.assertIn("GMT", headers["last-modified"])
+        self.assertIn('attachment; filename="data.txt"', headers["content-disposition"])
+
+    async def test_single_and_multi_range(self):
+        status, headers, body = await self._download({"Range": "bytes=2-5"})
+        self.assertEqual((status, body), (206, CONTENT[2:6]))
+        self.assertEqual(headers["content-range"], f"bytes 2-5/{len(CONTENT)}")
+
+        status, headers, body = await self._download({"Range": "bytes=0-1,-3"})
+        self.assertEqual(status, 206)
+        self.assertTrue(headers["content-type"].startswith("multipart/byteranges; boundary="))
+        self.assertIn(b"Content-Range: bytes 0-1/20\r\n\r\n01\r\n", body)
+        self.assertIn(b"Content-Range: bytes 17-19/20\r\n\r\nhij\r\n", body)
+
+    async def test_conditional_get_returns_304_without_logging(self):
+        _status, headers, _body = await self._download()
+        self.assertEqual(await self._download_count(), 1)
+
+        status, not_modified, body = await self._download({"If-None-Match": f'W/"other", {headers["etag"]}'})
+        self.assertEqual((status, body), (304, b""))
+        self.assertEqual(not_modified["etag"], headers["etag"])
+
+        status, _headers, _body = await self._download({"If-Modified-Since": headers["last-modified"]})
+        self.assertEqual(status, 304)
+        self.assertEqual(await self._download_count(), 1)
+
+    async def test_if_range_only_resumes_matching_content(self):
+        _status, headers, _body = await self._download()
+
+        status, _headers, body = await self._download({"Range": "bytes=10-", "If-Range": headers["etag"]})
+        self.assertEqual((status, body), (206, CONTENT[10:]))
+
+        status, _headers, body = await self._download({"Range": "bytes=10-", "If-Range": '"stale"'})
+        self.assertEqual((status, body), (200, CONTENT))
+
+    async def test_etag_changes_with_each_version(self):
+        _status, first, _body = await self._download()
+        async with self.session_factory() as db:
+            owner = await db.get(User, self.owner.id)
+            await files_router.upload_new_version(
+                request=Request(make_scope()),
+                file_id=self.file_id,
+                new_file=UploadFile(filename="data.txt", file=io.BytesIO(b"new content")),
+                current_user=owner,
+                db=db,
+            )
+            await db.commit()
+            v1_id = await db.scalar(
+                select(FileVersion.id).where(FileVersion.file_id == self.file_id, FileVersion.version == 1)
+            )
+
+        status, second, body = await self._download({"If-None-Match": first["etag"]})
+        self.assertEqual((status, body), (200, b"new content"))
+        self.assertNotEqual(second["etag"], first["etag"])
+
+        status, old, body = await self._download(
+            {"If-None-Match": first["etag"]},
+            endpoint=files_router.download_version,
+            version_id=v1_id,
+        )
+        self.assertEqual(status, 304)
+        self.assertEqual(old["etag"], first["etag"])
+
+    async def test_writes_proceed_while_a_download_streams(self):
+        gate = configure_sqlite(self.engine, single_writer=True)
+        gate.timeout = 0.2
+        scope = make_scope()
+        async with self.session_factory() as db:
+            # As under get_db, the request session stays open until the body is sent
+            response = await files_router.download_file(
+                request=Request(scope),
+                file_id=self.file_id,
+                current_user=self.owner,
+                db=db,
+            )
+            async with self.session_factory() as writer:
+                writer.add(ActivityLog(user_id=self.owner.id, action="upload", file_name="other.txt"))
+                await writer.commit()
+            status, _headers, body = await run_response(response, scope)
+            await db.commit()
+        self.assertEqual((status, body), (200, CONTENT))
+        self.assertEqual(await self._download_count(), 1)
+
+    async def test_accel_redirect_mode_hands_body_to_nginx(self):
+        files_router.settings.x_accel_redirect = True
+        try:
+            _status, plain, _body = await self._download()
+            status, headers, body = await self._download({"Range": "bytes=2-5"})
+            async with self.session_factory() as db:
+                preview_status, preview_headers, _preview_body = await run_response(
+                    await files_router.preview_file(
+                        request=Request(make_scope()),
+                        file_id=self.file_id,
+                        current_user=self.owner,
+                        db=db,
+                    ),
+                    make_scope(),
+                )
+            not_modified, _headers, _body = await self._download({"If-None-Match": plain["etag"]})
+        finally:
+            files_router.settings.x_accel_redirect = False
+
+        self.assertEqual((status, body), (200, b""))
+        self.assertRegex(headers["x-accel-redirect"], r"^/_protected_storage/blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}$")
+        self.assertEqual(headers["content-type"], "text/plain")
+        self.assertEqual(headers["etag"], plain["etag"])
+        self.assertEqual(headers["last-modified"], plain["last-modified"])
+        self.assertIn('attachment; filename="data.txt"', headers["content-disposition"])
+        self.assertNotIn("content-range", headers)
+        self.assertEqual(preview_status, 200)
+        self.assertTrue(preview_headers["x-accel-redirect"].startswith("/_protected_storage/blobs/"))
+        # Conditional requests are still answered by the API itself.
+        self.assertEqual(not_modified, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import unittest
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.database import Base  # noqa: E402
+from app.file_tree import rebuild_tree_index, tree_index_needs_rebuild  # noqa: E402
+from app.models import File as FileModel, FileClosure, User  # noqa: E402
+from app.routers.files import restore_file, trash_file, update_file  # noqa: E402
+from app.routers.folders import create_folder  # noqa: E402
+from app.schemas import FileUpdate, FolderCreate  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_file_tree_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(method: str = "PATCH") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class FileTreeTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'tree.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _create_folder(self, db, name, path):
+        return await create_folder(
+            folder=FolderCreate(name=name, path=path),
+            current_user=self.owner,
+            db=db,
+        )
+
+    async def _build_tree(self):
+        async with self.session_factory() as db:
+            docs = await self._create_folder(db, "Docs", [])
+            reports = await self._create_folder(db, "Reports", ["Docs"])
+            archive = await self._create_folder(db, "Archive", [])
+            leaf = FileModel(
+                name="q1.txt",
+                type="text",
+                path='["Docs","Reports"]',
+                parent_id=reports.id,
+                owner_id=self.owner.id,
+            )
+            db.add(leaf)
+            await db.flush()
+            db.add_all([
+                FileClosure(ancestor_id=leaf.id, descendant_id=leaf.id, depth=0),
+                FileClosure(ancestor_id=reports.id, descendant_id=leaf.id, depth=1),
+                FileClosure(ancestor_id=docs.id, descendant_id=leaf.id, depth=2),
+            ])
+            await db.commit()
+            return docs.id, reports.id, archive.id, leaf.id
+
+    async def _ancestors(self, db, file_id):
+        result = await db.execute(
+            select(FileClosure.ancestor_id, FileClosure.depth)
+            .where(FileClosure.descendant_id == file_id)
+            .order_by(FileClosure.depth)
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def test_create_folder_links_closure_to_parent(self):
+        docs_id, reports_id, _archive_id, _leaf_id = await self._build_tree()
+        async with self.session_factory() as db:
+            reports = await db.get(FileModel, reports_id)
+            self.assertEqual(reports.parent_id, docs_id)
+            self.assertEqual(await self._ancestors(db, reports_id), [(reports_id, 0), (docs_id, 1)])
+
+    async def test_folder_rename_cascades_to_descendants(self):
+        docs_id, _reports_id, _archive_id, leaf_id = await self._build_tree()
+        async with self.session_factory() as db:
+            await update_file(
+                request=make_request(),
+                file_id=docs_id,
+                update=FileUpdate(name="Papers"),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+
+        async with self.session_factory() as db:
+            leaf = await db.get(FileModel, leaf_id)
+            self.assertEqual(json.loads(leaf.path), ["Papers", "Reports"])
+
+    async def test_folder_move_rewrites_paths_and_closure(self):
+        docs_id, reports_id, archive_id, leaf_id = await self._build_tree()
+        async with self.session_factory() as db:
+            await update_file(
+                request=make_request(),
+                file_id=reports_id,
+                update=FileUpdate(path=["Archive"]),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+
+        async with self.session_factory() as db:
+            reports = await db.get(FileModel, reports_id)
+            leaf = await db.get(FileModel, leaf_id)
+            self.assertEqual(reports.parent_id, archive_id)
+            self.assertEqual(json.loads(leaf.path), ["Archive", "Reports"])
+            self.assertEqual(
+                await self._ancestors(db, leaf_id),
+                [(leaf_id, 0), (reports_id, 1), (archive_id, 2)],
+            )
+            self.assertNotIn(docs_id, [ancestor for ancestor, _ in await self._ancestors(db, reports_id)])
+
+    async def test_trash_and_restore_cover_whole_subtree(self):
+        docs_id, reports_id, archive_id, leaf_id = await self._build_tree()
+        async with self.session_factory() as db:
+            await trash_file(request=make_request("POST"), file_id=docs_id, current_user=self.owner, db=db)
+            await db.commit()
+
+        async with self.session_factory() as db:
+            flags = {
+                row.id: row.is_trashed
+                for row in (await db.execute(select(FileModel.id, FileModel.is_trashed))).all()
+            }
+            self.assertTrue(flags[docs_id] and flags[reports_id] and flags[leaf_id])
+            self.assertFalse(flags[archive_id])
+
+            await restore_file(request=make_request("POST"), file_id=docs_id, current_user=self.owner, db=db)
+            await db.commit()
+
+        async with self.session_factory() as db:
+            leaf = await db.get(FileModel, leaf_id)
+            self.assertFalse(leaf.is_trashed)
+
+    async def test_rebuild_backfills_parent_ids_and_normalizes_legacy_paths(self):
+        async with self.session_factory() as db:
+            root = FileModel(name="Music", type="folder", path="[]", owner_id=self.owner.id)
+            child = FileModel(name="Live", type="folder", path='["Music"]', owner_id=self.owner.id)
+            song = FileModel(name="song.mp3", type="file", path='["Music", "Live"]', owner_id=self.owner.id)
+            db.add_all([root, child, song])
+            await db.commit()
+
+        async with self.engine.begin() as conn:
+            self.assertTrue(await tree_index_needs_rebuild(conn))
+            self.assertEqual(await rebuild_tree_index(conn), 3)
+            self.assertFalse(await tree_index_needs_rebuild(conn))
+
+        async with self.session_factory() as db:
+            song = await db.get(FileModel, song.id)
+            self.assertEqual(song.parent_id, child.id)
+            self.assertEqual(song.path, '["Music","Live"]')
+            self.assertEqual(
+                await self._ancestors(db, song.id),
+                [(song.id, 0), (child.id, 1), (root.id, 2)],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from PIL import Image
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.database import Base  # noqa: E402
+from app.executors import shutdown_executors  # noqa: E402
+from app.jobs import JobWorkerPool, enqueue_file_processing  # noqa: E402
+from app.models import BackgroundJob, File as FileModel, FileContent, User  # noqa: E402
+from app.routers.jobs import get_job, list_jobs  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_job_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+class BackgroundJobTests(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutdown_executors()
+
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'jobs.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            self.other = User(email="other@example.com", username="other", password_hash="hashed")
+            db.add_all([self.owner, self.other])
+            await db.commit()
+
+        self.pool = JobWorkerPool(session_factory=self.session_factory, workers=1)
+        self.thumb_dir = os.path.join(self.test_dir, "thumbnails")
+
+    async def asyncTearDown(self):
+        await self.pool.stop()
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _write_image(self, name="photo.png"):
+        path = os.path.join(self.test_dir, name)
+        Image.new("RGB", (640, 480), color=(200, 40, 40)).save(path)
+        return path
+
+    async def _add_file(self, name, storage_path, mime_type=None, file_type="image"):
+        async with self.session_factory() as db:
+            file = FileModel(
+                id=str(uuid.uuid4()),
+                name=name,
+                type=file_type,
+                mime_type=mime_type,
+                size=os.path.getsize(storage_path),
+                path="[]",
+                storage_path=storage_path,
+                owner_id=self.owner.id,
+                version=1,
+                updated_at=datetime(2026, 1, 1),
+            )
+            db.add(file)
+            jobs = await enqueue_file_processing(
+                db,
+                file,
+                thumbnail_dir=self.thumb_dir,
+                thumbnail_key=file.id,
+                created_by=self.owner.id,
+            )
+            await db.commit()
+            return file, jobs
+
+    async def _reload(self, model, key):
+        async with self.session_factory() as db:
+            return await db.get(model, key)
+
+    async def test_thumbnail_job_updates_file_without_touching_updated_at(self):
+        file, jobs = await self._add_file("photo.png", self._write_image(), "image/png")
+        self.assertEqual([job.kind for job in jobs], ["thumbnail"])
+
+        self.assertEqual(await self.pool.run_until_idle(), 1)
+
+        stored = await self._reload(FileModel, file.id)
+        self.assertTrue(stored.thumbnail_path and os.path.exists(stored.thumbnail_path))
+        self.assertEqual(
+            sorted(os.listdir(self.thumb_dir)),
+            sorted(f"{file.id}_{size}.webp" for size in (64, 256, 1024)),
+        )
+        self.assertEqual(stored.updated_at, datetime(2026, 1, 1))
+        self.assertEqual((await self._reload(FileContent, file.id)).content_index, "")
+        job = await self._reload(BackgroundJob, jobs[0].id)
+        self.assertEqual((job.status, job.attempts), ("done", 1))
+
+    async def test_text_extraction_job_fills_content_index(self):
+        path = os.path.join(self.test_dir, "notes.txt")
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write("Quarterly   planning\nnotes")
+        file, jobs = await self._add_file("notes.txt", path, "text/plain", "text")
+        self.assertEqual([job.kind for job in jobs], ["extract_text"])
+        self.assertIsNone(await self._reload(FileContent, file.id))
+
+        await self.pool.run_until_idle()
+
+        stored = await self._reload(FileContent, file.id)
+        self.assertEqual(stored.content_index, "Quarterly planning notes")
+
+    async def test_failed_jobs_retry_with_backoff_then_fail(self):
+        path = os.path.join(self.test_dir, "broken.png")
+        with open(path, "wb") as handle:
+            handle.write(b"not an image")
+        file, jobs = await self._add_file("broken.png", path, "image/png")
+
+        await self.pool.run_until_idle()
+        job = await self._reload(BackgroundJob, jobs[0].id)
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertIn("thumbnail generation failed", job.last_error)
+        self.assertGreater(job.run_after, datetime.now(timezone.utc).replace(tzinfo=None))
+
+        for _ in range(job.max_attempts):
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job.id)
+                    .values(run_after=datetime.now(timezone.utc) - timedelta(seconds=1))
+                )
+                await db.commit()
+            await self.pool.run_until_idle()
+
+        job = await self._reload(BackgroundJob, jobs[0].id)
+        self.assertEqual((job.status, job.attempts), ("failed", job.max_attempts))
+        self.assertIsNotNone(job.finished_at)
+
+    async def test_lapsed_leases_are_reclaimed_until_attempts_run_out(self):
+        _file, jobs = await self._add_file("photo.png", self._write_image(), "image/png")
+        lapsed = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+        async def lose_lease(attempts):
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == jobs[0].id)
+                    .values(status="running", attempts=attempts, run_after=lapsed)
+                )
+                await db.commit()
+
+        await lose_lease(jobs[0].max_attempts - 1)
+        self.assertEqual(await self.pool.run_until_idle(), 1)
+        job = await self._reload(BackgroundJob, jobs[0].id)
+        self.assertEqual((job.status, job.attempts), ("done", job.max_attempts))
+
+        await lose_lease(job.max_attempts)
+        self.assertEqual(await self.pool.run_until_idle(), 0)
+        job = await self._reload(BackgroundJob, jobs[0].id)
+        self.assertEqual((job.status, job.attempts, job.last_error), ("failed", job.max_attempts, "Lease expired"))
+        self.assertIsNotNone(job.finished_at)
+
+    async def test_results_for_superseded_versions_are_discarded(self):
+        file, _jobs = await self._add_file("photo.png", self._write_image(), "image/png")
+        async with self.session_factory() as db:
+            await db.execute(update(FileModel).where(FileModel.id == file.id).values(version=2))
+            await db.commit()
+
+        await self.pool.run_until_idle()
+
+        stored = await self._reload(FileModel, file.id)
+        self.assertIsNone(stored.thumbnail_path)
+        self.assertEqual(os.listdir(self.thumb_dir) if os.path.isdir(self.thumb_dir) else [], [])
+
+    async def test_running_pool_is_woken_by_commit(self):
+        self.pool.start()
+        file, jobs = await self._add_file("photo.png", self._write_image(), "image/png")
+
+        for _ in range(200):
+            job = await self._reload(BackgroundJob, jobs[0].id)
+            if job.status == "done":
+                break
+            await asyncio.sleep(0.05)
+        self.assertEqual(job.status, "done")
+
+    async def test_job_status_is_visible_only_to_owner_or_requester(self):
+        file, jobs = await self._add_file("photo.png", self._write_image(), "image/png")
+        async with self.session_factory() as db:
+            job = await get_job(job_id=jobs[0].id, current_user=self.owner, db=db)
+            self.assertEqual(job.status, "queued")
+            listed = await list_jobs(file_id=file.id, job_status=None, limit=50, current_user=self.owner, db=db)
+            self.assertEqual([item.id for item in listed], [jobs[0].id])
+
+            with self.assertRaises(HTTPException) as ctx:
+                await get_job(job_id=jobs[0].id, current_user=self.other, db=db)
+            self.assertEqual(ctx.exception.status_code, 404)
+            self.assertEqual(
+                await list_jobs(file_id=None, job_status=None, limit=50, current_user=self.other, db=db),
+                [],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app import search_index  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import File as FileModel, User  # noqa: E402
+from app.pagination import decode_cursor, encode_cursor  # noqa: E402
+from app.routers.files import list_files, search_files  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_pagination_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+class CursorTests(unittest.TestCase):
+    def test_round_trip_preserves_datetimes(self):
+        stamp = datetime(2026, 1, 2, 3, 4, 5, 6000)
+        cursor = encode_cursor("search", [True, stamp, "a.txt", "id-1"])
+        self.assertEqual(decode_cursor(cursor, "search", 4), [True, stamp, "a.txt", "id-1"])
+
+    def test_rejects_garbage_and_cursors_from_other_orderings(self):
+        cursor = encode_cursor("files", ["text", "a.txt", "id-1"])
+        for bad, kind, size in (("not-a-cursor", "files", 3), (cursor, "search", 3), (cursor, "files", 4)):
+            with self.assertRaises(HTTPException) as ctx:
+                decode_cursor(bad, kind, size)
+            self.assertEqual(ctx.exception.status_code, 400)
+
+
+class PaginatedListingTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'pages.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+            base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+            # Duplicate names and timestamps make the id tie-breaker matter.
+            for index in range(7):
+                db.add(FileModel(
+                    name=f"report-{index % 3}.txt",
+                    type="text",
+                    path="[]",
+                    owner_id=self.owner.id,
+                    updated_at=base + timedelta(hours=index % 2),
+                ))
+            db.add(FileModel(name="reports", type="folder", path="[]", owner_id=self.owner.id))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _list(self, cursor=None, include_total=False):
+        async with self.session_factory() as db:
+            return await list_files(
+                path="[]",
+                include_trashed=False,
+                starred_only=False,
+                shared_folder_id=None,
+                limit=3,
+                cursor=cursor,
+                include_total=include_total,
+                current_user=self.owner,
+                db=db,
+            )
+
+    async def _search(self, cursor=None, include_total=False):
+        async with self.session_factory() as db:
+            return await search_files(
+                q="report",
+                file_type=None,
+                date_from=None,
+                date_to=None,
+                starred_only=False,
+                include_trashed=False,
+                shared_folder_id=None,
+                limit=3,
+                cursor=cursor,
+                include_total=include_total,
+                current_user=self.owner,
+                db=db,
+            )
+
+    async def _collect(self, fetch):
+        first = await fetch(include_total=True)
+        pages, page = [first], first
+        while page.next_cursor:
+            page = await fetch(cursor=page.next_cursor)
+            pages.append(page)
+        return first.total, pages
+
+    async def test_list_pages_cover_folder_in_order_without_duplicates(self):
+        total, pages = await self._collect(self._list)
+        items = [item for page in pages for item in page.items]
+        self.assertEqual(total, 8)
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 2])
+        self.assertIsNone(pages[-1].total)
+        self.assertEqual(len({item.id for item in items}), 8)
+        self.assertEqual(
+            [(item.type, item.name) for item in items],
+            sorted((item.type, item.name) for item in items),
+        )
+
+    async def test_search_pages_cover_all_matches_for_fts_and_like(self):
+        for fts_enabled in (True, False):
+            with patch.object(search_index, "fts_available", fts_enabled and search_index.fts_available):
+                total, pages = await self._collect(self._search)
+            items = [item for page in pages for item in page.items]
+            self.assertEqual(total, 8)
+            self.assertEqual(len({item.id for item in items}), 8)
+
+    async def test_like_search_keeps_folders_first(self):
+        with patch.object(search_index, "fts_available", False):
+            page = await self._search()
+        self.assertEqual(page.items[0].type, "folder")
+
+
+if __name__ == "__main__":
+    unittest.main()
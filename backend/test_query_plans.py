@@ -0,0 +1,228 @@
+import os
+import re
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.database import Base  # noqa: E402
+from app.main import cleanup_old_trash  # noqa: E402
+from app.models import ActivityLog, File as FileModel, SharedFolderAccess, User  # noqa: E402
+from app.routers.changes import list_changes  # noqa: E402
+from app.routers.files import list_files, search_files  # noqa: E402
+from app.routers.folders import create_folder  # noqa: E402
+from app.routers.shared_folders import list_shared_folders  # noqa: E402
+from app.routers.sharing import get_my_share_links  # noqa: E402
+from app.routers.storage import empty_trash, get_activity_log, get_storage_info  # noqa: E402
+from app.schemas import FolderCreate  # noqa: E402
+from app.shared_access import get_file_access_context  # noqa: E402
+from app.shared_grants import shared_grant_cache  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_query_plan_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+SCAN_PATTERN = re.compile(r"^SCAN (\w+)")
+
+
+def make_request(method: str = "GET") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/storage",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class QueryPlanTests(unittest.IsolatedAsyncioTestCase):
+    """Run each hot router query and fail if SQLite plans a full table scan for it."""
+
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'plans.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            self.viewer = User(email="viewer@example.com", username="viewer", password_hash="hashed")
+            db.add_all([self.owner, self.viewer])
+            await db.commit()
+
+            self.folder = await create_folder(
+                folder=FolderCreate(name="Docs", path=[]),
+                current_user=self.owner,
+                db=db,
+            )
+            db.add_all([
+                FileModel(name="notes.txt", type="text", path='["Docs"]', parent_id=self.folder.id, owner_id=self.owner.id),
+                FileModel(
+                    name="old.txt",
+                    type="text",
+                    path="[]",
+                    owner_id=self.owner.id,
+                    is_trashed=True,
+                    trashed_at=datetime.now(timezone.utc) - timedelta(days=365),
+                ),
+                ActivityLog(user_id=self.owner.id, action="upload", file_name="notes.txt"),
+                SharedFolderAccess(
+                    folder_id=self.folder.id,
+                    owner_id=self.owner.id,
+                    user_id=self.viewer.id,
+                    role="viewer",
+                ),
+            ])
+            await db.commit()
+
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._capture)
+
+    async def asyncTearDown(self):
+        event.remove(self.engine.sync_engine, "before_cursor_execute", self._capture)
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    async def _assert_no_full_scans(self):
+        self.assertTrue(self.statements, "expected the router to issue SELECT statements")
+        captured, self.statements = self.statements, []
+        tables = set(Base.metadata.tables)
+        async with self.engine.connect() as conn:
+            for statement, parameters in captured:
+                plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+                details = [row[3] for row in plan]
+                for detail in details:
+                    match = SCAN_PATTERN.match(detail)
+                    if match and match.group(1) in tables:
+                        self.fail(f"full scan of {match.group(1)}:\n{statement}\nplan: {details}")
+
+    async def test_list_files_root_folder_and_starred(self):
+        async with self.session_factory() as db:
+            for path, starred_only in (("[]", False), ('["Docs"]', False), (None, True)):
+                await list_files(
+                    path=path,
+                    include_trashed=False,
+                    starred_only=starred_only,
+                    shared_folder_id=None,
+                    limit=200,
+                    cursor=None,
+                    include_total=True,
+                    current_user=self.owner,
+                    db=db,
+                )
+        await self._assert_no_full_scans()
+
+    async def test_list_files_follows_keyset_cursor(self):
+        async with self.session_factory() as db:
+            first = await list_files(
+                path="[]",
+                include_trashed=False,
+                starred_only=False,
+                shared_folder_id=None,
+                limit=1,
+                cursor=None,
+                include_total=False,
+                current_user=self.owner,
+                db=db,
+            )
+            self.statements = []
+            await list_files(
+                path="[]",
+                include_trashed=False,
+                starred_only=False,
+                shared_folder_id=None,
+                limit=1,
+                cursor=first.next_cursor,
+                include_total=False,
+                current_user=self.owner,
+                db=db,
+            )
+        await self._assert_no_full_scans()
+
+    async def test_list_files_in_shared_folder(self):
+        async with self.session_factory() as db:
+            await list_files(
+                path="[]",
+                include_trashed=False,
+                starred_only=False,
+                shared_folder_id=self.folder.id,
+                limit=200,
+                cursor=None,
+                include_total=False,
+                current_user=self.viewer,
+                db=db,
+            )
+        await self._assert_no_full_scans()
+
+    async def test_search_files(self):
+        async with self.session_factory() as db:
+            for shared_folder_id, user in ((None, self.owner), (self.folder.id, self.viewer)):
+                await search_files(
+                    q="notes",
+                    file_type=None,
+                    date_from=None,
+                    date_to=None,
+                    starred_only=False,
+                    include_trashed=False,
+                    shared_folder_id=shared_folder_id,
+                    limit=200,
+                    cursor=None,
+                    include_total=False,
+                    current_user=user,
+                    db=db,
+                )
+        await self._assert_no_full_scans()
+
+    async def test_storage_activity_and_share_listings(self):
+        async with self.session_factory() as db:
+            await get_storage_info(request=make_request(), current_user=self.owner, db=db)
+            await get_activity_log(request=make_request(), limit=50, current_user=self.owner, db=db)
+            await get_my_share_links(current_user=self.owner, db=db)
+            await list_shared_folders(current_user=self.viewer, db=db)
+        await self._assert_no_full_scans()
+
+    async def test_shared_folder_access_resolution(self):
+        shared_grant_cache.clear()
+        async with self.session_factory() as db:
+            _file, ctx = await get_file_access_context(db, self.viewer, self.folder.id)
+        self.assertEqual(ctx.shared_folder_id, self.folder.id)
+        await self._assert_no_full_scans()
+
+    async def test_change_feed(self):
+        async with self.session_factory() as db:
+            await list_changes(request=make_request(), since=None, limit=200, current_user=self.owner, db=db)
+            await list_changes(request=make_request(), since=0, limit=200, current_user=self.owner, db=db)
+        await self._assert_no_full_scans()
+
+    async def test_empty_trash(self):
+        async with self.session_factory() as db:
+            await empty_trash(request=make_request("DELETE"), current_user=self.owner, db=db)
+        await self._assert_no_full_scans()
+
+    async def test_cleanup_old_trash(self):
+        with patch("app.database.async_session", self.session_factory):
+            await cleanup_old_trash()
+        await self._assert_no_full_scans()
+
+
+if __name__ == "__main__":
+    unittest.main()
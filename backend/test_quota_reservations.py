@@ -0,0 +1,199 @@
+import asyncio
+import os
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app import quota  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import File as FileModel, QuotaReservation, UploadSession, User  # noqa: E402
+from app.schemas import ChunkedUploadCompleteRequest, ChunkedUploadInitRequest  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_quota_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(parts=(), headers=None, method: str = "PUT") -> Request:
+    messages = [{"type": "http.request", "body": part, "more_body": True} for part in parts]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        # Let other uploads run between body messages, like a slow client
+        await asyncio.sleep(0)
+        return messages.pop(0)
+
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files/upload/raw",
+            "headers": [(b"host", b"testserver")] + [
+                (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+            ],
+            "server": ("testserver", 80),
+        },
+        receive,
+    )
+
+
+class QuotaReservationTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        # Each test gets its own rate-limit bucket
+        self.client_host = f"10.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'quota.db')}",
+            future=True,
+            connect_args={"timeout": 30},
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        self.original_max_file_size = files_router.settings.max_file_size_bytes
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+
+        async with self.session_factory() as db:
+            self.user = User(email="quota@example.com", username="quota", password_hash="hashed", storage_quota=1000)
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        files_router.settings.max_file_size_bytes = self.original_max_file_size
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _call(self, endpoint, request, **kwargs):
+        request.scope["client"] = (self.client_host, 50000)
+        async with self.session_factory() as db:
+            result = await endpoint(request=request, current_user=await db.get(User, self.user.id), db=db, **kwargs)
+            await db.commit()
+            return result
+
+    async def _raw_upload(self, name, body, headers=None):
+        parts = [body[i:i + 100] for i in range(0, len(body), 100)]
+        return await self._call(
+            files_router.upload_file_raw,
+            make_request(parts, headers),
+            filename=name,
+            path="[]",
+            shared_folder_id=None,
+        )
+
+    async def _usage(self):
+        async with self.session_factory() as db:
+            used = (await db.get(User, self.user.id)).storage_used
+            reservations = await db.scalar(select(func.count()).select_from(QuotaReservation))
+            return used, reservations
+
+    async def test_parallel_uploads_never_exceed_quota(self):
+        results = await asyncio.gather(
+            *(
+                self._raw_upload(f"file-{i}.bin", b"x" * 300, {"Content-Length": "300"})
+                for i in range(5)
+            ),
+            return_exceptions=True,
+        )
+
+        succeeded = [result for result in results if not isinstance(result, Exception)]
+        failed = [result for result in results if isinstance(result, HTTPException)]
+        self.assertEqual((len(succeeded), len(failed)), (3, 2))
+        self.assertTrue(all("Storage quota exceeded" in error.detail for error in failed))
+        self.assertEqual(await self._usage(), (900, 0))
+
+    async def test_failed_upload_releases_its_reservation(self):
+        files_router.settings.max_file_size_bytes = 500
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._raw_upload("big.bin", b"x" * 800)
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertEqual(await self._usage(), (0, 0))
+
+        # Without Content-Length the reservation grows with the body
+        uploaded = await self._raw_upload("small.bin", b"x" * 450)
+        self.assertEqual(uploaded.size, 450)
+        self.assertEqual(await self._usage(), (450, 0))
+
+    async def test_expired_reservations_stop_counting(self):
+        async with self.session_factory() as db:
+            stale = await quota.reserve(db, self.user.id, 900)
+            await db.execute(
+                update(QuotaReservation)
+                .where(QuotaReservation.id == stale.id)
+                .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+            )
+            await db.commit()
+
+        await self._raw_upload("fits.bin", b"x" * 600, {"Content-Length": "600"})
+        async with self.session_factory() as db:
+            self.assertEqual(await quota.expire_reservations(db), 0)  # reserve() swept it already
+        self.assertEqual(await self._usage(), (600, 0))
+
+    async def test_resumable_upload_holds_quota_until_complete(self):
+        init = await self._call(
+            files_router.init_chunked_upload,
+            make_request(method="POST"),
+            init_req=ChunkedUploadInitRequest(filename="data.bin", total_size=700, path=[]),
+        )
+        with self.assertRaises(HTTPException):
+            await self._raw_upload("other.bin", b"x" * 400, {"Content-Length": "400"})
+        self.assertEqual(await self._usage(), (0, 1))
+
+        await self._call(
+            files_router.upload_chunk_raw,
+            make_request([b"x" * 700]),
+            upload_id=init.upload_id,
+            chunk_index=0,
+        )
+        await self._call(
+            files_router.complete_chunked_upload,
+            make_request(method="POST"),
+            complete_req=ChunkedUploadCompleteRequest(upload_id=init.upload_id, filename="data.bin", total_size=700, path=[]),
+        )
+        self.assertEqual(await self._usage(), (700, 0))
+
+        # An abandoned session's reservation lapses with the session
+        abandoned = await self._call(
+            files_router.init_chunked_upload,
+            make_request(method="POST"),
+            init_req=ChunkedUploadInitRequest(filename="late.bin", total_size=300, path=[]),
+        )
+        async with self.session_factory() as db:
+            await db.execute(
+                update(UploadSession)
+                .where(UploadSession.id == abandoned.upload_id)
+                .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+            )
+            await db.commit()
+            self.assertEqual(await quota.available(db, self.user.id), 300)
+            await db.execute(UploadSession.__table__.delete())
+            self.assertEqual(await quota.expire_reservations(db), 1)
+            await db.commit()
+
+    async def test_copy_is_charged_with_a_conditional_update(self):
+        uploaded = await self._raw_upload("notes.txt", b"x" * 600, {"Content-Length": "600"})
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call(files_router.copy_file, make_request(method="POST"), file_id=uploaded.id)
+        self.assertIn("Available: 400 bytes", ctx.exception.detail)
+        async with self.session_factory() as db:
+            self.assertEqual(await db.scalar(select(func.count()).select_from(FileModel)), 1)
+        self.assertEqual(await self._usage(), (600, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import shutil
+import unittest
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import Blob, File as FileModel, FileVersion, User  # noqa: E402
+from app.schemas import ChunkedUploadCompleteRequest, ChunkedUploadInitRequest  # noqa: E402
+from app.storage import get_storage  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_raw_upload_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request(parts=(), headers=None, method: str = "PUT") -> Request:
+    """Request whose body arrives as separate ASGI messages, like a real upload."""
+    messages = [{"type": "http.request", "body": part, "more_body": True} for part in parts]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    received = []
+
+    async def receive():
+        message = messages.pop(0)
+        received.append(message)
+        return message
+
+    request = Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files/upload/raw",
+            "headers": [(b"host", b"testserver")] + [
+                (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+            ],
+            "server": ("testserver", 80),
+        },
+        receive,
+    )
+    request.state.received = received
+    return request
+
+
+class RawUploadTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'raw.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        self.original_max_file_size = files_router.settings.max_file_size_bytes
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+
+        async with self.session_factory() as db:
+            self.user = User(email="raw@example.com", username="raw", password_hash="hashed", storage_quota=1000)
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        files_router.settings.max_file_size_bytes = self.original_max_file_size
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _call(self, endpoint, request, **kwargs):
+        async with self.session_factory() as db:
+            user = await db.get(User, self.user.id)
+            result = await endpoint(request=request, current_user=user, db=db, **kwargs)
+            await db.commit()
+            return result
+
+    async def _raw_upload(self, parts, headers=None, filename="notes.txt"):
+        return await self._call(
+            files_router.upload_file_raw,
+            make_request(parts, headers),
+            filename=filename,
+            path="[]",
+            shared_folder_id=None,
+        )
+
+    async def _count(self, model):
+        async with self.session_factory() as db:
+            return await db.scalar(select(func.count()).select_from(model))
+
+    def _staged_files(self):
+        staging_dir = os.path.join(get_storage().blob_root, ".staging")
+        return os.listdir(staging_dir) if os.path.isdir(staging_dir) else []
+
+    async def test_raw_body_is_streamed_into_the_blob_store(self):
+        uploaded = await self._raw_upload(
+            [b"hello ", b"raw ", b"world"],
+            {"Content-Type": "application/octet-stream"},
+        )
+
+        self.assertEqual((uploaded.name, uploaded.size, uploaded.mime_type), ("notes.txt", 15, "text/plain"))
+        async with self.session_factory() as db:
+            stored = await db.get(FileModel, uploaded.id)
+            version = await db.scalar(select(FileVersion).where(FileVersion.file_id == uploaded.id))
+            user = await db.get(User, self.user.id)
+        with open(stored.storage_path, "rb") as handle:
+            self.assertEqual(handle.read(), b"hello raw world")
+        self.assertEqual((version.version, version.storage_path), (1, stored.storage_path))
+        self.assertEqual(user.storage_used, 15)
+        self.assertEqual(self._staged_files(), [])
+
+    async def test_size_limit_is_enforced_while_streaming(self):
+        files_router.settings.max_file_size_bytes = 10
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._raw_upload([b"x" * 6, b"x" * 6, b"x" * 6])
+
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertEqual(self._staged_files(), [])
+        self.assertEqual(await self._count(FileModel), 0)
+        self.assertEqual(await self._count(Blob), 0)
+
+    async def test_quota_is_enforced_before_and_while_streaming(self):
+        request = make_request([b"x" * 2000], {"Content-Length": "2000"})
+        with self.assertRaises(HTTPException) as ctx:
+            await self._call(files_router.upload_file_raw, request, filename="big.bin", path="[]", shared_folder_id=None)
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(request.state.received, [])
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._raw_upload([b"x" * 600, b"x" * 600])
+        self.assertIn("Storage quota exceeded", ctx.exception.detail)
+        self.assertEqual(self._staged_files(), [])
+
+    async def test_raw_chunks_and_versions(self):
+        async with self.session_factory() as db:
+            user = await db.get(User, self.user.id)
+            init = await files_router.init_chunked_upload(
+                request=make_request(method="POST"),
+                init_req=ChunkedUploadInitRequest(filename="data.bin", total_size=8, path=[]),
+                current_user=user,
+                db=db,
+            )
+            await db.commit()
+        await self._call(
+            files_router.upload_chunk_raw,
+            make_request([b"1234", b"5678"]),
+            upload_id=init.upload_id,
+            chunk_index=0,
+        )
+        uploaded = await self._call(
+            files_router.complete_chunked_upload,
+            make_request(method="POST"),
+            complete_req=ChunkedUploadCompleteRequest(
+                upload_id=init.upload_id, filename="data.bin", total_size=8, path=[]
+            ),
+        )
+        self.assertEqual(uploaded.size, 8)
+
+        updated = await self._call(
+            files_router.upload_new_version_raw,
+            make_request([b"version two"], {"Content-Type": "text/plain"}),
+            file_id=uploaded.id,
+            filename=None,
+        )
+        self.assertEqual((updated.version, updated.size, updated.mime_type), (2, 11, "text/plain"))
+        async with self.session_factory() as db:
+            stored = await db.get(FileModel, uploaded.id)
+            self.assertEqual((await db.get(User, self.user.id)).storage_used, 19)
+        with open(stored.storage_path, "rb") as handle:
+            self.assertEqual(handle.read(), b"version two")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import shutil
+import unittest
+import uuid
+from unittest.mock import patch
+
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app import uploads  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import Blob, UploadSession, User  # noqa: E402
+from app.schemas import ChunkedUploadCompleteRequest, ChunkedUploadInitRequest  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_resumable_upload_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/files/upload",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class ResumableUploadTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'resumable.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+        self.chunk_patch = patch.object(files_router, "RESUMABLE_CHUNK_SIZE", 4)
+        self.chunk_patch.start()
+
+        async with self.session_factory() as db:
+            self.user = User(email="resume@example.com", username="resume", password_hash="hashed")
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        self.chunk_patch.stop()
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _init(self, content):
+        async with self.session_factory() as db:
+            user = await db.get(User, self.user.id)
+            init = await files_router.init_chunked_upload(
+                request=make_request(),
+                init_req=ChunkedUploadInitRequest(filename="big.bin", total_size=len(content), path=[]),
+                current_user=user,
+                db=db,
+            )
+            await db.commit()
+        return init.upload_id
+
+    async def _send_chunk(self, upload_id, index, content):
+        async with self.session_factory() as db:
+            response = await files_router.upload_chunk(
+                request=make_request(),
+                upload_id=upload_id,
+                chunk_index=index,
+                file=UploadFile(filename="chunk", file=io.BytesIO(content[index * 4:(index + 1) * 4])),
+                current_user=self.user,
+                db=db,
+            )
+            await db.commit()
+            return response
+
+    async def _complete(self, upload_id, content):
+        async with self.session_factory() as db:
+            user = await db.get(User, self.user.id)
+            uploaded = await files_router.complete_chunked_upload(
+                request=make_request(),
+                complete_req=ChunkedUploadCompleteRequest(
+                    upload_id=upload_id, filename="big.bin", total_size=len(content), path=[]
+                ),
+                current_user=user,
+                db=db,
+            )
+            await db.commit()
+            blob = await db.scalar(select(Blob))
+        return uploaded, blob
+
+    async def test_in_order_upload_completes_with_a_rename(self):
+        content = b"0123456789"
+        upload_id = await self._init(content)
+        temp_dir = files_router.get_upload_temp_dir(self.user.id, upload_id)
+        data_inode = os.stat(uploads.data_path(temp_dir)).st_ino
+        self.assertEqual(os.path.getsize(uploads.data_path(temp_dir)), len(content))
+
+        for index in range(3):
+            await self._send_chunk(upload_id, index, content)
+
+        with patch.object(uploads, "hash_file", side_effect=AssertionError("re-read")):
+            uploaded, blob = await self._complete(upload_id, content)
+
+        self.assertEqual(uploaded.size, len(content))
+        self.assertEqual(blob.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(os.stat(blob.storage_path).st_ino, data_inode)
+        self.assertFalse(os.path.exists(temp_dir))
+        async with self.session_factory() as db:
+            self.assertIsNone(await db.get(UploadSession, upload_id))
+
+    async def test_out_of_order_upload_is_hashed_at_completion(self):
+        content = b"abcdefghij"
+        upload_id = await self._init(content)
+        for index in (2, 0, 1):
+            await self._send_chunk(upload_id, index, content)
+
+        async with self.session_factory() as db:
+            status = await files_router.get_chunked_upload_status(
+                request=make_request(), upload_id=upload_id, current_user=self.user, db=db
+            )
+        self.assertEqual((status.uploaded_chunks, status.uploaded_bytes), ([0, 1, 2], 10))
+
+        _uploaded, blob = await self._complete(upload_id, content)
+        self.assertEqual(blob.sha256, hashlib.sha256(content).hexdigest())
+        with open(blob.storage_path, "rb") as handle:
+            self.assertEqual(handle.read(), content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import shutil
+import unittest
+import uuid
+from unittest.mock import patch
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app import search_index  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import File as FileModel, FileContent, User  # noqa: E402
+from app.routers.files import list_files, search_files, update_file  # noqa: E402
+from app.schemas import FileUpdate  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_search_fts_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+LONG_TEXT = (
+    "Quarterly planning notes. " * 40
+    + "Revenue increased sharply after the new search launch and support stayed stable. "
+    + "Closing remarks. " * 40
+)
+
+
+def make_request(method: str = "PATCH") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "scheme": "http",
+            "path": "/api/files",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class SearchFtsTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'search.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+            self.report = FileModel(
+                name="summary.txt",
+                type="text",
+                mime_type="text/plain",
+                path="[]",
+                owner_id=self.owner.id,
+                content=FileContent(content_index=LONG_TEXT),
+            )
+            self.launch = FileModel(
+                name="search-launch.md",
+                type="text",
+                mime_type="text/markdown",
+                path="[]",
+                owner_id=self.owner.id,
+            )
+            db.add_all([self.report, self.launch])
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _search(self, q):
+        async with self.session_factory() as db:
+            return (await search_files(
+                q=q,
+                file_type=None,
+                date_from=None,
+                date_to=None,
+                starred_only=False,
+                include_trashed=False,
+                shared_folder_id=None,
+                limit=200,
+                cursor=None,
+                include_total=False,
+                current_user=self.owner,
+                db=db,
+            )).items
+
+    async def test_index_is_created_with_tables(self):
+        self.assertTrue(search_index.fts_available)
+
+    async def test_name_matches_rank_above_content_matches(self):
+        results = await self._search("LAUNCH")
+        self.assertEqual([r.id for r in results], [self.launch.id, self.report.id])
+        self.assertEqual(results[0].match_context, "search-launch.md")
+
+    async def test_content_match_uses_fts_snippet(self):
+        results = await self._search("sharply")
+        self.assertEqual([r.id for r in results], [self.report.id])
+        context = results[0].match_context
+        self.assertIn("sharply", context)
+        self.assertTrue(context.startswith("..."))
+        self.assertLessEqual(len(context), search_index.MAX_MATCH_CONTEXT_CHARS)
+
+    async def test_rename_and_delete_keep_index_in_sync(self):
+        async with self.session_factory() as db:
+            await update_file(
+                request=make_request(),
+                file_id=self.launch.id,
+                update=FileUpdate(name="roadmap.md"),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+
+        self.assertEqual([r.id for r in await self._search("roadmap")], [self.launch.id])
+        self.assertEqual(await self._search("search-launch"), [])
+
+        async with self.session_factory() as db:
+            await db.delete(await db.get(FileModel, self.launch.id))
+            await db.commit()
+        self.assertEqual(await self._search("roadmap"), [])
+
+    async def test_renumbered_rowids_never_attach_hits_to_another_file(self):
+        # VACUUM may renumber the implicit rowid of files; swap two to simulate it
+        async with self.engine.begin() as conn:
+            rowids = {
+                file_id: rowid
+                for rowid, file_id in (await conn.execute(text("SELECT rowid, id FROM files"))).all()
+            }
+            await conn.execute(text("UPDATE files SET rowid = -1 WHERE id = :id"), {"id": self.report.id})
+            await conn.execute(
+                text("UPDATE files SET rowid = :rowid WHERE id = :id"),
+                {"rowid": rowids[self.report.id], "id": self.launch.id},
+            )
+            await conn.execute(
+                text("UPDATE files SET rowid = :rowid WHERE id = :id"),
+                {"rowid": rowids[self.launch.id], "id": self.report.id},
+            )
+
+        self.assertEqual([r.id for r in await self._search("sharply")], [self.report.id])
+        self.assertEqual([r.id for r in await self._search("search-launch")], [self.launch.id])
+
+        # A rename misses the misaligned row instead of rewriting the other file's
+        async with self.session_factory() as db:
+            await update_file(
+                request=make_request(),
+                file_id=self.launch.id,
+                update=FileUpdate(name="roadmap.md"),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        self.assertEqual([r.id for r in await self._search("sharply")], [self.report.id])
+        self.assertEqual(await self._search("roadmap"), [])
+
+        # The next startup notices and rebuilds
+        async with self.engine.begin() as conn:
+            self.assertTrue(await conn.run_sync(search_index.ensure_search_index))
+        self.assertEqual([r.id for r in await self._search("roadmap")], [self.launch.id])
+        self.assertEqual(await self._search("search-launch"), [])
+
+    async def test_quotes_in_query_are_literal(self):
+        self.assertEqual(await self._search('"sharply" OR name:*'), [])
+
+    async def test_short_queries_and_missing_fts_fall_back_to_like(self):
+        self.assertEqual({r.id for r in await self._search("md")}, {self.launch.id})
+        with patch.object(search_index, "fts_available", False):
+            results = await self._search("sharply")
+        self.assertEqual([r.id for r in results], [self.report.id])
+        self.assertIn("sharply", results[0].match_context)
+
+    async def test_listings_project_columns_and_skip_extracted_text(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.engine.sync_engine, "before_cursor_execute", record)
+        try:
+            async with self.session_factory() as db:
+                page = await list_files(
+                    path=None,
+                    include_trashed=False,
+                    starred_only=False,
+                    shared_folder_id=None,
+                    limit=50,
+                    cursor=None,
+                    include_total=False,
+                    current_user=self.owner,
+                    db=db,
+                )
+            results = await self._search("sharply")
+        finally:
+            event.remove(self.engine.sync_engine, "before_cursor_execute", record)
+
+        self.assertEqual({item.id for item in page.items}, {self.report.id, self.launch.id})
+        self.assertEqual([r.id for r in results], [self.report.id])
+        self.assertTrue(statements)
+        for statement in statements:
+            self.assertNotIn("file_contents", statement)
+            self.assertNotIn("storage_path", statement)
+
+    async def test_deleting_a_file_drops_its_extracted_text(self):
+        async with self.session_factory() as db:
+            await db.delete(await db.get(FileModel, self.report.id))
+            await db.commit()
+            self.assertEqual(await db.scalar(select(func.count()).select_from(FileContent)), 0)
+        with patch.object(search_index, "fts_available", False):
+            self.assertEqual(await self._search("sharply"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,10 +24,14 @@ class SearchIndexTests(unittest.TestCase):
             type="text",
             mime_type="text/plain",
             path='["finance"]',
-            content_index="Revenue increased sharply after the new search launch and support stayed stable.",
         )
 
-        snippet = build_match_context(file, "search", ["finance"])
+        snippet = build_match_context(
+            file,
+            "search",
+            ["finance"],
+            content="Revenue increased sharply after the new search launch and support stayed stable.",
+        )
 
         self.assertIn("search launch", snippet.lower())
         self.assertTrue(snippet.startswith("...") or len(snippet) <= 180)
@@ -0,0 +1,131 @@
+import os
+import shutil
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.auth import get_current_user, revoke_user_sessions  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import User, UserSession  # noqa: E402
+from app.session_cache import last_seen_buffer, session_cache  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_session_cache_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+class SessionCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'sessions.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._record_statement)
+
+        session_cache.clear()
+        await last_seen_buffer.flush(self.session_factory)
+
+        async with self.session_factory() as db:
+            self.user = User(email="user@example.com", username="user", password_hash="hashed", storage_used=10)
+            db.add(self.user)
+            await db.flush()
+            self.session = UserSession(
+                user_id=self.user.id,
+                expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+                last_seen_at=datetime.now(timezone.utc) - timedelta(hours=1),
+            )
+            db.add(self.session)
+            await db.commit()
+        self.payload = {"sub": self.user.id, "sid": self.session.id, "type": "access"}
+
+    async def asyncTearDown(self):
+        session_cache.clear()
+        await last_seen_buffer.flush(self.session_factory)
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _record_statement(self, _conn, _cursor, statement, *_args):
+        self.statements.append(statement)
+
+    async def _authenticate(self):
+        async with self.session_factory() as db:
+            self.statements.clear()
+            user = await get_current_user(payload=self.payload, db=db)
+            queries = list(self.statements)
+            await db.commit()
+            return user, queries
+
+    async def test_cached_session_skips_queries_and_stays_writable(self):
+        _user, first_queries = await self._authenticate()
+        self.assertEqual(len(first_queries), 2)
+
+        async with self.session_factory() as db:
+            self.statements.clear()
+            user = await get_current_user(payload=self.payload, db=db)
+            self.assertEqual(self.statements, [])
+            self.assertEqual((user.id, user.storage_used), (self.user.id, 10))
+            self.assertIs(await db.get(User, self.user.id), user)
+
+            user.storage_used += 5
+            await db.commit()
+
+        user, queries = await self._authenticate()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(user.storage_used, 15)
+
+    async def test_revocation_takes_effect_immediately(self):
+        await self._authenticate()
+
+        async with self.session_factory() as db:
+            await revoke_user_sessions(db, self.user.id)
+            await db.commit()
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._authenticate()
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_logout_style_revocation_invalidates_cache(self):
+        await self._authenticate()
+
+        async with self.session_factory() as db:
+            session = await db.get(UserSession, self.session.id)
+            session.revoked_at = datetime.now(timezone.utc)
+            await db.commit()
+
+        with self.assertRaises(HTTPException):
+            await self._authenticate()
+
+    async def test_last_seen_is_written_in_one_batch_by_the_flusher(self):
+        await self._authenticate()
+        await self._authenticate()
+
+        async with self.session_factory() as db:
+            stored = (await db.get(UserSession, self.session.id)).last_seen_at
+        self.assertLess(stored, datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=30))
+        self.assertIsNotNone(last_seen_buffer.pending(self.session.id))
+
+        self.statements.clear()
+        self.assertEqual(await last_seen_buffer.flush(self.session_factory), 1)
+        self.assertEqual(len([s for s in self.statements if s.startswith("UPDATE user_sessions")]), 1)
+
+        async with self.session_factory() as db:
+            stored = (await db.get(UserSession, self.session.id)).last_seen_at
+        self.assertGreater(stored, datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=1))
+        self.assertIsNone(last_seen_buffer.pending(self.session.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import io
+import os
+import shutil
+import time
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+import app.routers.sharing as sharing_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import ShareLink, User  # noqa: E402
+from app.schemas import ShareLinkCreate  # noqa: E402
+from app.share_links import (  # noqa: E402
+    create_share_grant,
+    settings as share_settings,
+    share_link_cache,
+    verify_resume_token,
+    verify_share_grant,
+)
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_share_link_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+CONTENT = b"shared file contents"
+
+
+def make_scope(path: str = "/api/share", headers=None) -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "headers": [(b"host", b"testserver"), (b"x-forwarded-for", b"127.0.0.1")] + [
+            (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+        ],
+        "server": ("testserver", 80),
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+    }
+
+
+class ShareGrantTests(unittest.TestCase):
+    def make_link(self, **overrides) -> ShareLink:
+        values = {"id": "link-1", "password_hash": "hash-1", "max_downloads": 5, "expires_at": None}
+        values.update(overrides)
+        return ShareLink(**values)
+
+    def test_grant_is_bound_to_link_password_and_cap(self):
+        grant = create_share_grant(self.make_link())
+
+        self.assertTrue(verify_share_grant(grant, self.make_link()))
+        self.assertFalse(verify_share_grant(grant, self.make_link(id="link-2")))
+        self.assertFalse(verify_share_grant(grant, self.make_link(password_hash="hash-2")))
+        self.assertFalse(verify_share_grant(grant, self.make_link(max_downloads=6)))
+        self.assertFalse(verify_share_grant(grant[:-1] + ("0" if grant[-1] != "0" else "1"), self.make_link()))
+        self.assertFalse(verify_share_grant("not-a-grant", self.make_link()))
+
+    def test_grant_never_outlives_the_link(self):
+        expired = self.make_link(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertFalse(verify_share_grant(create_share_grant(expired), expired))
+
+
+class ShareLinkAccessTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'share.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = os.path.join(self.test_dir, "storage")
+        share_link_cache.clear()
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+            uploaded = await files_router.upload_files(
+                request=Request(make_scope()),
+                files=[UploadFile(filename="report.txt", file=io.BytesIO(CONTENT))],
+                path="[]",
+                shared_folder_id=None,
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        self.file_id = uploaded[0].id
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        share_link_cache.clear()
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def create_link(self, password=None, max_downloads=None):
+        async with self.session_factory() as db:
+            link = await sharing_router.create_share_link(
+                request=Request(make_scope()),
+                data=ShareLinkCreate(
+                    file_id=self.file_id, permission="download", password=password, max_downloads=max_downloads
+                ),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        return link
+
+    async def access(self, token, body=None):
+        async with self.session_factory() as db:
+            response = await sharing_router.access_shared_file(
+                request=Request(make_scope()),
+                token=token,
+                body=body,
+                db=db,
+            )
+            await db.commit()
+        return response
+
+    async def download(self, token, password=None, grant=None, headers=None, resume=None):
+        async with self.session_factory() as db:
+            response = await sharing_router.download_shared_file(
+                request=Request(make_scope(f"/api/share/{token}/download", headers)),
+                token=token,
+                x_share_password=password,
+                x_share_grant=grant,
+                x_share_resume=resume,
+                db=db,
+            )
+            await db.commit()
+        return response
+
+    async def test_grant_replaces_the_password_after_one_bcrypt_check(self):
+        link = await self.create_link(password="open sesame")
+        access = await self.access(link.token, sharing_router.ShareAccessRequest(password="open sesame"))
+        grant = access["access_grant"]
+        self.assertGreater(access["grant_expires_at"], datetime.now(timezone.utc))
+
+        bcrypt = AsyncMock(side_effect=AssertionError("bcrypt should not run"))
+        with patch.object(sharing_router, "verify_password_async", bcrypt):
+            again = await self.access(link.token, sharing_router.ShareAccessRequest(grant=grant))
+            response = await self.download(link.token, grant=grant)
+        self.assertEqual(again["file_name"], "report.txt")
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.download(link.token, password="wrong", grant=grant[:-4] + "0000")
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_range_requests_are_counted_without_a_resume_token(self):
+        link = await self.create_link(max_downloads=1)
+        await self.download(link.token, headers={"Range": "bytes=1-"})
+
+        for headers in ({"Range": "bytes=1-"}, {"Range": f"bytes=-{len(CONTENT) - 1}"}, None):
+            with self.assertRaises(HTTPException) as ctx:
+                await self.download(link.token, headers=headers)
+            self.assertEqual(ctx.exception.status_code, 410)
+
+    async def test_resume_token_continues_a_counted_download(self):
+        link = await self.create_link(max_downloads=1)
+        response = await self.download(link.token)
+        self.assertEqual(response.status_code, 200)
+        resume = response.headers["x-share-resume"]
+
+        for _ in range(3):
+            response = await self.download(link.token, headers={"Range": "bytes=5-"}, resume=resume)
+            self.assertNotIn("x-share-resume", response.headers)
+
+        # The token only covers continuations, and only genuine ones
+        for headers, token in (
+            ({"Range": "bytes=0-"}, resume),
+            ({"Range": f"bytes=-{len(CONTENT)}"}, resume),
+            (None, resume),
+            ({"Range": "bytes=5-"}, resume[:-4] + "0000"),
+        ):
+            with self.assertRaises(HTTPException) as ctx:
+                await self.download(link.token, headers=headers, resume=token)
+            self.assertEqual(ctx.exception.status_code, 410)
+
+        async with self.session_factory() as db:
+            stored, file = await sharing_router._load_share(db, link.token)
+        later = time.time() + share_settings.share_resume_ttl_seconds + 1
+        with patch("app.share_links.time.time", return_value=later):
+            self.assertFalse(verify_resume_token(resume, stored, file))
+
+    async def test_cached_links_follow_revoke_and_trash(self):
+        revoked = await self.create_link()
+        await self.access(revoked.token)
+        self.assertIsNotNone(share_link_cache.get(revoked.token))
+
+        async with self.session_factory() as db:
+            await sharing_router.revoke_share_link(
+                request=Request(make_scope()),
+                link_id=revoked.id,
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        with self.assertRaises(HTTPException) as ctx:
+            await self.access(revoked.token)
+        self.assertEqual(ctx.exception.status_code, 410)
+
+        trashed = await self.create_link()
+        await self.download(trashed.token)
+        self.assertIsNotNone(share_link_cache.get(trashed.token))
+        self.assertEqual(share_link_cache.get(trashed.token).link_state["download_count"], 1)
+
+        async with self.session_factory() as db:
+            await files_router.trash_file(
+                request=Request(make_scope()),
+                file_id=self.file_id,
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        self.assertIsNone(share_link_cache.get(trashed.token))
+        with self.assertRaises(HTTPException) as ctx:
+            await self.download(trashed.token)
+        self.assertEqual(ctx.exception.status_code, 410)
+
+
+if __name__ == "__main__":
+    unittest.main()
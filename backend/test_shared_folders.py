@@ -12,8 +12,15 @@ from app.database import Base  # noqa: E402
 from app.models import File as FileModel, SharedFolderAccess, User  # noqa: E402
 from app.routers.files import list_files  # noqa: E402
 from app.routers.folders import create_folder  # noqa: E402
-from app.routers.shared_folders import invite_to_shared_folder, list_shared_folders  # noqa: E402
-from app.schemas import FolderCreate, SharedFolderInviteCreate  # noqa: E402
+from app.routers.shared_folders import (  # noqa: E402
+    invite_to_shared_folder,
+    list_shared_folders,
+    remove_shared_folder_access,
+    update_shared_folder_access,
+)
+from app.schemas import FolderCreate, SharedFolderAccessUpdate, SharedFolderInviteCreate  # noqa: E402
+from app.shared_access import get_file_access_context  # noqa: E402
+from app.shared_grants import shared_grant_cache  # noqa: E402
 
 
 TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_shared_folder_tests")
@@ -109,10 +116,13 @@ class SharedFolderTests(unittest.IsolatedAsyncioTestCase):
                 include_trashed=False,
                 starred_only=False,
                 shared_folder_id=self.root_folder.id,
+                limit=200,
+                cursor=None,
+                include_total=False,
                 current_user=self.editor,
                 db=db,
             )
-            names = {item.name: item.path for item in items}
+            names = {item.name: item.path for item in items.items}
             self.assertIn("Roadmap", names)
             self.assertIn("Specs", names)
             self.assertEqual(names["Roadmap"], [])
@@ -138,6 +148,64 @@ class SharedFolderTests(unittest.IsolatedAsyncioTestCase):
 
             self.assertEqual(ctx.exception.status_code, 403)
 
+    async def test_nearest_grant_decides_and_follows_invites_updates_and_removals(self):
+        async with self.session_factory() as db:
+            area = await create_folder(folder=FolderCreate(name="Area", path=[]), current_user=self.owner, db=db)
+            team = await create_folder(folder=FolderCreate(name="Team", path=["Area"]), current_user=self.owner, db=db)
+            plans = await create_folder(
+                folder=FolderCreate(name="Plans", path=["Area", "Team"]), current_user=self.owner, db=db
+            )
+            await db.commit()
+
+        async def invite(folder_id, role):
+            async with self.session_factory() as db:
+                access = await invite_to_shared_folder(
+                    folder_id=folder_id,
+                    payload=SharedFolderInviteCreate(identifier=self.viewer.email, role=role),
+                    current_user=self.owner,
+                    db=db,
+                )
+                await db.commit()
+            return access
+
+        async def resolve():
+            async with self.session_factory() as db:
+                _file, ctx = await get_file_access_context(db, self.viewer, plans.id)
+            return ctx.shared_folder_id, ctx.role
+
+        outer = await invite(area.id, "viewer")
+        self.assertEqual(await resolve(), (area.id, "viewer"))
+        self.assertEqual(shared_grant_cache.get(self.viewer.id, self.owner.id), {area.id: "viewer"})
+
+        inner = await invite(team.id, "editor")
+        self.assertEqual(await resolve(), (team.id, "editor"))
+
+        async with self.session_factory() as db:
+            await update_shared_folder_access(
+                folder_id=team.id,
+                access_id=inner.id,
+                payload=SharedFolderAccessUpdate(role="admin"),
+                current_user=self.owner,
+                db=db,
+            )
+            await db.commit()
+        self.assertEqual(await resolve(), (team.id, "admin"))
+
+        for folder, access in ((team, inner), (area, outer)):
+            async with self.session_factory() as db:
+                await remove_shared_folder_access(
+                    folder_id=folder.id,
+                    access_id=access.id,
+                    current_user=self.owner,
+                    db=db,
+                )
+                await db.commit()
+            if folder is team:
+                self.assertEqual(await resolve(), (area.id, "viewer"))
+        with self.assertRaises(HTTPException) as ctx:
+            await resolve()
+        self.assertEqual(ctx.exception.status_code, 404)
+
 
 if __name__ == "__main__":
     unittest.main()
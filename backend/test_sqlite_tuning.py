@@ -0,0 +1,87 @@
+import asyncio
+import os
+import shutil
+import unittest
+import uuid
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app.database import Base  # noqa: E402
+from app.models import ActivityLog, User  # noqa: E402
+from app.sqlite_tuning import configure_sqlite, engine_options  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_sqlite_tuning_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+class SqliteTuningTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        url = f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'tuning.db')}"
+        self.engine = create_async_engine(url, future=True, **engine_options(url))
+        self.gate = configure_sqlite(self.engine, single_writer=True)
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            self.user = User(email="writer@example.com", username="writer", password_hash="hashed")
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def test_connections_use_the_performance_pragmas(self):
+        async with self.engine.connect() as conn:
+            values = [
+                (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store")
+            ]
+        self.assertEqual(values, ["wal", 1, 5000, 2])
+
+    async def test_concurrent_writers_queue_instead_of_failing(self):
+        async def client(n):
+            for i in range(5):
+                async with self.session_factory() as db:
+                    db.add(ActivityLog(user_id=self.user.id, action="upload", file_name=f"{n}-{i}.txt"))
+                    await asyncio.sleep(0)  # let the other clients interleave
+                    await db.flush()
+                    await asyncio.sleep(0)
+                    await db.commit()
+
+        await asyncio.gather(*(client(n) for n in range(50)))
+
+        async with self.session_factory() as db:
+            self.assertEqual(await db.scalar(select(func.count()).select_from(ActivityLog)), 250)
+        self.assertGreater(self.gate.waits, 0)
+
+    async def test_reads_do_not_wait_for_the_writer(self):
+        async with self.session_factory() as writer:
+            writer.add(ActivityLog(user_id=self.user.id, action="upload", file_name="pending.txt"))
+            await writer.flush()
+
+            async with self.session_factory() as reader:
+                count = await asyncio.wait_for(
+                    reader.scalar(select(func.count()).select_from(ActivityLog)),
+                    timeout=1,
+                )
+            self.assertEqual(count, 0)
+
+            self.gate.timeout = 0.05
+            async with self.session_factory() as second_writer:
+                with self.assertRaises(OperationalError) as ctx:
+                    await second_writer.execute(text("DELETE FROM activity_logs"))
+                self.assertIn("database is locked", str(ctx.exception))
+            await writer.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import shutil
+import time
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+from app import storage_gc, uploads  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import Blob, File as FileModel, FileVersion, UploadSession, User  # noqa: E402
+from app.schemas import StorageGCReport  # noqa: E402
+from app.storage import get_storage  # noqa: E402
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_storage_gc_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+class StorageGCTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'gc.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        settings = storage_gc.settings
+        self.original = (settings.storage_path, settings.storage_gc_batch_size, settings.storage_gc_batch_pause_seconds)
+        settings.storage_path = os.path.join(self.test_dir, "storage")
+        settings.storage_gc_batch_size = 2
+        settings.storage_gc_batch_pause_seconds = 0
+        storage_gc.gc_metrics = storage_gc.GCMetrics()
+        self.collector = storage_gc.StorageCollector(self.session_factory, interval=0)
+
+        async with self.session_factory() as db:
+            self.user = User(email="gc@example.com", username="gc", password_hash="hashed")
+            db.add(self.user)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        settings = storage_gc.settings
+        settings.storage_path, settings.storage_gc_batch_size, settings.storage_gc_batch_pause_seconds = self.original
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _write(self, path, content=b"data", old=True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as handle:
+            handle.write(content)
+        if old:
+            stale = time.time() - 2 * 86400
+            os.utime(path, (stale, stale))
+        return path
+
+    async def _populate(self):
+        storage = get_storage()
+        user_dir = os.path.join(storage_gc.settings.storage_path, self.user.id)
+        thumb_dir = os.path.join(user_dir, "thumbnails")
+        paths = {
+            "live_blob": self._write(storage.blob_path("a" * 64)),
+            "orphan_blob": self._write(storage.blob_path("b" * 64), b"orphan!"),
+            "fresh_blob": self._write(storage.blob_path("c" * 64), old=False),
+            "staged": self._write(os.path.join(storage.blob_root, ".staging", "leftover"), b"xx"),
+            "legacy_live": self._write(os.path.join(user_dir, "legacy.txt")),
+            "legacy_orphan": self._write(os.path.join(user_dir, "gone.txt"), b"abc"),
+        }
+        async with self.session_factory() as db:
+            file = FileModel(
+                name="photo.jpg",
+                type="image",
+                size=4,
+                owner_id=self.user.id,
+                storage_path=paths["live_blob"],
+                thumbnail_path=os.path.join(thumb_dir, "placeholder_256.webp"),
+            )
+            db.add(file)
+            await db.flush()
+            file.thumbnail_path = os.path.join(thumb_dir, f"{file.id}_256.webp")
+            db.add(Blob(sha256="a" * 64, size=4, refcount=1, storage_path=paths["live_blob"]))
+            db.add(FileVersion(file_id=file.id, version=1, size=4, storage_path=paths["live_blob"], created_by=self.user.id))
+            legacy = FileModel(name="legacy.txt", type="document", size=4, owner_id=self.user.id, storage_path=paths["legacy_live"])
+            db.add(legacy)
+
+            expired = uploads.new_session(
+                str(uuid.uuid4()), self.user.id, filename="a.bin", path="[]", mime_type=None,
+                total_size=3, chunk_size=3, expected_chunks=1,
+            )
+            expired.expires_at = datetime.now(timezone.utc) - timedelta(hours=1)
+            active = uploads.new_session(
+                str(uuid.uuid4()), self.user.id, filename="b.bin", path="[]", mime_type=None,
+                total_size=3, chunk_size=3, expected_chunks=1,
+            )
+            db.add_all([expired, active])
+            await db.commit()
+
+        paths["live_thumb"] = self._write(file.thumbnail_path)
+        paths["live_thumb_large"] = self._write(os.path.join(thumb_dir, f"{file.id}_1024.webp"))
+        paths["orphan_thumb"] = self._write(os.path.join(thumb_dir, f"{uuid.uuid4()}_256.webp"), b"12345")
+        paths["expired_upload"] = self._write(uploads.data_path(uploads.temp_dir_for(self.user.id, expired.id)), b"abc")
+        paths["active_upload"] = self._write(uploads.data_path(uploads.temp_dir_for(self.user.id, active.id)))
+        paths["orphan_upload"] = self._write(uploads.data_path(uploads.temp_dir_for(self.user.id, str(uuid.uuid4()))))
+        self.expired_id = expired.id
+        return paths
+
+    async def test_dry_run_reports_without_deleting(self):
+        paths = await self._populate()
+
+        report = await self.collector.collect(dry_run=True)
+
+        self.assertTrue(all(os.path.exists(path) for path in paths.values()))
+        counts = {name: category.files for name, category in report.categories.items()}
+        self.assertEqual(counts, {"upload_sessions": 2, "staging": 1, "blobs": 1, "user_files": 1, "thumbnails": 1})
+        self.assertEqual(report.expired_upload_sessions, 1)
+        self.assertEqual(report.reclaimed_bytes, 3 + 4 + 2 + 7 + 3 + 5)
+        self.assertEqual(storage_gc.gc_metrics.runs, 0)
+        self.assertEqual(StorageGCReport.model_validate(report).categories["blobs"].samples, [
+            os.path.relpath(paths["orphan_blob"], storage_gc.settings.storage_path)
+        ])
+        async with self.session_factory() as db:
+            self.assertIsNotNone(await db.get(UploadSession, self.expired_id))
+
+    async def test_collect_removes_only_unreferenced_entries(self):
+        paths = await self._populate()
+
+        report = await self.collector.collect()
+
+        removed = {"orphan_blob", "staged", "legacy_orphan", "orphan_thumb", "expired_upload", "orphan_upload"}
+        for name, path in paths.items():
+            self.assertEqual(os.path.exists(path), name not in removed, name)
+        async with self.session_factory() as db:
+            self.assertIsNone(await db.get(UploadSession, self.expired_id))
+        self.assertEqual(storage_gc.gc_metrics.runs, 1)
+        self.assertEqual(storage_gc.gc_metrics.reclaimed_bytes_total["blobs"], 7)
+        self.assertEqual(report.reclaimed_bytes, sum(storage_gc.gc_metrics.reclaimed_bytes_total.values()))
+
+        second = await self.collector.collect()
+        self.assertEqual(second.reclaimed_bytes, 0)
+
+    async def test_unexpected_stored_path_layout_skips_reconciliation(self):
+        paths = await self._populate()
+        async with self.session_factory() as db:
+            db.add(FileModel(name="moved.txt", type="document", owner_id=self.user.id, storage_path="/elsewhere/moved.txt"))
+            await db.commit()
+
+        report = await self.collector.collect()
+
+        self.assertTrue(report.skipped)
+        self.assertTrue(os.path.exists(paths["orphan_blob"]))
+        self.assertTrue(os.path.exists(paths["orphan_thumb"]))
+        self.assertFalse(os.path.exists(paths["staged"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import shutil
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import HTTPException
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "0123456789abcdef0123456789abcdef")
+
+import app.routers.files as files_router  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import File as FileModel, User  # noqa: E402
+from app.signed_urls import url_expiry  # noqa: E402
+from app.thumbnails import (  # noqa: E402
+    generate_thumbnails,
+    nearest_rendition_size,
+    remove_thumbnails,
+    thumbnail_key,
+)
+
+
+TEST_DB_ROOT = os.path.join(os.path.dirname(__file__), "_tmp_thumbnail_tests")
+os.makedirs(TEST_DB_ROOT, exist_ok=True)
+
+
+def make_request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/files/thumbnail",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+        }
+    )
+
+
+class ThumbnailGenerationTests(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"gen-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_generates_every_size_from_one_draft_decode(self):
+        source = os.path.join(self.test_dir, "photo.jpg")
+        Image.new("RGB", (4000, 3000), color=(10, 120, 200)).save(source, "JPEG")
+        thumb_dir = os.path.join(self.test_dir, "thumbnails")
+
+        with patch.object(JpegImageFile, "draft", autospec=True, side_effect=JpegImageFile.draft) as draft:
+            outputs = generate_thumbnails(source, thumb_dir, "file-1")
+
+        draft.assert_called_once()
+        self.assertEqual(draft.call_args.args[1:], ("RGB", (1024, 1024)))
+        self.assertEqual(sorted(outputs), [64, 256, 1024])
+        for size, path in outputs.items():
+            self.assertEqual(path, os.path.join(thumb_dir, f"file-1_{size}.webp"))
+            with Image.open(path) as rendition:
+                self.assertEqual(rendition.format, "WEBP")
+                self.assertEqual(max(rendition.size), size)
+
+    def test_invalid_source_returns_none(self):
+        source = os.path.join(self.test_dir, "broken.png")
+        with open(source, "wb") as handle:
+            handle.write(b"not an image")
+        self.assertIsNone(generate_thumbnails(source, self.test_dir, "broken"))
+
+    def test_nearest_rendition_size_rounds_up(self):
+        self.assertEqual(nearest_rendition_size(None), 256)
+        self.assertEqual(nearest_rendition_size(48), 64)
+        self.assertEqual(nearest_rendition_size(300), 1024)
+        self.assertEqual(nearest_rendition_size(2048), 1024)
+
+    def test_remove_thumbnails_deletes_all_renditions_of_one_key(self):
+        for name in ("abc_64.webp", "abc_256.webp", "abc_thumb.jpg", "abc-v2_256.webp"):
+            open(os.path.join(self.test_dir, name), "wb").close()
+
+        remove_thumbnails(os.path.join(self.test_dir, "abc_256.webp"))
+
+        self.assertEqual(os.listdir(self.test_dir), ["abc-v2_256.webp"])
+
+
+class ThumbnailEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_dir = os.path.join(TEST_DB_ROOT, f"db-{uuid.uuid4()}")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.test_dir, 'thumbs.db')}",
+            future=True,
+        )
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        self.original_storage_path = files_router.settings.storage_path
+        files_router.settings.storage_path = self.test_dir
+
+        async with self.session_factory() as db:
+            self.owner = User(email="owner@example.com", username="owner", password_hash="hashed")
+            db.add(self.owner)
+            await db.commit()
+            source = os.path.join(self.test_dir, self.owner.id, "photo.png")
+            os.makedirs(os.path.dirname(source))
+            Image.new("RGB", (800, 600), color=(200, 40, 40)).save(source)
+            self.file = FileModel(
+                name="photo.png",
+                type="image",
+                mime_type="image/png",
+                size=os.path.getsize(source),
+                path="[]",
+                storage_path=source,
+                owner_id=self.owner.id,
+                version=2,
+            )
+            db.add(self.file)
+            await db.commit()
+
+    async def asyncTearDown(self):
+        files_router.settings.storage_path = self.original_storage_path
+        await self.engine.dispose()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    async def _get(self, file_id, size):
+        async with self.session_factory() as db:
+            return await files_router.get_thumbnail(
+                request=make_request(),
+                file_id=file_id,
+                size=size,
+                current_user=self.owner,
+                db=db,
+            )
+
+    async def test_missing_rendition_is_generated_once_for_concurrent_requests(self):
+        decodes = []
+
+        async def run_in_thread(func, *args, **kwargs):
+            decodes.append(args[3])
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+        with patch("app.executors.run_in_process", run_in_thread):
+            responses = await asyncio.gather(*(self._get(self.file.id, 48) for _ in range(5)))
+
+        expected = os.path.join(
+            self.test_dir, self.owner.id, "thumbnails", f"{thumbnail_key(self.file.id, 2)}_64.webp"
+        )
+        self.assertEqual(decodes, [(64,)])
+        self.assertEqual({response.path for response in responses}, {expected})
+        self.assertEqual(responses[0].media_type, "image/webp")
+        with Image.open(expected) as rendition:
+            self.assertEqual(rendition.size, (64, 48))
+
+    async def _get_signed(self, url, size, db=None):
+        parts = urlsplit(url)
+        _, _, _, file_id, _, version = parts.path.split("/")
+        params = dict(parse_qsl(parts.query))
+        return await files_router.get_thumbnail_signed(
+            request=make_request(),
+            file_id=file_id,
+            version=int(version),
+            owner=params["owner"],
+            expires=int(params["expires"]),
+            sig=params["sig"],
+            size=size,
+            db=db,
+        )
+
+    async def test_signed_url_serves_cached_renditions_without_the_database(self):
+        self.file.thumbnail_path = "pending"
+        response_model = files_router.to_file_response(self.file)
+        self.assertEqual(response_model, files_router.to_file_response(self.file))  # stable across listings
+        url = response_model.thumbnail_url
+        self.assertTrue(url.startswith(f"/api/files/{self.file.id}/thumbnail/2?"))
+        self.assertTrue(response_model.preview_url.startswith(f"/api/files/{self.file.id}/preview/2?"))
+
+        with patch("app.executors.run_in_process", lambda func, *args: asyncio.to_thread(func, *args)):
+            async with self.session_factory() as db:
+                first = await self._get_signed(url, 256, db)
+        second = await self._get_signed(url, 256, db=None)
+
+        self.assertEqual(first.path, second.path)
+        self.assertEqual(second.headers["cache-control"].split(", ")[::2], ["private", "immutable"])
+        max_age = int(second.headers["cache-control"].split("max-age=")[1].split(",")[0])
+        self.assertGreater(max_age, 0)
+        self.assertLessEqual(max_age, url_expiry() - int(time.time()))
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._get_signed(url.replace("/thumbnail/2?", "/thumbnail/3?"), 256)
+        self.assertEqual(ctx.exception.status_code, 403)
+
+    async def test_signed_preview_url_names_one_version(self):
+        url = urlsplit(files_router.to_file_response(self.file).preview_url)
+        params = dict(parse_qsl(url.query))
+
+        async def preview(version):
+            async with self.session_factory() as db:
+                return await files_router.preview_signed(
+                    request=make_request(),
+                    file_id=self.file.id,
+                    version=version,
+                    expires=int(params["expires"]),
+                    sig=params["sig"],
+                    db=db,
+                )
+
+        response = await preview(2)
+        self.assertEqual(response.path, self.file.storage_path)
+        self.assertIn("immutable", response.headers["cache-control"])
+        self.assertEqual(
+            int(params["expires"]), url_expiry(ttl=files_router.settings.signed_preview_url_ttl_seconds)
+        )
+        self.assertLess(int(params["expires"]), url_expiry())
+
+        async with self.session_factory() as db:
+            file = await db.get(FileModel, self.file.id)
+            file.version = 3
+            await db.commit()
+        with self.assertRaises(HTTPException) as ctx:
+            await preview(2)
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    async def test_signed_preview_url_stops_working_once_the_file_is_trashed(self):
+        url = urlsplit(files_router.to_file_response(self.file).preview_url)
+        params = dict(parse_qsl(url.query))
+        async with self.session_factory() as db:
+            file = await db.get(FileModel, self.file.id)
+            file.is_trashed = True
+            await db.commit()
+
+        async with self.session_factory() as db:
+            with self.assertRaises(HTTPException) as ctx:
+                await files_router.preview_signed(
+                    request=make_request(),
+                    file_id=self.file.id,
+                    version=2,
+                    expires=int(params["expires"]),
+                    sig=params["sig"],
+                    db=db,
+                )
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    async def test_files_without_thumbnails_return_404(self):
+        async with self.session_factory() as db:
+            doc = FileModel(name="notes.txt", type="text", path="[]", owner_id=self.owner.id)
+            db.add(doc)
+            await db.commit()
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self._get(doc.id, None)
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
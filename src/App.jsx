@@ -32,8 +32,10 @@ export default function App() {
     const [currentPath, setCurrentPath] = useState([]);
     const [currentSharedFolder, setCurrentSharedFolder] = useState(null);
     const [files, setFiles] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [searchQuery, setSearchQuery] = useState("");
     const [searchResults, setSearchResults] = useState([]);
+    const [searchCursor, setSearchCursor] = useState(null);
     const [searchLoading, setSearchLoading] = useState(false);
     const [searchError, setSearchError] = useState("");
     const [searchRefreshKey, setSearchRefreshKey] = useState(0);
@@ -41,6 +43,13 @@ export default function App() {
     const [uploadProgress, setUploadProgress] = useState({});
     const uploadAbortRef = React.useRef(null);
     const [loading, setLoading] = useState(false);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const loadingMoreRef = React.useRef(false);
+    // Bumped whenever a listing or search starts over, so pages of a
+    // superseded one are dropped instead of appended
+    const listingGenerationRef = React.useRef(0);
+    const searchGenerationRef = React.useRef(0);
+    const fileAreaRef = React.useRef(null);
 
     // View/Navigation state
     const [currentView, setCurrentView] = useState("home");
@@ -94,47 +103,67 @@ export default function App() {
     }, []);
 
     /* ---------------- LOAD FILES ---------------- */
+    // Listings are loaded one page at a time; further pages follow on scroll.
+    const fetchListingPage = useCallback((cursor) => {
+        if (currentView === "starred") {
+            return api.listFilesPage([], { starredOnly: true, cursor });
+        }
+        if (currentSharedFolder) {
+            return api.listFilesPage(currentPath, {
+                sharedFolderId: currentSharedFolder.shared_folder_id || currentSharedFolder.id,
+                cursor,
+            });
+        }
+        return api.listFilesPage(currentPath, { cursor });
+    }, [currentPath, currentView, currentSharedFolder]);
+
     const loadFiles = useCallback(async () => {
         if (!user) return;
+        const generation = ++listingGenerationRef.current;
         setLoading(true);
         try {
-            let data;
-            if (currentView === "starred") {
-                data = await api.listFiles([], { starredOnly: true });
-            } else if (currentView === "trash") {
-                data = await api.listFiles([], { includeTrash: true });
-                data = data.filter(f => f.is_trashed);
-                setTrashedFiles(data);
-                setLoading(false);
-                return;
+            if (currentView === "trash") {
+                // Trashed items are picked out of the whole listing, so read it to the end
+                const data = await api.listAllFiles([], { includeTrash: true });
+                if (generation !== listingGenerationRef.current) return;
+                setTrashedFiles(data.filter(f => f.is_trashed));
+                setNextCursor(null);
             } else {
-                if (currentSharedFolder) {
-                    data = await api.listFiles(currentPath, { sharedFolderId: currentSharedFolder.shared_folder_id || currentSharedFolder.id });
-                } else {
-                    data = await api.listFiles(currentPath);
-                    if (currentPath.length === 0) {
-                        const sharedFolders = await api.getSharedFolders();
-                        data = [...data, ...sharedFolders];
-                    }
+                const page = await fetchListingPage(null);
+                let data = page.items;
+                if (currentView !== "starred" && !currentSharedFolder && currentPath.length === 0) {
+                    const sharedFolders = await api.getSharedFolders();
+                    data = [...data, ...sharedFolders];
                 }
+                if (generation !== listingGenerationRef.current) return;
+                setFiles(data.filter(f => !f.is_trashed));
+                setNextCursor(page.next_cursor);
             }
-            setFiles(data.filter(f => !f.is_trashed));
         } catch (err) {
             console.error("Failed to load files:", err);
         }
-        setLoading(false);
-    }, [user, currentPath, currentView, currentSharedFolder]);
+        if (generation === listingGenerationRef.current) {
+            setLoading(false);
+        }
+    }, [user, currentPath, currentView, currentSharedFolder, fetchListingPage]);
 
     useEffect(() => {
         loadFiles();
     }, [loadFiles]);
 
     /* ---------------- SEARCH ---------------- */
+    const searchFilters = () => ({
+        starredOnly: currentView === "starred",
+        sharedFolderId: currentSharedFolder?.shared_folder_id || currentSharedFolder?.id,
+    });
+
     useEffect(() => {
         if (!user) return;
 
         const trimmedQuery = searchQuery.trim();
         const searchEnabled = currentView !== "activity" && currentView !== "trash" && currentView !== "admin";
+        const generation = ++searchGenerationRef.current;
+        setSearchCursor(null);
 
         if (!trimmedQuery || !searchEnabled) {
             setSearchResults([]);
@@ -149,12 +178,10 @@ export default function App() {
             setSearchError("");
 
             try {
-                const results = await api.searchFiles(trimmedQuery, {
-                    starredOnly: currentView === "starred",
-                    sharedFolderId: currentSharedFolder?.shared_folder_id || currentSharedFolder?.id,
-                });
-                if (!cancelled) {
-                    setSearchResults(results);
+                const page = await api.searchFilesPage(trimmedQuery, searchFilters());
+                if (!cancelled && generation === searchGenerationRef.current) {
+                    setSearchResults(page.items);
+                    setSearchCursor(page.next_cursor);
                 }
             } catch (err) {
                 if (!cancelled) {
@@ -174,6 +201,54 @@ export default function App() {
         };
     }, [user, searchQuery, currentView, searchRefreshKey, currentSharedFolder]);
 
+    /* ---------------- LOAD MORE ON SCROLL ---------------- */
+    const loadMore = async () => {
+        if (currentView === "activity" || currentView === "trash" || currentView === "admin") return;
+        const searching = searchQuery.trim().length > 0;
+        const cursor = searching ? searchCursor : nextCursor;
+        if (!cursor || loadingMoreRef.current || loading || searchLoading) return;
+
+        const generationRef = searching ? searchGenerationRef : listingGenerationRef;
+        const generation = generationRef.current;
+        loadingMoreRef.current = true;
+        setLoadingMore(true);
+        try {
+            const page = searching
+                ? await api.searchFilesPage(searchQuery.trim(), { ...searchFilters(), cursor })
+                : await fetchListingPage(cursor);
+            if (generation === generationRef.current) {
+                const items = page.items.filter(f => !f.is_trashed);
+                if (searching) {
+                    setSearchResults((results) => [...results, ...items]);
+                    setSearchCursor(page.next_cursor);
+                } else {
+                    setFiles((loaded) => [...loaded, ...items]);
+                    setNextCursor(page.next_cursor);
+                }
+            }
+        } catch (err) {
+            console.error("Failed to load more files:", err);
+        } finally {
+            loadingMoreRef.current = false;
+            setLoadingMore(false);
+        }
+    };
+
+    const handleFileAreaScroll = (e) => {
+        const area = e.currentTarget;
+        if (area.scrollHeight - area.scrollTop - area.clientHeight < 400) {
+            loadMore();
+        }
+    };
+
+    // A first page too short to scroll would never ask for the next one
+    useEffect(() => {
+        const area = fileAreaRef.current;
+        if (area && area.scrollHeight - area.clientHeight < 400) {
+            loadMore();
+        }
+    }, [files, searchResults, nextCursor, searchCursor, loading, searchLoading]);
+
     /* ---------------- LOAD ACTIVITY & STORAGE ---------------- */
     const loadExtra = useCallback(async () => {
         if (!user) return;
@@ -203,7 +278,7 @@ export default function App() {
     // keydownStateRef so the listener never needs to be removed/re-added.
     useEffect(() => {
         const handleKeyDown = (e) => {
-            const { selectedIds, currentView, filteredFiles, handleTrash } =
+            const { selectedIds, currentView, filteredFiles, handleBulkTrash } =
                 keydownStateRef.current;
 
             if (e.key === "Escape") {
@@ -218,7 +293,7 @@ export default function App() {
             }
 
             if (e.key === "Delete" && selectedIds.size > 0) {
-                selectedIds.forEach((id) => handleTrash(id));
+                handleBulkTrash([...selectedIds]);
                 setSelectedIds(new Set());
                 setIsMultiSelect(false);
             }
@@ -459,17 +534,23 @@ export default function App() {
     /* ---------------- DOWNLOAD ---------------- */
     const downloadFile = async (file) => {
         try {
-            const blob = await api.downloadFile(file.id);
-            const url = URL.createObjectURL(blob);
+            const isFolder = file.type === "folder";
+            // Folder archives go straight to the browser's download manager, which
+            // writes the streamed ZIP to disk instead of holding it in memory
+            const url = isFolder
+                ? await api.getArchiveDownloadUrl(file.id)
+                : URL.createObjectURL(await api.downloadFile(file.id));
             const a = document.createElement("a");
             a.href = url;
-            a.download = file.name;
+            a.download = isFolder ? `${file.name}.zip` : file.name;
             a.style.display = "none";
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);
-            // Delay revocation so the browser has time to start reading the blob
-            setTimeout(() => URL.revokeObjectURL(url), 10000);
+            if (!isFolder) {
+                // Delay revocation so the browser has time to start reading the blob
+                setTimeout(() => URL.revokeObjectURL(url), 10000);
+            }
         } catch (err) {
             console.error("Download failed:", err);
         }
@@ -617,13 +698,24 @@ export default function App() {
         }
     };
 
+    const handleBulkTrash = async (ids) => {
+        try {
+            await api.bulkFileOperation("trash", ids);
+            setDetailsFile(null);
+            setSearchRefreshKey((key) => key + 1);
+            loadFiles();
+        } catch (err) {
+            console.error("Trash failed:", err);
+        }
+    };
+
     const handleRestore = async (id) => {
         try {
             await api.restoreFile(id);
             setSearchRefreshKey((key) => key + 1);
             loadFiles();
             // Reload trash view
-            const trashData = await api.listFiles([], { includeTrash: true });
+            const trashData = await api.listAllFiles([], { includeTrash: true });
             setTrashedFiles(trashData.filter(f => f.is_trashed));
         } catch (err) {
             console.error("Restore failed:", err);
@@ -746,7 +838,7 @@ export default function App() {
 
     // Keep the keydown handler ref up to date on every render so the stable
     // listener always operates on the latest state without being re-registered.
-    keydownStateRef.current = { selectedIds, currentView, filteredFiles, handleTrash };
+    keydownStateRef.current = { selectedIds, currentView, filteredFiles, handleBulkTrash };
 
     // Get recent files (top 4 most recent non-folder files)
     const recentFiles = [...files]
@@ -895,6 +987,7 @@ export default function App() {
         api.logout();
         setUser(null);
         setFiles([]);
+        setNextCursor(null);
         setSearchQuery("");
         setSearchResults([]);
         setSearchError("");
@@ -980,7 +1073,7 @@ export default function App() {
                     showFileControls={currentView !== "activity" && currentView !== "trash" && currentView !== "admin"}
                 />
 
-                <div className="file-area">
+                <div className="file-area" ref={fileAreaRef} onScroll={handleFileAreaScroll}>
                     {isDragging && <DropZone />}
 
                     {loading || searchLoading ? (
@@ -1061,6 +1154,12 @@ export default function App() {
                                         ))}
                                     </div>
                                 )}
+
+                                {loadingMore && (
+                                    <div style={{ padding: '24px', textAlign: 'center', color: 'var(--text-muted)' }}>
+                                        Loading more files...
+                                    </div>
+                                )}
                             </div>
 
                             {/* Floating Storage Panel (when sidebar collapsed) */}
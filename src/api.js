@@ -59,7 +59,8 @@ class ApiService {
         }
 
         // Don't set Content-Type for FormData (browser will set it with boundary)
-        if (!(options.body instanceof FormData)) {
+        // or raw Blob bodies (sent with the blob's own type)
+        if (!(options.body instanceof FormData) && !(options.body instanceof Blob)) {
             headers['Content-Type'] = 'application/json';
         }
 
@@ -220,16 +221,38 @@ class ApiService {
     }
 
     // ============ FILES ============
-    async listFiles(path = [], options = {}) {
+    /**
+     * Follow next_cursor until the listing is exhausted and return all items.
+     * Views load one page at a time; use this only where every item is needed.
+     */
+    async collectPages(fetchPage) {
+        const items = [];
+        let cursor = null;
+        do {
+            const page = await fetchPage(cursor);
+            items.push(...page.items);
+            cursor = page.next_cursor;
+        } while (cursor);
+        return items;
+    }
+
+    async listFilesPage(path = [], options = {}) {
         const params = new URLSearchParams();
         params.append('path', JSON.stringify(path));
         if (options.includeTrash) params.append('include_trashed', 'true');
         if (options.starredOnly) params.append('starred_only', 'true');
         if (options.sharedFolderId) params.append('shared_folder_id', options.sharedFolderId);
+        if (options.limit) params.append('limit', options.limit);
+        if (options.cursor) params.append('cursor', options.cursor);
+        if (options.includeTotal) params.append('include_total', 'true');
 
         return this.request(`/files?${params.toString()}`);
     }
 
+    async listAllFiles(path = [], options = {}) {
+        return this.collectPages((cursor) => this.listFilesPage(path, { ...options, cursor }));
+    }
+
     async uploadFiles(files, path = []) {
         const formData = new FormData();
         files.forEach(file => {
@@ -382,15 +405,14 @@ class ApiService {
 
                         try {
                             await new Promise((chunkResolve, chunkReject) => {
-                                const formData = new FormData();
-                                formData.append('file', chunk);
-
                                 const xhr = new XMLHttpRequest();
                                 currentXhr = xhr;
-                                const url = `${API_BASE_URL}/files/upload/${upload_id}/chunk?chunk_index=${i}`;
+                                // Raw body: streamed straight to disk, no multipart parsing
+                                const url = `${API_BASE_URL}/files/upload/${upload_id}/chunk/raw?chunk_index=${i}`;
 
-                                xhr.open('POST', url);
+                                xhr.open('PUT', url);
                                 xhr.setRequestHeader('Authorization', `Bearer ${this.getToken()}`);
+                                xhr.setRequestHeader('Content-Type', 'application/octet-stream');
 
                                 xhr.upload.onprogress = (e) => {
                                     if (!e.lengthComputable || isAborted) return;
@@ -454,7 +476,7 @@ class ApiService {
                                     chunkReject(new Error('Upload cancelled'));
                                 };
 
-                                xhr.send(formData);
+                                xhr.send(chunk);
                             });
                             
                             chunkSuccess = true;
@@ -532,6 +554,36 @@ class ApiService {
         return response.blob();
     }
 
+    /**
+     * Short-lived signed URL for a folder's ZIP archive. Navigating to it lets the
+     * browser stream the archive to disk instead of buffering it as a blob.
+     * @param {string} folderId
+     * @returns {Promise<string>}
+     */
+    async getArchiveDownloadUrl(folderId) {
+        const { url } = await this.request(`/files/${folderId}/archive/link`, {
+            method: 'POST',
+        });
+        return `${API_BASE_URL}${url.replace(/^\/api/, '')}`;
+    }
+
+    async downloadSelectionArchive(fileIds) {
+        const response = await fetch(`${API_BASE_URL}/files/archive`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${this.getToken()}`,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ file_ids: fileIds }),
+        });
+
+        if (!response.ok) {
+            throw new Error('Download failed');
+        }
+
+        return response.blob();
+    }
+
     async downloadVersion(fileId, versionId) {
         const response = await fetch(`${API_BASE_URL}/files/${fileId}/versions/${versionId}/download`, {
             headers: {
@@ -551,11 +603,11 @@ class ApiService {
     }
 
     async uploadVersion(fileId, file) {
-        const formData = new FormData();
-        formData.append('new_file', file);
-        return this.request(`/files/${fileId}/versions`, {
-            method: 'POST',
-            body: formData,
+        const params = new URLSearchParams();
+        if (file.name) params.append('filename', file.name);
+        return this.request(`/files/${fileId}/versions/raw?${params.toString()}`, {
+            method: 'PUT',
+            body: file,
         });
     }
 
@@ -596,6 +648,13 @@ class ApiService {
         });
     }
 
+    async bulkFileOperation(operation, fileIds, path = null) {
+        return this.request('/files/bulk', {
+            method: 'POST',
+            body: JSON.stringify({ operation, file_ids: fileIds, path }),
+        });
+    }
+
     async copyFile(fileId) {
         return this.request(`/files/${fileId}/copy`, {
             method: 'POST',
@@ -710,8 +769,8 @@ class ApiService {
         });
     }
 
-    async accessSharedFile(token, password = null) {
-        const body = password ? { password } : {};
+    async accessSharedFile(token, password = null, grant = null) {
+        const body = grant ? { grant } : password ? { password } : {};
         return this.request(`/share/${token}`, {
             method: 'POST',
             body: JSON.stringify(body),
@@ -723,9 +782,11 @@ class ApiService {
         return `${API_BASE_URL}/share/${token}/download`;
     }
 
-    async downloadSharedFile(token, password = null) {
+    async downloadSharedFile(token, password = null, grant = null) {
         const headers = {};
-        if (password) {
+        if (grant) {
+            headers['X-Share-Grant'] = grant;
+        } else if (password) {
             headers['X-Share-Password'] = password;
         }
         const response = await fetch(`${API_BASE_URL}/share/${token}/download`, { headers });
@@ -737,7 +798,7 @@ class ApiService {
     }
 
     // ============ SEARCH ============
-    async searchFiles(query, filters = {}) {
+    async searchFilesPage(query, filters = {}) {
         const params = new URLSearchParams();
         params.append('q', query);
         if (filters.type) params.append('type', filters.type);
@@ -746,18 +807,35 @@ class ApiService {
         if (filters.starredOnly) params.append('starred_only', 'true');
         if (filters.includeTrash) params.append('include_trashed', 'true');
         if (filters.sharedFolderId) params.append('shared_folder_id', filters.sharedFolderId);
+        if (filters.limit) params.append('limit', filters.limit);
+        if (filters.cursor) params.append('cursor', filters.cursor);
+        if (filters.includeTotal) params.append('include_total', 'true');
 
         return this.request(`/files/search?${params.toString()}`);
     }
 
     // ============ THUMBNAILS & PREVIEWS ============
+    /**
+     * Resolve a signed thumbnail/preview URL from a listing for use as a src.
+     * The signature replaces the Authorization header, so the browser can cache it.
+     * @param {string} signedUrl - `thumbnail_url` or `preview_url` ("/api/...")
+     * @param {number} [size] - Displayed edge length in device pixels (thumbnails)
+     * @returns {string}
+     */
+    signedFileUrl(signedUrl, size) {
+        const url = `${API_BASE_URL}${signedUrl.replace(/^\/api/, '')}`;
+        return size ? `${url}&size=${Math.min(2048, Math.round(size))}` : url;
+    }
+
     /**
      * Fetch a thumbnail as a blob URL using Authorization header.
      * @param {string} fileId
+     * @param {number} [size] - Displayed edge length in device pixels
      * @returns {Promise<string>} Object URL for the thumbnail blob
      */
-    async fetchThumbnailBlob(fileId) {
-        const response = await fetch(`${API_BASE_URL}/files/${fileId}/thumbnail`, {
+    async fetchThumbnailBlob(fileId, size) {
+        const query = size ? `?size=${Math.min(2048, Math.round(size))}` : '';
+        const response = await fetch(`${API_BASE_URL}/files/${fileId}/thumbnail${query}`, {
             headers: { 'Authorization': `Bearer ${this.getToken()}` },
         });
         if (!response.ok) throw new Error('Thumbnail fetch failed');
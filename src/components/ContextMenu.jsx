@@ -32,7 +32,7 @@ export default function ContextMenu({
 }) {
     const menuItems = [
         { icon: Eye, label: "Preview", action: onPreview, show: file.type !== "folder" },
-        { icon: Download, label: "Download", action: onDownload, show: file.type !== "folder" },
+        { icon: Download, label: file.type === "folder" ? "Download as ZIP" : "Download", action: onDownload },
         { divider: true },
         { icon: isStarred ? StarOff : Star, label: isStarred ? "Unstar" : "Star", action: onStar, show: !file.is_shared || file.can_share_public },
         { icon: Edit3, label: "Rename", action: onRename, show: file.can_write },
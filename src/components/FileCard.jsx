@@ -55,9 +55,7 @@ export default function FileCard({
     useEffect(() => {
         let revoke = null;
         if (file.thumbnail_url) {
-            api.fetchThumbnailBlob(file.id)
-                .then(url => { setThumbnail(url); revoke = url; })
-                .catch(() => setThumbnail(null));
+            setThumbnail(api.signedFileUrl(file.thumbnail_url, 256 * (window.devicePixelRatio || 1)));
         } else if (file.type === "image" && file.blob) {
             const url = URL.createObjectURL(file.blob);
             setThumbnail(url);
@@ -31,8 +31,13 @@ export default function FilePreviewModal({
         }
     }, [file]);
 
-    // Fetch blob URL for image/video/PDF previews (avoids JWT in URL)
+    // Image/video/PDF previews: the signed preview_url when the listing has one,
+    // otherwise a blob fetched with the Authorization header (avoids JWT in URL)
     useEffect(() => {
+        if (["image", "video", "pdf"].includes(file.type) && file.preview_url) {
+            setPreviewUrl(api.signedFileUrl(file.preview_url));
+            return undefined;
+        }
         if (["image", "video", "pdf"].includes(file.type)) {
             let active = true;
             let objectUrl = null;